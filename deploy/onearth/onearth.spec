@@ -49,6 +49,7 @@ OnEarth log tool for metrics
 
 %package mrfgen
 Summary:	MRF generator for OnEarth
+Requires:	%{name} = %{version}-%{release}
 Requires:	gibs-gdal
 
 %description mrfgen
@@ -115,6 +116,14 @@ rm -rf %{buildroot}
 %{_datadir}/onearth/apache
 %defattr(755,root,root,-)
 %{_bindir}/oe_create_cache_config
+%{_bindir}/oe_prewarm_tiles.py
+%defattr(644,root,root,-)
+%{python_sitelib}/oe_mrf_index.py*
+%{python_sitelib}/oe_sigevent.py*
+%{python_sitelib}/oe_time_index.py*
+%{python_sitelib}/oe_time_ranges.py*
+%{python_sitelib}/oe_cache_config.py*
+%{python_sitelib}/oe_capabilities.py*
 
 %files config
 %defattr(664,gibs,gibs,775)
@@ -145,12 +154,18 @@ sudo python setup.py install
 %{_bindir}/RGBApng2Palpng
 %{_bindir}/mrfgen
 %{_bindir}/colormap2vrt.py
+%{_bindir}/mrf_compact.py
+%{_bindir}/mrfgen_batch.py
+%defattr(644,root,root,755)
+%{python_sitelib}/mrfgen
 
 %files metrics
 %defattr(664,gibs,gibs,775)
 %{_sysconfdir}/onearth/metrics
 %defattr(755,root,root,-)
 %{_bindir}/onearth_metrics
+%defattr(644,root,root,-)
+%{python_sitelib}/oe_log_stats.py*
 
 %files demo
 %defattr(-,gibs,gibs,-)
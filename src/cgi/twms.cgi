@@ -1,10 +1,6 @@
 #!/bin/bash
-ct() {
-  while read a
-  do
-    echo $a
-  done
-}
+# getCapabilities.xml and getTileService.xml are served with the compressed
+# copies, ETag and hash written by oe_configure_layer (see oe_capabilities.py)
 
 QS=${QUERY_STRING%%GetMap*}
 if [[ -z ${QS##*=} ]]
@@ -22,18 +18,13 @@ else
   # GetCapabilities is only here for WorldWind
   if [[ $QUERY_STRING == *GetCapabilities* ]]
   then
-    echo -e "Content-type: text/xml\n"
-#    cat getCapabilities.xml
-    IFS= ct <.lib/getCapabilities.xml
-    exit
+    exec python -m oe_capabilities .lib/getCapabilities.xml
   else
     # Don't believe this works as the file is located in .lib
     # Believe it is served from there by the Apache module
     if [[ $QUERY_STRING == *GetTileService* ]]
     then
-      echo -e "Content-type: text/xml\n"
-      cat getTileService.xml
-      exit
+      exec python -m oe_capabilities getTileService.xml
     fi
   fi
   echo -e "Content-type: text/html\n"
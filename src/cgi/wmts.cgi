@@ -1,10 +1,6 @@
 #!/bin/bash
-ct() {
-  while read a
-  do
-    echo $a
-  done
-}
+# getCapabilities.xml and getTileService.xml are served with the compressed
+# copies, ETag and hash written by oe_configure_layer (see oe_capabilities.py)
 
 QS=${QUERY_STRING%%GetTile*}
 if [[ -z ${QS##*=} ]]
@@ -21,15 +17,11 @@ then
 else
   if [[ $QUERY_STRING == *GetCapabilities* ]]
   then
-    echo -e "Content-type: text/xml\n"
-    IFS= ct <getCapabilities.xml
-    exit
+    exec python -m oe_capabilities getCapabilities.xml
   else
     if [[ $QUERY_STRING == *GetTileService* ]]
     then
-      echo -e "Content-type: text/xml\n"
-      cat getTileService.xml
-      exit
+      exec python -m oe_capabilities getTileService.xml
     fi
   fi
   echo -e "Content-type: text/html\n"
@@ -0,0 +1,462 @@
+#!/bin/env python
+
+# Copyright (c) 2002-2015, California Institute of Technology.
+# All rights reserved.  Based on Government Sponsored Research under contracts NAS7-1407 and/or NAS7-03001.
+# 
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+#   1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+#   2. Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#   3. Neither the name of the California Institute of Technology (Caltech), its operating division the Jet Propulsion Laboratory (JPL),
+#      the National Aeronautics and Space Administration (NASA), nor the names of its contributors may be used to
+#      endorse or promote products derived from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE CALIFORNIA INSTITUTE OF TECHNOLOGY BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+#
+# oe_cache_config.py
+# Cache configurations of the OnEarth server, built from MRF headers.
+#
+# Writes the same files as oe_create_cache_config (mod_onearth/twms_tool.cpp):
+#
+#  - The binary cache configuration read by mod_onearth (-cb), laid out as the
+#    Caches, WMSCache and WMSlevel structures of mod_onearth/cache.h on 64-bit
+#    Linux: the caches, then the levels of all caches, then the strings.
+#    Pointers are stored as offsets from the start of the file.
+#  - The XML version of the cache configuration (-cx).
+#  - The <TilePattern> elements of a layer for GetTileService (-p).
+#
+# Example:
+#   layers = [read_cache_layer(filename) for filename in ['LayerA.mrf', 'LayerB.mrf']]
+#   write_cache_config(layers, 'cache.config')
+#   write_cache_xml(layers, 'cache.xml')
+#   print layers[0].get_tile_patterns()
+#
+# Global Imagery Browse Services
+# NASA Jet Propulsion Laboratory
+# 2015
+
+import math
+import os
+import struct
+import xml.dom.minidom
+import xml.parsers.expat
+
+# Data file extension, page signature and HTTP header by MRF compression
+COMPRESSIONS = {'PNG': ('.ppg', -1991255785, 'Content-type: image/png'),
+                'JPEG': ('.pjg', -2555936, 'Content-type: image/jpeg'),
+                'TIF': ('.ptf', 1296891946, 'Content-type: image/tiff')}
+DEFAULT_TIME_PERIOD = '1970-01-01/2099-12-31/P1D'
+
+# Caches {size, count}
+CACHES_FORMAT = '<2i'
+# WMSCache {size, levels, levelt_offset, signature, orientation, num_patterns,
+#           pattern, prefix, time_period, num_periods}
+CACHE_FORMAT = '<6i3qi4x'
+# WMSlevel {psizex, psizey, xcount, ycount, index_add, empty_record,
+#           X0, Y0, X1, Y1, levelx, levely, dfname, ifname}
+LEVEL_FORMAT = '<4i3q6d2q'
+CACHES_SIZE = struct.calcsize(CACHES_FORMAT)
+CACHE_SIZE = struct.calcsize(CACHE_FORMAT)
+LEVEL_SIZE = struct.calcsize(LEVEL_FORMAT)
+# Size of an index record, index_s
+INDEX_RECORD_SIZE = 16
+
+
+class CacheConfigError(Exception):
+    """Error raised for an MRF header that cannot be added to a cache configuration"""
+    pass
+
+
+def get_xml_node(element, path):
+    """
+    Returns the attribute value or child element at a dotted path, like
+    CPLGetXMLNode, or None.
+    Arguments:
+        element -- the DOM element to start from
+        path -- e.g. 'Raster.Size.x'
+    """
+    node = element
+    names = path.split('.')
+    for name in names:
+        if name == names[-1] and node.hasAttribute(name):
+            return node.getAttribute(name)
+        children = [child for child in node.childNodes
+                    if child.nodeType == child.ELEMENT_NODE and child.tagName == name]
+        if len(children) == 0:
+            return None
+        node = children[0]
+    return node
+
+
+def get_xml_text(node, default):
+    """
+    Returns the text of an element, or the default if it has no text or has
+    child elements.  Whitespace between CDATA sections is ignored.
+    Arguments:
+        node -- an element or attribute value from get_xml_node
+        default -- the value returned for None or an element without text
+    """
+    if node == None:
+        return default
+    if isinstance(node, basestring):
+        return node.encode('utf-8')
+    text = []
+    for child in node.childNodes:
+        if child.nodeType == child.CDATA_SECTION_NODE or \
+                (child.nodeType == child.TEXT_NODE and child.data.strip() != ''):
+            text.append(child.data)
+        elif child.nodeType != child.TEXT_NODE:
+            return default
+    if len(text) == 0:
+        return default
+    return u''.join(text).encode('utf-8')
+
+
+def get_xml_value(element, path, default):
+    """
+    Returns the text at a dotted path, like CPLGetXMLValue.
+    Arguments:
+        element -- the DOM element to start from
+        path -- e.g. 'Raster.Size.x'
+        default -- the value returned if there is no text at the path
+    """
+    return get_xml_text(get_xml_node(element, path), default)
+
+
+def get_xml_values(element, path):
+    """
+    Returns the text of all elements with the name of the last component of
+    a dotted path, e.g. every <Pattern> for 'TWMS.Pattern'.
+    Arguments:
+        element -- the DOM element to start from
+        path -- e.g. 'TWMS.Pattern'
+    """
+    parent_path, name = path.rsplit('.', 1)
+    parent = get_xml_node(element, parent_path)
+    if parent == None or isinstance(parent, basestring):
+        return []
+    return [get_xml_text(child, '') for child in parent.childNodes
+            if child.nodeType == child.ELEMENT_NODE and child.tagName == name]
+
+
+def escape_xml(text):
+    """
+    Escapes text for an XML element or attribute.
+    """
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+
+
+def format_double(value):
+    """
+    Formats a double as %.16g.
+    """
+    return '%.16g' % value
+
+
+class CacheLayer:
+    """Layer of a cache configuration, read from an MRF header"""
+
+    def __init__(self, mrf_filename, dom=None):
+        """
+        Arguments:
+            mrf_filename -- the MRF header (.mrf)
+            dom -- the parsed MRF header, read from mrf_filename if None
+        """
+        if dom == None:
+            try:
+                dom = xml.dom.minidom.parse(mrf_filename)
+            except (IOError, xml.parsers.expat.ExpatError), e:
+                raise CacheConfigError('Cannot read MRF header ' + mrf_filename + ': ' + str(e))
+        mrf = dom.documentElement
+        self.filename = mrf_filename
+        try:
+            self.read(mrf)
+        except ValueError, e:
+            raise CacheConfigError('Invalid value in MRF header ' + mrf_filename + ': ' + str(e))
+
+    def read(self, mrf):
+        """
+        Reads the layer from the MRF_META element, with the defaults of oe_create_cache_config.
+        Arguments:
+            mrf -- the MRF_META element
+        """
+        raster = get_xml_node(mrf, 'Raster')
+        if raster == None or isinstance(raster, basestring):
+            raise CacheConfigError("Can't find the Raster node in " + self.filename)
+        self.orientation = 0 if get_xml_value(raster, 'Orientation', 'TL').upper() == 'TL' else 1
+        self.size_x = int(get_xml_value(raster, 'Size.x', '1'))
+        self.size_y = int(get_xml_value(raster, 'Size.y', '1'))
+        self.tile_size_x = int(get_xml_value(raster, 'PageSize.x', '512'))
+        self.tile_size_y = int(get_xml_value(raster, 'PageSize.y', '512'))
+        self.bands = int(get_xml_value(raster, 'PageSize.c', '1'))
+
+        compression = get_xml_value(raster, 'Compression', 'PNG')
+        data_extension, self.signature, self.mime_header = COMPRESSIONS.get(compression, (None, 0, ''))
+        basename = self.filename[:-4] if len(self.filename) > 4 else self.filename
+        self.index_filename = get_xml_value(mrf, 'Rsets.IndexFileName', basename + '.idx')
+        self.data_filename = get_xml_value(mrf, 'Rsets.DataFileName', None)
+        if self.data_filename == None:
+            if data_extension == None:
+                raise CacheConfigError("Can't guess extension for data file compressed as " + compression +
+                                       ", please provide <Rsets><DataFileName> in " + self.filename)
+            self.data_filename = basename + data_extension
+
+        self.bbox = [float(get_xml_value(mrf, 'GeoTags.BoundingBox.' + name, default))
+                     for (name, default) in [('minx', '-180'), ('miny', '-90'), ('maxx', '180'), ('maxy', '90')]]
+        self.scale = int(get_xml_value(mrf, 'Rsets.scale', '2'))
+
+        # All levels down to a single page for uniform overviews, unless set
+        self.levels = 1
+        if get_xml_value(mrf, 'Rsets.model', '').lower() == 'uniform':
+            size_x, size_y = self.size_x, self.size_y
+            while ((size_x - 1) // self.tile_size_x + 1) * ((size_y - 1) // self.tile_size_y + 1) > 1:
+                self.levels += 1
+                size_x = (size_x - 1) // self.scale + 1
+                size_y = (size_y - 1) // self.scale + 1
+        if get_xml_node(mrf, 'TWMS.Levels') != None:
+            self.levels = int(get_xml_value(mrf, 'TWMS.Levels', '-1'))
+
+        self.empty_size = int(get_xml_value(mrf, 'TWMS.EmptyInfo.size', '0'))
+        self.empty_offset = int(get_xml_value(mrf, 'TWMS.EmptyInfo.offset', '0'))
+        self.patterns = get_xml_values(mrf, 'TWMS.Pattern')
+        if len(self.patterns) == 0:
+            raise CacheConfigError("Can't find <TWMS><Pattern> in " + self.filename)
+        self.time_periods = sorted([period or DEFAULT_TIME_PERIOD for period in get_xml_values(mrf, 'TWMS.Time')])
+        if len(self.time_periods) == 0:
+            self.time_periods = [DEFAULT_TIME_PERIOD]
+
+    def get_level(self, level):
+        """
+        Returns the (tile width, tile height, columns, rows) of a level, in
+        map units and pages.
+        Arguments:
+            level -- the level, 0 for full resolution
+        """
+        minx, miny, maxx, maxy = self.bbox
+        factor = math.pow(self.scale, level)
+        return ((maxx - minx) * (self.tile_size_x * factor) / self.size_x,
+                (maxy - miny) * (self.tile_size_y * factor) / self.size_y,
+                int((self.size_x - 1) / (self.tile_size_x * factor) + 1),
+                int((self.size_y - 1) / (self.tile_size_y * factor) + 1))
+
+    def get_tile_patterns(self):
+        """
+        Returns the <TilePattern> elements of the layer for GetTileService,
+        one per level, with the bounding box of the top left tile.
+        """
+        minx, miny, maxx, maxy = self.bbox
+        resx = (maxx - minx) / self.size_x * self.tile_size_x
+        resy = (maxy - miny) / self.size_y * self.tile_size_y
+        tile_patterns = []
+        for level in range(self.levels):
+            bbox = ','.join([format_double(value) for value in (minx, maxy - resy, minx + resx, maxy)])
+            tokens, has_time = self.get_pattern_tokens(self.patterns[0], bbox)
+            pattern = '&'.join(tokens)
+            if has_time and len(self.patterns) > 1:
+                pattern = pattern + ' ' + '&'.join(self.get_pattern_tokens(self.patterns[1], bbox)[0])
+            tile_patterns.append(str().join(['<TilePattern>\n  <![CDATA[', pattern, ']]>\n</TilePattern>\n']))
+            # Tiles of each level are twice the size
+            resx *= 2
+            resy *= 2
+        return str().join(tile_patterns)
+
+    def get_pattern_tokens(self, pattern, bbox):
+        """
+        Returns the parameters of a request pattern with the bbox and time filled
+        in, and whether the pattern has a time.
+        Arguments:
+            pattern -- the request pattern
+            bbox -- the bounding box
+        """
+        tokens = []
+        has_time = False
+        for token in pattern.split('&'):
+            if token == '':
+                continue
+            if token[:5].lower() == 'bbox=':
+                token = token[:5] + bbox
+            elif token[:5].lower() == 'time=':
+                token = token[:5] + '${time}'
+                has_time = True
+            tokens.append(token)
+        return (tokens, has_time)
+
+
+def read_cache_layer(mrf_filename):
+    """
+    Returns the CacheLayer of an MRF header.
+    Arguments:
+        mrf_filename -- the MRF header (.mrf)
+    """
+    return CacheLayer(mrf_filename)
+
+
+class StringTable:
+    """Strings stored after the caches and levels of a binary cache configuration"""
+
+    def __init__(self):
+        self.strings = []
+        self.size = 0
+        # Offset of the first copy of each string
+        self.offsets = {}
+
+    def add(self, string):
+        """
+        Adds a string and returns its offset in the table.
+        """
+        offset = self.size
+        self.strings.append(string + '\0')
+        self.size += len(string) + 1
+        self.offsets.setdefault(string, offset)
+        return offset
+
+    def insert(self, string):
+        """
+        Adds a string unless it is already in the table, and returns its offset.
+        """
+        # Like oe_create_cache_config, the string at offset 0 is never reused.
+        offset = self.offsets.get(string)
+        if offset:
+            return offset
+        return self.add(string)
+
+
+def get_cache_config(layers):
+    """
+    Returns the binary cache configuration of layers.
+    Arguments:
+        layers -- list of CacheLayers
+    """
+    strings = StringTable()
+    caches = []
+    levels = []
+    for layer in layers:
+        # Patterns and time periods must be sequential
+        pattern = strings.add(layer.patterns[0])
+        for extra_pattern in layer.patterns[1:]:
+            strings.add(extra_pattern)
+        levelt_offset = LEVEL_SIZE * len(levels)
+        prefix = strings.insert(layer.mime_header + '\n\n')
+        time_period = strings.add(layer.time_periods[-1])
+        for period in reversed(layer.time_periods[:-1]):
+            strings.add(period)
+        caches.append([layer.levels, levelt_offset, layer.signature, layer.orientation, len(layer.patterns),
+                       pattern, prefix, time_period, len(layer.time_periods)])
+
+        index_offset = 0
+        for level in range(layer.levels):
+            levelx, levely, xcount, ycount = layer.get_level(level)
+            minx, miny, maxx, maxy = layer.bbox
+            levels.append([layer.tile_size_x, layer.tile_size_y, xcount, ycount, index_offset,
+                           layer.empty_offset, layer.empty_size, minx, miny, maxx, maxy, levelx, levely,
+                           strings.insert(layer.data_filename), strings.insert(layer.index_filename)])
+            index_offset += INDEX_RECORD_SIZE * xcount * ycount
+
+    # Offsets are from the start of the configuration
+    string_offset = CACHES_SIZE + CACHE_SIZE * len(caches) + LEVEL_SIZE * len(levels)
+    config = [struct.pack(CACHES_FORMAT, string_offset + strings.size, len(caches))]
+    for (number, (level_count, levelt_offset, signature, orientation, pattern_count, pattern, prefix,
+                  time_period, period_count)) in enumerate(caches):
+        # The level table offset is relative to each cache
+        config.append(struct.pack(CACHE_FORMAT, 0, level_count, levelt_offset + CACHE_SIZE * (len(caches) - number),
+                                  signature, orientation, pattern_count, pattern + string_offset,
+                                  prefix + string_offset, time_period + string_offset, period_count))
+    for level in levels:
+        level[-2] += string_offset
+        level[-1] += string_offset
+        config.append(struct.pack(LEVEL_FORMAT, *level))
+    config.extend(strings.strings)
+    return str().join(config)
+
+
+def get_cache_xml(layers):
+    """
+    Returns the XML cache configuration of layers.
+    Arguments:
+        layers -- list of CacheLayers
+    """
+    if len(layers) == 0:
+        return '<Cache />\n'
+    xml = ['<Cache>\n']
+    for layer in layers:
+        minx, miny, maxx, maxy = layer.bbox
+        xml.append('  <Layer>\n    <Patterns>\n')
+        for pattern in layer.patterns:
+            xml.append(str().join(['      <Pattern>\n        <![CDATA[', pattern, ']]>\n      </Pattern>\n']))
+        xml.append('    </Patterns>\n')
+        # HTMLHeader is the number of levels, as in oe_create_cache_config
+        xml.append('    <HTMLHeader>%d</HTMLHeader>\n' % layer.levels)
+        xml.append('    <HTMLFormat>%s</HTMLFormat>\n' % escape_xml(layer.mime_header))
+        xml.append('    <Signature>%d</Signature>\n' % layer.signature)
+        xml.append('    <BinaryOrientation>%d</BinaryOrientation>\n' % layer.orientation)
+        xml.append('    <LayerSize x="%d" y="%d" />\n' % (layer.size_x, layer.size_y))
+        xml.append('    <Bands>%d</Bands>\n' % layer.bands)
+        xml.append('    <Scale>%d</Scale>\n' % layer.scale)
+        xml.append('    <TimePeriods>\n')
+        for period in layer.time_periods:
+            xml.append('      <TimePeriod>%s</TimePeriod>\n' % escape_xml(period))
+        xml.append('    </TimePeriods>\n')
+        xml.append('    <Levels>%d</Levels>\n' % layer.levels)
+        index_offset = 0
+        for level in range(layer.levels):
+            levelx, levely, xcount, ycount = layer.get_level(level)
+            xml.append('    <Level>\n')
+            xml.append('      <TileSize x="%d" y="%d" />\n' % (layer.tile_size_x, layer.tile_size_y))
+            xml.append('      <BoundingBox xmin="%s" ymin="%s" xmax="%s" ymax="%s" />\n' %
+                       tuple([format_double(value) for value in layer.bbox]))
+            xml.append('      <TileResolution x="%s" y="%s" />\n' % (format_double(levelx), format_double(levely)))
+            xml.append('      <DataFileName>%s</DataFileName>\n' % escape_xml(layer.data_filename))
+            xml.append('      <IndexFileName>%s</IndexFileName>\n' % escape_xml(layer.index_filename))
+            xml.append('      <IndexOffset>%d</IndexOffset>\n' % index_offset)
+            xml.append('      <EmptyInfo size="%d" offset="%d" />\n' % (layer.empty_size, layer.empty_offset))
+            xml.append('    </Level>\n')
+            # oe_create_cache_config adds the unrounded page counts here
+            factor = math.pow(layer.scale, level)
+            index_offset = int(index_offset + INDEX_RECORD_SIZE * ((layer.size_x - 1) / (layer.tile_size_x * factor) + 1) *
+                               ((layer.size_y - 1) / (layer.tile_size_y * factor) + 1))
+        xml.append('  </Layer>\n')
+    xml.append('</Cache>\n')
+    return str().join(xml)
+
+
+def write_file(filename, contents):
+    """
+    Writes a file through a temporary file, so it is replaced all at once.
+    Arguments:
+        filename -- the file to write
+        contents -- the contents of the file
+    """
+    temp_filename = filename + '.' + str(os.getpid())
+    output = open(temp_filename, 'wb')
+    try:
+        output.write(contents)
+    finally:
+        output.close()
+    os.rename(temp_filename, filename)
+
+
+def write_cache_config(layers, filename):
+    """
+    Writes the binary cache configuration of layers.
+    Arguments:
+        layers -- list of CacheLayers
+        filename -- the cache configuration file, e.g. cache.config
+    """
+    write_file(filename, get_cache_config(layers))
+
+
+def write_cache_xml(layers, filename):
+    """
+    Writes the XML cache configuration of layers.
+    Arguments:
+        layers -- list of CacheLayers
+        filename -- the XML cache configuration file, e.g. cache.xml
+    """
+    write_file(filename, get_cache_xml(layers))
@@ -0,0 +1,346 @@
+#!/bin/env python
+
+# Copyright (c) 2002-2015, California Institute of Technology.
+# All rights reserved.  Based on Government Sponsored Research under contracts NAS7-1407 and/or NAS7-03001.
+# 
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+#   1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+#   2. Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#   3. Neither the name of the California Institute of Technology (Caltech), its operating division the Jet Propulsion Laboratory (JPL),
+#      the National Aeronautics and Space Administration (NASA), nor the names of its contributors may be used to
+#      endorse or promote products derived from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE CALIFORNIA INSTITUTE OF TECHNOLOGY BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+#
+# oe_capabilities.py
+# Assembles and serves the GetCapabilities and GetTileService files of an endpoint.
+#
+# The base lines and the layer fragments (the _gc.xml, _gts.xml and WMTS
+# layer .xml files written for each layer) are streamed into the output in
+# one pass, without reading the fragments into memory.  The output is written
+# to a temporary file and renamed, so the web server never reads a partial
+# file.  In the same pass, write_xml may write compressed copies
+# (getCapabilities.xml.gz, and getCapabilities.xml.br if the brotli module is
+# installed), and always writes the SHA-1 hash of the contents to
+# getCapabilities.xml.etag.
+#
+# Run as a CGI program, it serves one of these files with the compressed copy
+# accepted by the client, an ETag and a Last-Modified date, and answers
+# If-None-Match and If-Modified-Since with 304 Not Modified.
+#
+# Example:
+#   fragments = Fragments(list_fragments('/layer_config/twms/EPSG4326', '_gc.xml'))
+#   parts = []
+#   for line in open('getcapabilities_base_twms.xml').readlines():
+#       if '</Layer>' in line:
+#           parts.append(fragments)
+#       parts.append(line)
+#   write_xml('/layer_config/twms/EPSG4326/getCapabilities.xml', parts, compress=True)
+#
+#   python -m oe_capabilities getCapabilities.xml
+#
+# Global Imagery Browse Services
+# NASA Jet Propulsion Laboratory
+# 2015
+
+import email.utils
+import gzip
+import hashlib
+import os
+import shutil
+import sys
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bytes buffered before each write to the output file.
+BUFFER_SIZE = 1048576
+# Compression level of the gzip copies.
+COMPRESS_LEVEL = 9
+# Compression quality of the brotli copies.
+BROTLI_QUALITY = 11
+GZIP_EXTENSION = '.gz'
+BROTLI_EXTENSION = '.br'
+ETAG_EXTENSION = '.etag'
+# Content encodings of the compressed copies, in order of preference
+ENCODINGS = [('br', BROTLI_EXTENSION), ('gzip', GZIP_EXTENSION)]
+CONTENT_TYPE = 'text/xml'
+
+
+class Fragments:
+    """Files copied into the output in order, in place of a part"""
+
+    def __init__(self, filenames):
+        """
+        Arguments:
+            filenames -- list of the files to copy
+        """
+        self.filenames = filenames
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def copy(self, output):
+        """
+        Copy the files into an output.
+        Arguments:
+            output -- file object to write to
+        """
+        for filename in self.filenames:
+            fragment = open(filename, 'rb')
+            try:
+                shutil.copyfileobj(fragment, output, BUFFER_SIZE)
+            finally:
+                fragment.close()
+
+
+class Outputs:
+    """File objects written together, and the hash of what was written"""
+
+    def __init__(self, outputs):
+        self.outputs = outputs
+        self.hash = hashlib.sha1()
+
+    def write(self, data):
+        self.hash.update(data)
+        for output in self.outputs:
+            output.write(data)
+
+
+class BrotliFile:
+    """File object writing brotli compressed data to another file object"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def write(self, data):
+        self.fileobj.write(self.compressor.process(data))
+
+    def close(self):
+        self.fileobj.write(self.compressor.finish())
+
+
+def list_fragments(path, suffix, exclude=[]):
+    """
+    Returns the full paths of the files in a directory ending with a suffix,
+    sorted by name regardless of case.
+    Arguments:
+        path -- the directory of the fragments, e.g. an endpoint staging location
+        suffix -- the end of the fragment file names, e.g. '_gc.xml'
+        exclude -- file names that are not fragments, e.g. ['getCapabilities.xml']
+    """
+    filenames = [filename for filename in os.listdir(path) if filename.endswith(suffix) and filename not in exclude]
+    return [os.path.join(path, filename) for filename in sorted(filenames, key=lambda s: s.lower())]
+
+
+def get_temp_filename(filename):
+    """
+    Returns the temporary file a file is written to before it is renamed.
+    Arguments:
+        filename -- the file to write
+    """
+    return str().join([filename, '.', str(os.getpid())])
+
+
+def write_xml(filename, parts, compress=False):
+    """
+    Writes a file from strings and Fragments, replacing it all at once, and
+    the hash of its contents to filename + '.etag'.
+    Arguments:
+        filename -- the file to write, e.g. getCapabilities.xml
+        parts -- list of strings and Fragments, in order
+        compress -- also write compressed copies, filename + '.gz' and
+                    filename + '.br' if the brotli module is installed
+    """
+    extensions = ['']
+    if compress:
+        extensions.append(GZIP_EXTENSION)
+        if brotli != None:
+            extensions.append(BROTLI_EXTENSION)
+    files = []
+    try:
+        files.append(open(get_temp_filename(filename), 'wb', BUFFER_SIZE))
+        outputs = [files[0]]
+        for extension in extensions[1:]:
+            files.append(open(get_temp_filename(filename + extension), 'wb'))
+            if extension == GZIP_EXTENSION:
+                # Without a time stamp, the compressed copy only changes with the contents.
+                files.append(gzip.GzipFile(os.path.basename(filename), 'wb', COMPRESS_LEVEL, files[-1], 0))
+            else:
+                files.append(BrotliFile(files[-1]))
+            outputs.append(files[-1])
+        output = Outputs(outputs)
+        for part in parts:
+            if isinstance(part, Fragments):
+                part.copy(output)
+            else:
+                output.write(part)
+        for output_file in reversed(files):
+            output_file.close()
+    except:
+        for output_file in reversed(files):
+            output_file.close()
+        for extension in extensions:
+            if os.path.isfile(get_temp_filename(filename + extension)):
+                os.remove(get_temp_filename(filename + extension))
+        raise
+    for extension in extensions:
+        os.rename(get_temp_filename(filename + extension), filename + extension)
+    for encoding, extension in ENCODINGS:
+        if extension not in extensions and os.path.isfile(filename + extension):
+            # An old compressed copy would no longer match.
+            os.remove(filename + extension)
+    # The hash is replaced last, so it never names contents that are not there yet.
+    etag_file = open(get_temp_filename(filename + ETAG_EXTENSION), 'w')
+    etag_file.write(output.hash.hexdigest())
+    etag_file.close()
+    os.rename(get_temp_filename(filename + ETAG_EXTENSION), filename + ETAG_EXTENSION)
+
+
+def copy_xml(filename, destination):
+    """
+    Copies a file written by write_xml, with its compressed copies and hash,
+    replacing the destination all at once.
+    Arguments:
+        filename -- the file to copy
+        destination -- the file to write
+    """
+    for extension in ['', GZIP_EXTENSION, BROTLI_EXTENSION, ETAG_EXTENSION]:
+        if extension == '' or os.path.isfile(filename + extension):
+            shutil.copyfile(filename + extension, get_temp_filename(destination + extension))
+            os.rename(get_temp_filename(destination + extension), destination + extension)
+        elif os.path.isfile(destination + extension):
+            os.remove(destination + extension)
+
+
+def get_encoding(accept_encoding, encodings):
+    """
+    Returns the content encoding preferred by a client, or None for no encoding.
+    Arguments:
+        accept_encoding -- the Accept-Encoding header, e.g. 'gzip, deflate, br'
+        encodings -- the available content encodings, in order of preference
+    """
+    qualities = {}
+    for coding in accept_encoding.split(','):
+        params = [param.strip() for param in coding.split(';')]
+        quality = 1.0
+        for param in params[1:]:
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        qualities[params[0].lower()] = quality
+    best_encoding = None
+    best_quality = 0.0
+    for encoding in encodings:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best_encoding = encoding
+            best_quality = quality
+    return best_encoding
+
+
+def get_etag(filename):
+    """
+    Returns the ETag of a file without quotes: the hash written by write_xml,
+    or the time and size of the file if there is none.
+    Arguments:
+        filename -- the file served, e.g. getCapabilities.xml
+    """
+    try:
+        etag_file = open(filename + ETAG_EXTENSION, 'r')
+        etag = etag_file.read().strip()
+        etag_file.close()
+        if etag != '':
+            return etag
+    except IOError:
+        pass
+    stat = os.stat(filename)
+    return '%x-%x' % (int(stat.st_mtime), stat.st_size)
+
+
+def is_not_modified(environ, etag, mtime):
+    """
+    Returns whether the conditional headers of a request match, so the
+    client's copy may be used.
+    Arguments:
+        environ -- the CGI environment of the request
+        etag -- the quoted ETag of the response
+        mtime -- the modification time of the response, in seconds
+    """
+    if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+    if if_none_match != None:
+        # Weak comparison, as for GET requests
+        etags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in etags or etag in [tag[2:] if tag.startswith('W/') else tag for tag in etags]
+    if_modified_since = environ.get('HTTP_IF_MODIFIED_SINCE')
+    if if_modified_since != None:
+        date = email.utils.parsedate_tz(if_modified_since.split(';')[0])
+        if date != None:
+            return int(mtime) <= email.utils.mktime_tz(date)
+    return False
+
+
+def respond(filename, environ=os.environ, output=sys.stdout):
+    """
+    Writes a CGI response with a file written by write_xml, compressed if the
+    client accepts it.
+    Arguments:
+        filename -- the file to serve, e.g. getCapabilities.xml
+        environ -- the CGI environment of the request
+        output -- file object of the response
+    """
+    encodings = [encoding for encoding, extension in ENCODINGS if os.path.isfile(filename + extension)]
+    encoding = get_encoding(environ.get('HTTP_ACCEPT_ENCODING', ''), encodings)
+    try:
+        # write_xml replaces the .etag file last, so reading it before the content can
+        # only pair a new body with an old ETag, which the next request corrects.
+        etag = get_etag(filename)
+        mtime = os.stat(filename).st_mtime
+        content = open(filename + dict(ENCODINGS).get(encoding, ''), 'rb')
+    except (IOError, OSError):
+        output.write('Status: 404 Not Found\nContent-type: text/html\n\n')
+        output.write('<body>' + os.path.basename(filename) + ' was not found</body>\n')
+        return
+    if encoding == None:
+        etag = '"' + etag + '"'
+    else:
+        etag = str().join(['"', etag, '-', encoding, '"'])
+    headers = [('ETag', etag), ('Last-Modified', email.utils.formatdate(mtime, usegmt=True)),
+               ('Vary', 'Accept-Encoding')]
+    if is_not_modified(environ, etag, mtime):
+        headers.insert(0, ('Status', '304 Not Modified'))
+        content.close()
+        content = None
+    else:
+        headers.insert(0, ('Content-type', CONTENT_TYPE))
+        if encoding != None:
+            headers.append(('Content-Encoding', encoding))
+        headers.append(('Content-Length', str(os.fstat(content.fileno()).st_size)))
+    output.write(str().join([name + ': ' + value + '\n' for name, value in headers]) + '\n')
+    if content != None:
+        try:
+            if environ.get('REQUEST_METHOD') != 'HEAD':
+                shutil.copyfileobj(content, output, BUFFER_SIZE)
+        finally:
+            content.close()
+    output.flush()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        sys.stderr.write('Usage: python -m oe_capabilities getCapabilities.xml\n')
+        sys.exit(1)
+    respond(sys.argv[1])
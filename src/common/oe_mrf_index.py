@@ -0,0 +1,292 @@
+#!/bin/env python
+
+# Copyright (c) 2002-2015, California Institute of Technology.
+# All rights reserved.  Based on Government Sponsored Research under contracts NAS7-1407 and/or NAS7-03001.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+#   1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+#   2. Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#   3. Neither the name of the California Institute of Technology (Caltech), its operating division the Jet Propulsion Laboratory (JPL),
+#      the National Aeronautics and Space Administration (NASA), nor the names of its contributors may be used to
+#      endorse or promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE CALIFORNIA INSTITUTE OF TECHNOLOGY BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+#
+# oe_mrf_index.py
+# Read and write MRF index (.idx) files.
+#
+# An MRF index is a flat array of big-endian index_s {offset, size} records
+# (see mod_onearth/cache.h), one per page.  Level 0 is the full resolution
+# image, followed by each overview level (smaller by the Rsets scale, 2 by
+# default) until the level fits in one page.
+# Within a level, records are stored row by row, and for band-separate MRFs
+# the band is the fastest varying.  A zero size means the page is not present.
+#
+# The index is memory-mapped and exposed as a NumPy structured array, so
+# indexes covering millions of tiles are not read into memory.
+#
+# Example:
+#   header = read_mrf_header('MODIS_Aqua_Aerosol2014001_.mrf')
+#   index = MRFIndex('MODIS_Aqua_Aerosol2014001_.idx', header)
+#   records = index.lookup(0, rows, cols)
+#   print records['offset'], records['size']
+#
+# Global Imagery Browse Services
+# NASA Jet Propulsion Laboratory
+# 2015
+
+import os
+import xml.dom.minidom
+import numpy
+
+# index_s from mod_onearth/cache.h
+INDEX_DTYPE = numpy.dtype([('offset', '>i8'), ('size', '>i8')])
+
+# MRF data file extensions by compression type.
+DATA_EXTENSIONS = {'PNG': '.ppg', 'PPNG': '.ppg', 'JPEG': '.pjg', 'JPG': '.pjg', 'TIF': '.ptf', 'TIFF': '.ptf'}
+
+
+class MRFIndexError(Exception):
+    """Error raised for an MRF header or index that cannot be used"""
+    pass
+
+
+def ceil_div(a, b):
+    """
+    Integer division rounded up.
+    """
+    return (a + b - 1) // b
+
+
+class MRFHeader:
+    """Raster layout from an MRF header (.mrf) file"""
+
+    def __init__(self, size, pagesize, compression='PNG', filename='', scale=2):
+        """
+        Arguments:
+            size -- (x, y, c) of the full resolution image
+            pagesize -- (x, y, c) of a page
+            compression -- MRF compression type (e.g. 'PNG', 'JPEG')
+            filename -- the .mrf filename, if any
+            scale -- the size ratio of successive overview levels
+        """
+        self.size = tuple([int(value) for value in size])
+        self.pagesize = tuple([int(value) for value in pagesize])
+        self.compression = compression.upper()
+        self.filename = filename
+        self.scale = int(scale)
+        if min(self.size) < 1 or min(self.pagesize) < 1:
+            raise MRFIndexError('Invalid MRF size ' + str(self.size) + ' or page size ' + str(self.pagesize))
+        if self.scale < 2:
+            raise MRFIndexError('Invalid MRF overview scale ' + str(self.scale))
+        # Number of index records per tile; more than one for band-separate MRFs.
+        self.bands = ceil_div(self.size[2], self.pagesize[2])
+
+    def get_level_shapes(self):
+        """
+        Return a list of (rows, cols) page counts for every possible level,
+        from full resolution down to the level that fits in a single page.
+        """
+        shapes = []
+        x, y = self.size[0], self.size[1]
+        while True:
+            shape = (ceil_div(y, self.pagesize[1]), ceil_div(x, self.pagesize[0]))
+            shapes.append(shape)
+            if shape == (1, 1):
+                break
+            # Overviews are smaller by the scale, rounded up.
+            x, y = ceil_div(x, self.scale), ceil_div(y, self.scale)
+        return shapes
+
+    def get_data_filename(self):
+        """
+        Return the data file name that goes with the header.
+        """
+        return os.path.splitext(self.filename)[0] + DATA_EXTENSIONS.get(self.compression, '.ppg')
+
+    def get_index_filename(self):
+        """
+        Return the index file name that goes with the header.
+        """
+        return os.path.splitext(self.filename)[0] + '.idx'
+
+
+def read_mrf_header(mrf_filename):
+    """
+    Read the raster size, page size, compression and overview scale from an MRF header.
+    Arguments:
+        mrf_filename -- the .mrf file
+    """
+    try:
+        dom = xml.dom.minidom.parse(mrf_filename)
+    except IOError:
+        raise MRFIndexError('Cannot read MRF header ' + mrf_filename)
+    size_elements = dom.getElementsByTagName('Size')
+    if len(size_elements) == 0:
+        raise MRFIndexError('No <Size> found in ' + mrf_filename)
+    size = [size_elements[0].getAttribute(dim) or '1' for dim in ('x', 'y', 'c')]
+    pagesize_elements = dom.getElementsByTagName('PageSize')
+    if len(pagesize_elements) > 0:
+        pagesize = [pagesize_elements[0].getAttribute('x') or '512',
+                    pagesize_elements[0].getAttribute('y') or '512',
+                    pagesize_elements[0].getAttribute('c') or size[2]]
+    else:
+        # MRF default page size
+        pagesize = ['512', '512', size[2]]
+    compression_elements = dom.getElementsByTagName('Compression')
+    if len(compression_elements) > 0 and compression_elements[0].firstChild != None:
+        compression = compression_elements[0].firstChild.data.strip()
+    else:
+        compression = 'PNG'
+    rsets_elements = dom.getElementsByTagName('Rsets')
+    scale = '2'
+    if len(rsets_elements) > 0 and rsets_elements[0].getAttribute('scale') != '':
+        scale = rsets_elements[0].getAttribute('scale')
+    try:
+        return MRFHeader(size, pagesize, compression, mrf_filename, scale)
+    except ValueError:
+        raise MRFIndexError('Invalid MRF size, page size or overview scale in ' + mrf_filename)
+
+
+class MRFIndex:
+    """Memory-mapped MRF index file"""
+
+    def __init__(self, idx_filename, header, mode='r'):
+        """
+        Arguments:
+            idx_filename -- the .idx file
+            header -- MRFHeader describing the raster
+            mode -- 'r' for read only or 'r+' for read and write
+        """
+        self.filename = idx_filename
+        self.header = header
+        self.mode = mode
+        record_count = os.path.getsize(idx_filename) // INDEX_DTYPE.itemsize
+        if record_count == 0:
+            raise MRFIndexError(idx_filename + ' is empty')
+        # Shared memory map; slices and reshapes below are views, not copies.
+        self.records = numpy.memmap(idx_filename, dtype=INDEX_DTYPE, mode=mode, shape=(record_count,))
+        # Levels present in the file.  An MRF without overviews only has level 0.
+        self.shapes = []
+        self.level_offsets = []
+        start = 0
+        for shape in header.get_level_shapes():
+            count = shape[0] * shape[1] * header.bands
+            if start + count > record_count:
+                break
+            self.shapes.append(shape)
+            self.level_offsets.append(start)
+            start += count
+        if len(self.shapes) == 0:
+            raise MRFIndexError(idx_filename + ' is too small for ' + str(header.size) + ' with page size ' + str(header.pagesize))
+        self.levels = len(self.shapes)
+
+    def level(self, level):
+        """
+        Return a view of the records of one level, shaped (rows, cols) or
+        (rows, cols, bands) for band-separate MRFs.
+        Arguments:
+            level -- 0 for full resolution, 1 for the first overview, ...
+        """
+        rows, cols = self.shapes[level]
+        start = self.level_offsets[level]
+        view = self.records[start:start + rows * cols * self.header.bands]
+        if self.header.bands > 1:
+            return view.reshape(rows, cols, self.header.bands)
+        return view.reshape(rows, cols)
+
+    def record_numbers(self, level, row, col, band=0):
+        """
+        Return the position of records in the index file, in records.
+        Arguments may be scalars or arrays of the same shape.
+        Arguments:
+            level -- level(s), 0 for full resolution
+            row -- page row(s) from the top
+            col -- page column(s) from the left
+            band -- band page(s) for band-separate MRFs
+        """
+        level = numpy.asarray(level)
+        row = numpy.asarray(row)
+        col = numpy.asarray(col)
+        band = numpy.asarray(band)
+        offsets = numpy.array(self.level_offsets, dtype=numpy.int64)
+        rows = numpy.array([shape[0] for shape in self.shapes], dtype=numpy.int64)
+        cols = numpy.array([shape[1] for shape in self.shapes], dtype=numpy.int64)
+        if (level < 0).any() or (level >= self.levels).any():
+            raise MRFIndexError('Level out of range in ' + self.filename)
+        if (row < 0).any() or (row >= rows[level]).any() or (col < 0).any() or (col >= cols[level]).any():
+            raise MRFIndexError('Row or column out of range in ' + self.filename)
+        if (band < 0).any() or (band >= self.header.bands).any():
+            raise MRFIndexError('Band out of range in ' + self.filename)
+        return offsets[level] + (row * cols[level] + col) * self.header.bands + band
+
+    def lookup(self, level, row, col, band=0):
+        """
+        Return the index records for the given tiles.  Arguments may be scalars
+        or arrays of the same shape, and the result has the same shape.
+        Arguments:
+            level -- level(s), 0 for full resolution
+            row -- page row(s) from the top
+            col -- page column(s) from the left
+            band -- band page(s) for band-separate MRFs
+        """
+        return self.records[self.record_numbers(level, row, col, band)]
+
+    def update(self, level, row, col, offset, size, band=0):
+        """
+        Set the index records for the given tiles.  The index must be opened
+        with mode 'r+'.
+        Arguments:
+            level -- level(s), 0 for full resolution
+            row -- page row(s) from the top
+            col -- page column(s) from the left
+            offset -- data file offset(s) of the tiles
+            size -- size(s) of the tiles in bytes, 0 for missing tiles
+            band -- band page(s) for band-separate MRFs
+        """
+        if self.mode == 'r':
+            raise MRFIndexError(self.filename + ' is open read only')
+        positions = self.record_numbers(level, row, col, band)
+        self.records['offset'][positions] = offset
+        self.records['size'][positions] = size
+
+    def flush(self):
+        """
+        Write changes to disk.
+        """
+        if self.mode != 'r':
+            self.records.flush()
+
+    def close(self):
+        """
+        Flush changes and release the memory map.
+        """
+        self.flush()
+        self.records = None
+
+
+def create_index(idx_filename, header, levels=None):
+    """
+    Create an empty index (all pages missing) and return it open for write.
+    The file is created sparse, so only pages written use disk space.
+    Arguments:
+        idx_filename -- the .idx file to create
+        header -- MRFHeader describing the raster
+        levels -- number of levels to include, all levels by default
+    """
+    shapes = header.get_level_shapes()
+    if levels != None:
+        shapes = shapes[:levels]
+    record_count = sum([rows * cols for (rows, cols) in shapes]) * header.bands
+    idx_file = open(idx_filename, 'wb')
+    idx_file.truncate(record_count * INDEX_DTYPE.itemsize)
+    idx_file.close()
+    return MRFIndex(idx_filename, header, 'r+')
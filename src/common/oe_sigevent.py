@@ -0,0 +1,403 @@
+#!/bin/env python
+
+# Copyright (c) 2002-2015, California Institute of Technology.
+# All rights reserved.  Based on Government Sponsored Research under contracts NAS7-1407 and/or NAS7-03001.
+# 
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+#   1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+#   2. Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#   3. Neither the name of the California Institute of Technology (Caltech), its operating division the Jet Propulsion Laboratory (JPL),
+#      the National Aeronautics and Space Administration (NASA), nor the names of its contributors may be used to
+#      endorse or promote products derived from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE CALIFORNIA INSTITUTE OF TECHNOLOGY BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+#
+# oe_sigevent.py
+# Asynchronous client for the sigevent service, shared by the OnEarth tools.
+#
+# sigevent() prints the message and returns immediately.  Messages are sent by
+# a background thread, one per sigevent URL and category, so a slow or
+# unreachable sigevent service does not hold up processing:
+#
+#  - The queue of unsent messages is bounded.  Identical messages waiting in
+#    the queue are sent once, with the number of repeats.
+#  - Each request has a timeout.  After a failed request, messages are
+#    spooled to disk without contacting the service until retry_interval has
+#    passed, and spooled messages are resent, a batch with each message, once
+#    the service is reachable.  The spool file is bounded; the oldest messages
+#    are dropped when it is full.
+#  - Pending messages are sent (or spooled) when the program exits.
+#  - A forked process (e.g. a multiprocessing worker) starts its own senders,
+#    since the threads of its parent are not copied.
+#
+# Example:
+#   from oe_sigevent import sigevent
+#   sigevent('WARN', 'Empty tile was not found', 'http://localhost:8100/sigevent/events/create', 'MRFGEN')
+#
+# Global Imagery Browse Services
+# NASA Jet Propulsion Laboratory
+# 2015
+
+import atexit
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+import urllib
+import urllib2
+import httplib
+
+# Seconds to wait for the sigevent service to answer a request.
+DEFAULT_TIMEOUT = 5
+# Maximum number of distinct messages waiting to be sent.
+DEFAULT_QUEUE_SIZE = 1000
+# Seconds to wait after a failed request before contacting the service again.
+DEFAULT_RETRY_INTERVAL = 60
+# Seconds to wait at exit for pending messages to be sent.
+DEFAULT_FLUSH_TIMEOUT = 10
+# Maximum size in bytes of the spool file; the oldest half is dropped when it is exceeded.
+DEFAULT_SPOOL_SIZE = 1 << 20
+# Maximum number of spooled messages resent with each message.
+DEFAULT_RESEND_COUNT = 100
+# Directory of the spool file, may be set with ONEARTH_SIGEVENT_SPOOL.
+DEFAULT_SPOOL_DIR = os.environ.get('ONEARTH_SIGEVENT_SPOOL', tempfile.gettempdir())
+
+
+def truncate_mssg(mssg, suffix=''):
+    """
+    Return mssg followed by suffix, constrained to 256 characters (including '...').
+    Arguments:
+        mssg -- 'message for operations'
+        suffix -- text kept at the end of the message
+    """
+    length = 256 - len(suffix)
+    if len(mssg) > length:
+        mssg=str().join([mssg[0:length-3], '...'])
+    return str().join([mssg, suffix])
+
+
+def get_sigevent_parameters(type, mssg, category):
+    """
+    Return the sigevent parameters that get encoded into the URL.
+    Arguments:
+        type -- 'INFO', 'WARN', 'ERROR'
+        mssg -- 'message for operations'
+        category -- sigevent category, e.g. 'ONEARTH' or 'MRFGEN'
+    """
+    data={}
+    data['type']=type
+    data['description']=truncate_mssg(mssg)
+    data['computer']=socket.gethostname()
+    data['source']='ONEARTH'
+    data['format']='TEXT'
+    data['category']=category
+    data['provider']='GIBS'
+    return data
+
+
+def clean_sigevent_url(sigevent_url):
+    """
+    Remove any trailing slash or question mark from the sigevent URL.
+    Arguments:
+        sigevent_url -- Example:  'http://[host]/sigevent/events/create'
+    """
+    return sigevent_url.rstrip('/?')
+
+
+class SigeventSender:
+    """Background thread sending messages to one sigevent service"""
+
+    def __init__(self, sigevent_url, category, timeout=DEFAULT_TIMEOUT, queue_size=DEFAULT_QUEUE_SIZE,
+                 retry_interval=DEFAULT_RETRY_INTERVAL, spool_dir=DEFAULT_SPOOL_DIR, spool_size=DEFAULT_SPOOL_SIZE,
+                 resend_count=DEFAULT_RESEND_COUNT):
+        """
+        Arguments:
+            sigevent_url -- Example:  'http://[host]/sigevent/events/create'
+            category -- sigevent category, e.g. 'ONEARTH' or 'MRFGEN'
+            timeout -- seconds to wait for each request
+            queue_size -- maximum number of distinct messages waiting
+            retry_interval -- seconds between attempts while the service is down
+            spool_dir -- directory for unsent messages, None to drop them
+            spool_size -- maximum size in bytes of the spool file
+            resend_count -- maximum number of spooled messages resent with each message
+        """
+        self.sigevent_url = clean_sigevent_url(sigevent_url)
+        self.category = category
+        self.timeout = timeout
+        self.queue_size = queue_size
+        self.retry_interval = retry_interval
+        self.spool_size = spool_size
+        self.resend_count = resend_count
+        # The spool file is written by the sender thread and by flush().
+        self.spool_lock = threading.Lock()
+        if spool_dir:
+            spool_name = str().join(['onearth_sigevent_', category.lower(), '_',
+                                     str(abs(hash(self.sigevent_url))), '.spool'])
+            self.spool_filename = os.path.join(spool_dir, spool_name)
+        else:
+            self.spool_filename = None
+        # (type, mssg) of waiting messages, in order, and how often each was sent.
+        self.pending = []
+        self.counts = {}
+        self.dropped = 0
+        # Time of the last failed request, 0 if the service is up.
+        self.failed_time = 0
+        self.sending = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, name='sigevent')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def put(self, type, mssg):
+        """
+        Queue a message.  Never blocks on the network.
+        Arguments:
+            type -- 'INFO', 'WARN', 'ERROR'
+            mssg -- 'message for operations'
+        """
+        key = (type, mssg)
+        self.condition.acquire()
+        try:
+            if key in self.counts:
+                self.counts[key] += 1
+            elif len(self.pending) >= self.queue_size:
+                self.dropped += 1
+            else:
+                self.pending.append(key)
+                self.counts[key] = 1
+                self.condition.notify()
+        finally:
+            self.condition.release()
+
+    def run(self):
+        """
+        Send queued messages until the program exits.
+        """
+        while True:
+            self.condition.acquire()
+            try:
+                while len(self.pending) == 0:
+                    self.condition.wait()
+                key = self.pending.pop(0)
+                count = self.counts.pop(key)
+                dropped = self.dropped
+                self.dropped = 0
+                self.sending = True
+            finally:
+                self.condition.release()
+            type, mssg = key
+            if count > 1:
+                mssg = truncate_mssg(mssg, str().join([' (repeated ', str(count), ' times)']))
+            messages = [get_sigevent_parameters(type, mssg, self.category)]
+            if dropped > 0:
+                messages.append(get_sigevent_parameters('WARN', str().join([str(dropped),
+                                ' sigevent messages were dropped because the queue was full']), self.category))
+            self.deliver(messages)
+            self.condition.acquire()
+            self.sending = False
+            self.condition.notifyAll()
+            self.condition.release()
+
+    def deliver(self, messages):
+        """
+        Send messages, resending up to resend_count spooled messages first.
+        Messages that cannot be sent are spooled.
+        Arguments:
+            messages -- list of sigevent parameter dictionaries
+        """
+        if self.failed_time != 0 and time.time() - self.failed_time < self.retry_interval:
+            self.spool(messages)
+            return
+        messages = self.read_spool(self.resend_count) + messages
+        for ndx in range(len(messages)):
+            if not self.send(messages[ndx]):
+                self.failed_time = time.time()
+                self.spool(messages[ndx:])
+                return
+        self.failed_time = 0
+
+    def send(self, data):
+        """
+        Send one message.  Returns False if the service could not be reached.
+        """
+        full_url=self.sigevent_url+'?'+urllib.urlencode(data)
+        try:
+            response = urllib2.urlopen(full_url, timeout=self.timeout)
+            response.close()
+        except (urllib2.URLError, httplib.HTTPException, socket.error), e:
+            logging.warning('sigevent service is unavailable: ' + str(e))
+            return False
+        return True
+
+    def spool(self, messages):
+        """
+        Append messages to the spool file, or drop them if there is none.
+        When the spool file exceeds spool_size, the oldest messages are dropped.
+        """
+        if self.spool_filename == None or len(messages) == 0:
+            return
+        self.spool_lock.acquire()
+        try:
+            spool_file = open(self.spool_filename, 'a')
+            for data in messages:
+                spool_file.write(json.dumps(data) + '\n')
+            spool_file.close()
+            if os.path.getsize(self.spool_filename) > self.spool_size:
+                lines = self.take_spool()
+                # Keep the newest half, so the file is not trimmed again with every message.
+                kept = []
+                size = 0
+                for line in reversed(lines):
+                    size += len(line)
+                    if size > self.spool_size / 2:
+                        break
+                    kept.append(line)
+                kept.reverse()
+                self.replace_spool(kept)
+                logging.warning(str().join([str(len(lines) - len(kept)),
+                                ' spooled sigevent messages were dropped because the spool file was full']))
+        except (IOError, OSError), e:
+            logging.warning('Cannot write sigevent spool file: ' + str(e))
+        finally:
+            self.spool_lock.release()
+
+    def take_spool(self):
+        """
+        Return the lines of the spool file and remove it.  The spool file is
+        renamed first, so messages spooled by other processes meanwhile are kept.
+        """
+        if not os.path.isfile(self.spool_filename):
+            return []
+        taken_filename = str().join([self.spool_filename, '.', str(os.getpid())])
+        os.rename(self.spool_filename, taken_filename)
+        spool_file = open(taken_filename, 'r')
+        lines = spool_file.readlines()
+        spool_file.close()
+        os.remove(taken_filename)
+        return lines
+
+    def replace_spool(self, lines):
+        """
+        Put lines in front of the messages spooled meanwhile.
+        """
+        lines = lines + self.take_spool()
+        if len(lines) == 0:
+            return
+        temp_filename = str().join([self.spool_filename, '.', str(os.getpid())])
+        spool_file = open(temp_filename, 'w')
+        spool_file.writelines(lines)
+        spool_file.close()
+        os.rename(temp_filename, self.spool_filename)
+
+    def read_spool(self, count):
+        """
+        Take up to count of the oldest messages from the spool file.
+        Arguments:
+            count -- maximum number of messages
+        """
+        if self.spool_filename == None:
+            return []
+        messages = []
+        self.spool_lock.acquire()
+        try:
+            lines = self.take_spool()
+            ndx = 0
+            while ndx < len(lines) and len(messages) < count:
+                try:
+                    messages.append(json.loads(lines[ndx]))
+                except ValueError:
+                    pass
+                ndx += 1
+            self.replace_spool(lines[ndx:])
+        except (IOError, OSError), e:
+            logging.warning('Cannot read sigevent spool file: ' + str(e))
+        finally:
+            self.spool_lock.release()
+        return messages
+
+    def flush(self, timeout=DEFAULT_FLUSH_TIMEOUT):
+        """
+        Wait until all queued messages have been sent or spooled.
+        Arguments:
+            timeout -- maximum seconds to wait
+        """
+        end_time = time.time() + timeout
+        self.condition.acquire()
+        try:
+            while len(self.pending) > 0 or self.sending:
+                remaining = end_time - time.time()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            unsent = [get_sigevent_parameters(type, mssg, self.category) for (type, mssg) in self.pending]
+            self.pending = []
+            self.counts = {}
+        finally:
+            self.condition.release()
+        # Messages not sent in time are kept for the next run.
+        self.spool(unsent)
+
+
+# Senders by (sigevent_url, category), and the process they run in
+senders = {}
+senders_pid = os.getpid()
+senders_lock = threading.Lock()
+
+
+def get_sender(sigevent_url, category):
+    """
+    Return the sender for a sigevent service, starting it if needed.
+    """
+    global senders, senders_pid
+    key = (clean_sigevent_url(sigevent_url), category)
+    senders_lock.acquire()
+    try:
+        if senders_pid != os.getpid():
+            # Forked, the senders of the parent process have no thread here.
+            senders = {}
+            senders_pid = os.getpid()
+        if key not in senders:
+            senders[key] = SigeventSender(sigevent_url, category)
+        return senders[key]
+    finally:
+        senders_lock.release()
+
+
+def sigevent(type, mssg, sigevent_url, category='ONEARTH'):
+    """
+    Send a message to sigevent service in the background.
+    Arguments:
+        type -- 'INFO', 'WARN', 'ERROR'
+        mssg -- 'message for operations'
+        sigevent_url -- Example:  'http://[host]/sigevent/events/create'
+                        'http://localhost:8100/sigevent/events/create'
+        category -- sigevent category, e.g. 'ONEARTH' or 'MRFGEN'
+    """
+    mssg = truncate_mssg(mssg)
+    print str().join(['sigevent ', type, ' - ', mssg])
+    get_sender(sigevent_url, category).put(type, mssg)
+
+
+def flush(timeout=DEFAULT_FLUSH_TIMEOUT):
+    """
+    Wait until the messages of all senders have been sent or spooled.
+    Arguments:
+        timeout -- maximum seconds to wait for each sender
+    """
+    if senders_pid != os.getpid():
+        return
+    for sender in senders.values():
+        sender.flush(timeout)
+
+atexit.register(flush)
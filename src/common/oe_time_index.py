@@ -0,0 +1,280 @@
+#!/bin/env python
+
+# Copyright (c) 2002-2015, California Institute of Technology.
+# All rights reserved.  Based on Government Sponsored Research under contracts NAS7-1407 and/or NAS7-03001.
+# 
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+#   1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+#   2. Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#   3. Neither the name of the California Institute of Technology (Caltech), its operating division the Jet Propulsion Laboratory (JPL),
+#      the National Aeronautics and Space Administration (NASA), nor the names of its contributors may be used to
+#      endorse or promote products derived from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE CALIFORNIA INSTITUTE OF TECHNOLOGY BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+#
+# oe_time_index.py
+# Index of the times of the MRF files in archive locations.
+#
+# Finding the times of a layer by walking its archive location lists every
+# directory and file on each run.  TimeIndex keeps the times parsed from the
+# file names (...YYYYDDD_.mrf or ...YYYYDDDHHMMSS_.mrf) in a SQLite database
+# with the modification time of each directory.  When the index is refreshed,
+# only directories whose modification time has changed are listed again; the
+# others are only stat'ed.  A directory's modification time changes whenever
+# files are added, removed or renamed in it, so files published by mrfgen are
+# picked up on the next refresh.
+#
+# Example:
+#   index = TimeIndex('/var/cache/onearth/time_index.db')
+#   index.refresh('/data/EPSG4326/MODIS_Aqua_Aerosol')
+#   times, subdaily = index.get_times('/data/EPSG4326/MODIS_Aqua_Aerosol', 'MODIS_Aqua_Aerosol')
+#
+# Global Imagery Browse Services
+# NASA Jet Propulsion Laboratory
+# 2015
+
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+# Directories modified less than this many seconds before a scan are listed
+# again on the next refresh, since files may be added within the same mtime.
+MTIME_MARGIN = 2
+# Seconds to wait for another process writing to the database.
+DEFAULT_TIMEOUT = 60
+
+SCHEMA = """
+BEGIN IMMEDIATE;
+CREATE TABLE IF NOT EXISTS directories (path TEXT PRIMARY KEY, parent TEXT, mtime REAL);
+CREATE INDEX IF NOT EXISTS directories_parent ON directories (parent);
+CREATE TABLE IF NOT EXISTS files (directory TEXT, filename TEXT, time TEXT, subdaily INTEGER);
+CREATE INDEX IF NOT EXISTS files_directory ON files (directory);
+COMMIT;
+"""
+
+
+def get_file_time(filename):
+    """
+    Returns the (datetime, subdaily) of an MRF file name ending in YYYYDDD_.ext
+    or YYYYDDDHHMMSS_.ext, or None if the name has no time.
+    Arguments:
+        filename -- the file name
+    """
+    try:
+        return (datetime.strptime(filename[-12:-5], "%Y%j"), False)
+    except ValueError:
+        try:
+            return (datetime.strptime(filename[-18:-5], "%Y%j%H%M%S"), True)
+        except ValueError:
+            return None
+
+
+def get_subtree_range(path):
+    """
+    Returns the (low, high) bounds of the paths below a directory, for range queries.
+    Arguments:
+        path -- the normalized directory path
+    """
+    # '0' follows '/' in ASCII, so the bounds enclose exactly the paths starting with path + '/'.
+    return (path.rstrip('/') + '/', path.rstrip('/') + '0')
+
+
+def walk_times(location, prefix):
+    """
+    Returns the sorted, distinct times of the files in a location (including its
+    subdirectories) whose names start with a prefix, and whether any is subdaily,
+    by listing every directory without an index.
+    Arguments:
+        location -- the archive location
+        prefix -- the FileNamePrefix of the layer
+    """
+    file_times = {}
+    for dirname, dirnames, filenames in os.walk(location, followlinks=True):
+        for filename in filenames:
+            if filename.startswith(prefix):
+                file_time = get_file_time(filename)
+                if file_time != None:
+                    file_times[file_time[0]] = file_times.get(file_time[0], False) or file_time[1]
+    return (sorted(file_times.keys()), any(file_times.values()))
+
+
+class TimeIndex:
+    """Times of the files in archive locations, refreshed from directory modification times"""
+
+    def __init__(self, database=':memory:', timeout=DEFAULT_TIMEOUT):
+        """
+        Arguments:
+            database -- the SQLite database file, ':memory:' for an index of this process only
+            timeout -- seconds to wait for another process writing to the database
+        """
+        self.database = database
+        self.timeout = timeout
+        self.connection = None
+        self.pid = None
+        # Locations refreshed by this process
+        self.refreshed = set()
+
+    def get_connection(self):
+        """
+        Returns the database connection of this process, opening it on first use.
+        Connections are not shared with forked processes.
+        """
+        if self.connection == None or self.pid != os.getpid():
+            # Transactions are started explicitly, see refresh().
+            self.connection = sqlite3.connect(self.database, timeout=self.timeout, isolation_level=None)
+            self.connection.text_factory = str
+            self.connection.executescript(SCHEMA)
+            self.pid = os.getpid()
+            self.refreshed = set()
+        return self.connection
+
+    def is_refreshed(self, path):
+        """
+        Returns whether a directory or one of its parents was refreshed by this process.
+        Arguments:
+            path -- the normalized directory path
+        """
+        while True:
+            if path in self.refreshed:
+                return True
+            parent = os.path.dirname(path)
+            if parent == path:
+                return False
+            path = parent
+
+    def refresh(self, location):
+        """
+        Brings the index of a location up to date.  Returns the number of directories listed.
+        Arguments:
+            location -- the archive location
+        """
+        connection = self.get_connection()
+        location = os.path.normpath(location)
+        if self.is_refreshed(location):
+            return 0
+        scan_time = time.time()
+        listed = 0
+        pending = [location]
+        # Directories are listed outside of transactions and each is written in its own,
+        # so processes refreshing other locations only wait for a single directory.
+        while len(pending) > 0:
+            path = pending.pop()
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                self.write(connection, self.remove_directory, path)
+                continue
+            row = connection.execute('SELECT mtime FROM directories WHERE path = ?', (path,)).fetchone()
+            if row != None and row[0] == mtime:
+                pending.extend([r[0] for r in connection.execute('SELECT path FROM directories WHERE parent = ?', (path,))])
+                continue
+            files, subdirs = self.list_directory(path)
+            listed += 1
+            if scan_time - mtime < MTIME_MARGIN:
+                mtime = None
+            self.write(connection, self.update_directory, path, mtime, files, subdirs)
+            pending.extend(subdirs)
+        self.refreshed.add(location)
+        return listed
+
+    def write(self, connection, function, *args):
+        """
+        Calls a function writing to the database in a transaction.
+        Arguments:
+            connection -- the database connection
+            function -- the function, called with the connection and args
+        """
+        # Take the write lock first, so processes writing at the same time wait for each other.
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            function(connection, *args)
+            connection.execute('COMMIT')
+        except:
+            connection.execute('ROLLBACK')
+            raise
+
+    def list_directory(self, path):
+        """
+        Returns the (files, subdirectories) of a directory, with the files as rows of the files table.
+        Arguments:
+            path -- the directory
+        """
+        subdirs = []
+        files = []
+        for filename in os.listdir(path):
+            full_path = os.path.join(path, filename)
+            if os.path.isdir(full_path):
+                subdirs.append(full_path)
+                continue
+            file_time = get_file_time(filename)
+            if file_time != None:
+                files.append((path, filename, file_time[0].strftime('%Y%m%d%H%M%S'), int(file_time[1])))
+        return (files, subdirs)
+
+    def update_directory(self, connection, path, mtime, files, subdirs):
+        """
+        Replaces the files and subdirectories of a directory in the index.
+        Arguments:
+            connection -- the database connection
+            path -- the directory
+            mtime -- the modification time of the directory, None to list it again on the next refresh
+            files -- the rows of the files table of the directory
+            subdirs -- the subdirectories
+        """
+        connection.execute('DELETE FROM files WHERE directory = ?', (path,))
+        connection.executemany('INSERT INTO files (directory, filename, time, subdaily) VALUES (?, ?, ?, ?)', files)
+        for (old_subdir,) in connection.execute('SELECT path FROM directories WHERE parent = ?', (path,)).fetchall():
+            if old_subdir not in subdirs:
+                self.remove_directory(connection, old_subdir)
+        # New subdirectories are recorded without a modification time, so they are listed
+        # on the next refresh if this one is interrupted before they are.
+        connection.executemany('INSERT OR IGNORE INTO directories (path, parent, mtime) VALUES (?, ?, NULL)',
+                               [(subdir, path) for subdir in subdirs])
+        connection.execute('INSERT OR REPLACE INTO directories (path, parent, mtime) VALUES (?, ?, ?)',
+                           (path, os.path.dirname(path), mtime))
+
+    def remove_directory(self, connection, path):
+        """
+        Removes a directory and everything below it from the index.
+        Arguments:
+            connection -- the database connection
+            path -- the directory
+        """
+        low, high = get_subtree_range(path)
+        connection.execute('DELETE FROM files WHERE directory = ? OR (directory >= ? AND directory < ?)', (path, low, high))
+        connection.execute('DELETE FROM directories WHERE path = ? OR (path >= ? AND path < ?)', (path, low, high))
+
+    def get_times(self, location, prefix):
+        """
+        Returns the sorted, distinct times of the files in a location (including its
+        subdirectories) whose names start with a prefix, and whether any is subdaily.
+        The location must have been refreshed.
+        Arguments:
+            location -- the archive location
+            prefix -- the FileNamePrefix of the layer
+        """
+        location = os.path.normpath(location)
+        low, high = get_subtree_range(location)
+        rows = self.get_connection().execute('SELECT time, MAX(subdaily) FROM files '
+                                             'WHERE (directory = ? OR (directory >= ? AND directory < ?)) '
+                                             'AND substr(filename, 1, ?) = ? GROUP BY time ORDER BY time',
+                                             (location, low, high, len(prefix), prefix)).fetchall()
+        times = [datetime(int(t[0:4]), int(t[4:6]), int(t[6:8]), int(t[8:10]), int(t[10:12]), int(t[12:14])) for t, subdaily in rows]
+        return (times, any(subdaily for t, subdaily in rows))
+
+    def close(self):
+        """
+        Closes the database connection.
+        """
+        if self.connection != None and self.pid == os.getpid():
+            self.connection.close()
+        self.connection = None
@@ -0,0 +1,190 @@
+#!/bin/env python
+
+# Copyright (c) 2002-2015, California Institute of Technology.
+# All rights reserved.  Based on Government Sponsored Research under contracts NAS7-1407 and/or NAS7-03001.
+# 
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+#   1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+#   2. Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#   3. Neither the name of the California Institute of Technology (Caltech), its operating division the Jet Propulsion Laboratory (JPL),
+#      the National Aeronautics and Space Administration (NASA), nor the names of its contributors may be used to
+#      endorse or promote products derived from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE CALIFORNIA INSTITUTE OF TECHNOLOGY BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+#
+# oe_time_ranges.py
+# Detection of the periods and ranges of the times of a layer.
+#
+# The times found in an archive location are grouped into ISO 8601 intervals
+# (start/end/period) of times one period apart, as listed in the <Time>
+# elements of the GetCapabilities.  The times are converted to arrays of
+# seconds and months, so the steps between all times are computed at once.
+# If no period is configured, the most common step between times is used.
+#
+# Periods have a single unit.  Months and years are calendar periods: the
+# day of the month is kept, or the last day of shorter months is used, and
+# times on the last day of each month (e.g. monthly composites dated at the
+# end of the month) are one month apart.
+#
+# Example:
+#   ranges, period = get_time_ranges([datetime(2015, 1, 1), datetime(2015, 1, 2), datetime(2015, 1, 5)])
+#   ['2015-01-01/2015-01-02/P1D', '2015-01-05/2015-01-05/P1D'], 'P1D'
+#
+# Global Imagery Browse Services
+# NASA Jet Propulsion Laboratory
+# 2015
+
+import calendar
+import re
+import numpy
+
+DEFAULT_PERIOD = 'P1D'
+DATE_FORMAT = '%Y-%m-%d'
+SUBDAILY_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+PERIOD_PATTERN = re.compile(r'^P(?:(\d+)([YMWD])|T(\d+)([HMS]))$')
+# Seconds in each unit of fixed periods.
+UNIT_SECONDS = {'W': 604800, 'D': 86400, 'TH': 3600, 'TM': 60, 'TS': 1}
+
+
+class TimeArrays:
+    """Times as arrays of numbers"""
+
+    def __init__(self, times):
+        """
+        Arguments:
+            times -- list of sorted, distinct datetimes
+        """
+        timetuples = [t.timetuple() for t in times]
+        self.seconds = numpy.array([calendar.timegm(t) for t in timetuples], dtype=numpy.int64)
+        # Months since year 0, day of the month and seconds into the day
+        self.months = numpy.array([t.tm_year * 12 + t.tm_mon - 1 for t in timetuples], dtype=numpy.int64)
+        self.days = numpy.array([t.tm_mday for t in timetuples], dtype=numpy.int64)
+        self.month_days = numpy.array([calendar.monthrange(t.tm_year, t.tm_mon)[1] for t in timetuples],
+                                      dtype=numpy.int64)
+        self.day_seconds = self.seconds % 86400
+
+
+def parse_period(period):
+    """
+    Returns the (unit, value) of an ISO 8601 period, where unit is 'M' for
+    months and 'S' for seconds.  Years are returned as 12 months and weeks,
+    days, hours and minutes as seconds.  Raises ValueError if the period
+    does not have a single unit.
+    Arguments:
+        period -- the period, e.g. 'P1D', 'P1M' or 'PT3H'
+    """
+    match = PERIOD_PATTERN.match(period)
+    if match == None:
+        raise ValueError('Unsupported period ' + period)
+    if match.group(1) != None:
+        value, unit = int(match.group(1)), match.group(2)
+    else:
+        value, unit = int(match.group(3)), 'T' + match.group(4)
+    if value == 0:
+        raise ValueError('Unsupported period ' + period)
+    if unit == 'Y':
+        return ('M', value * 12)
+    if unit == 'M':
+        return ('M', value)
+    return ('S', value * UNIT_SECONDS[unit])
+
+
+def get_most_common(values):
+    """
+    Returns the most common of an array of numbers, the smallest if several are.
+    Arguments:
+        values -- array of numbers
+    """
+    unique_values, inverse = numpy.unique(values, return_inverse=True)
+    return unique_values[numpy.bincount(inverse.ravel()).argmax()]
+
+
+def get_same_days(arrays):
+    """
+    Returns a boolean array that is True for the times on the same day of the
+    month and time of day as the previous time.  The day is kept up to the
+    last day of the month, and the last day of a month follows the last day
+    of another month.
+    Arguments:
+        arrays -- the TimeArrays of the times
+    """
+    last_days = arrays.days == arrays.month_days
+    return (((arrays.days[1:] == numpy.minimum(arrays.days[:-1], arrays.month_days[1:])) |
+             (last_days[1:] & last_days[:-1])) &
+            (numpy.diff(arrays.day_seconds) == 0))
+
+
+def detect_period(arrays):
+    """
+    Returns the most common period between times, in the largest unit that
+    divides it.  Times on the same day of the month (or the last day of each
+    month) are monthly or yearly if most of them are the most common number
+    of months apart.
+    Arguments:
+        arrays -- the TimeArrays of the times
+    """
+    if len(arrays.seconds) < 2:
+        return DEFAULT_PERIOD
+    month_steps = numpy.diff(arrays.months)
+    step = int(get_most_common(month_steps))
+    same_days = get_same_days(arrays)
+    if step > 0 and (numpy.all(same_days) or numpy.mean((month_steps == step) & same_days) > 0.5):
+        if step % 12 == 0 and numpy.all(arrays.months % 12 == arrays.months[0] % 12):
+            return 'P' + str(step // 12) + 'Y'
+        return 'P' + str(step) + 'M'
+    step = int(get_most_common(numpy.diff(arrays.seconds)))
+    if step % 86400 == 0:
+        return 'P' + str(step // 86400) + 'D'
+    if step % 3600 == 0:
+        return 'PT' + str(step // 3600) + 'H'
+    if step % 60 == 0:
+        return 'PT' + str(step // 60) + 'M'
+    return 'PT' + str(step) + 'S'
+
+
+def get_range_starts(arrays, period):
+    """
+    Returns a boolean array that is True for the times that do not follow
+    the previous time by one period.
+    Arguments:
+        arrays -- the TimeArrays of the times
+        period -- the ISO 8601 period
+    """
+    unit, value = parse_period(period)
+    if unit == 'S':
+        consecutive = numpy.diff(arrays.seconds) == value
+    else:
+        consecutive = (numpy.diff(arrays.months) == value) & get_same_days(arrays)
+    return numpy.concatenate(([True], ~consecutive))
+
+
+def get_time_ranges(times, subdaily=False, period=None):
+    """
+    Returns the ISO 8601 intervals (start/end/period) of the runs of times
+    one period apart, and the period.  Raises ValueError if the period does
+    not have a single unit.
+    Arguments:
+        times -- list of sorted, distinct datetimes
+        subdaily -- whether the times are subdaily, for the time format
+        period -- the period of the times, detected if None
+    """
+    if len(times) == 0:
+        return ([], period if period != None else DEFAULT_PERIOD)
+    arrays = TimeArrays(times)
+    if period == None:
+        period = detect_period(arrays)
+    starts = numpy.nonzero(get_range_starts(arrays, period))[0]
+    ends = numpy.concatenate((starts[1:] - 1, [len(times) - 1]))
+    time_format = SUBDAILY_FORMAT if subdaily else DATE_FORMAT
+    ranges = [str().join([times[start].strftime(time_format), '/', times[end].strftime(time_format), '/', period])
+              for start, end in zip(starts, ends)]
+    return (ranges, period)
@@ -0,0 +1,89 @@
+#!/bin/env python
+
+# Tests for oe_cache_config.py using a temporary MRF header
+
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from oe_cache_config import *
+
+MRF_HEADER = """<MRF_META>
+  <Raster>
+    <Size x="2048" y="1024" c="1"/>
+    <PageSize x="512" y="512" c="1"/>
+    <Compression>JPEG</Compression>
+  </Raster>
+  <Rsets model="uniform" scale="2"><DataFileName>/data/LayerATTTTTTT_.pjg</DataFileName></Rsets>
+  <GeoTags>
+    <BoundingBox minx="-180" miny="-90" maxx="180" maxy="90"/>
+  </GeoTags>
+<TWMS>
+	<Levels>3</Levels>
+	<EmptyInfo offset="0" size="1397"/>
+	<Pattern><![CDATA[request=GetMap&layers=LayerA&time=[-0-9]*&bbox=[-,\.0-9+Ee]*]]></Pattern>
+	<Pattern><![CDATA[request=GetMap&layers=LayerA&bbox=[-,\.0-9+Ee]*]]></Pattern>
+	<Time>2015-01-01/2015-01-10/P1D</Time>
+	<Time>2014-01-01/2014-12-31/P1D</Time>
+</TWMS>
+</MRF_META>
+"""
+
+class TestCacheConfig(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.mrf_filename = os.path.join(self.tmp_dir, 'LayerATTTTTTT_.mrf')
+        mrf_file = open(self.mrf_filename, 'w')
+        mrf_file.write(MRF_HEADER)
+        mrf_file.close()
+        self.layer = read_cache_layer(self.mrf_filename)
+
+    def test_layer(self):
+        self.assertEqual(self.layer.levels, 3)
+        self.assertEqual(self.layer.signature, -2555936)
+        self.assertEqual(self.layer.mime_header, 'Content-type: image/jpeg')
+        self.assertEqual(self.layer.data_filename, '/data/LayerATTTTTTT_.pjg')
+        self.assertEqual(self.layer.index_filename, self.mrf_filename[:-4] + '.idx')
+        self.assertEqual(self.layer.time_periods, ['2014-01-01/2014-12-31/P1D', '2015-01-01/2015-01-10/P1D'])
+        self.assertEqual(self.layer.get_level(1), (180.0, 180.0, 2, 1))
+        self.assertRaises(CacheConfigError, read_cache_layer, os.path.join(self.tmp_dir, 'missing.mrf'))
+
+    def test_cache_config(self):
+        config = get_cache_config([self.layer, self.layer])
+        size, count = struct.unpack_from(CACHES_FORMAT, config)
+        self.assertEqual((size, count), (len(config), 2))
+        cache = struct.unpack_from(CACHE_FORMAT, config, CACHES_SIZE + CACHE_SIZE)
+        levels, levelt_offset, num_patterns, pattern, prefix, time_period, num_periods = \
+            cache[1], cache[2], cache[5], cache[6], cache[7], cache[8], cache[9]
+        self.assertEqual((levels, num_patterns, num_periods), (3, 2, 2))
+        # Strings are stored after the caches and levels
+        get_string = lambda offset: config[offset:config.index('\0', offset)]
+        self.assertEqual(get_string(pattern), self.layer.patterns[0])
+        self.assertEqual(get_string(pattern + len(self.layer.patterns[0]) + 1), self.layer.patterns[1])
+        self.assertEqual(get_string(prefix), 'Content-type: image/jpeg\n\n')
+        self.assertEqual(get_string(time_period), '2015-01-01/2015-01-10/P1D')
+        # The level table of the second cache follows the levels of the first
+        level = struct.unpack_from(LEVEL_FORMAT, config, CACHES_SIZE + CACHE_SIZE + levelt_offset + LEVEL_SIZE)
+        self.assertEqual(level[:7], (512, 512, 2, 1, 128, 0, 1397))
+        self.assertEqual(get_string(level[13]), '/data/LayerATTTTTTT_.pjg')
+
+    def test_cache_xml(self):
+        cache_xml = get_cache_xml([self.layer])
+        self.assertTrue(cache_xml.startswith('<Cache>\n  <Layer>\n    <Patterns>\n      <Pattern>\n'))
+        self.assertTrue('      <TileResolution x="90" y="90" />\n' in cache_xml)
+        self.assertTrue('      <TimePeriod>2014-01-01/2014-12-31/P1D</TimePeriod>\n' in cache_xml)
+        self.assertEqual(get_cache_xml([]), '<Cache />\n')
+
+    def test_tile_patterns(self):
+        patterns = self.layer.get_tile_patterns().splitlines()
+        self.assertEqual(len(patterns), 9)
+        self.assertEqual(patterns[1], '  <![CDATA[request=GetMap&layers=LayerA&time=${time}&bbox=-180,0,-90,90 '
+                                      'request=GetMap&layers=LayerA&bbox=-180,0,-90,90]]>')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+if __name__ == '__main__':
+    unittest.main()
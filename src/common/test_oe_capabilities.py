@@ -0,0 +1,118 @@
+#!/bin/env python
+
+# Tests for oe_capabilities.py using temporary layer fragments
+
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+import oe_capabilities
+from oe_capabilities import *
+
+class TestCapabilities(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        for name in ['LayerB_gc.xml', 'layerA_gc.xml', 'LayerC_gts.xml', 'getCapabilities.xml']:
+            fragment = open(os.path.join(self.tmp_dir, name), 'w')
+            fragment.write('<Layer>' + name + '</Layer>\n')
+            fragment.close()
+        self.filename = os.path.join(self.tmp_dir, 'getCapabilities.xml')
+
+    def test_list_fragments(self):
+        fragments = list_fragments(self.tmp_dir, '_gc.xml')
+        self.assertEqual([os.path.basename(fragment) for fragment in fragments], ['layerA_gc.xml', 'LayerB_gc.xml'])
+        self.assertEqual(len(list_fragments(self.tmp_dir, '.xml', ['getCapabilities.xml'])), 3)
+
+    def test_write_xml(self):
+        parts = ['<Capabilities>\n', Fragments(list_fragments(self.tmp_dir, '_gc.xml')), '</Capabilities>\n']
+        write_xml(self.filename, parts, compress=True)
+        expected = '<Capabilities>\n<Layer>layerA_gc.xml</Layer>\n<Layer>LayerB_gc.xml</Layer>\n</Capabilities>\n'
+        self.assertEqual(open(self.filename).read(), expected)
+        self.assertEqual(gzip.open(self.filename + '.gz').read(), expected)
+        self.assertEqual(open(self.filename + '.etag').read(), hashlib.sha1(expected).hexdigest())
+        if brotli != None:
+            self.assertEqual(brotli.decompress(open(self.filename + '.br', 'rb').read()), expected)
+        self.assertFalse([name for name in os.listdir(self.tmp_dir) if name.endswith('.' + str(os.getpid()))])
+        # The compressed copy only changes with the contents
+        compressed = open(self.filename + '.gz', 'rb').read()
+        write_xml(self.filename, parts, compress=True)
+        self.assertEqual(open(self.filename + '.gz', 'rb').read(), compressed)
+        # A stale compressed copy is removed
+        write_xml(self.filename, ['<Capabilities/>\n'])
+        self.assertFalse(os.path.exists(self.filename + '.gz'))
+
+    def test_failed_write(self):
+        write_xml(self.filename, ['<Capabilities/>\n'])
+        parts = ['<Capabilities>\n', Fragments([os.path.join(self.tmp_dir, 'missing_gc.xml')])]
+        self.assertRaises(IOError, write_xml, self.filename, parts, True)
+        self.assertEqual(open(self.filename).read(), '<Capabilities/>\n')
+        self.assertEqual(len(os.listdir(self.tmp_dir)), 5)
+
+    def test_copy_xml(self):
+        write_xml(self.filename, ['<Capabilities/>\n'], compress=True)
+        destination = os.path.join(self.tmp_dir, 'WMTSCapabilities.xml')
+        copy_xml(self.filename, destination)
+        self.assertEqual(gzip.open(destination + '.gz').read(), '<Capabilities/>\n')
+        write_xml(self.filename, ['<Capabilities></Capabilities>\n'])
+        copy_xml(self.filename, destination)
+        self.assertEqual(open(destination).read(), '<Capabilities></Capabilities>\n')
+        self.assertFalse(os.path.exists(destination + '.gz'))
+
+    def test_get_encoding(self):
+        self.assertEqual(get_encoding('gzip, deflate, br', ['br', 'gzip']), 'br')
+        self.assertEqual(get_encoding('gzip, deflate, br', ['gzip']), 'gzip')
+        self.assertEqual(get_encoding('gzip;q=1.0, br;q=0.5', ['br', 'gzip']), 'gzip')
+        self.assertEqual(get_encoding('*;q=0.1, gzip;q=0', ['br', 'gzip']), 'br')
+        self.assertEqual(get_encoding('identity', ['br', 'gzip']), None)
+        self.assertEqual(get_encoding('', ['br', 'gzip']), None)
+
+    def test_respond(self):
+        write_xml(self.filename, ['<Capabilities/>\n'], compress=True)
+        etag = open(self.filename + '.etag').read()
+        output = StringIO()
+        respond(self.filename, {'HTTP_ACCEPT_ENCODING': 'gzip'}, output)
+        headers, content = output.getvalue().split('\n\n', 1)
+        self.assertTrue('ETag: "' + etag + '-gzip"' in headers.split('\n'))
+        self.assertTrue('Content-Encoding: gzip' in headers.split('\n'))
+        self.assertEqual(content, open(self.filename + '.gz', 'rb').read())
+        output = StringIO()
+        respond(self.filename, {'HTTP_IF_NONE_MATCH': '"other", W/"' + etag + '"'}, output)
+        self.assertTrue(output.getvalue().startswith('Status: 304 Not Modified\nETag: "' + etag + '"\n'))
+        self.assertTrue(output.getvalue().endswith('\n\n'))
+        output = StringIO()
+        respond(self.filename, {'HTTP_IF_NONE_MATCH': '"other"', 'HTTP_IF_MODIFIED_SINCE': 'Fri, 31 Dec 2099 23:59:59 GMT'},
+                output)
+        self.assertTrue(output.getvalue().endswith('\n\n<Capabilities/>\n'))
+        output = StringIO()
+        respond(os.path.join(self.tmp_dir, 'missing.xml'), {}, output)
+        self.assertTrue(output.getvalue().startswith('Status: 404 Not Found\n'))
+
+    def test_respond_during_write(self):
+        write_xml(self.filename, ['<Capabilities version="1"/>\n'])
+        old_etag = open(self.filename + '.etag').read()
+        get_etag = oe_capabilities.get_etag
+        def get_etag_and_write(filename):
+            # The file is replaced right after the ETag is read.
+            etag = get_etag(filename)
+            write_xml(self.filename, ['<Capabilities version="2"/>\n'])
+            return etag
+        oe_capabilities.get_etag = get_etag_and_write
+        try:
+            output = StringIO()
+            respond(self.filename, {}, output)
+        finally:
+            oe_capabilities.get_etag = get_etag
+        # The old ETag with the new content is replaced on the next request, the reverse would be kept.
+        headers, content = output.getvalue().split('\n\n', 1)
+        self.assertTrue('ETag: "' + old_etag + '"' in headers.split('\n'))
+        self.assertEqual(content, '<Capabilities version="2"/>\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+#!/bin/env python
+
+# Tests for oe_mrf_index.py using the demo MRF
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+from oe_mrf_index import *
+
+class TestMRFIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.demo_mrf = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'demo', 'data', 'nasa-logo-jpeg.mrf')
+        self.header = read_mrf_header(self.demo_mrf)
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def test_header(self):
+        self.assertEqual(self.header.size, (2750, 2750, 3))
+        self.assertEqual(self.header.pagesize, (512, 512, 3))
+        self.assertEqual(self.header.bands, 1)
+        self.assertEqual(self.header.get_level_shapes(), [(6, 6), (3, 3), (2, 2), (1, 1)])
+        self.assertEqual(self.header.get_data_filename(), self.demo_mrf.replace('.mrf', '.pjg'))
+
+    def test_scale(self):
+        mrf_filename = os.path.join(self.tmp_dir, 'scale.mrf')
+        mrf_file = open(mrf_filename, 'w')
+        mrf_file.write(open(self.demo_mrf).read().replace('<Rsets', '<Rsets scale="3"'))
+        mrf_file.close()
+        header = read_mrf_header(mrf_filename)
+        self.assertEqual(header.scale, 3)
+        self.assertEqual(header.get_level_shapes(), [(6, 6), (2, 2), (1, 1)])
+        self.assertRaises(MRFIndexError, MRFHeader, (2750, 2750, 3), (512, 512, 3), scale=1)
+
+    def test_read_index(self):
+        index = MRFIndex(self.header.get_index_filename(), self.header)
+        self.assertEqual(index.levels, 4)
+        self.assertEqual(index.level(0).shape, (6, 6))
+        self.assertEqual(index.level(3).shape, (1, 1))
+        # All tiles must be inside the data file.
+        data_size = os.path.getsize(self.header.get_data_filename())
+        ends = index.records['offset'] + index.records['size']
+        self.assertTrue(ends.max() <= data_size, "Index points past end of data file")
+        # Vectorized lookup matches the level views.
+        records = index.lookup([0, 1, 3], [5, 2, 0], [4, 1, 0])
+        self.assertEqual(records[0], index.level(0)[5, 4])
+        self.assertEqual(records[1], index.level(1)[2, 1])
+        self.assertEqual(records[2], index.level(3)[0, 0])
+        self.assertRaises(MRFIndexError, index.lookup, 0, 6, 0)
+        index.close()
+
+    def test_create_index(self):
+        idx_filename = os.path.join(self.tmp_dir, 'test.idx')
+        index = create_index(idx_filename, self.header)
+        self.assertEqual(os.path.getsize(idx_filename), 50 * INDEX_DTYPE.itemsize)
+        index.update(numpy.array([0, 2]), numpy.array([1, 1]), numpy.array([3, 0]), [100, 200], [10, 20])
+        index.close()
+        index = MRFIndex(idx_filename, self.header)
+        self.assertEqual(tuple(index.level(0)[1, 3]), (100, 10))
+        self.assertEqual(tuple(index.level(2)[1, 0]), (200, 20))
+        self.assertEqual(index.records['size'].sum(), 30)
+        self.assertRaises(MRFIndexError, index.update, 0, 0, 0, 0, 0)
+        index.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+#!/bin/env python
+
+# Tests for oe_sigevent.py using a local HTTP server as the sigevent service
+
+import BaseHTTPServer
+import json
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+import urlparse
+from oe_sigevent import *
+
+class SigeventHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Records the messages of the requests, or fails them if the server is down"""
+
+    def do_GET(self):
+        if self.server.down:
+            self.send_response(503)
+        else:
+            query = urlparse.parse_qs(urlparse.urlparse(self.path).query)
+            self.server.messages.append((query['type'][0], query['description'][0]))
+            self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+class TestSigevent(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), SigeventHandler)
+        self.server.messages = []
+        self.server.down = False
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+        self.sigevent_url = 'http://127.0.0.1:%d/sigevent/events/create' % self.server.server_address[1]
+        logging.disable(logging.WARNING)
+
+    def get_sender(self, **options):
+        return SigeventSender(self.sigevent_url, 'TEST', spool_dir=self.tmp_dir, **options)
+
+    def put(self, sender, messages):
+        # The sender thread cannot take messages while the condition is held.
+        sender.condition.acquire()
+        try:
+            for (type, mssg) in messages:
+                sender.put(type, mssg)
+        finally:
+            sender.condition.release()
+        sender.flush()
+
+    def test_truncate(self):
+        self.assertEqual(truncate_mssg('message'), 'message')
+        self.assertEqual(truncate_mssg('x' * 256), 'x' * 256)
+        self.assertEqual(truncate_mssg('x' * 257), 'x' * 253 + '...')
+        self.assertEqual(truncate_mssg('x' * 300, ' (repeated 2 times)'), 'x' * 234 + '... (repeated 2 times)')
+
+    def test_coalesce(self):
+        sender = self.get_sender()
+        long_mssg = 'y' * 300
+        self.put(sender, [('WARN', 'tile missing'), ('ERROR', 'failed'), ('WARN', 'tile missing'),
+                          ('WARN', 'tile missing'), ('INFO', long_mssg), ('INFO', long_mssg)])
+        self.assertEqual(self.server.messages, [('WARN', 'tile missing (repeated 3 times)'),
+                                                ('ERROR', 'failed'),
+                                                ('INFO', 'y' * 234 + '... (repeated 2 times)')])
+
+    def test_queue_full(self):
+        sender = self.get_sender(queue_size=2)
+        self.put(sender, [('INFO', 'one'), ('INFO', 'two'), ('INFO', 'three'), ('INFO', 'four'), ('INFO', 'one')])
+        self.assertEqual(self.server.messages, [('INFO', 'one (repeated 2 times)'),
+                                                ('WARN', '2 sigevent messages were dropped because the queue was full'),
+                                                ('INFO', 'two')])
+
+    def test_spool(self):
+        sender = self.get_sender(retry_interval=60)
+        self.server.down = True
+        self.put(sender, [('ERROR', 'first')])
+        self.assertTrue(os.path.isfile(sender.spool_filename))
+        # The service is not contacted again until retry_interval has passed.
+        self.server.down = False
+        self.put(sender, [('ERROR', 'second')])
+        self.assertEqual(self.server.messages, [])
+        spooled = [json.loads(line)['description'] for line in open(sender.spool_filename)]
+        self.assertEqual(spooled, ['first', 'second'])
+        # Spooled messages are resent first once the service is reachable.
+        sender.retry_interval = 0
+        self.put(sender, [('INFO', 'third')])
+        self.assertEqual(self.server.messages, [('ERROR', 'first'), ('ERROR', 'second'), ('INFO', 'third')])
+        self.assertFalse(os.path.exists(sender.spool_filename))
+
+    def test_spool_size(self):
+        sender = self.get_sender(retry_interval=60, spool_size=1000, resend_count=2)
+        self.server.down = True
+        self.put(sender, [('ERROR', 'first')])
+        self.put(sender, [('INFO', 'message ' + str(count)) for count in range(20)])
+        # The oldest messages are dropped when the spool file is full.
+        self.assertTrue(os.path.getsize(sender.spool_filename) <= 1000)
+        spooled = [json.loads(line)['description'] for line in open(sender.spool_filename)]
+        self.assertEqual(spooled, ['message ' + str(count) for count in range(20 - len(spooled), 20)])
+        # Spooled messages are resent a batch at a time, oldest first.
+        self.server.down = False
+        sender.retry_interval = 0
+        self.put(sender, [('INFO', 'new')])
+        self.assertEqual(self.server.messages, [('INFO', spooled[0]), ('INFO', spooled[1]), ('INFO', 'new')])
+        self.assertEqual([json.loads(line)['description'] for line in open(sender.spool_filename)], spooled[2:])
+
+    def test_unreachable(self):
+        # A port without a server
+        unused = socket.socket()
+        unused.bind(('127.0.0.1', 0))
+        self.sigevent_url = 'http://127.0.0.1:%d/sigevent/events/create' % unused.getsockname()[1]
+        unused.close()
+        sender = self.get_sender(timeout=1)
+        self.put(sender, [('ERROR', 'lost')])
+        spooled = [json.loads(line)['description'] for line in open(sender.spool_filename)]
+        self.assertEqual(spooled, ['lost'])
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp_dir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+#!/bin/env python
+
+# Tests for oe_time_index.py using a temporary archive
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from datetime import datetime
+from oe_time_index import *
+
+class SlowTimeIndex(TimeIndex):
+    """Lists directories slowly, like a large archive on NFS"""
+
+    def list_directory(self, path):
+        time.sleep(0.1)
+        return TimeIndex.list_directory(self, path)
+
+def refresh_location(args):
+    database, location = args
+    index = SlowTimeIndex(database, timeout=1)
+    listed = index.refresh(location)
+    index.close()
+    return listed
+
+class TestTimeIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.archive = os.path.join(self.tmp_dir, 'archive')
+        for filename in ['2014/LayerA2014364_.mrf', '2014/LayerA2014364_.idx', '2014/LayerB2014365_.mrf',
+                         '2015/LayerA2015001_.mrf', '2015/LayerA2015002000000_.mrf', '2015/LayerA2015002120000_.mrf',
+                         '2015/LayerA.txt', 'LayerA2013001_.mrf']:
+            self.add_file(filename)
+        self.index = TimeIndex(os.path.join(self.tmp_dir, 'index.db'))
+
+    def add_file(self, filename):
+        path = os.path.join(self.archive, filename)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        open(path, 'w').close()
+        self.age_directories()
+
+    def age_directories(self):
+        # Directories modified just now are always listed again.
+        for dirname, dirnames, filenames in os.walk(self.archive):
+            os.utime(dirname, (time.time() - 60, time.time() - 60))
+
+    def test_file_time(self):
+        self.assertEqual(get_file_time('LayerA2015032_.mrf'), (datetime(2015, 2, 1), False))
+        self.assertEqual(get_file_time('LayerA2015032123000_.mrf'), (datetime(2015, 2, 1, 12, 30), True))
+        self.assertEqual(get_file_time('LayerA.txt'), None)
+
+    def test_times(self):
+        self.assertEqual(self.index.refresh(self.archive), 3)
+        times, subdaily = self.index.get_times(self.archive, 'LayerA')
+        self.assertEqual(times, [datetime(2013, 1, 1), datetime(2014, 12, 30), datetime(2015, 1, 1),
+                                 datetime(2015, 1, 2), datetime(2015, 1, 2, 12)])
+        self.assertTrue(subdaily)
+        times, subdaily = self.index.get_times(self.archive + '/2014/', 'LayerB')
+        self.assertEqual(times, [datetime(2014, 12, 31)])
+        self.assertFalse(subdaily)
+
+    def test_refresh(self):
+        self.index.refresh(self.archive)
+        self.index.close()
+        # Only directories that changed are listed by another process.
+        self.add_file('2015/LayerA2015003_.mrf')
+        shutil.rmtree(os.path.join(self.archive, '2014'))
+        self.age_directories()
+        index = TimeIndex(os.path.join(self.tmp_dir, 'index.db'))
+        self.assertEqual(index.refresh(self.archive), 2)
+        self.assertEqual(index.refresh(self.archive + '/2015'), 0)
+        times, subdaily = index.get_times(self.archive, 'LayerA')
+        self.assertEqual(times[0], datetime(2013, 1, 1))
+        self.assertEqual(times[1], datetime(2015, 1, 1))
+        self.assertEqual(times[-1], datetime(2015, 1, 3))
+        self.assertEqual(index.get_times(self.archive, 'LayerB'), ([], False))
+        index.close()
+
+    def test_concurrent_refresh(self):
+        # Scans of other locations take longer than the timeout, but each directory is written on its own.
+        for location in ['a', 'b']:
+            for day in range(1, 16):
+                self.add_file(os.path.join(location, str(day), 'LayerA2015%03d_.mrf' % day))
+        database = os.path.join(self.tmp_dir, 'index.db')
+        pool = multiprocessing.Pool(2)
+        listed = pool.map(refresh_location, [(database, os.path.join(self.archive, location)) for location in ['a', 'b']])
+        pool.close()
+        pool.join()
+        self.assertEqual(listed, [16, 16])
+        times, subdaily = self.index.get_times(os.path.join(self.archive, 'b'), 'LayerA')
+        self.assertEqual(times, [datetime(2015, 1, day) for day in range(1, 16)])
+        # Only the directories outside of both locations are listed again.
+        self.assertEqual(self.index.refresh(self.archive), 3)
+
+    def test_walk_times(self):
+        self.index.refresh(self.archive)
+        self.assertEqual(walk_times(self.archive, 'LayerA'), self.index.get_times(self.archive, 'LayerA'))
+        self.assertEqual(walk_times(self.archive, 'LayerC'), ([], False))
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.tmp_dir)
+
+if __name__ == '__main__':
+    unittest.main()
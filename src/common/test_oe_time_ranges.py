@@ -0,0 +1,59 @@
+#!/bin/env python
+
+# Tests for oe_time_ranges.py
+
+import unittest
+from datetime import datetime, timedelta
+from oe_time_ranges import *
+
+class TestTimeRanges(unittest.TestCase):
+
+    def test_parse_period(self):
+        self.assertEqual(parse_period('P5D'), ('S', 432000))
+        self.assertEqual(parse_period('P2W'), ('S', 1209600))
+        self.assertEqual(parse_period('P1M'), ('M', 1))
+        self.assertEqual(parse_period('P2Y'), ('M', 24))
+        self.assertEqual(parse_period('PT10M'), ('S', 600))
+        self.assertRaises(ValueError, parse_period, 'P1DT12H')
+
+    def test_daily(self):
+        times = [datetime(2000, 1, 1) + timedelta(days=day) for day in range(6000) if day not in (10, 11, 500)]
+        ranges, period = get_time_ranges(times)
+        self.assertEqual(period, 'P1D')
+        self.assertEqual(ranges, ['2000-01-01/2000-01-10/P1D', '2000-01-13/2001-05-14/P1D',
+                                  '2001-05-16/2016-06-04/P1D'])
+        # Exactly three times
+        ranges, period = get_time_ranges([datetime(2015, 1, 1), datetime(2015, 1, 9), datetime(2015, 1, 17)])
+        self.assertEqual(ranges, ['2015-01-01/2015-01-17/P8D'])
+        ranges, period = get_time_ranges([datetime(2015, 1, 1), datetime(2015, 1, 9), datetime(2015, 1, 25)])
+        self.assertEqual(ranges, ['2015-01-01/2015-01-09/P8D', '2015-01-25/2015-01-25/P8D'])
+        self.assertEqual(get_time_ranges([datetime(2015, 1, 1)]), (['2015-01-01/2015-01-01/P1D'], 'P1D'))
+
+    def test_calendar(self):
+        times = [datetime(2014, month, 1) for month in range(1, 13)] + [datetime(2015, 3, 1)]
+        self.assertEqual(get_time_ranges(times), (['2014-01-01/2014-12-01/P1M', '2015-03-01/2015-03-01/P1M'], 'P1M'))
+        times = [datetime(2014, 1, 31), datetime(2014, 2, 28), datetime(2014, 3, 28), datetime(2014, 4, 30)]
+        self.assertEqual(get_time_ranges(times, period='P1M')[0],
+                         ['2014-01-31/2014-03-28/P1M', '2014-04-30/2014-04-30/P1M'])
+        # Monthly times on the last day of the month
+        times = [datetime(2014, 1, 31), datetime(2014, 2, 28), datetime(2014, 3, 31), datetime(2014, 4, 30)]
+        self.assertEqual(get_time_ranges(times), (['2014-01-31/2014-04-30/P1M'], 'P1M'))
+        times = [datetime(2014, 1, 31), datetime(2014, 2, 28), datetime(2014, 4, 30), datetime(2014, 5, 31)]
+        self.assertEqual(get_time_ranges(times), (['2014-01-31/2014-02-28/P1M', '2014-04-30/2014-05-31/P1M'], 'P1M'))
+        # Mostly monthly, with one time off the day of the month
+        times = [datetime(2014, month, 15) for month in range(1, 7)] + [datetime(2014, 7, 20)]
+        self.assertEqual(get_time_ranges(times)[1], 'P1M')
+        times = [datetime(year, 7, 1) for year in (2010, 2011, 2012, 2014)]
+        self.assertEqual(get_time_ranges(times), (['2010-07-01/2012-07-01/P1Y', '2014-07-01/2014-07-01/P1Y'], 'P1Y'))
+
+    def test_subdaily(self):
+        times = [datetime(2015, 1, 1) + timedelta(hours=hour) for hour in range(0, 48, 3) if hour != 24]
+        ranges, period = get_time_ranges(times, True)
+        self.assertEqual(period, 'PT3H')
+        self.assertEqual(ranges, ['2015-01-01T00:00:00Z/2015-01-01T21:00:00Z/PT3H',
+                                  '2015-01-02T03:00:00Z/2015-01-02T21:00:00Z/PT3H'])
+        ranges, period = get_time_ranges(times, True, 'PT90M')
+        self.assertEqual(len(ranges), 15)
+
+if __name__ == '__main__':
+    unittest.main()
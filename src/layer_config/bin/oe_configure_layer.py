@@ -50,41 +50,51 @@
 # 2015
 
 import os
+import hashlib
+import json
+import multiprocessing
 import subprocess
 import sys
+import cPickle
 import socket
 import urllib
-import urllib2
 import xml.dom.minidom
 import logging
 import shutil
 import re
-import distutils.spawn
-from datetime import datetime, time, timedelta
+import sqlite3
+from datetime import datetime, time
 from time import asctime
-from dateutil.relativedelta import relativedelta
 from optparse import OptionParser
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'common'))
+import oe_sigevent
+from oe_cache_config import CacheConfigError, read_cache_layer, write_cache_config, write_cache_xml
+from oe_capabilities import Fragments, copy_xml, list_fragments, write_xml
+from oe_time_index import TimeIndex, walk_times
+from oe_time_ranges import get_time_ranges
 
 versionNumber = '0.6.2'
 
 class WMTSEndPoint:
     """End point data for WMTS"""
     
-    def __init__(self, path, cacheConfig, getCapabilities, projection):
+    def __init__(self, path, cacheConfig, getCapabilities, projection, serviceUrl):
         self.path = path
         self.cacheConfig = cacheConfig
         self.getCapabilities = getCapabilities
         self.projection = projection
+        self.serviceUrl = serviceUrl
         
 class TWMSEndPoint:
     """End point data for TWMS"""
     
-    def __init__(self, path, cacheConfig, getCapabilities, getTileService, projection):
+    def __init__(self, path, cacheConfig, getCapabilities, getTileService, projection, serviceUrl):
         self.path = path
         self.cacheConfig = cacheConfig
         self.getCapabilities = getCapabilities
         self.getTileService = getTileService
         self.projection = projection
+        self.serviceUrl = serviceUrl
 
 class Environment:
     """Environment information for layer(s)"""
@@ -120,45 +130,109 @@ class TileMatrixSetMeta:
         self.levels = levels
         self.scale = scale
 
+class ConfigRegistry:
+    """Parsed configuration files, keyed by path and reparsed only when the file changes"""
+    
+    def __init__(self):
+        # (parser name, path) -> ((mtime, size), parsed configuration)
+        self.entries = {}
+        # The entries parsed since the last call of take_new_entries
+        self.new_entries = {}
+        self.changed = False
+        
+    def get(self, parser, path):
+        """
+        Returns the configuration parsed from a file, parsing it on first use or when it has changed.
+        Arguments:
+            parser -- function reading the configuration from a path
+            path -- the configuration file
+        """
+        key = (parser.__name__, os.path.abspath(path))
+        try:
+            stat = os.stat(path)
+            stamp = (stat.st_mtime, stat.st_size)
+        except OSError:
+            # Let the parser report the missing file
+            return parser(path)
+        entry = self.entries.get(key)
+        if entry != None and entry[0] == stamp:
+            return entry[1]
+        value = parser(path)
+        self.entries[key] = (stamp, value)
+        self.new_entries[key] = (stamp, value)
+        self.changed = True
+        return value
+        
+    def take_new_entries(self):
+        """
+        Returns the entries parsed since the last call, e.g. to send them from a worker process.
+        """
+        new_entries = self.new_entries
+        self.new_entries = {}
+        return new_entries
+        
+    def update(self, entries):
+        """
+        Adds configurations parsed elsewhere, e.g. by a worker process.
+        Arguments:
+            entries -- the entries of another ConfigRegistry
+        """
+        self.entries.update(entries)
+        self.changed = True
+        
+    def load(self, cache_file):
+        """
+        Loads parsed configurations saved by a previous run.  A cache that cannot be read is ignored.
+        Arguments:
+            cache_file -- the cache file
+        """
+        try:
+            cache = open(cache_file, 'rb')
+            try:
+                entries = cPickle.load(cache)
+            finally:
+                cache.close()
+        except Exception, e:
+            if os.path.exists(cache_file):
+                log_info_mssg('Ignoring configuration cache ' + cache_file + ': ' + str(e))
+            return
+        if isinstance(entries, dict):
+            self.entries.update(entries)
+            log_info_mssg('Using configuration cache: ' + cache_file)
+        
+    def save(self, cache_file):
+        """
+        Saves the parsed configurations for the next run, if any were parsed in this run.
+        Arguments:
+            cache_file -- the cache file
+        """
+        if not self.changed:
+            return
+        temp_file = cache_file + '.' + str(os.getpid())
+        cache = open(temp_file, 'wb')
+        cPickle.dump(self.entries, cache, cPickle.HIGHEST_PROTOCOL)
+        cache.close()
+        os.rename(temp_file, cache_file)
+        self.changed = False
+
 warnings = []
 errors = []
+# Configuration files parsed in this run
+config_registry = ConfigRegistry()
+# Digests of remote files fetched in this run, by URL
+url_digests = {}
 
 def sigevent(type, mssg, sigevent_url):
     """
-    Send a message to sigevent service.
+    Send a message to sigevent service.  The message is sent in the
+    background by oe_sigevent.
     Arguments:
         type -- 'INFO', 'WARN', 'ERROR'
         mssg -- 'message for operations'
         sigevent_url -- Example:  'http://[host]/sigevent/events/create'
                         'http://localhost:8100/sigevent/events/create'
     """
-    # Constrain mssg to 256 characters (including '...').
-    if len(mssg) > 256:
-        mssg=str().join([mssg[0:253], '...'])
-    print str().join(['sigevent ', type, ' - ', mssg])
-    # Remove any trailing slash from URL.
-    if sigevent_url[-1] == '/':
-        sigevent_url=sigevent_url[0:len(sigevent_url)-1]
-    # Remove any question mark from URL.  It is added later.
-    if sigevent_url[-1] == '?':
-        sigevent_url=sigevent_url[0:len(sigevent_url)-1]
-    # Remove any trailing slash from URL.  (Again.)
-    if sigevent_url[-1] == '/':
-        sigevent_url=sigevent_url[0:len(sigevent_url)-1]
-    # Define sigevent parameters that get encoded into the URL.
-    data={}
-    data['type']=type
-    data['description']=mssg
-    data['computer']=socket.gethostname()
-    data['source']='ONEARTH'
-    data['format']='TEXT'
-    data['category']='ONEARTH'
-    data['provider']='GIBS'
-    # Format sigevent parameters that get encoded into the URL.
-    values=urllib.urlencode(data)
-    # Create complete URL.
-    full_url=sigevent_url+'?'+values
-    data=urllib2.urlopen(full_url)
+    oe_sigevent.sigevent(type, mssg, sigevent_url, 'ONEARTH')
 
 def log_info_mssg(mssg):
     """
@@ -193,10 +267,7 @@ def log_sig_warn(mssg, sigevent_url):
     global warnings
     warnings.append(asctime() + " " + mssg)
     # Send to sigevent.
-    try:
-        sigevent('WARN', mssg, sigevent_url)
-    except urllib2.URLError:
-        print 'sigevent service is unavailable'
+    sigevent('WARN', mssg, sigevent_url)
         
 def log_sig_err(mssg, sigevent_url):
     """
@@ -210,10 +281,7 @@ def log_sig_err(mssg, sigevent_url):
     global errors
     errors.append(asctime() + " " + mssg)
     # Send to sigevent.
-    try:
-        sigevent('ERROR', mssg, sigevent_url)
-    except urllib2.URLError:
-        print 'sigevent service is unavailable'
+    sigevent('ERROR', mssg, sigevent_url)
 
 def log_sig_exit(type, mssg, sigevent_url):
     """
@@ -226,10 +294,7 @@ def log_sig_exit(type, mssg, sigevent_url):
     # Add "Exiting" to mssg.
     mssg=str().join([mssg, '  Exiting oe_configure_layer.'])
     # Send to sigevent.
-    try:
-        sigevent(type, mssg, sigevent_url)
-    except urllib2.URLError:
-        print 'sigevent service is unavailable'
+    sigevent(type, mssg, sigevent_url)
     # Send to log.
     if type == 'INFO':
         log_info_mssg_with_timestamp(mssg)
@@ -304,7 +369,19 @@ def add_trailing_slash(directory_path):
 
 def get_environment(environmentConfig):
     """
-    Gets environment metadata from a environment configuration file.
+    Gets environment metadata from a environment configuration file and creates the staging locations.
+    Arguments:
+        environmentConfig -- the location of the projection configuration file
+    """
+    environment = config_registry.get(read_environment_config, environmentConfig)
+    for stagingLocation in [environment.wmts_dir, environment.twms_dir]:
+        if stagingLocation != None and not os.path.exists(stagingLocation):
+            os.makedirs(stagingLocation)
+    return environment
+
+def read_environment_config(environmentConfig):
+    """
+    Reads environment metadata from a environment configuration file.
     Arguments:
         environmentConfig -- the location of the projection configuration file
     """
@@ -364,14 +441,6 @@ def get_environment(environmentConfig):
         except KeyError:
             raise Exception('service is not defined in <StagingLocation>') 
     
-    if twmsStagingLocation != None:
-        add_trailing_slash(twmsStagingLocation)
-        if not os.path.exists(twmsStagingLocation):
-            os.makedirs(twmsStagingLocation)
-    if wmtsStagingLocation != None:
-        add_trailing_slash(wmtsStagingLocation)
-        if not os.path.exists(wmtsStagingLocation):
-            os.makedirs(wmtsStagingLocation)           
     try:
         legendLocation = add_trailing_slash(get_dom_tag_value(dom, 'LegendLocation'))
     except IndexError:
@@ -397,6 +466,20 @@ def get_archive(archive_root, archive_configuration):
         archive_root -- the key used for the archive
         archive_configuration -- the location of the archive configuration file
     """
+    archives = config_registry.get(read_archive_config, archive_configuration)
+    location = archives.get(archive_root.lower(), "")
+    if location == "":
+        log_sig_err('Archive "' + archive_root + '" not found in ' + archive_configuration, sigevent_url)
+    else:
+        print "Archive location: " + location + " \n"
+    return location
+
+def read_archive_config(archive_configuration):
+    """
+    Reads the archive locations from an archive configuration file into a dictionary keyed by lowercase archive ID.
+    Arguments:
+        archive_configuration -- the location of the archive configuration file
+    """
     try:
         # Open file.
         archive_config=open(archive_configuration, 'r')
@@ -405,16 +488,13 @@ def get_archive(archive_root, archive_configuration):
         mssg=str().join(['Cannot read archive configuration file:  ', archive_configuration])
         log_sig_exit('ERROR', mssg, sigevent_url)
     
-    location = ""
+    archives = {}
     dom = xml.dom.minidom.parse(archive_config)
+    archive_config.close()
     archiveElements = dom.getElementsByTagName('Archive')
     for archiveElement in archiveElements:
-        if str(archiveElement.attributes['id'].value).lower() == archive_root.lower():
-                location = archiveElement.getElementsByTagName('Location')[0].firstChild.data.strip()
-                print "Archive location: " + location + " \n"
-    if location == "":
-        log_sig_err('Archive "' + archive_root + '" not found in ' + archive_configuration, sigevent_url)
-    return location
+        archives[str(archiveElement.attributes['id'].value).lower()] = archiveElement.getElementsByTagName('Location')[0].firstChild.data.strip()
+    return archives
     
 def get_projection(projectionId, projectionConfig, lcdir, tilematrixset_configuration):
     """
@@ -423,6 +503,30 @@ def get_projection(projectionId, projectionConfig, lcdir, tilematrixset_configur
         projectionId -- the name of the projection and key used
         projectionConfig -- the location of the projection configuration file
     """
+    projections = config_registry.get(read_projection_config, projectionConfig)
+    if projectionId not in projections:
+        mssg = "Projection " + projectionId + " could not be found in projection configuration file."
+        raise Exception(mssg)
+    if projections[projectionId] == None:
+        mssg = "Projection " + projectionId + " is missing <WKT> or bounding box corners in projection configuration file."
+        raise Exception(mssg)
+    wkt, bbox, lowercorner, uppercorner = projections[projectionId]
+    
+    projection_tilematrixsets = config_registry.get(read_tilematrixset_config, tilematrixset_configuration)
+    if projectionId in projection_tilematrixsets:
+        tms_xml, tilematrixsets = projection_tilematrixsets[projectionId]
+    else:
+        tms_xml, tilematrixsets = "", {}
+    
+    return Projection(projectionId, wkt, bbox, tilematrixsets, tms_xml, lowercorner, uppercorner)
+
+def read_projection_config(projectionConfig):
+    """
+    Reads the projections of a projection configuration file into a dictionary keyed by projection ID
+    of (WKT, bounding box XML, lower corner, upper corner), or None for an incomplete projection.
+    Arguments:
+        projectionConfig -- the location of the projection configuration file
+    """
     try:
         # Open file.
         projection_config=open(projectionConfig, 'r')
@@ -432,59 +536,222 @@ def get_projection(projectionId, projectionConfig, lcdir, tilematrixset_configur
         log_sig_exit('ERROR', mssg, sigevent_url)
         
     dom = xml.dom.minidom.parse(projection_config)
-    projection = None
+    projection_config.close()
+    projections = {}
     projectionTags = dom.getElementsByTagName('Projection')
     for projectionElement in projectionTags:
-        if projectionElement.attributes['id'].value == projectionId:
+        try:
             wkt = projectionElement.getElementsByTagName('WKT')[0].firstChild.data.strip()
-            try:
-                wgsbbox = projectionElement.getElementsByTagName('WGS84BoundingBox')[0].toxml().replace("WGS84BoundingBox", "ows:WGS84BoundingBox")
-            except:
-                wgsbbox = ""
-            try:
-                boundbox = "\n         " + projectionElement.getElementsByTagName('BoundingBox')[0].toxml().replace("BoundingBox", "ows:BoundingBox")
-            except:
-                boundbox = ""
-            bbox = str(wgsbbox + boundbox).replace("LowerCorner","ows:LowerCorner").replace("UpperCorner","ows:UpperCorner")
-            # get corners...a bit messy
-            lowercorner = xml.dom.minidom.parseString("<bbox>"+str(boundbox+wgsbbox).replace("ows:", "")+"</bbox>").getElementsByTagName('LowerCorner')[0].firstChild.nodeValue.split(" ")
-            uppercorner = xml.dom.minidom.parseString("<bbox>"+str(boundbox+wgsbbox).replace("ows:", "")+"</bbox>").getElementsByTagName('UpperCorner')[0].firstChild.nodeValue.split(" ")
-            tilematrixsets = {}
-            try:
-                # Open file.
-                tilematrixsetconfig=open(tilematrixset_configuration, 'r')
-                print ('Using TileMatrixSet config: ' + tilematrixset_configuration + '\n')
-            except IOError:
-                mssg=str().join(['Cannot read TileMatrixSet configuration file:  ', tilematrixset_configuration])
-                log_sig_exit('ERROR', mssg, sigevent_url)
-            tms_dom = xml.dom.minidom.parse(tilematrixsetconfig)
-            tms_projections = tms_dom.getElementsByTagName('Projection')
-            tms_xml = ""
-            for tms_projection in tms_projections:
-                try:
-                    if tms_projection.attributes['id'].value == projectionId:
-                        tms_xml = '\n'.join(tms_projection.toxml().split('\n')[1:-1]) # remove <Projection> lines
-                        tms_xml = re.sub(r'<TileMatrixSet level="\d+">', '<TileMatrixSet>', tms_xml) # remove added level metadata
-                        tileMatrixSetElements = tms_projection.getElementsByTagName('TileMatrixSet')
-                        for tilematrixset in tileMatrixSetElements:
-                            scale_denominators = tilematrixset.getElementsByTagName("ScaleDenominator")
-                            if scale_denominators.length > 1:
-                                scale = int(round(float(scale_denominators[0].firstChild.nodeValue.strip())/float(scale_denominators[1].firstChild.nodeValue.strip())))
-                            else:
-                                scale = 2 # default to powers of 2 scale
-                            print "TileMatrixSet: " + tilematrixset.getElementsByTagName('ows:Identifier')[0].firstChild.nodeValue.strip() + " - levels: " + str(tilematrixset.getElementsByTagName("TileMatrix").length) + ", overview scale: " + str(scale)
-                            tilematrixsets[tilematrixset.getElementsByTagName('ows:Identifier')[0].firstChild.nodeValue.strip()] = TileMatrixSetMeta(tilematrixset.getElementsByTagName("TileMatrix").length, scale)
-                                
-                except KeyError, e:
-                    log_sig_exit('ERROR', 'Projection ' + projectionId + " " + str(e) + ' missing in TileMatrixSet configuration ' + tilematrixset_configuration, sigevent_url)
-                
-            projection = Projection(projectionId, wkt, bbox, tilematrixsets, tms_xml, lowercorner, uppercorner)
-    
-    if projection == None:
-        mssg = "Projection " + projectionId + " could not be found in projection configuration file."
-        raise Exception(mssg)
-    
-    return projection
+        except (IndexError, AttributeError):
+            projections[projectionElement.attributes['id'].value] = None
+            continue
+        wgsbboxElements = projectionElement.getElementsByTagName('WGS84BoundingBox')
+        boundboxElements = projectionElement.getElementsByTagName('BoundingBox')
+        if wgsbboxElements.length > 0:
+            wgsbbox = wgsbboxElements[0].toxml().replace("WGS84BoundingBox", "ows:WGS84BoundingBox")
+        else:
+            wgsbbox = ""
+        if boundboxElements.length > 0:
+            boundbox = "\n         " + boundboxElements[0].toxml().replace("BoundingBox", "ows:BoundingBox")
+        else:
+            boundbox = ""
+        bbox = str(wgsbbox + boundbox).replace("LowerCorner","ows:LowerCorner").replace("UpperCorner","ows:UpperCorner")
+        # Corners of the BoundingBox, or of the WGS84BoundingBox if there is none
+        try:
+            cornerElement = (boundboxElements.length > 0 and boundboxElements or wgsbboxElements)[0]
+            lowercorner = cornerElement.getElementsByTagName('LowerCorner')[0].firstChild.nodeValue.split(" ")
+            uppercorner = cornerElement.getElementsByTagName('UpperCorner')[0].firstChild.nodeValue.split(" ")
+        except (IndexError, AttributeError):
+            projections[projectionElement.attributes['id'].value] = None
+            continue
+        projections[projectionElement.attributes['id'].value] = (wkt, bbox, lowercorner, uppercorner)
+    return projections
+
+def read_tilematrixset_config(tilematrixset_configuration):
+    """
+    Reads the TileMatrixSets of a TileMatrixSet configuration file into a dictionary keyed by projection ID
+    of (TileMatrixSet XML, dictionary of TileMatrixSetMeta by TileMatrixSet identifier).
+    Arguments:
+        tilematrixset_configuration -- the location of the TileMatrixSet configuration file
+    """
+    try:
+        # Open file.
+        tilematrixsetconfig=open(tilematrixset_configuration, 'r')
+        print ('Using TileMatrixSet config: ' + tilematrixset_configuration + '\n')
+    except IOError:
+        mssg=str().join(['Cannot read TileMatrixSet configuration file:  ', tilematrixset_configuration])
+        log_sig_exit('ERROR', mssg, sigevent_url)
+    tms_dom = xml.dom.minidom.parse(tilematrixsetconfig)
+    tilematrixsetconfig.close()
+    projection_tilematrixsets = {}
+    tms_projections = tms_dom.getElementsByTagName('Projection')
+    for tms_projection in tms_projections:
+        try:
+            projectionId = tms_projection.attributes['id'].value
+        except KeyError, e:
+            log_sig_exit('ERROR', 'Projection ' + str(e) + ' missing in TileMatrixSet configuration ' + tilematrixset_configuration, sigevent_url)
+        tms_xml = '\n'.join(tms_projection.toxml().split('\n')[1:-1]) # remove <Projection> lines
+        tms_xml = re.sub(r'<TileMatrixSet level="\d+">', '<TileMatrixSet>', tms_xml) # remove added level metadata
+        tilematrixsets = {}
+        tileMatrixSetElements = tms_projection.getElementsByTagName('TileMatrixSet')
+        for tilematrixset in tileMatrixSetElements:
+            scale_denominators = tilematrixset.getElementsByTagName("ScaleDenominator")
+            if scale_denominators.length > 1:
+                scale = int(round(float(scale_denominators[0].firstChild.nodeValue.strip())/float(scale_denominators[1].firstChild.nodeValue.strip())))
+            else:
+                scale = 2 # default to powers of 2 scale
+            print "TileMatrixSet: " + tilematrixset.getElementsByTagName('ows:Identifier')[0].firstChild.nodeValue.strip() + " - levels: " + str(tilematrixset.getElementsByTagName("TileMatrix").length) + ", overview scale: " + str(scale)
+            tilematrixsets[tilematrixset.getElementsByTagName('ows:Identifier')[0].firstChild.nodeValue.strip()] = TileMatrixSetMeta(tilematrixset.getElementsByTagName("TileMatrix").length, scale)
+        projection_tilematrixsets[projectionId] = (tms_xml, tilematrixsets)
+    return projection_tilematrixsets
+
+def get_file_digest(path):
+    """
+    Returns the SHA-1 digest of the contents of a file.
+    Arguments:
+        path -- the file
+    """
+    digest = hashlib.sha1()
+    input_file = open(path, 'rb')
+    try:
+        while True:
+            data = input_file.read(1048576)
+            if len(data) == 0:
+                break
+            digest.update(data)
+    finally:
+        input_file.close()
+    return digest.hexdigest()
+
+def get_url_digest(url):
+    """
+    Returns the SHA-1 digest of the contents of a URL, fetched once per run.
+    Raises IOError if the URL cannot be read.
+    Arguments:
+        url -- the URL
+    """
+    if url not in url_digests:
+        digest = hashlib.sha1()
+        url_file = urllib.urlopen(url)
+        try:
+            if url_file.getcode() not in (None, 200):
+                raise IOError('HTTP status ' + str(url_file.getcode()) + ' for ' + url)
+            while True:
+                data = url_file.read(1048576)
+                if len(data) == 0:
+                    break
+                digest.update(data)
+        finally:
+            url_file.close()
+        url_digests[url] = digest.hexdigest()
+    return url_digests[url]
+
+def get_layer_hash(conf, environmentConfig, headerFileName, emptyTile, colormap, detected_times):
+    """
+    Returns a hash of everything the files of a layer are generated from: its configuration
+    files, MRF archetype, empty tile, color map, detected times and the settings of this run.
+    Returns None if the hash cannot be computed, e.g. if a remote color map cannot be fetched.
+    Arguments:
+        conf -- the layer configuration file
+        environmentConfig -- the environment configuration file
+        headerFileName -- the MRF archetype
+        emptyTile -- the empty tile file, or None
+        colormap -- the color map file or URL, or None
+        detected_times -- the detected time ranges of the layer
+    """
+    layer_hash = hashlib.sha1()
+    settings = [versionNumber, lcdir, str(configuration_time), str(legend), str(skip_empty_tiles),
+                str(no_xml), str(no_cache), str(no_twms), str(no_wmts)]
+    layer_hash.update('\n'.join(settings))
+    inputs = [conf, environmentConfig, archive_configuration, projection_configuration, tilematrixset_configuration, headerFileName,
+              lcdir+'/conf/getcapabilities_base_twms.xml', lcdir+'/conf/gettileservice_base.xml', lcdir+'/conf/getcapabilities_base_wmts.xml']
+    if emptyTile != None and (colormap == None or skip_empty_tiles == True):
+        inputs.append(emptyTile)
+    if colormap != None and os.path.isfile(colormap):
+        inputs.append(colormap)
+    elif colormap != None:
+        # A remote color map may change without its URL changing.
+        try:
+            layer_hash.update(str().join(['\n', colormap, ' ', get_url_digest(colormap)]))
+        except IOError, e:
+            log_info_mssg('Cannot read color map ' + colormap + ', the layer is not skipped: ' + str(e))
+            return None
+    for path in inputs:
+        try:
+            digest = config_registry.get(get_file_digest, path)
+        except (IOError, OSError):
+            digest = 'missing'
+        layer_hash.update(str().join(['\n', path, ' ', digest]))
+    layer_hash.update('\n' + str(colormap))
+    layer_hash.update('\n' + '\n'.join(detected_times))
+    return layer_hash.hexdigest()
+
+def read_manifest(manifest_file):
+    """
+    Returns the layers recorded in a manifest by a previous run, by configuration file.
+    A manifest that cannot be read is ignored.
+    Arguments:
+        manifest_file -- the manifest file
+    """
+    try:
+        manifest_input = open(manifest_file, 'r')
+        try:
+            layers = json.load(manifest_input)
+        finally:
+            manifest_input.close()
+    except (IOError, ValueError), e:
+        if os.path.exists(manifest_file):
+            log_info_mssg('Ignoring manifest ' + manifest_file + ': ' + str(e))
+        return {}
+    if not isinstance(layers, dict):
+        return {}
+    log_info_mssg('Using manifest: ' + manifest_file)
+    return layers
+
+def write_manifest(manifest_file, layers):
+    """
+    Writes the layers configured so far to a manifest for the next run.
+    Arguments:
+        manifest_file -- the manifest file
+        layers -- dictionary of manifest entries by configuration file
+    """
+    temp_file = manifest_file + '.' + str(os.getpid())
+    manifest_output = open(temp_file, 'w')
+    json.dump(layers, manifest_output, indent=1, sort_keys=True)
+    manifest_output.close()
+    os.rename(temp_file, manifest_file)
+
+def record_layer(conf, layer_entry):
+    """
+    Records a configured layer in the manifest and marks the end points to rebuild.
+    Arguments:
+        conf -- the layer configuration file
+        layer_entry -- the entry returned by configure_layer, None if the layer failed
+    """
+    previous = manifest.pop(conf, None)
+    if previous != None and (layer_entry == None or layer_entry['changed']):
+        changed_endpoints.update([previous['wmts'], previous['twms']])
+    if layer_entry != None:
+        if layer_entry['changed']:
+            changed_endpoints.update([layer_entry['wmts'], layer_entry['twms']])
+        if layer_entry['hash'] != None:
+            manifest[conf] = {'hash': layer_entry['hash'], 'wmts': layer_entry['wmts'],
+                              'twms': layer_entry['twms'], 'files': layer_entry['files']}
+
+def get_archive_times(location, fileNamePrefix):
+    """
+    Returns the sorted times of the MRF files of a layer in an archive location and whether any is subdaily.
+    The location is listed without the time index if the index cannot be used.
+    Arguments:
+        location -- the archive location
+        fileNamePrefix -- the prefix of the MRF files
+    """
+    try:
+        time_index.refresh(location)
+        return time_index.get_times(location, fileNamePrefix)
+    except sqlite3.OperationalError, e:
+        log_sig_err("Cannot use time index " + time_index.database + " for " + location + ": " + str(e) + " - listing all files", sigevent_url)
+        return walk_times(location, fileNamePrefix)
 
 def detect_time(time, archiveLocation, fileNamePrefix, year):
     """
@@ -500,7 +767,6 @@ def detect_time(time, archiveLocation, fileNamePrefix, year):
     time = time.upper()
     detect = "DETECT"
     period = "P1D"
-    period_value = 1 # numeric value of period
     archiveLocation = add_trailing_slash(archiveLocation)
     subdaily = False
     
@@ -511,121 +777,31 @@ def detect_time(time, archiveLocation, fileNamePrefix, year):
     
     if time == detect or time == '' or time.startswith(detect+'/P'):
     #detect everything including breaks in date
-        dates = []
-        for dirname, dirnames, filenames in os.walk(archiveLocation, followlinks=True):
-            # Print subdirectories
-            for subdirname in dirnames:
-                print "Searching:", os.path.join(dirname, subdirname)
-
-            for filename in filenames:
-                if str(filename).startswith(fileNamePrefix):
-                    filetime = filename[-12:-5]
-                    try:
-                        filedate = datetime.strptime(filetime,"%Y%j")
-                        dates.append(filedate)
-                    except ValueError:
-                        # check for subdaily time
-                        try:
-                            filetime = filename[-18:-5]
-                            filedate = datetime.strptime(filetime,"%Y%j%H%M%S")
-                            dates.append(filedate)
-                            subdaily = True
-                        except ValueError:
-                            print "Skipping", filename
-                else:
-                    print "Ignoring", filename
-        dates = sorted(list(set(dates)))
-        for testdate in dates:
-            print datetime.strftime(testdate,"%Y-%m-%dT%H:%M:%SZ")
-        # Get period, attempt to figure out period (in days) if none
+        dates, subdaily = get_archive_times(archiveLocation, fileNamePrefix)
+        print "Found " + str(len(dates)) + " dates for " + fileNamePrefix + " in " + archiveLocation
+        # Get period, detect the most common period between dates if none
+        period = None
         if time.startswith(detect+'/P'):
             period = time.split('/')[1]
-        else:
-            if len(dates) >= 3: #check if the difference between first three dates are the same
-                if subdaily == False:
-                    diff1 = abs((dates[0] - dates[1]).days)
-                    diff2 = abs((dates[1] - dates[2]).days)
-                    diff3 = abs((dates[2] - dates[3]).days)
-                    if diff1==diff2==diff3:
-                        period = "P"+str(diff1)+"D"
-                    elif 31 in [diff1, diff2, diff3]:
-                        period = "P1M"
-                    if 365 in [diff1, diff2, diff3]:
-                        period = "P1Y"
-                else:
-                    diff1 = abs((dates[0] - dates[1]))
-                    diff2 = abs((dates[1] - dates[2]))
-                    diff3 = abs((dates[2] - dates[3]))
-                    if diff1==diff2==diff3:
-                        if diff1.seconds % 3600 == 0:
-                            period = "PT"+str(diff1.seconds/3600)+"H"
-                        elif diff1.seconds % 60 == 0:
-                            period = "PT"+str(diff1.seconds/60)+"M"
-                        else:
-                            period = "PT"+str(diff1.seconds)+"S"
-            message = "No period in time configuration for " + fileNamePrefix + " - detected " + period
-            log_sig_warn(message, sigevent_url)
-        print "Using period " + str(period)
-        try:
-            if subdaily == False:
-                period_value = int(period[1:-1])
-            else:
-                period_value = int(period[2:-1])
-        except ValueError:
-            log_sig_err("Mixed period values are not supported on server: " + period, sigevent_url)
-        # Search for date ranges
         if len(dates) == 0:
             message = "No files with dates found for '" + fileNamePrefix + "' in '" + archiveLocation + "' - please check if data exists."
             log_sig_err(message, sigevent_url)
-            startdate = datetime.now() # default to now
-        else:
-            startdate = min(dates)
-            print "Start of data " + datetime.strftime(startdate,"%Y-%m-%dT%H:%M:%SZ")
-        enddate = startdate # set end date to start date for lone dates
-        for i, d in enumerate(dates):
-            # print d
-            if period[-1] == "W":
-                next_day = d + timedelta(weeks=period_value)
-            elif period[-1] == "M" and subdaily == False:
-                next_day = d + relativedelta(months=period_value)
-            elif period[-1] == "Y":
-                next_day = d + relativedelta(years=period_value)
-            elif period[-1] == "H":
-                next_day = d + relativedelta(hours=period_value)
-            elif period[-1] == "M" and subdaily == True:
-                next_day = d + relativedelta(minutes=period_value)
-            elif period[-1] == "S":
-                next_day = d + relativedelta(seconds=period_value)
-            else:
-                next_day = d + timedelta(days=period_value)
-            
+            return times
+        if period != None:
             try:
-                if dates[i+1] == next_day:
-                    enddate = next_day # set end date to next existing day
-                else: # end of range
-                    if subdaily == False:
-                        print "Break in data beginning on " + datetime.strftime(next_day,"%Y-%m-%d")
-                        start = datetime.strftime(startdate,"%Y-%m-%d")
-                        end = datetime.strftime(enddate,"%Y-%m-%d")
-                    else:
-                        print "Break in data beginning on " + datetime.strftime(next_day,"%Y-%m-%dT%H:%M:%SZ")
-                        start = datetime.strftime(startdate,"%Y-%m-%dT%H:%M:%SZ")
-                        end = datetime.strftime(enddate,"%Y-%m-%dT%H:%M:%SZ")    
-                    times.append(start+'/'+end+'/'+period)
-                    startdate = dates[i+1] # start new range loop
-                    enddate = startdate
-            except IndexError:
-                # breaks when loop completes
-                if subdaily == False:
-                    start = datetime.strftime(startdate,"%Y-%m-%d")
-                    end = datetime.strftime(enddate,"%Y-%m-%d")
-                else:
-                    start = datetime.strftime(startdate,"%Y-%m-%dT%H:%M:%SZ")
-                    end = datetime.strftime(enddate,"%Y-%m-%dT%H:%M:%SZ")                    
-                times.append(start+'/'+end+'/'+period)
-                print "End of data " + end
-                print "Time ranges: " + ", ".join(times)
-                return times
+                times, period = get_time_ranges(dates, subdaily, period)
+            except ValueError:
+                log_sig_err("Mixed period values are not supported on server: " + period, sigevent_url)
+                period = None
+        if period == None:
+            times, period = get_time_ranges(dates, subdaily)
+            message = "No period in time configuration for " + fileNamePrefix + " - detected " + period
+            log_sig_warn(message, sigevent_url)
+        print "Using period " + str(period)
+        print "Start of data " + datetime.strftime(dates[0],"%Y-%m-%dT%H:%M:%SZ")
+        print "End of data " + times[-1].split('/')[1]
+        print "Time ranges: " + ", ".join(times)
+        return times
     
     else:
         intervals = time.split('/')
@@ -682,60 +858,30 @@ def detect_time(time, archiveLocation, fileNamePrefix, year):
                 return times
                             
         if start==detect:
-            for dirname, dirnames, filenames in os.walk(archiveLocation+'/'+oldest_year, followlinks=True):
-                dates = []
-                for filename in filenames:
-                    if str(filename).startswith(fileNamePrefix):
-                        try:
-                            filetime = filename[-12:-5]
-                            filedate = datetime.strptime(filetime,"%Y%j")
-                            dates.append(filedate)
-                        except ValueError:
-                            # check for subdaily time
-                            try:
-                                filetime = filename[-18:-5]
-                                filedate = datetime.strptime(filetime,"%Y%j%H%M%S")
-                                dates.append(filedate)
-                                subdaily = True
-                            except ValueError:
-                                print "Skipping", filename
-                    else:
-                        print "Ignoring", filename
-                if len(dates) == 0:
-                    message = "No valid files with dates found for '" + fileNamePrefix + "' in '" + archiveLocation +"/"+oldest_year + "' - please check if data exists."
-                    log_sig_err(message, sigevent_url)
-                    return times
-                startdate = min(dates)
-                if subdaily == False:
-                    start = datetime.strftime(startdate,"%Y-%m-%d")
-                else:
-                    start = datetime.strftime(startdate,"%Y-%m-%dT%H:%M:%SZ")
+            dates, dates_subdaily = get_archive_times(archiveLocation+'/'+oldest_year, fileNamePrefix)
+            subdaily = subdaily or dates_subdaily
+            if len(dates) == 0:
+                message = "No valid files with dates found for '" + fileNamePrefix + "' in '" + archiveLocation +"/"+oldest_year + "' - please check if data exists."
+                log_sig_err(message, sigevent_url)
+                return times
+            startdate = dates[0]
+            if subdaily == False:
+                start = datetime.strftime(startdate,"%Y-%m-%d")
+            else:
+                start = datetime.strftime(startdate,"%Y-%m-%dT%H:%M:%SZ")
         
         if end==detect:
-            for dirname, dirnames, filenames in os.walk(archiveLocation+'/'+newest_year, followlinks=True):
-                dates = []
-                for filename in filenames:
-                    if str(filename).startswith(fileNamePrefix):
-                        try:
-                            filetime = filename[-12:-5]
-                            filedate = datetime.strptime(filetime,"%Y%j")
-                            dates.append(filedate)
-                        except ValueError:
-                            # check for subdaily time
-                            try:
-                                filetime = filename[-18:-5]
-                                filedate = datetime.strptime(filetime,"%Y%j%H%M%S")
-                                dates.append(filedate)
-                                subdaily = True
-                            except ValueError:
-                                print "Skipping", filename
-                    else:
-                        print "Ignoring", filename
-                enddate = max(dates)
-                if subdaily == False:
-                    end = datetime.strftime(enddate,"%Y-%m-%d")
-                else:
-                    end = datetime.strftime(enddate,"%Y-%m-%dT%H:%M:%SZ")
+            dates, dates_subdaily = get_archive_times(archiveLocation+'/'+newest_year, fileNamePrefix)
+            subdaily = subdaily or dates_subdaily
+            if len(dates) == 0:
+                message = "No valid files with dates found for '" + fileNamePrefix + "' in '" + archiveLocation +"/"+newest_year + "' - please check if data exists."
+                log_sig_err(message, sigevent_url)
+                return times
+            enddate = dates[-1]
+            if subdaily == False:
+                end = datetime.strftime(enddate,"%Y-%m-%d")
+            else:
+                end = datetime.strftime(enddate,"%Y-%m-%dT%H:%M:%SZ")
         
         print "Time: start="+start+" end="+end+" period="+period
         time = start+'/'+end+'/'+period
@@ -832,238 +978,89 @@ def generate_empty_tile(colormap, output, width, height):
     
     return empty_size
     
-#-------------------------------------------------------------------------------   
-
-print 'OnEarth Layer Configurator v' + versionNumber
-
-if os.environ.has_key('LCDIR') == False:
-    print 'LCDIR environment variable not set.\nLCDIR should point to your OnEarth layer_config directory.\n'
-    lcdir = os.path.abspath(os.path.dirname(__file__) + '/..')
-else:
-    lcdir = os.environ['LCDIR']
-
-usageText = 'oe_configure_layer.py --conf_file [layer_configuration_file.xml] --layer_dir [$LCDIR/layers/] --lcdir [$LCDIR] --projection_config [projection.xml] --sigevent_url [url] --time [ISO 8601] --restart_apache --no_xml --no_cache --no_twms --no_wmts --generate_legend --skip_empty_tiles'
-
-# Define command line options and args.
-parser=OptionParser(usage=usageText, version=versionNumber)
-parser.add_option('-a', '--archive_config',
-                  action='store', type='string', dest='archive_configuration',
-                  help='Full path of archive configuration file.  Default: $LCDIR/conf/archive.xml')
-parser.add_option('-c', '--conf_file',
-                  action='store', type='string', dest='layer_config_filename',
-                  help='Full path of layer configuration filename.')
-parser.add_option('-d', '--layer_dir',
-                  action='store', type='string', dest='layer_directory',
-                  help='Full path of directory containing configuration files for layers.  Default: $LCDIR/layers/')
-parser.add_option("-e", "--skip_empty_tiles",
-                  action="store_true", dest="skip_empty_tiles", 
-                  default=False, help="Do not generate empty tiles for layers using color maps in configuration.")
-parser.add_option("-g", "--generate_legend",
-                  action="store_true", dest="generate_legend", 
-                  default=False, help="Generate legends for layers using color maps in configuration.")
-parser.add_option('-l', '--lcdir',
-                  action='store', type='string', dest='lcdir',
-                  default=lcdir,
-                  help='Full path of the OnEarth Layer Configurator (layer_config) directory.  Default: $LCDIR')
-parser.add_option('-m', '--tilematrixset_config',
-                  action='store', type='string', dest='tilematrixset_configuration',
-                  help='Full path of TileMatrixSet configuration file.  Default: $LCDIR/conf/tilematrixsets.xml')
-parser.add_option("-n", "--no_twms",
-                  action="store_true", dest="no_twms", 
-                  default=False, help="Do not use configurations for Tiled-WMS")
-parser.add_option('-p', '--projection_config',
-                  action='store', type='string', dest='projection_configuration',
-                  help='Full path of projection configuration file.  Default: $LCDIR/conf/projection.xml')
-parser.add_option("-r", "--restart_apache",
-                  action="store_true", dest="restart", 
-                  default=False, help="Restart the Apache server on completion (requires sudo).")
-parser.add_option('-s', '--sigevent_url',
-                  action='store', type='string', dest='sigevent_url',
-                  default=
-                  'http://localhost:8100/sigevent/events/create',
-                  help='Default:  http://localhost:8100/sigevent/events/create')
-parser.add_option('-t', '--time',
-                  action='store', type='string', dest='time',
-                  help='ISO 8601 time(s) for single configuration file (conf_file must be specified).')
-parser.add_option("-w", "--no_wmts",
-                  action="store_true", dest="no_wmts", 
-                  default=False, help="Do not use configurations for WMTS.")
-parser.add_option("-x", "--no_xml",
-                  action="store_true", dest="no_xml", 
-                  default=False, help="Do not generate getCapabilities and getTileService XML.")
-parser.add_option("-z", "--no_cache",
-                  action="store_true", dest="no_cache", 
-                  default=False, help="Do not copy cache configuration files to cache location.")
-
-# Read command line args.
-(options, args) = parser.parse_args()
-# Configuration filename.
-configuration_filename = options.layer_config_filename
-# Command line set LCDIR.
-lcdir = options.lcdir
-# Configuration directory.
-if options.layer_directory:
-    configuration_directory = options.layer_directory
-else:
-    configuration_directory = lcdir+'/layers/'
-# No XML configurations (getCapabilities, getTileService)
-no_xml = options.no_xml
-# No cache configuration.
-no_cache = options.no_cache
-# No Tiled-WMS configuration.
-no_twms = options.no_twms
-# No WMTS configuration.
-no_wmts = options.no_wmts
-# Do restart Apache.
-restart = options.restart
-# Time for conf file.
-configuration_time = options.time
-# Generate Empty Tiles
-skip_empty_tiles = options.skip_empty_tiles
-# Generate legends
-legend = options.generate_legend
-# Projection configuration
-if options.projection_configuration:
-    projection_configuration = options.projection_configuration
-else:
-    projection_configuration = lcdir+'/conf/projection.xml'
-# TileMatrixSet configuration
-if options.tilematrixset_configuration:
-    tilematrixset_configuration = options.tilematrixset_configuration
-else:
-    tilematrixset_configuration = lcdir+'/conf/tilematrixsets.xml'
-# Archive configuration
-if options.archive_configuration:
-    archive_configuration = options.archive_configuration
-else:
-    archive_configuration = lcdir+'/conf/archive.xml'
-
-# Sigevent URL.
-sigevent_url = options.sigevent_url
-  
-print 'Using ' + lcdir + ' as $LCDIR.'
-
-if no_xml:
-    print "no_xml specified, getCapabilities and getTileService files will not be generated"
-if no_cache:
-    print "no_cache specified, cache configuration files will not be generated"
-    restart = False
-if no_xml and no_cache:
-    print "no_xml and no_cache specified, nothing to do...exiting"
-    exit()
-if no_twms and no_wmts:
-    print "no_twms and no_wmts specified, nothing to do...exiting"
-    exit()
-    
-if configuration_time:
-    if configuration_filename == None:
-        print "A configuration file must be specified with --time"
-        exit()
-    else:
-        print "Using time='" + configuration_time + "' for " + configuration_filename
-        
-# set location of tools
-if os.path.isfile(os.path.abspath(lcdir)+'/bin/oe_create_cache_config'):
-    depth = os.path.abspath(lcdir)+'/bin'
-elif distutils.spawn.find_executable('oe_create_cache_config') != None:
-    depth = distutils.spawn.find_executable('oe_create_cache_config').split('/oe_create_cache_config')[0]
-else:
-    depth = '/usr/bin' # default
-
-# Read XML configuration files.
-
-conf_files = []
-wmts_endpoints = {}
-twms_endpoints = {}
-
-if not options.layer_config_filename:
-    conf = subprocess.Popen('ls ' + configuration_directory + '/*.xml',shell=True,stdout=subprocess.PIPE,stderr=subprocess.PIPE).stdout
-    for line in conf:
-        conf_files.append(line.strip())
-else:
-    # use only the solo MRF when specified
-    conf_files.append(configuration_filename)
-    
-print 'Configuration file(s):'
-print conf_files
-if conf_files==[]:
-    mssg = 'No configuration files found.'
-    log_sig_exit('ERROR', mssg, sigevent_url)
-    
-for conf in conf_files:
-    
-    try:
-        # Open file.
-        config_file=open(conf, 'r')
-        print ('\nUsing config: ' + conf)
-    except IOError:
-        log_sig_err(str().join(['Cannot read configuration file: ', conf]), sigevent_url)
-        continue
-    else:
-        dom = xml.dom.minidom.parse(config_file)
-        
-        #Required parameters
-        try:
-            identifier = get_dom_tag_value(dom, 'Identifier')
-        except IndexError:
-            log_sig_err('Required <Identifier> element is missing in ' + conf, sigevent_url)
-            continue
-        try:
-            title = get_dom_tag_value(dom, 'Title')
-        except IndexError:
-            log_sig_err('Required <Title> element is missing in ' + conf, sigevent_url)
-            continue
-        try:
-            compression = get_dom_tag_value(dom, 'Compression')
-            compression = compression.upper()
-            if compression == "JPG":
-                compression = "JPEG"
-            if compression == "PPNG":
-                compression = "PNG"
-            if compression == "TIFF":
-                compression = "TIF"
-            if compression not in ["JPEG", "PNG", "TIF"]:
-                log_sig_err('<Compression> must be either JPEG, PNG, or TIF in ' + conf, sigevent_url)
-                continue
-        except IndexError:
-            log_sig_err('Required <Compression> element is missing in ' + conf, sigevent_url)
-            continue
-        try:
-            tilematrixset = get_dom_tag_value(dom, 'TileMatrixSet')
-        except:
-            log_sig_err('Required <TileMatrixSet> element is missing in ' + conf, sigevent_url)
-            continue
-        try:
-            emptyTileSize = int(get_dom_tag_value(dom, 'EmptyTileSize'))
-        except IndexError:
-            try:
-                emptyTileSize = ""
-                emptyTile = get_dom_tag_value(dom, 'EmptyTile')
-            except IndexError: # Required if EmptyTile is not specified
-                log_sig_err('Required <EmptyTileSize> or <EmptyTile> element is missing in ' + conf, sigevent_url)
-                continue
-        try:
-            fileNamePrefix = get_dom_tag_value(dom, 'FileNamePrefix')
-        except IndexError:
-            log_sig_err('Required <FileNamePrefix> element is missing in ' + conf, sigevent_url)
-            continue
-        try:
-            environmentConfig = get_dom_tag_value(dom, 'EnvironmentConfig')
-            try:
-                environment = get_environment(environmentConfig)
-            except Exception, e:
-                log_sig_err(str(e), sigevent_url)
-                continue
-        except IndexError:
-            log_sig_err('Required <EnvironmentConfig> element is missing in ' + conf, sigevent_url)
-            continue
-            
-        cacheConfig = environment.cache
-        wmts_getCapabilities = environment.getCapabilities_wmts
-        twms_getCapabilities = environment.getCapabilities_twms
-        getTileService = environment.getTileService
-        wmtsServiceUrl = environment.wmtsServiceUrl
-        twmsServiceUrl = environment.twmsServiceUrl
+def configure_layer(conf):
+    """
+    Configures the layer of one configuration file: writes its TWMS and WMTS MRF files,
+    legends, empty tile and layer XML, and adds its end points to wmts_endpoints and
+    twms_endpoints.  Uses the command line settings of this run.
+    Returns the manifest entry of the layer (with a hash of None if the layer failed),
+    or None if the layer failed before its end points were known.
+    Arguments:
+        conf -- the layer configuration file
+    """
+    
+    try:
+        # Open file.
+        config_file=open(conf, 'r')
+        print ('\nUsing config: ' + conf)
+    except IOError:
+        log_sig_err(str().join(['Cannot read configuration file: ', conf]), sigevent_url)
+        return
+    else:
+        dom = xml.dom.minidom.parse(config_file)
+        
+        #Required parameters
+        try:
+            identifier = get_dom_tag_value(dom, 'Identifier')
+        except IndexError:
+            log_sig_err('Required <Identifier> element is missing in ' + conf, sigevent_url)
+            return
+        try:
+            title = get_dom_tag_value(dom, 'Title')
+        except IndexError:
+            log_sig_err('Required <Title> element is missing in ' + conf, sigevent_url)
+            return
+        try:
+            compression = get_dom_tag_value(dom, 'Compression')
+            compression = compression.upper()
+            if compression == "JPG":
+                compression = "JPEG"
+            if compression == "PPNG":
+                compression = "PNG"
+            if compression == "TIFF":
+                compression = "TIF"
+            if compression not in ["JPEG", "PNG", "TIF"]:
+                log_sig_err('<Compression> must be either JPEG, PNG, or TIF in ' + conf, sigevent_url)
+                return
+        except IndexError:
+            log_sig_err('Required <Compression> element is missing in ' + conf, sigevent_url)
+            return
+        try:
+            tilematrixset = get_dom_tag_value(dom, 'TileMatrixSet')
+        except:
+            log_sig_err('Required <TileMatrixSet> element is missing in ' + conf, sigevent_url)
+            return
+        try:
+            emptyTileSize = int(get_dom_tag_value(dom, 'EmptyTileSize'))
+        except IndexError:
+            try:
+                emptyTileSize = ""
+                emptyTile = get_dom_tag_value(dom, 'EmptyTile')
+            except IndexError: # Required if EmptyTile is not specified
+                log_sig_err('Required <EmptyTileSize> or <EmptyTile> element is missing in ' + conf, sigevent_url)
+                return
+        try:
+            fileNamePrefix = get_dom_tag_value(dom, 'FileNamePrefix')
+        except IndexError:
+            log_sig_err('Required <FileNamePrefix> element is missing in ' + conf, sigevent_url)
+            return
+        try:
+            environmentConfig = get_dom_tag_value(dom, 'EnvironmentConfig')
+            try:
+                environment = get_environment(environmentConfig)
+            except Exception, e:
+                log_sig_err(str(e), sigevent_url)
+                return
+        except IndexError:
+            log_sig_err('Required <EnvironmentConfig> element is missing in ' + conf, sigevent_url)
+            return
+            
+        cacheConfig = environment.cache
+        wmts_getCapabilities = environment.getCapabilities_wmts
+        twms_getCapabilities = environment.getCapabilities_twms
+        getTileService = environment.getTileService
+        wmtsServiceUrl = environment.wmtsServiceUrl
+        twmsServiceUrl = environment.twmsServiceUrl
 
         # Optional parameters
         try:
@@ -1111,10 +1108,10 @@ for conf in conf_files:
             projection = get_projection(get_dom_tag_value(dom, 'Projection'), projection_configuration, lcdir, tilematrixset_configuration)
         except IndexError:
             log_sig_err('Required <Projection> element is missing in ' + conf, sigevent_url)
-            continue
+            return
         except Exception, e:
             log_sig_err(str(e), sigevent_url)
-            continue
+            return
         try:
             colormap = get_dom_tag_value(dom, 'ColorMap')
         except:
@@ -1146,7 +1143,7 @@ for conf in conf_files:
 
 #         if len(patterns) == 0:
 #             log_sig_err('No <Pattern> elements for TWMS found in ' + conf, sigevent_url)
-#             continue
+#             return
             
         # Time
         if configuration_time:
@@ -1171,8 +1168,8 @@ for conf in conf_files:
             # default projection dir
             twmsEndPoint = lcdir + "/twms/" + projection.id.replace(":","")
                 
-        wmts_endpoints[wmtsEndPoint] = WMTSEndPoint(wmtsEndPoint, cacheConfig, wmts_getCapabilities, projection)
-        twms_endpoints[twmsEndPoint] = TWMSEndPoint(twmsEndPoint, cacheConfig, twms_getCapabilities, getTileService, projection)
+        wmts_endpoints[wmtsEndPoint] = WMTSEndPoint(wmtsEndPoint, cacheConfig, wmts_getCapabilities, projection, wmtsServiceUrl)
+        twms_endpoints[twmsEndPoint] = TWMSEndPoint(twmsEndPoint, cacheConfig, twms_getCapabilities, getTileService, projection, twmsServiceUrl)
         
         # Close file.
         config_file.close()
@@ -1278,13 +1275,31 @@ for conf in conf_files:
         
     log_info_mssg('MRF Archetype: ' + headerFileName)
     
+    # Detect times
+    detected_times = []
+    if static == False:
+        for time in times:
+            detected_times.extend(detect_time(time, archiveLocation, fileNamePrefix, year))
+    
+    # Skip the layer if nothing it is generated from has changed since the manifest was written
+    layer_entry = {'hash': None, 'wmts': wmtsEndPoint, 'twms': twmsEndPoint, 'files': [], 'changed': True}
+    layer_hash = None
+    if manifest != None:
+        layer_hash = get_layer_hash(conf, environmentConfig, headerFileName, emptyTile, colormap, detected_times)
+        previous = manifest.get(conf)
+        if layer_hash != None and previous != None and previous['hash'] == layer_hash and previous['wmts'] == wmtsEndPoint and previous['twms'] == twmsEndPoint \
+                and len(previous['files']) > 0 and all(os.path.isfile(filename) for filename in previous['files']):
+            log_info_mssg(identifier + ' has not changed since the last run, skipping')
+            layer_entry.update({'hash': layer_hash, 'files': previous['files'], 'changed': False})
+            return layer_entry
+    
     # Modify MRF Archetype
     try:
         # Open file.
         mrf_file=open(headerFileName, 'r')
     except IOError:
         log_sig_err(str().join(['Cannot read MRF header file: ', headerFileName]), sigevent_url)
-        continue
+        return layer_entry
     else:
         mrf_dom = xml.dom.minidom.parse(mrf_file)
     
@@ -1304,12 +1319,12 @@ for conf in conf_files:
         if scale_attribute:
             if int(scale_attribute) != projection.tilematrixsets[tilematrixset].scale:
                 log_sig_err("Overview scales do not match - " + tilematrixset + ": " + str(str(projection.tilematrixsets[tilematrixset].scale)) + ", " + headerFileName + ": " + scale_attribute, sigevent_url)
-                continue
+                return layer_entry
         if projection.tilematrixsets[tilematrixset].levels > 1:
             rsets.setAttribute('scale', str(projection.tilematrixsets[tilematrixset].scale))
     except KeyError:
         log_sig_err("Invalid TileMatrixSet " + tilematrixset + " for projection " + projection.id, sigevent_url)
-        continue
+        return layer_entry
     dataFileNameElement = mrf_dom.createElement('DataFileName')
     dataFileNameElement.appendChild(mrf_dom.createTextNode(dataFileLocation))
     indexFileNameElement = mrf_dom.createElement('IndexFileName')
@@ -1366,11 +1381,9 @@ for conf in conf_files:
     # Time elements
     if static == False:
         timeElements = []
-        for time in times:
-            detected_times = detect_time(time, archiveLocation, fileNamePrefix, year)
-            for detected_time in detected_times:
-                timeElements.append(mrf_dom.createElement('Time'))
-                timeElements[-1].appendChild(mrf_dom.createTextNode(detected_time))
+        for detected_time in detected_times:
+            timeElements.append(mrf_dom.createElement('Time'))
+            timeElements[-1].appendChild(mrf_dom.createTextNode(detected_time))
         
         for timeElement in timeElements:
             twms.appendChild(timeElement)
@@ -1382,10 +1395,38 @@ for conf in conf_files:
         projectionElement.appendChild(mrf_dom.createCDATASection(projection.wkt))
         mrf_meta.appendChild(projectionElement)
     
-    if not os.path.exists(twmsEndPoint):
-        os.makedirs(twmsEndPoint)
-    if not os.path.exists(wmtsEndPoint):
-        os.makedirs(wmtsEndPoint)
+    # generate color map if requested
+    legendUrl_vertical = ''
+    legendUrl_horizontal = '' 
+    if legend == True and colormap != None:
+        legend_output = ''
+        try:
+            legend_output = environment.legend_dir + identifier
+        except:
+            message = "Legend directory has not been defined for environment with cache location: " + environment.cache
+            log_sig_err(message, sigevent_url)
+        try:
+            if environment.legendUrl != None:
+                if legend_output != '':
+                    legendUrl_vertical = generate_legend(colormap, legend_output + '_V.svg', environment.legendUrl + identifier + '_V.svg', 'vertical')
+                    legendUrl_horizontal = generate_legend(colormap, legend_output + '_H.svg', environment.legendUrl + identifier + '_H.svg', 'horizontal')
+            else:
+                message = "Legend URL has not been defined for environment with cache location: " + environment.cache
+                log_sig_err(message, sigevent_url)
+        except:
+            message = "Error generating legend for " + identifier
+            log_sig_err(message, sigevent_url)
+    
+    # Layers sharing an MRF name are configured in the same task, other tasks
+    # may create the same end point directories.
+    layer_files_lock.acquire()
+    try:
+        if not os.path.exists(twmsEndPoint):
+            os.makedirs(twmsEndPoint)
+        if not os.path.exists(wmtsEndPoint):
+            os.makedirs(wmtsEndPoint)
+    finally:
+        layer_files_lock.release()
         
     twms_mrf_filename = twmsEndPoint+'/'+mrf_base
     twms_mrf_file = open(twms_mrf_filename,'w+')
@@ -1398,6 +1439,8 @@ for conf in conf_files:
         if tilematrixset not in wmts_mrf_file.read():
             log_sig_warn(tilematrixset + " not found in existing " + wmts_mrf_filename + ". Creating new file for TileMatrixSet.", sigevent_url)
             wmts_mrf_filename = wmts_mrf_filename.split(".mrf")[0] + "_" + tilematrixset + ".mrf"
+            # The layer XML depends on the other layer, so this layer is never skipped
+            layer_hash = None
         wmts_mrf_file.close()
         
     wmts_mrf_file = open(wmts_mrf_filename,'w+')
@@ -1434,125 +1477,15 @@ for conf in conf_files:
     wmts_mrf_file.close()
     mrf_file.close()
     
+    # Read for the tile patterns and the cache configuration before another layer can replace the file
+    try:
+        cache_layer = config_registry.get(read_cache_layer, twms_mrf_filename)
+    except CacheConfigError, e:
+        log_sig_err(str(e), sigevent_url)
+        cache_layer = None
+    
     print '\n'+ twms_mrf_filename + ' configured successfully\n'
     print '\n'+ wmts_mrf_filename + ' configured successfully\n'
-
-
-    # generate color map if requested
-    legendUrl_vertical = ''
-    legendUrl_horizontal = '' 
-    if legend == True and colormap != None:
-        legend_output = ''
-        try:
-            legend_output = environment.legend_dir + identifier
-        except:
-            message = "Legend directory has not been defined for environment with cache location: " + environment.cache
-            log_sig_err(message, sigevent_url)
-        try:
-            if environment.legendUrl != None:
-                if legend_output != '':
-                    legendUrl_vertical = generate_legend(colormap, legend_output + '_V.svg', environment.legendUrl + identifier + '_V.svg', 'vertical')
-                    legendUrl_horizontal = generate_legend(colormap, legend_output + '_H.svg', environment.legendUrl + identifier + '_H.svg', 'horizontal')
-            else:
-                message = "Legend URL has not been defined for environment with cache location: " + environment.cache
-                log_sig_err(message, sigevent_url)
-        except:
-            message = "Error generating legend for " + identifier
-            log_sig_err(message, sigevent_url)
-            
-# Modify service files
-    
-
-    #getCapabilities TWMS
-    if no_twms == False and no_xml == False:
-        try:
-            # Copy and open base GetCapabilities.
-            getCapabilities_file = twmsEndPoint+'/getCapabilities.xml'
-            shutil.copyfile(lcdir+'/conf/getcapabilities_base_twms.xml', getCapabilities_file)
-            getCapabilities_base=open(getCapabilities_file, 'r+')
-        except IOError:
-            mssg=str().join(['Cannot read getcapabilities_base_twms.xml file:  ', 
-                             lcdir+'/conf/getcapabilities_base_twms.xml'])
-            log_sig_exit('ERROR', mssg, sigevent_url)
-        else:
-            lines = getCapabilities_base.readlines()
-            for idx in range(0, len(lines)):
-                if '<SRS></SRS>' in lines[idx]:
-                    lines[idx] =  lines[idx].replace('<SRS></SRS>', '<SRS>'+projection.id+'</SRS>')
-                if '<CRS></CRS>' in lines[idx]:
-                    lines[idx] =  lines[idx].replace('<CRS></CRS>', '<CRS>'+projection.id+'</CRS>')
-                if 'OnlineResource' in lines[idx]:
-                    spaces = lines[idx].index('<')
-                    onlineResource = xml.dom.minidom.parseString(lines[idx]).getElementsByTagName('OnlineResource')[0]
-                    onlineResource.attributes['xlink:href'] = twmsServiceUrl
-                    lines[idx] = (' '*spaces) + onlineResource.toprettyxml(indent=" ")
-            getCapabilities_base.seek(0)
-            getCapabilities_base.truncate()
-            getCapabilities_base.writelines(lines)
-            getCapabilities_base.close()
-    
-        #getTileService
-    if no_twms == False and no_xml == False:
-        try:
-            # Copy and open base GetTileService.
-            getTileService_file = twmsEndPoint+'/getTileService.xml'
-            shutil.copyfile(lcdir+'/conf/gettileservice_base.xml', getTileService_file)
-            getTileService_base=open(getTileService_file, 'r+')
-        except IOError:
-            mssg=str().join(['Cannot read gettileservice_base.xml file:  ', 
-                             lcdir+'/conf/gettileservice_base.xml'])
-            log_sig_exit('ERROR', mssg, sigevent_url)
-        else:
-            lines = getTileService_base.readlines()
-            for idx in range(0, len(lines)):
-                if 'BoundingBox' in lines[idx]:
-                    lines[idx] = lines[idx].replace("{minx}",projection.lowercorner[0]).replace("{miny}",projection.lowercorner[1]).replace("{maxx}",projection.uppercorner[0]).replace("{maxy}",projection.uppercorner[1])
-                if 'OnlineResource' in lines[idx]:
-                    spaces = lines[idx].index('<')
-                    onlineResource = xml.dom.minidom.parseString(lines[idx]).getElementsByTagName('OnlineResource')[0]
-                    onlineResource.attributes['xlink:href'] = twmsServiceUrl
-                    lines[idx] = (' '*spaces) + onlineResource.toprettyxml(indent=" ")
-            getTileService_base.seek(0)
-            getTileService_base.truncate()
-            getTileService_base.writelines(lines)
-            getTileService_base.close()
-    
-    #getCapabilities WMTS modify Service URL
-    if no_wmts == False and no_xml == False:
-        try:
-            # Copy and open base GetCapabilities.
-            getCapabilities_file = wmtsEndPoint+'/getCapabilities.xml'
-            shutil.copyfile(lcdir+'/conf/getcapabilities_base_wmts.xml', getCapabilities_file)
-            getCapabilities_base=open(getCapabilities_file, 'r+')
-        except IOError:
-            mssg=str().join(['Cannot read getcapabilities_base_wmts.xml file:  ', 
-                             lcdir+'/conf/getcapabilities_base_wmts.xml'])
-            log_sig_exit('ERROR', mssg, sigevent_url)
-        else:
-            lines = getCapabilities_base.readlines()
-            for idx in range(0, len(lines)):
-                if '<ows:Get' in lines[idx]:
-                    spaces = lines[idx].index('<')
-                    getUrlLine = lines[idx].replace('ows:Get','Get xmlns:xlink="http://www.w3.org/1999/xlink"').replace('>','/>')
-                    getUrl = xml.dom.minidom.parseString(getUrlLine).getElementsByTagName('Get')[0]
-                    if '1.0.0/WMTSCapabilities.xml' in lines[idx]:
-                        getUrl.attributes['xlink:href'] = wmtsServiceUrl + '1.0.0/WMTSCapabilities.xml'
-                    elif 'wmts.cgi?' in lines[idx]:
-                        getUrl.attributes['xlink:href'] = wmtsServiceUrl + 'wmts.cgi?'
-                    else:
-                        getUrl.attributes['xlink:href'] = wmtsServiceUrl
-                    lines[idx] = (' '*spaces) + getUrl.toprettyxml(indent=" ").replace('Get','ows:Get').replace(' xmlns:xlink="http://www.w3.org/1999/xlink"','').replace('/>','>')
-                if 'ServiceMetadataURL' in lines[idx]:
-                    spaces = lines[idx].index('<')
-                    serviceMetadataUrlLine = lines[idx].replace('ServiceMetadataURL','ServiceMetadataURL xmlns:xlink="http://www.w3.org/1999/xlink"')
-                    serviceMetadataUrl = xml.dom.minidom.parseString(serviceMetadataUrlLine).getElementsByTagName('ServiceMetadataURL')[0]
-                    serviceMetadataUrl.attributes['xlink:href'] = wmtsServiceUrl + '1.0.0/WMTSCapabilities.xml'
-                    lines[idx] = (' '*spaces) + serviceMetadataUrl.toprettyxml(indent=" ").replace(' xmlns:xlink="http://www.w3.org/1999/xlink"','')
-            getCapabilities_base.seek(0)
-            getCapabilities_base.truncate()
-            getCapabilities_base.writelines(lines)
-            getCapabilities_base.close()   
-            
         
     # create WMTS layer metadata for GetCapabilities
     if no_wmts == False:
@@ -1662,7 +1595,6 @@ for conf in conf_files:
         # close new file        
         layer_xml.close()
         
-        
     # create TWMS layer metadata for GetCapabilities
     if no_twms == False:
         try:
@@ -1755,36 +1687,365 @@ $Patterns</TiledGroup>"""
                 line = line.replace("$maxy",projection.uppercorner[1])
             if '$Patterns' in line:
                 patterns = ""
-                cmd = depth + '/oe_create_cache_config -p ' + twms_mrf_filename
-                try:
-                    print '\nRunning command: ' + cmd
-                    process = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                    process.wait()
-                    for output in process.stdout:
-                        patterns = patterns + output
-                except:
-                    log_sig_err("Error running command " + cmd, sigevent_url)
+                if cache_layer != None:
+                    patterns = cache_layer.get_tile_patterns()
                 line = line.replace("$Patterns",patterns)
             layer_output = layer_output + line
         layer_xml.writelines(layer_output)
         layer_xml.close()   
-             
+    
+    # Files that must exist to skip the layer in a later run
+    layer_entry['files'] = [twms_mrf_filename, wmts_mrf_filename]
+    if no_wmts == False:
+        layer_entry['files'].append(wmts_mrf_filename.replace('.mrf','.xml'))
+    if no_twms == False:
+        layer_entry['files'].extend([twms_mrf_filename.replace('.mrf','_gc.xml'), twms_mrf_filename.replace('.mrf','_gts.xml')])
+    layer_entry['hash'] = layer_hash
+    return layer_entry
+        
+def write_cache_configs(endpoint_path, config_filename, xml_filename):
+    """
+    Writes the binary and XML cache configurations of the MRF files in an end point.
+    MRF headers that were already read in this run or a cached run are not read again.
+    Arguments:
+        endpoint_path -- the end point directory with the MRF files
+        config_filename -- the binary cache configuration file
+        xml_filename -- the XML cache configuration file
+    """
+    layers = []
+    for mrf_file in sorted(os.listdir(endpoint_path)):
+        if mrf_file.endswith(".mrf"):
+            try:
+                layers.append(config_registry.get(read_cache_layer, endpoint_path+'/'+mrf_file))
+            except CacheConfigError, e:
+                log_sig_err(str(e), sigevent_url)
+    print '\nWriting cache configuration for ' + str(len(layers)) + ' MRF files: ' + config_filename
+    write_cache_config(layers, config_filename)
+    print '\nWriting cache configuration for ' + str(len(layers)) + ' MRF files: ' + xml_filename
+    write_cache_xml(layers, xml_filename)
+
+def get_conf_group(conf):
+    """
+    Returns the FileNamePrefix of a layer configuration file, which names the MRF
+    files of the layer, or the file itself if it cannot be read.
+    Arguments:
+        conf -- the layer configuration file
+    """
+    try:
+        return get_dom_tag_value(xml.dom.minidom.parse(conf), 'FileNamePrefix')
+    except Exception:
+        # configure_layer reports the error
+        return conf
+
+def configure_layer_process(confs):
+    """
+    Configures layers in a worker process, in order.  Returns the manifest entries of
+    the layers, their end points, the warnings and errors they logged, the
+    configurations parsed by the worker in this task and whether a layer stopped the run.
+    Arguments:
+        confs -- the layer configuration files
+    """
+    # Each task reports only its own end points, messages and parsed configurations.
+    wmts_endpoints.clear()
+    twms_endpoints.clear()
+    del warnings[:]
+    del errors[:]
+    config_registry.take_new_entries()
+    layer_entries = []
+    exited = False
+    try:
+        for conf in confs:
+            layer_entries.append(configure_layer(conf))
+    except SystemExit:
+        # log_sig_exit was called, the run is stopped by the main process.
+        exited = True
+    oe_sigevent.flush()
+    sys.stdout.flush()
+    return (layer_entries, wmts_endpoints, twms_endpoints, warnings, errors, config_registry.take_new_entries(), exited)
+    
+#-------------------------------------------------------------------------------   
+
+print 'OnEarth Layer Configurator v' + versionNumber
+
+if os.environ.has_key('LCDIR') == False:
+    print 'LCDIR environment variable not set.\nLCDIR should point to your OnEarth layer_config directory.\n'
+    lcdir = os.path.abspath(os.path.dirname(__file__) + '/..')
+else:
+    lcdir = os.environ['LCDIR']
+
+usageText = 'oe_configure_layer.py --conf_file [layer_configuration_file.xml] --layer_dir [$LCDIR/layers/] --lcdir [$LCDIR] --projection_config [projection.xml] --config_cache [file] --manifest [file] --time_index [file] --jobs [count] --sigevent_url [url] --time [ISO 8601] --restart_apache --no_xml --no_cache --no_twms --no_wmts --generate_legend --skip_empty_tiles'
+
+# Define command line options and args.
+parser=OptionParser(usage=usageText, version=versionNumber)
+parser.add_option('-a', '--archive_config',
+                  action='store', type='string', dest='archive_configuration',
+                  help='Full path of archive configuration file.  Default: $LCDIR/conf/archive.xml')
+parser.add_option('-c', '--conf_file',
+                  action='store', type='string', dest='layer_config_filename',
+                  help='Full path of layer configuration filename.')
+parser.add_option('-d', '--layer_dir',
+                  action='store', type='string', dest='layer_directory',
+                  help='Full path of directory containing configuration files for layers.  Default: $LCDIR/layers/')
+parser.add_option("-e", "--skip_empty_tiles",
+                  action="store_true", dest="skip_empty_tiles", 
+                  default=False, help="Do not generate empty tiles for layers using color maps in configuration.")
+parser.add_option('-f', '--manifest',
+                  action='store', type='string', dest='manifest',
+                  help='Full path of a file recording what each layer was generated from.  Layers that have not changed since the last run are not reconfigured.')
+parser.add_option("-g", "--generate_legend",
+                  action="store_true", dest="generate_legend", 
+                  default=False, help="Generate legends for layers using color maps in configuration.")
+parser.add_option('-i', '--time_index',
+                  action='store', type='string', dest='time_index',
+                  help='Full path of a SQLite database in which the times of archive files are kept between runs.  Default: index in memory for this run')
+parser.add_option('-j', '--jobs',
+                  action='store', type='int', dest='jobs', default=1,
+                  help='Number of layers configured in parallel.  Default: 1')
+parser.add_option('-k', '--config_cache',
+                  action='store', type='string', dest='config_cache',
+                  help='Full path of a file in which parsed environment, archive, projection and TileMatrixSet configurations are kept between runs.')
+parser.add_option('-l', '--lcdir',
+                  action='store', type='string', dest='lcdir',
+                  default=lcdir,
+                  help='Full path of the OnEarth Layer Configurator (layer_config) directory.  Default: $LCDIR')
+parser.add_option('-m', '--tilematrixset_config',
+                  action='store', type='string', dest='tilematrixset_configuration',
+                  help='Full path of TileMatrixSet configuration file.  Default: $LCDIR/conf/tilematrixsets.xml')
+parser.add_option("-n", "--no_twms",
+                  action="store_true", dest="no_twms", 
+                  default=False, help="Do not use configurations for Tiled-WMS")
+parser.add_option('-p', '--projection_config',
+                  action='store', type='string', dest='projection_configuration',
+                  help='Full path of projection configuration file.  Default: $LCDIR/conf/projection.xml')
+parser.add_option("-r", "--restart_apache",
+                  action="store_true", dest="restart", 
+                  default=False, help="Restart the Apache server on completion (requires sudo).")
+parser.add_option('-s', '--sigevent_url',
+                  action='store', type='string', dest='sigevent_url',
+                  default=
+                  'http://localhost:8100/sigevent/events/create',
+                  help='Default:  http://localhost:8100/sigevent/events/create')
+parser.add_option('-t', '--time',
+                  action='store', type='string', dest='time',
+                  help='ISO 8601 time(s) for single configuration file (conf_file must be specified).')
+parser.add_option("-w", "--no_wmts",
+                  action="store_true", dest="no_wmts", 
+                  default=False, help="Do not use configurations for WMTS.")
+parser.add_option("-x", "--no_xml",
+                  action="store_true", dest="no_xml", 
+                  default=False, help="Do not generate getCapabilities and getTileService XML.")
+parser.add_option("-z", "--no_cache",
+                  action="store_true", dest="no_cache", 
+                  default=False, help="Do not copy cache configuration files to cache location.")
+
+# Read command line args.
+(options, args) = parser.parse_args()
+# Configuration filename.
+configuration_filename = options.layer_config_filename
+# Command line set LCDIR.
+lcdir = options.lcdir
+# Configuration directory.
+if options.layer_directory:
+    configuration_directory = options.layer_directory
+else:
+    configuration_directory = lcdir+'/layers/'
+# No XML configurations (getCapabilities, getTileService)
+no_xml = options.no_xml
+# No cache configuration.
+no_cache = options.no_cache
+# No Tiled-WMS configuration.
+no_twms = options.no_twms
+# No WMTS configuration.
+no_wmts = options.no_wmts
+# Do restart Apache.
+restart = options.restart
+# Time for conf file.
+configuration_time = options.time
+# Generate Empty Tiles
+skip_empty_tiles = options.skip_empty_tiles
+# Generate legends
+legend = options.generate_legend
+# Projection configuration
+if options.projection_configuration:
+    projection_configuration = options.projection_configuration
+else:
+    projection_configuration = lcdir+'/conf/projection.xml'
+# TileMatrixSet configuration
+if options.tilematrixset_configuration:
+    tilematrixset_configuration = options.tilematrixset_configuration
+else:
+    tilematrixset_configuration = lcdir+'/conf/tilematrixsets.xml'
+# Archive configuration
+if options.archive_configuration:
+    archive_configuration = options.archive_configuration
+else:
+    archive_configuration = lcdir+'/conf/archive.xml'
+
+# Sigevent URL.
+sigevent_url = options.sigevent_url
+# Parsed configuration cache
+config_cache = options.config_cache
+# Layers configured in parallel
+jobs = options.jobs
+# Manifest of configured layers
+manifest_file = options.manifest
+# Times of the files in archive locations
+if options.time_index:
+    time_index = TimeIndex(options.time_index)
+else:
+    time_index = TimeIndex()
+  
+print 'Using ' + lcdir + ' as $LCDIR.'
+
+if no_xml:
+    print "no_xml specified, getCapabilities and getTileService files will not be generated"
+if no_cache:
+    print "no_cache specified, cache configuration files will not be generated"
+    restart = False
+if no_xml and no_cache:
+    print "no_xml and no_cache specified, nothing to do...exiting"
+    exit()
+if no_twms and no_wmts:
+    print "no_twms and no_wmts specified, nothing to do...exiting"
+    exit()
+if jobs < 1:
+    print "jobs must be positive...exiting"
+    exit()
+    
+if configuration_time:
+    if configuration_filename == None:
+        print "A configuration file must be specified with --time"
+        exit()
+    else:
+        print "Using time='" + configuration_time + "' for " + configuration_filename
+        
+# Read XML configuration files.
+
+if config_cache:
+    config_registry.load(config_cache)
+
+conf_files = []
+wmts_endpoints = {}
+twms_endpoints = {}
+# Layers of the previous run and the end points with changed layers, when a manifest is used
+if manifest_file:
+    manifest = read_manifest(manifest_file)
+else:
+    manifest = None
+changed_endpoints = set()
+
+if not options.layer_config_filename:
+    conf = subprocess.Popen('ls ' + configuration_directory + '/*.xml',shell=True,stdout=subprocess.PIPE,stderr=subprocess.PIPE).stdout
+    for line in conf:
+        conf_files.append(line.strip())
+else:
+    # use only the solo MRF when specified
+    conf_files.append(configuration_filename)
+    
+print 'Configuration file(s):'
+print conf_files
+if conf_files==[]:
+    mssg = 'No configuration files found.'
+    log_sig_exit('ERROR', mssg, sigevent_url)
+    
+# Configure the layers, in worker processes if there are several jobs.
+# Layers sharing an MRF name are configured in one task, in configuration file order,
+# so the WMTS MRF file of each TileMatrixSet is named as in a run with one job.
+# The end points of the tasks are combined in order of their first configuration file.
+layer_files_lock = multiprocessing.Lock()
+conf_groups = []
+if jobs > 1 and len(conf_files) > 1:
+    group_confs = {}
+    for conf in conf_files:
+        group = get_conf_group(conf)
+        if group not in group_confs:
+            group_confs[group] = []
+            conf_groups.append(group_confs[group])
+        group_confs[group].append(conf)
+if len(conf_groups) > 1:
+    pool = multiprocessing.Pool(min(jobs, len(conf_groups)))
+    results = pool.imap(configure_layer_process, conf_groups)
+    for confs in conf_groups:
+        layer_entries, layer_wmts_endpoints, layer_twms_endpoints, layer_warnings, layer_errors, layer_configs, exited = results.next()
+        if manifest != None:
+            for conf, layer_entry in zip(confs, layer_entries):
+                record_layer(conf, layer_entry)
+        wmts_endpoints.update(layer_wmts_endpoints)
+        twms_endpoints.update(layer_twms_endpoints)
+        warnings.extend(layer_warnings)
+        errors.extend(layer_errors)
+        if layer_configs:
+            config_registry.update(layer_configs)
+        if exited:
+            pool.terminate()
+            sys.exit()
+    pool.close()
+    pool.join()
+else:
+    for conf in conf_files:
+        layer_entry = configure_layer(conf)
+        if manifest != None:
+            record_layer(conf, layer_entry)
+
+# End points of layers that were removed are rebuilt
+if manifest != None and not options.layer_config_filename:
+    for conf in manifest.keys():
+        if conf not in conf_files:
+            record_layer(conf, None)
         
 # run scripts
 
 if no_twms == False:
     for key, twms_endpoint in twms_endpoints.iteritems():
         #twms
+        if manifest != None and key not in changed_endpoints and os.path.isfile(twms_endpoint.path+'/cache.config'):
+            print "\nNo changed layers for endpoint: " + twms_endpoint.path
+            continue
         print "\nRunning commands for endpoint: " + twms_endpoint.path
-        mrfs = ""
-        # get list of MRF files
-        for mrf_file in os.listdir(twms_endpoint.path):
-            if mrf_file.endswith(".mrf"):
-                mrfs = mrfs + twms_endpoint.path+'/'+mrf_file + ' '
-        cmd = depth + '/oe_create_cache_config -cb '+ mrfs + " " + twms_endpoint.path+'/cache.config'
-        run_command(cmd, sigevent_url)
-        cmd = depth + '/oe_create_cache_config -cx '+ mrfs + " " + twms_endpoint.path+'/cache.xml'
-        run_command(cmd, sigevent_url)
+        if no_xml == False:
+            #getCapabilities TWMS
+            try:
+                # Open base GetCapabilities.
+                getCapabilities_base=open(lcdir+'/conf/getcapabilities_base_twms.xml', 'r')
+            except IOError:
+                mssg=str().join(['Cannot read getcapabilities_base_twms.xml file:  ', 
+                                 lcdir+'/conf/getcapabilities_base_twms.xml'])
+                log_sig_exit('ERROR', mssg, sigevent_url)
+            else:
+                lines = getCapabilities_base.readlines()
+                getCapabilities_base.close()
+                for idx in range(0, len(lines)):
+                    if '<SRS></SRS>' in lines[idx]:
+                        lines[idx] =  lines[idx].replace('<SRS></SRS>', '<SRS>'+twms_endpoint.projection.id+'</SRS>')
+                    if '<CRS></CRS>' in lines[idx]:
+                        lines[idx] =  lines[idx].replace('<CRS></CRS>', '<CRS>'+twms_endpoint.projection.id+'</CRS>')
+                    if 'OnlineResource' in lines[idx]:
+                        spaces = lines[idx].index('<')
+                        onlineResource = xml.dom.minidom.parseString(lines[idx]).getElementsByTagName('OnlineResource')[0]
+                        onlineResource.attributes['xlink:href'] = twms_endpoint.serviceUrl
+                        lines[idx] = (' '*spaces) + onlineResource.toprettyxml(indent=" ")
+                getCapabilities_lines = lines
+            #getTileService
+            try:
+                # Open base GetTileService.
+                getTileService_base=open(lcdir+'/conf/gettileservice_base.xml', 'r')
+            except IOError:
+                mssg=str().join(['Cannot read gettileservice_base.xml file:  ', 
+                                 lcdir+'/conf/gettileservice_base.xml'])
+                log_sig_exit('ERROR', mssg, sigevent_url)
+            else:
+                lines = getTileService_base.readlines()
+                getTileService_base.close()
+                for idx in range(0, len(lines)):
+                    if 'BoundingBox' in lines[idx]:
+                        lines[idx] = lines[idx].replace("{minx}",twms_endpoint.projection.lowercorner[0]).replace("{miny}",twms_endpoint.projection.lowercorner[1]).replace("{maxx}",twms_endpoint.projection.uppercorner[0]).replace("{maxy}",twms_endpoint.projection.uppercorner[1])
+                    if 'OnlineResource' in lines[idx]:
+                        spaces = lines[idx].index('<')
+                        onlineResource = xml.dom.minidom.parseString(lines[idx]).getElementsByTagName('OnlineResource')[0]
+                        onlineResource.attributes['xlink:href'] = twms_endpoint.serviceUrl
+                        lines[idx] = (' '*spaces) + onlineResource.toprettyxml(indent=" ")
+                getTileService_lines = lines
+        write_cache_configs(twms_endpoint.path, twms_endpoint.path+'/cache.config', twms_endpoint.path+'/cache.xml')
         if no_cache == False:
             if twms_endpoint.cacheConfig:
                 print '\nCopying: ' + twms_endpoint.path+'/cache.config' + ' -> ' + twms_endpoint.cacheConfig+'/cache.config'
@@ -1792,60 +2053,79 @@ if no_twms == False:
                 print '\nCopying: ' + twms_endpoint.path+'/cache.xml' + ' -> ' + twms_endpoint.cacheConfig+'/cache.xml'
                 shutil.copyfile(twms_endpoint.path+'/cache.xml', twms_endpoint.cacheConfig+'/cache.xml')
         if no_xml == False:
+            # Add layer metadata to getCapabilities
+            getCapabilities_parts = []
             if twms_endpoint.getCapabilities:
-                # Add layer metadata to getCapabilities
-                layer_xml = ""
-                for xml_file in sorted(os.listdir(twms_endpoint.path), key=lambda s: s.lower()):
-                    if xml_file.endswith("_gc.xml") and xml_file != "getCapabilities.xml":
-                        layer_xml = layer_xml + open(twms_endpoint.path+'/'+str(xml_file), 'r').read()
-                getCapabilities_file = twms_endpoint.path+'/getCapabilities.xml'
-                getCapabilities_base = open(getCapabilities_file, 'r+')
-                gc_lines = getCapabilities_base.readlines()
-                for idx in range(0, len(gc_lines)):
-                    if "</Layer>" in gc_lines[idx]:
-                        gc_lines[idx] = layer_xml + gc_lines[idx]
+                layer_xml = Fragments(list_fragments(twms_endpoint.path, "_gc.xml", ["getCapabilities.xml"]))
+                for line in getCapabilities_lines:
+                    if "</Layer>" in line:
+                        getCapabilities_parts.append(layer_xml)
                         print '\nAdding layers to TWMS GetCapabilities'
-                    getCapabilities_base.seek(0)
-                    getCapabilities_base.truncate()
-                    getCapabilities_base.writelines(gc_lines)        
-                getCapabilities_base.close()
-                
-                print '\nCopying: ' + twms_endpoint.path+'/getCapabilities.xml' + ' -> ' + twms_endpoint.getCapabilities+'/getCapabilities.xml'
-                shutil.copyfile(twms_endpoint.path+'/getCapabilities.xml', twms_endpoint.getCapabilities+'/getCapabilities.xml')
+                    getCapabilities_parts.append(line)
+            else:
+                getCapabilities_parts = getCapabilities_lines
+            getCapabilities_file = twms_endpoint.path+'/getCapabilities.xml'
+            write_xml(getCapabilities_file, getCapabilities_parts, compress=True)
+            if twms_endpoint.getCapabilities:
+                print '\nCopying: ' + getCapabilities_file + ' -> ' + twms_endpoint.getCapabilities+'/getCapabilities.xml'
+                copy_xml(getCapabilities_file, twms_endpoint.getCapabilities+'/getCapabilities.xml')
                 
+            # Add layer metadata to getTileService
+            getTileService_parts = []
             if twms_endpoint.getTileService:
-                # Add layer metadata to getTileService
-                layer_xml = ""
-                for xml_file in sorted(os.listdir(twms_endpoint.path), key=lambda s: s.lower()):
-                    if xml_file.endswith("_gts.xml") and xml_file != "getTileService.xml":
-                        layer_xml = layer_xml + open(twms_endpoint.path+'/'+str(xml_file), 'r').read()
-                getTileService_file = twms_endpoint.path+'/getTileService.xml'
-                getTileService_base = open(getTileService_file, 'r+')
-                gc_lines = getTileService_base.readlines()
-                for idx in range(0, len(gc_lines)):
-                    if "</TiledPatterns>" in gc_lines[idx]:
-                        gc_lines[idx] = layer_xml + gc_lines[idx]
+                layer_xml = Fragments(list_fragments(twms_endpoint.path, "_gts.xml", ["getTileService.xml"]))
+                for line in getTileService_lines:
+                    if "</TiledPatterns>" in line:
+                        getTileService_parts.append(layer_xml)
                         print '\nAdding layers to TWMS GetTileService'
-                    getTileService_base.seek(0)
-                    getTileService_base.truncate()
-                    getTileService_base.writelines(gc_lines)        
-                getTileService_base.close()                
-                print '\nCopying: ' + twms_endpoint.path+'/getTileService.xml' + ' -> ' + twms_endpoint.getTileService+'/getTileService.xml'
-                shutil.copyfile(twms_endpoint.path+'/getTileService.xml', twms_endpoint.getTileService+'/getTileService.xml')
+                    getTileService_parts.append(line)
+            else:
+                getTileService_parts = getTileService_lines
+            getTileService_file = twms_endpoint.path+'/getTileService.xml'
+            write_xml(getTileService_file, getTileService_parts, compress=True)
+            if twms_endpoint.getTileService:
+                print '\nCopying: ' + getTileService_file + ' -> ' + twms_endpoint.getTileService+'/getTileService.xml'
+                copy_xml(getTileService_file, twms_endpoint.getTileService+'/getTileService.xml')
 
 if no_wmts == False:
     for key, wmts_endpoint in wmts_endpoints.iteritems():
         #wmts
+        if manifest != None and key not in changed_endpoints and os.path.isfile(wmts_endpoint.path+'/cache_wmts.config'):
+            print "\nNo changed layers for endpoint: " + wmts_endpoint.path
+            continue
         print "\nRunning commands for endpoint: " + wmts_endpoint.path
-        mrfs = ""
-        # get list of MRF files
-        for mrf_file in os.listdir(wmts_endpoint.path):
-            if mrf_file.endswith(".mrf"):
-                mrfs = mrfs + wmts_endpoint.path+'/'+mrf_file + ' '
-        cmd = depth + '/oe_create_cache_config -cb '+ mrfs + " " + wmts_endpoint.path+'/cache_wmts.config'
-        run_command(cmd, sigevent_url)
-        cmd = depth + '/oe_create_cache_config -cx '+ mrfs + " " + wmts_endpoint.path+'/cache_wmts.xml'
-        run_command(cmd, sigevent_url)
+        if no_xml == False:
+            #getCapabilities WMTS modify Service URL
+            try:
+                # Open base GetCapabilities.
+                getCapabilities_base=open(lcdir+'/conf/getcapabilities_base_wmts.xml', 'r')
+            except IOError:
+                mssg=str().join(['Cannot read getcapabilities_base_wmts.xml file:  ', 
+                                 lcdir+'/conf/getcapabilities_base_wmts.xml'])
+                log_sig_exit('ERROR', mssg, sigevent_url)
+            else:
+                lines = getCapabilities_base.readlines()
+                getCapabilities_base.close()
+                for idx in range(0, len(lines)):
+                    if '<ows:Get' in lines[idx]:
+                        spaces = lines[idx].index('<')
+                        getUrlLine = lines[idx].replace('ows:Get','Get xmlns:xlink="http://www.w3.org/1999/xlink"').replace('>','/>')
+                        getUrl = xml.dom.minidom.parseString(getUrlLine).getElementsByTagName('Get')[0]
+                        if '1.0.0/WMTSCapabilities.xml' in lines[idx]:
+                            getUrl.attributes['xlink:href'] = wmts_endpoint.serviceUrl + '1.0.0/WMTSCapabilities.xml'
+                        elif 'wmts.cgi?' in lines[idx]:
+                            getUrl.attributes['xlink:href'] = wmts_endpoint.serviceUrl + 'wmts.cgi?'
+                        else:
+                            getUrl.attributes['xlink:href'] = wmts_endpoint.serviceUrl
+                        lines[idx] = (' '*spaces) + getUrl.toprettyxml(indent=" ").replace('Get','ows:Get').replace(' xmlns:xlink="http://www.w3.org/1999/xlink"','').replace('/>','>')
+                    if 'ServiceMetadataURL' in lines[idx]:
+                        spaces = lines[idx].index('<')
+                        serviceMetadataUrlLine = lines[idx].replace('ServiceMetadataURL','ServiceMetadataURL xmlns:xlink="http://www.w3.org/1999/xlink"')
+                        serviceMetadataUrl = xml.dom.minidom.parseString(serviceMetadataUrlLine).getElementsByTagName('ServiceMetadataURL')[0]
+                        serviceMetadataUrl.attributes['xlink:href'] = wmts_endpoint.serviceUrl + '1.0.0/WMTSCapabilities.xml'
+                        lines[idx] = (' '*spaces) + serviceMetadataUrl.toprettyxml(indent=" ").replace(' xmlns:xlink="http://www.w3.org/1999/xlink"','')
+                getCapabilities_lines = lines
+        write_cache_configs(wmts_endpoint.path, wmts_endpoint.path+'/cache_wmts.config', wmts_endpoint.path+'/cache_wmts.xml')
         if no_cache == False:
             if wmts_endpoint.cacheConfig:
                 print '\nCopying: ' + wmts_endpoint.path+'/cache_wmts.config' + ' -> ' + wmts_endpoint.cacheConfig+'/cache_wmts.config'
@@ -1853,33 +2133,41 @@ if no_wmts == False:
                 print '\nCopying: ' + wmts_endpoint.path+'/cache_wmts.xml' + ' -> ' + wmts_endpoint.cacheConfig+'/cache_wmts.xml'
                 shutil.copyfile(wmts_endpoint.path+'/cache_wmts.xml', wmts_endpoint.cacheConfig+'/cache_wmts.xml')
         if no_xml == False:
+            # Add layer metadata to getCapabilities
+            getCapabilities_parts = []
             if wmts_endpoint.getCapabilities:
-                # Add layer metadata to getCapabilities
-                layer_xml = ""
-                for xml_file in sorted(os.listdir(wmts_endpoint.path), key=lambda s: s.lower()):
-                    if xml_file.endswith(".xml") and xml_file != "getCapabilities.xml" and xml_file != "cache_wmts.xml":
-                        layer_xml = layer_xml + open(wmts_endpoint.path+'/'+str(xml_file), 'r').read()
-                getCapabilities_file = wmts_endpoint.path+'/getCapabilities.xml'
-                getCapabilities_base = open(getCapabilities_file, 'r+')
-                gc_lines = getCapabilities_base.readlines()
-                for idx in range(0, len(gc_lines)):
-                    if "<Contents>" in gc_lines[idx]:
-                        gc_lines[idx] = gc_lines[idx] + layer_xml
-                        print '\nAdding layers to WMTS GetCapabilities'
-                    if "</Contents>" in gc_lines[idx] and " </TileMatrixSet>" not in gc_lines[idx-1]:
-                        gc_lines[idx] = wmts_endpoint.projection.tilematrixset_xml[2:] + '\n' + gc_lines[idx]
+                layer_xml = Fragments(list_fragments(wmts_endpoint.path, ".xml", ["getCapabilities.xml", "cache_wmts.xml"]))
+                for idx in range(0, len(getCapabilities_lines)):
+                    # Layers end with </Layer>, so only TileMatrixSets already in the base are found
+                    if "</Contents>" in getCapabilities_lines[idx] and " </TileMatrixSet>" not in getCapabilities_lines[idx-1]:
+                        getCapabilities_parts.append(wmts_endpoint.projection.tilematrixset_xml[2:] + '\n')
                         print "\nAdding TileMatrixSet to WMTS GetCapabilities"
-                    getCapabilities_base.seek(0)
-                    getCapabilities_base.truncate()
-                    getCapabilities_base.writelines(gc_lines)        
-                getCapabilities_base.close()
-                
+                    getCapabilities_parts.append(getCapabilities_lines[idx])
+                    if "<Contents>" in getCapabilities_lines[idx]:
+                        getCapabilities_parts.append(layer_xml)
+                        print '\nAdding layers to WMTS GetCapabilities'
+            else:
+                getCapabilities_parts = getCapabilities_lines
+            getCapabilities_file = wmts_endpoint.path+'/getCapabilities.xml'
+            write_xml(getCapabilities_file, getCapabilities_parts, compress=True)
+            if wmts_endpoint.getCapabilities:
                 print '\nCopying: ' + getCapabilities_file + ' -> ' + wmts_endpoint.getCapabilities+'/getCapabilities.xml'
-                shutil.copyfile(getCapabilities_file, wmts_endpoint.getCapabilities+'/getCapabilities.xml')
+                copy_xml(getCapabilities_file, wmts_endpoint.getCapabilities+'/getCapabilities.xml')
                 if not os.path.exists(wmts_endpoint.getCapabilities +'1.0.0/'):
                     os.makedirs(wmts_endpoint.getCapabilities +'1.0.0')
                 print '\nCopying: ' + getCapabilities_file + ' -> ' + wmts_endpoint.getCapabilities + '/1.0.0/WMTSCapabilities.xml'
-                shutil.copyfile(getCapabilities_file, wmts_endpoint.getCapabilities + '/1.0.0/WMTSCapabilities.xml')
+                copy_xml(getCapabilities_file, wmts_endpoint.getCapabilities + '/1.0.0/WMTSCapabilities.xml')
+
+if config_cache:
+    try:
+        config_registry.save(config_cache)
+    except (IOError, OSError, cPickle.PicklingError), e:
+        log_sig_warn('Cannot save configuration cache ' + config_cache + ': ' + str(e), sigevent_url)
+if manifest_file:
+    try:
+        write_manifest(manifest_file, manifest)
+    except (IOError, OSError), e:
+        log_sig_warn('Cannot save manifest ' + manifest_file + ': ' + str(e), sigevent_url)
 
 print '\n*** Layers have been configured successfully ***'
 if no_cache == False:
@@ -1916,10 +2204,7 @@ if len(warnings) == 0 and len(errors) == 0:
 print ""
 message = message + " " + ("Cache configurations created.", "No cache configurations.")[no_cache] + " " + ("Server XML created","No server XML")[no_xml] + "." + " " + ("Apache not restarted","Apache restarted")[restart] + "." + " " + ("Legends not generated","Legends generated")[legend] + "." + " Warnings: " + str(len(warnings)) + ". Errors: " + str(len(errors)) + "." 
 
-try:
-    sigevent('INFO', asctime() + " " + message, sigevent_url)
-except urllib2.URLError:
-    print 'sigevent service is unavailable'
+sigevent('INFO', asctime() + " " + message, sigevent_url)
 print 'Exiting oe_configure_layer.'
 
 if len(errors) > 0:
@@ -37,12 +37,13 @@
 
 from optparse import OptionParser
 import logging
+import os
 import sys
 import time
-import socket
 import urllib
-import urllib2
 import xml.dom.minidom
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import oe_sigevent
 
 versionNumber = '0.3.0'
     
@@ -69,40 +70,15 @@ def hex_to_rgb(value):
 
 def sigevent(type, mssg, sigevent_url):
     """
-    Send a message to sigevent service.
+    Send a message to sigevent service.  The message is sent in the
+    background by oe_sigevent.
     Arguments:
         type -- 'INFO', 'WARN', 'ERROR'
         mssg -- 'message for operations'
         sigevent_url -- Example:  'http://[host]/sigevent/events/create'
                         'http://localhost:8100/sigevent/events/create'
     """
-    # Constrain mssg to 256 characters (including '...').
-    if len(mssg) > 256:
-        mssg=str().join([mssg[0:253], '...'])
-    print str().join(['sigevent ', type, ' - ', mssg])
-    # Remove any trailing slash from URL.
-    if sigevent_url[-1] == '/':
-        sigevent_url=sigevent_url[0:len(sigevent_url)-1]
-    # Remove any question mark from URL.  It is added later.
-    if sigevent_url[-1] == '?':
-        sigevent_url=sigevent_url[0:len(sigevent_url)-1]
-    # Remove any trailing slash from URL.  (Again.)
-    if sigevent_url[-1] == '/':
-        sigevent_url=sigevent_url[0:len(sigevent_url)-1]
-    # Define sigevent parameters that get encoded into the URL.
-    data={}
-    data['type']=type
-    data['description']=mssg
-    data['computer']=socket.gethostname()
-    data['source']='ONEARTH'
-    data['format']='TEXT'
-    data['category']='MRFGEN'
-    data['provider']='GIBS'
-    # Format sigevent parameters that get encoded into the URL.
-    values=urllib.urlencode(data)
-    # Create complete URL.
-    full_url=sigevent_url+'?'+values
-    data=urllib2.urlopen(full_url)
+    oe_sigevent.sigevent(type, mssg, sigevent_url, 'MRFGEN')
 
 def log_info_mssg(mssg):
     """
@@ -136,10 +112,7 @@ def log_sig_warn(mssg, sigevent_url):
     logging.warning(time.asctime())
     logging.warning(mssg)
     # Send to sigevent.
-    try:
-        sent=sigevent('WARN', mssg, sigevent_url)
-    except urllib2.URLError:
-        print 'sigevent service is unavailable'
+    sigevent('WARN', mssg, sigevent_url)
 
 def log_sig_exit(type, mssg, sigevent_url):
     """
@@ -152,10 +125,7 @@ def log_sig_exit(type, mssg, sigevent_url):
     # Add "Exiting" to mssg.
     mssg=str().join([mssg, '  Exiting colormap2vrt.'])
     # Send to sigevent.
-    try:
-        sent=sigevent(type, mssg, sigevent_url)
-    except urllib2.URLError:
-        print 'sigevent service is unavailable'
+    sigevent(type, mssg, sigevent_url)
     # Send to log.
     if type == 'INFO':
         log_info_mssg_with_timestamp(mssg)
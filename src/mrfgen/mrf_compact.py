@@ -0,0 +1,304 @@
+#!/bin/env python
+
+# Copyright (c) 2002-2015, California Institute of Technology.
+# All rights reserved.  Based on Government Sponsored Research under contracts NAS7-1407 and/or NAS7-03001.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+#   1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+#   2. Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#   3. Neither the name of the California Institute of Technology (Caltech), its operating division the Jet Propulsion Laboratory (JPL),
+#      the National Aeronautics and Space Administration (NASA), nor the names of its contributors may be used to
+#      endorse or promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE CALIFORNIA INSTITUTE OF TECHNOLOGY BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+#
+# Tool for compacting the data file of an MRF.
+#
+# Tiles replaced by mrf_insert stay in the data file, and many tiles (e.g.
+# ocean or nodata) are byte-identical.  This tool copies only the tiles that
+# are referenced by the index into a new data file, in index order, and
+# stores identical tiles once so that several index records point to them.
+#
+# The start of the data file, before the first referenced tile, is kept as
+# is.  mrfgen seeds it with the empty tile that the server uses for missing
+# tiles.  Use --empty_tile_size if the seeded empty tile is also referenced.
+#
+# The new data and index files are written next to the originals and then
+# renamed over them, data file first.  The two files cannot be replaced at
+# once, and mod_onearth finds them by name (from the patterns in
+# cache.config, not from the MRF header), so the MRF must not be served while
+# it is compacted.  This is a checked precondition: --offline must be given,
+# no other process may have the data or index file open, and an exclusive
+# lock on the MRF header keeps two compactions of the same MRF apart.
+#
+# Example:
+#
+#  mrf_compact.py -i MODIS_Aqua_Aerosol2014001_.mrf --offline
+#
+# Global Imagery Browse Services
+# NASA Jet Propulsion Laboratory
+# 2015
+
+from optparse import OptionParser
+import errno
+import fcntl
+import hashlib
+import os
+import sys
+import numpy
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from oe_mrf_index import read_mrf_header, MRFIndex, MRFIndexError, INDEX_DTYPE
+
+versionNumber = '0.1.0'
+
+# Bytes copied per read when preserving the start of the data file.
+COPY_BUFFER_SIZE = 1048576
+
+
+class MRFCompactError(Exception):
+    """Error raised when an MRF cannot safely be compacted"""
+    pass
+
+
+def get_open_pids(filenames):
+    """
+    Return the ids of the other processes that have any of the files open,
+    from the file descriptors in /proc.
+    Arguments:
+        filenames -- list of files to look for
+    """
+    if not os.path.isdir('/proc/self/fd'):
+        raise MRFCompactError('Cannot check for open files without /proc')
+    files = set()
+    for filename in filenames:
+        if os.path.exists(filename):
+            stat = os.stat(filename)
+            files.add((stat.st_dev, stat.st_ino))
+    pids = []
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit() or int(pid) == os.getpid():
+            continue
+        fd_dir = os.path.join('/proc', pid, 'fd')
+        try:
+            fds = os.listdir(fd_dir)
+        except OSError:
+            # Process of another user, or that has exited
+            continue
+        for fd in fds:
+            try:
+                stat = os.stat(os.path.join(fd_dir, fd))
+            except OSError:
+                continue
+            if (stat.st_dev, stat.st_ino) in files:
+                pids.append(int(pid))
+                break
+    return pids
+
+
+def lock_mrf(mrf_filename):
+    """
+    Take an exclusive lock on an MRF header, without waiting.  Returns the
+    open header file, which holds the lock until it is closed.
+    Arguments:
+        mrf_filename -- the MRF header (.mrf)
+    """
+    lock_file = open(mrf_filename, 'r')
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except IOError, e:
+        lock_file.close()
+        if e.errno in (errno.EAGAIN, errno.EACCES):
+            raise MRFCompactError(mrf_filename + ' is locked by another mrf_compact')
+        raise
+    return lock_file
+
+
+def copy_bytes(source, destination, length):
+    """
+    Copy length bytes from the current position of one file to another.
+    Arguments:
+        source -- file to read from
+        destination -- file to write to
+        length -- number of bytes to copy
+    """
+    while length > 0:
+        data = source.read(min(length, COPY_BUFFER_SIZE))
+        if len(data) == 0:
+            raise IOError('Unexpected end of file in ' + source.name)
+        destination.write(data)
+        length -= len(data)
+
+
+def compact_mrf(mrf_filename, data_filename=None, empty_tile_size=None, dedup=True, dry_run=False, offline=False):
+    """
+    Rewrite the data and index files of an MRF with only live tiles.
+    Returns a dictionary of statistics.  Unless dry_run is set, the MRF must
+    be offline: no other process may have its data or index file open.
+    Arguments:
+        mrf_filename -- the MRF header (.mrf)
+        data_filename -- the data file, by default derived from the header
+        empty_tile_size -- bytes to keep at the start of the data file,
+                           by default everything before the first tile
+        dedup -- store byte-identical tiles only once
+        dry_run -- compute statistics without replacing any files
+        offline -- confirms that the MRF is not being served, required unless dry_run
+    """
+    header = read_mrf_header(mrf_filename)
+    idx_filename = header.get_index_filename()
+    if data_filename == None:
+        data_filename = header.get_data_filename()
+    lock_file = None
+    if not dry_run:
+        if not offline:
+            raise MRFCompactError('The data and index files cannot be replaced at once, ' +
+                                  'take ' + mrf_filename + ' offline and confirm with --offline')
+        lock_file = lock_mrf(mrf_filename)
+    try:
+        if not dry_run:
+            pids = get_open_pids([data_filename, idx_filename])
+            if len(pids) > 0:
+                raise MRFCompactError(str().join([data_filename, ' or ', idx_filename, ' is open in process ',
+                                                  ', '.join([str(pid) for pid in sorted(pids)])]))
+        return compact_files(header, data_filename, idx_filename, empty_tile_size, dedup, dry_run)
+    finally:
+        if lock_file != None:
+            lock_file.close()
+
+
+def compact_files(header, data_filename, idx_filename, empty_tile_size, dedup, dry_run):
+    """
+    Rewrite the data and index files of an MRF with only live tiles, see
+    compact_mrf.  Returns a dictionary of statistics.
+    """
+    index = MRFIndex(idx_filename, header, 'r')
+    records = index.records
+    live = numpy.nonzero(records['size'] > 0)[0]
+    stats = {'records': len(records), 'tiles': len(live), 'unique_tiles': 0,
+             'old_size': os.path.getsize(data_filename), 'new_size': 0}
+
+    # Preserve the start of the data file (the seeded empty tile).
+    if empty_tile_size != None:
+        prefix_size = int(empty_tile_size)
+    elif len(live) > 0:
+        prefix_size = int(records['offset'][live].min())
+    else:
+        prefix_size = stats['old_size']
+
+    new_offsets = numpy.array(records['offset'], dtype=numpy.int64)
+    new_data_filename = str().join([data_filename, '.', str(os.getpid()), '.compact'])
+    new_idx_filename = str().join([idx_filename, '.', str(os.getpid()), '.compact'])
+    data_file = open(data_filename, 'rb')
+    if dry_run:
+        new_data_file = None
+    else:
+        new_data_file = open(new_data_filename, 'wb')
+        copy_bytes(data_file, new_data_file, prefix_size)
+    position = prefix_size
+
+    # Records that already share a tile are copied once: (offset, size) -> new offset
+    copied = {}
+    # Tiles with identical contents: (size, digest) -> new offset
+    digests = {}
+    try:
+        for record in live:
+            offset = int(records['offset'][record])
+            size = int(records['size'][record])
+            if offset + size <= prefix_size:
+                # Tile inside the preserved start of the file
+                continue
+            if (offset, size) in copied:
+                new_offsets[record] = copied[(offset, size)]
+                continue
+            data_file.seek(offset)
+            tile = data_file.read(size)
+            if len(tile) != size:
+                raise IOError(str().join(['Tile at offset ', str(offset), ' is past the end of ', data_filename]))
+            if dedup:
+                key = (size, hashlib.sha1(tile).digest())
+                if key in digests:
+                    new_offsets[record] = copied[(offset, size)] = digests[key]
+                    continue
+                digests[key] = position
+            if new_data_file != None:
+                new_data_file.write(tile)
+            new_offsets[record] = copied[(offset, size)] = position
+            stats['unique_tiles'] += 1
+            position += size
+    except:
+        data_file.close()
+        if new_data_file != None:
+            new_data_file.close()
+            os.remove(new_data_filename)
+        index.close()
+        raise
+    data_file.close()
+    if new_data_file != None:
+        new_data_file.close()
+    stats['new_size'] = position
+
+    if not dry_run:
+        new_records = numpy.empty(len(records), dtype=INDEX_DTYPE)
+        new_records['offset'] = new_offsets
+        new_records['size'] = records['size']
+        index.close()
+        new_records.tofile(new_idx_filename)
+        # Data file first: the new index never points past the end of the data file.
+        os.rename(new_data_filename, data_filename)
+        os.rename(new_idx_filename, idx_filename)
+    else:
+        index.close()
+    return stats
+
+
+#-------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    usageText = 'mrf_compact.py --input [file.mrf] --data [file.ppg] --empty_tile_size [bytes] --no_dedup --dry_run --offline'
+
+    # Define command line options and args.
+    parser=OptionParser(usage=usageText, version=versionNumber)
+    parser.add_option('-i', '--input',
+                      action='store', type='string', dest='mrf_filename',
+                      help='Full path of the MRF header (.mrf) file to compact.')
+    parser.add_option('-d', '--data',
+                      action='store', type='string', dest='data_filename',
+                      help='Full path of the MRF data file.  Default: derived from the MRF header')
+    parser.add_option('-e', '--empty_tile_size',
+                      action='store', type='int', dest='empty_tile_size',
+                      help='Number of bytes at the start of the data file to keep.  Default: everything before the first tile')
+    parser.add_option('-n', '--no_dedup', action='store_true', dest='no_dedup',
+                      default=False, help='Do not combine identical tiles')
+    parser.add_option('-o', '--offline', action='store_true', dest='offline',
+                      default=False, help='Confirm that the MRF is not being served.  Required unless --dry_run')
+    parser.add_option('-t', '--dry_run', action='store_true', dest='dry_run',
+                      default=False, help='Only report the savings, do not modify any files')
+
+    # Read command line args.
+    (options, args) = parser.parse_args()
+    if not options.mrf_filename:
+        parser.error('MRF filename not provided. --input must be specified.')
+
+    print 'mrf_compact v' + versionNumber
+    try:
+        stats = compact_mrf(options.mrf_filename, options.data_filename, options.empty_tile_size,
+                            not options.no_dedup, options.dry_run, options.offline)
+    except (IOError, OSError, MRFIndexError, MRFCompactError), e:
+        print >> sys.stderr, 'Error: ' + str(e)
+        sys.exit(1)
+
+    print 'Index records:  ' + str(stats['records'])
+    print 'Tiles:          ' + str(stats['tiles'])
+    print 'Unique tiles:   ' + str(stats['unique_tiles'])
+    print 'Data file size: ' + str(stats['old_size']) + ' -> ' + str(stats['new_size']) + ' bytes'
+    if options.dry_run:
+        print 'Dry run, no files were modified'
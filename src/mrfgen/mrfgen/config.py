@@ -0,0 +1,252 @@
+#!/bin/env python
+
+# Copyright (c) 2002-2015, California Institute of Technology.
+# All rights reserved.  Based on Government Sponsored Research under contracts NAS7-1407 and/or NAS7-03001.
+# 
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+#   1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+#   2. Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#   3. Neither the name of the California Institute of Technology (Caltech), its operating division the Jet Propulsion Laboratory (JPL),
+#      the National Aeronautics and Space Administration (NASA), nor the names of its contributors may be used to
+#      endorse or promote products derived from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE CALIFORNIA INSTITUTE OF TECHNOLOGY BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+#
+# mrfgen configuration.
+#
+# Global Imagery Browse Services
+# NASA Jet Propulsion Laboratory
+# 2015
+
+import multiprocessing
+import os
+import string
+import sys
+import xml.dom.minidom
+from mrfgen.log import log_sig_warn, log_sig_exit
+from mrfgen.utils import get_dom_tag_value, check_abs_path, add_trailing_slash, lookupEmptyTile
+
+DEFAULT_SIGEVENT_URL = 'http://localhost:8100/sigevent/events/create'
+
+
+class MrfgenConfig:
+    """Settings from an mrfgen XML configuration file"""
+
+    def __init__(self, configuration_filename, sigevent_url=DEFAULT_SIGEVENT_URL, data_only=False, script_dir=None):
+        """
+        Arguments:
+            configuration_filename -- the mrfgen XML configuration file
+            sigevent_url -- Example:  'http://[host]/sigevent/events/create'
+            data_only -- only output the MRF data, index, and header files
+            script_dir -- directory with colormap2vrt.py, RGBApng2Palpng and
+                          empty_config.  Default: directory of the running script
+        """
+        self.configuration_filename = configuration_filename
+        self.sigevent_url = sigevent_url
+        self.data_only = data_only
+        if script_dir == None:
+            script_dir = os.path.dirname(os.path.abspath(sys.argv[0]))
+        self.script_dir = add_trailing_slash(script_dir)
+        self.read()
+
+    def read(self):
+        """
+        Read the XML configuration file.
+        """
+        sigevent_url = self.sigevent_url
+        try:
+            # Open file.
+            config_file=open(self.configuration_filename, 'r')
+        except IOError:
+            mssg=str().join(['Cannot read configuration file:  ', 
+                             self.configuration_filename])
+            log_sig_exit('ERROR', mssg, sigevent_url)
+        # Get dom from XML file.
+        dom=xml.dom.minidom.parse(config_file)
+        # Parameter name.
+        self.parameter_name         =get_dom_tag_value(dom, 'parameter_name')
+        self.date_of_data           =get_dom_tag_value(dom, 'date_of_data')
+        # for sub-daily imagery
+        try: 
+            self.time_of_data = get_dom_tag_value(dom, 'time_of_data')
+        except:
+            self.time_of_data = ''
+        # Directories.
+        try:
+            self.input_dir            =get_dom_tag_value(dom, 'input_dir')
+        except: #use output_dir if not specified (for previous cycle time)
+            self.input_dir            =get_dom_tag_value(dom, 'output_dir')
+        self.output_dir             =get_dom_tag_value(dom, 'output_dir')
+        try:
+            self.cache_dir              =get_dom_tag_value(dom, 'cache_dir')
+        except: # use output dir if not provided
+            self.cache_dir              =get_dom_tag_value(dom, 'output_dir')
+        try:
+            self.working_dir            =get_dom_tag_value(dom, 'working_dir')
+        except: # use /tmp/ as default
+            self.working_dir            ='/tmp/'
+        try:
+            self.logfile_dir            =get_dom_tag_value(dom, 'logfile_dir')
+        except: #use working_dir if not specified
+            self.logfile_dir            =self.working_dir
+        try:
+            self.mrf_name=get_dom_tag_value(dom, 'mrf_name')
+        except:
+            # default to GIBS naming convention
+            self.mrf_name='{$parameter_name}%Y%j_.mrf'
+        # MRF specific parameters.
+        try:
+            self.mrf_empty_tile_filename=check_abs_path(get_dom_tag_value(dom, 'mrf_empty_tile_filename'))
+        except:
+            try:
+                self.mrf_empty_tile_filename=lookupEmptyTile(get_dom_tag_value(dom, 'empty_tile'), self.script_dir, sigevent_url)
+            except:
+                log_sig_warn("Empty tile was not found for " + self.parameter_name, sigevent_url)
+                self.mrf_empty_tile_filename = ''
+        try:
+            self.vrtnodata = get_dom_tag_value(dom, 'vrtnodata')
+        except:
+            self.vrtnodata = ""
+        self.mrf_blocksize          =get_dom_tag_value(dom, 'mrf_blocksize')
+        # Ensure that mrf_compression_type is uppercase.
+        self.mrf_compression_type   =string.upper(get_dom_tag_value(dom, 'mrf_compression_type'))
+        try:
+            self.outsize = get_dom_tag_value(dom, 'outsize')
+            self.target_x, self.target_y = self.outsize.split(' ')
+        except:
+            self.outsize = ''
+            try:
+                self.target_x               =get_dom_tag_value(dom, 'target_x')
+            except:
+                self.target_x = '' # if no target_x then use rasterXSize and rasterYSize from VRT file
+            try:
+                self.target_y               =get_dom_tag_value(dom, 'target_y')
+            except:
+                self.target_y = ''
+        # EPSG code projection.
+        try:
+            self.target_epsg        = 'EPSG:' + str(get_dom_tag_value(dom, 'target_epsg'))
+        except:
+            self.target_epsg = 'EPSG:4326' # default to geographic
+        try:
+            self.source_epsg        = 'EPSG:' + str(get_dom_tag_value(dom, 'source_epsg'))
+        except:
+            self.source_epsg = 'EPSG:4326' # default to geographic
+        # Target extents.
+        try:
+            self.extents        =get_dom_tag_value(dom, 'extents')
+        except:
+            self.extents = '-180,-90,180,90' # default to geographic
+        self.xmin, self.ymin, self.xmax, self.ymax = self.extents.split(',')
+        try:
+            self.target_extents        =get_dom_tag_value(dom, 'target_extents')
+        except:
+            if self.target_epsg == 'EPSG:3857':
+                self.target_extents = '-20037508.34,-20037508.34,20037508.34,20037508.34'
+            else:
+                self.target_extents = self.extents # default to extents
+        self.target_xmin, self.target_ymin, self.target_xmax, self.target_ymax = self.target_extents.split(',')
+        # Input files.
+        try:
+            self.input_files        =get_dom_tag_value(dom, 'input_files').strip()
+        except:
+            self.input_files = ''
+        # overview levels
+        try:
+            self.overview_levels       =get_dom_tag_value(dom, 'overview_levels').split(' ')
+        except:
+            self.overview_levels = ''
+        for level in self.overview_levels:
+            if level.isdigit() == False:
+                log_sig_exit("ERROR", "'" + level + "' is not a valid overview value.", sigevent_url)
+        # resampling method
+        try:
+            self.overview_resampling        =get_dom_tag_value(dom, 'overview_resampling')
+        except:
+            self.overview_resampling = 'nearest'    
+        # gdalwarp resampling method for resizing
+        try:
+            self.resize_resampling        =get_dom_tag_value(dom, 'resize_resampling')
+            if self.resize_resampling == "none":
+                self.resize_resampling = ''
+        except:
+            self.resize_resampling = ''
+        if self.resize_resampling != '' and self.target_x == '':
+            log_sig_exit('ERROR', "target_x or outsize must be provided for resizing", sigevent_url)
+              
+        # gdalwarp resampling method for reprojection
+        try:
+            self.reprojection_resampling        =get_dom_tag_value(dom, 'reprojection_resampling')
+        except:
+            self.reprojection_resampling = 'cubic' # default to cubic  
+        # colormap
+        try:
+            self.colormap               =get_dom_tag_value(dom, 'colormap')
+        except:
+            self.colormap = ''    
+        # GDAL engine: 'subprocess' runs the GDAL command line utilities,
+        # 'python' runs the same steps in-process with the osgeo.gdal bindings.
+        try:
+            self.engine                 =get_dom_tag_value(dom, 'engine').lower()
+        except:
+            self.engine = 'subprocess'
+        # Number of worker threads for tile preprocessing.
+        try:
+            self.worker_count           =get_dom_tag_value(dom, 'worker_count')
+        except:
+            self.worker_count = str(multiprocessing.cpu_count())
+        # Insert only modified tiles into an existing MRF.
+        try:
+            self.partial_update         =get_dom_tag_value(dom, 'partial_update').lower() == 'true'
+        except:
+            self.partial_update = False
+        # A partial update finds the MRF of the previous cycle by its name.
+        if self.partial_update == True and self.mrf_name == '':
+            log_sig_exit('ERROR', '<partial_update> requires <mrf_name> to find the MRF of the previous cycle', sigevent_url)
+        # File with the time of the previous cycle, relative to input_dir.
+        try:
+            self.previous_cycle_time_file =get_dom_tag_value(dom, 'previous_cycle_time_file')
+        except:
+            self.previous_cycle_time_file = 'mrfgen_previous_cycle_time.txt'
+        # Per-stage resource usage, written next to the log.
+        try:
+            self.metrics                =get_dom_tag_value(dom, 'metrics').lower() == 'true'
+        except:
+            self.metrics = False
+        try:
+            self.metrics_statsd         =get_dom_tag_value(dom, 'metrics_statsd')
+        except:
+            self.metrics_statsd = ''
+        try:
+            self.metrics_prometheus_dir =add_trailing_slash(check_abs_path(get_dom_tag_value(dom, 'metrics_prometheus_dir')))
+        except:
+            self.metrics_prometheus_dir = ''
+        # Close file.
+        config_file.close()
+
+        # Make certain each directory has a trailing slash.
+        self.input_dir  =add_trailing_slash(check_abs_path(self.input_dir))
+        self.output_dir =add_trailing_slash(check_abs_path(self.output_dir))
+        self.cache_dir  =add_trailing_slash(check_abs_path(self.cache_dir))
+        self.working_dir=add_trailing_slash(check_abs_path(self.working_dir))
+        self.logfile_dir=add_trailing_slash(check_abs_path(self.logfile_dir))
+
+
+def read_configuration(configuration_filename, sigevent_url=DEFAULT_SIGEVENT_URL, data_only=False, script_dir=None):
+    """
+    Read an mrfgen XML configuration file.  Returns an MrfgenConfig.
+    Arguments:
+        configuration_filename -- the mrfgen XML configuration file
+        sigevent_url -- Example:  'http://[host]/sigevent/events/create'
+        data_only -- only output the MRF data, index, and header files
+        script_dir -- directory with colormap2vrt.py, RGBApng2Palpng and empty_config
+    """
+    return MrfgenConfig(configuration_filename, sigevent_url, data_only, script_dir)
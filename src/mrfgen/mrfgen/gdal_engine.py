@@ -0,0 +1,270 @@
+#!/bin/env python
+
+# Copyright (c) 2002-2014, California Institute of Technology.
+# All rights reserved.  Based on Government Sponsored Research under contracts NAS7-1407 and/or NAS7-03001.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+#   1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+#   2. Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#   3. Neither the name of the California Institute of Technology (Caltech), its operating division the Jet Propulsion Laboratory (JPL),
+#      the National Aeronautics and Space Administration (NASA), nor the names of its contributors may be used to
+#      endorse or promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE CALIFORNIA INSTITUTE OF TECHNOLOGY BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+#
+# In-process GDAL engine for mrfgen.
+#
+# Runs the gdalbuildvrt, gdalwarp, gdal_translate and gdaladdo steps of
+# mrfgen through the osgeo.gdal Python bindings instead of subprocesses.
+# Intermediate VRTs are kept in memory under /vsimem/ and failures are
+# reported as GDALEngineError instead of being inferred from stderr files
+# and index modification times.
+#
+# Requires the GDAL 2.1+ Python utility functions (gdal.BuildVRT,
+# gdal.Warp, gdal.Translate).
+#
+# Global Imagery Browse Services
+# NASA Jet Propulsion Laboratory
+# 2015
+
+import os
+
+try:
+    from osgeo import gdal
+except ImportError:
+    gdal = None
+
+VSIMEM = '/vsimem/'
+
+
+class GDALEngineError(Exception):
+    """Error raised when a GDAL step fails inside the engine"""
+
+    def __init__(self, step, mssg):
+        """
+        Arguments:
+            step -- name of the equivalent GDAL utility (e.g. 'gdalbuildvrt')
+            mssg -- the GDAL error message
+        """
+        Exception.__init__(self, step + ': ' + str(mssg))
+        self.step = step
+        self.mssg = mssg
+
+
+class GDALEngine:
+    """Runs mrfgen GDAL steps in-process using the osgeo.gdal bindings"""
+
+    def __init__(self):
+        if gdal == None:
+            raise GDALEngineError('engine', 'osgeo.gdal Python bindings are not installed')
+        for function in ['BuildVRT', 'Warp', 'Translate']:
+            if not hasattr(gdal, function):
+                raise GDALEngineError('engine', 'gdal.' + function + ' requires GDAL 2.1 or newer')
+        gdal.UseExceptions()
+        gdal.AllRegister()
+        # Warnings collected from GDAL (e.g. skipped tiles in gdalbuildvrt).
+        self.warnings = []
+        # /vsimem/ files created by the engine, released by cleanup().
+        self.memory_files = []
+
+    def _error_handler(self, err_class, err_num, err_msg):
+        """
+        Collect GDAL warnings instead of writing them to stderr.
+        Errors are still raised as exceptions by gdal.UseExceptions().
+        """
+        if err_class == gdal.CE_Warning:
+            self.warnings.append(str(err_msg))
+
+    def _run(self, step, function, *args, **kwargs):
+        """
+        Run a GDAL function and convert failures to GDALEngineError.
+        Arguments:
+            step -- name of the equivalent GDAL utility
+            function -- the gdal function to call
+        """
+        gdal.PushErrorHandler(self._error_handler)
+        try:
+            try:
+                result = function(*args, **kwargs)
+            except RuntimeError, e:
+                raise GDALEngineError(step, e)
+        finally:
+            gdal.PopErrorHandler()
+        if result == None:
+            raise GDALEngineError(step, gdal.GetLastErrorMsg() or 'no output dataset created')
+        return result
+
+    def memory_filename(self, filename):
+        """
+        Return the /vsimem/ equivalent of a filename.
+        Arguments:
+            filename -- the on-disk filename
+        """
+        memory_filename = VSIMEM + os.path.basename(filename)
+        if memory_filename not in self.memory_files:
+            self.memory_files.append(memory_filename)
+        return memory_filename
+
+    def build_vrt(self, vrt_filename, tiles, extents, resolution=None, srs=None, vrtnodata='', srcnodata=None):
+        """
+        Equivalent of gdalbuildvrt.  Returns the VRT filename.
+        Arguments:
+            vrt_filename -- output VRT (may be a /vsimem/ path)
+            tiles -- list of input tile filenames
+            extents -- (xmin, ymin, xmax, ymax) strings or floats
+            resolution -- optional (xres, yres) for '-resolution user -tr'
+            srs -- optional output SRS (e.g. 'EPSG:4326')
+            vrtnodata -- optional VRT nodata value
+            srcnodata -- optional source nodata value
+        """
+        options = {'outputBounds': [float(x) for x in extents]}
+        if resolution != None:
+            options['resolution'] = 'user'
+            options['xRes'] = float(resolution[0])
+            options['yRes'] = float(resolution[1])
+        if srs != None:
+            options['outputSRS'] = srs
+        if vrtnodata != '':
+            options['VRTNodata'] = vrtnodata
+        if srcnodata != None:
+            options['srcNodata'] = srcnodata
+        dataset = self._run('gdalbuildvrt', gdal.BuildVRT, vrt_filename, list(tiles),
+                            options=gdal.BuildVRTOptions(**options))
+        dataset = None # flush VRT
+        return vrt_filename
+
+    def warp(self, dst_filename, src_filename, output_format, resampling, extents,
+             source_srs=None, target_srs=None, size=None):
+        """
+        Equivalent of gdalwarp.  Returns the output filename.
+        Arguments:
+            dst_filename -- output filename (may be a /vsimem/ path)
+            src_filename -- input filename
+            output_format -- GDAL driver name (e.g. 'VRT', 'GTiff')
+            resampling -- resampling method
+            extents -- (xmin, ymin, xmax, ymax) target extents
+            source_srs -- optional source SRS
+            target_srs -- optional target SRS
+            size -- optional (width, height) of the output
+        """
+        options = {'format': output_format,
+                   'resampleAlg': resampling,
+                   'outputBounds': [float(x) for x in extents],
+                   'multithread': True}
+        if source_srs != None:
+            options['srcSRS'] = source_srs
+        if target_srs != None:
+            options['dstSRS'] = target_srs
+        if size != None:
+            options['width'] = int(size[0])
+            options['height'] = int(size[1])
+        if output_format != 'VRT' and os.path.isfile(dst_filename):
+            gdal.GetDriverByName(output_format).Delete(dst_filename) # -overwrite
+        dataset = self._run('gdalwarp', gdal.Warp, dst_filename, src_filename,
+                            options=gdal.WarpOptions(**options))
+        dataset = None
+        return dst_filename
+
+    def get_size(self, filename):
+        """
+        Return (rasterXSize, rasterYSize) of a dataset.
+        Arguments:
+            filename -- the dataset filename
+        """
+        dataset = self._run('gdalinfo', gdal.Open, filename)
+        size = (dataset.RasterXSize, dataset.RasterYSize)
+        dataset = None
+        return size
+
+    def read_text(self, filename):
+        """
+        Return the contents of a (possibly /vsimem/) text file such as a VRT.
+        Arguments:
+            filename -- the file to read
+        """
+        stat = gdal.VSIStatL(filename)
+        if stat == None:
+            raise GDALEngineError('vsi', filename + ' does not exist')
+        handle = gdal.VSIFOpenL(filename, 'rb')
+        try:
+            text = gdal.VSIFReadL(1, stat.size, handle)
+        finally:
+            gdal.VSIFCloseL(handle)
+        return text
+
+    def write_text(self, filename, text):
+        """
+        Write text to a (possibly /vsimem/) file.
+        Arguments:
+            filename -- the file to write
+            text -- the file contents
+        """
+        handle = gdal.VSIFOpenL(filename, 'wb')
+        if handle == None:
+            raise GDALEngineError('vsi', 'cannot open ' + filename + ' for write')
+        try:
+            gdal.VSIFWriteL(text, 1, len(text), handle)
+        finally:
+            gdal.VSIFCloseL(handle)
+        return filename
+
+    def unlink(self, filename):
+        """
+        Remove a /vsimem/ file.  On-disk files are left to the caller.
+        Arguments:
+            filename -- the file to remove
+        """
+        if filename.startswith(VSIMEM):
+            if gdal.VSIStatL(filename) != None:
+                gdal.Unlink(filename)
+            if filename in self.memory_files:
+                self.memory_files.remove(filename)
+
+    def cleanup(self):
+        """
+        Release all /vsimem/ files created by the engine.
+        """
+        for filename in list(self.memory_files):
+            self.unlink(filename)
+
+    def translate_mrf(self, mrf_filename, src_filename, compress, blocksize, size):
+        """
+        Equivalent of gdal_translate -of MRF.  Returns the MRF filename.
+        Arguments:
+            mrf_filename -- output MRF header filename
+            src_filename -- input VRT (may be a /vsimem/ path)
+            compress -- MRF creation option, e.g. 'COMPRESS=PNG'
+            blocksize -- MRF creation option, e.g. 'BLOCKSIZE=512'
+            size -- (width, height) of the output
+        """
+        options = gdal.TranslateOptions(format='MRF', creationOptions=[compress, blocksize],
+                                        width=int(size[0]), height=int(size[1]))
+        dataset = self._run('gdal_translate', gdal.Translate, mrf_filename, src_filename, options=options)
+        dataset = None # flush MRF
+        return mrf_filename
+
+    def build_overviews(self, mrf_filename, resampling, levels):
+        """
+        Equivalent of gdaladdo.
+        Arguments:
+            mrf_filename -- MRF header filename
+            resampling -- overview resampling method (e.g. 'nearest')
+            levels -- list of overview levels
+        """
+        dataset = self._run('gdaladdo', gdal.Open, mrf_filename, gdal.GA_Update)
+        try:
+            result = dataset.BuildOverviews(str(resampling).upper(), [int(level) for level in levels])
+        except RuntimeError, e:
+            raise GDALEngineError('gdaladdo', e)
+        dataset = None # flush index
+        if result != 0:
+            raise GDALEngineError('gdaladdo', gdal.GetLastErrorMsg())
+        return mrf_filename
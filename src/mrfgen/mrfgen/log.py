@@ -0,0 +1,140 @@
+#!/bin/env python
+
+# Copyright (c) 2002-2015, California Institute of Technology.
+# All rights reserved.  Based on Government Sponsored Research under contracts NAS7-1407 and/or NAS7-03001.
+# 
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+#   1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+#   2. Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#   3. Neither the name of the California Institute of Technology (Caltech), its operating division the Jet Propulsion Laboratory (JPL),
+#      the National Aeronautics and Space Administration (NASA), nor the names of its contributors may be used to
+#      endorse or promote products derived from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE CALIFORNIA INSTITUTE OF TECHNOLOGY BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+#
+# Logging and sigevent functions for mrfgen.
+#
+# Global Imagery Browse Services
+# NASA Jet Propulsion Laboratory
+# 2015
+
+import logging
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'common'))
+import oe_sigevent
+
+
+class MrfgenExit(Exception):
+    """
+    Raised by log_sig_exit to end processing.  The command line tool exits
+    with exit_code; a Pipeline treats an exit_code of 0 as normal completion.
+    """
+
+    def __init__(self, type, mssg, exit_code):
+        """
+        Arguments:
+            type -- 'INFO', 'WARN', 'ERROR'
+            mssg -- 'message for operations'
+            exit_code -- 0 for success, 1 for errors
+        """
+        Exception.__init__(self, mssg)
+        self.type = type
+        self.mssg = mssg
+        self.exit_code = exit_code
+
+
+def sigevent(type, mssg, sigevent_url):
+    """
+    Send a message to sigevent service.  The message is sent in the
+    background by oe_sigevent.
+    Arguments:
+        type -- 'INFO', 'WARN', 'ERROR'
+        mssg -- 'message for operations'
+        sigevent_url -- Example:  'http://[host]/sigevent/events/create'
+                        'http://localhost:8100/sigevent/events/create'
+    """
+    oe_sigevent.sigevent(type, mssg, sigevent_url, 'MRFGEN')
+
+def log_info_mssg(mssg):
+    """
+    For information messages only.  Not for warning or error.
+    Arguments:
+        mssg -- 'message for operations'
+    """
+    # Send to log.
+    print mssg
+    logging.info(mssg)
+
+def log_info_mssg_with_timestamp(mssg):
+    """
+    For information messages only.  Not for warning or error.
+    Arguments:
+        mssg -- 'message for operations'
+    """
+    # Send to log.
+    print time.asctime()
+    logging.info(time.asctime())
+    log_info_mssg(mssg)
+
+def log_sig_warn(mssg, sigevent_url):
+    """
+    Send a warning to the log and to sigevent.
+    Arguments:
+        mssg -- 'message for operations'
+        sigevent_url -- Example:  'http://[host]/sigevent/events/create'
+    """
+    # Send to log.
+    logging.warning(time.asctime())
+    logging.warning(mssg)
+    # Send to sigevent.
+    sigevent('WARN', mssg, sigevent_url)
+
+def log_sig_exit(type, mssg, sigevent_url):
+    """
+    Send a message to the log, to sigevent, and then end processing by
+    raising MrfgenExit.
+    Arguments:
+        type -- 'INFO', 'WARN', 'ERROR'
+        mssg -- 'message for operations'
+        sigevent_url -- Example:  'http://[host]/sigevent/events/create'
+    """
+    exit_code = 0
+    # Add "Exiting" to mssg.
+    mssg=str().join([mssg, '  Exiting mrfgen.'])
+    # Send to sigevent.
+    sigevent(type, mssg, sigevent_url)
+    # Send to log.
+    if type == 'INFO':
+        log_info_mssg_with_timestamp(mssg)
+    elif type == 'WARN':
+        logging.warning(time.asctime())
+        logging.warning(mssg)
+    elif type == 'ERROR':
+        logging.error(time.asctime())
+        logging.error(mssg)
+        exit_code = 1
+    # Exit.
+    raise MrfgenExit(type, mssg, exit_code)
+
+def log_the_command(command_list):
+    """
+    Send a command list to the log.
+    Arguments:
+        command_list -- list containing all elements of a subprocess command.
+    """
+    # Add a blank space between each element.
+    spaced_command=''
+    for ndx in range(len(command_list)):
+        spaced_command=str().join([spaced_command, command_list[ndx], ' '])
+    # Send to log.
+    log_info_mssg_with_timestamp(spaced_command)
@@ -0,0 +1,206 @@
+#!/bin/env python
+
+# Copyright (c) 2002-2015, California Institute of Technology.
+# All rights reserved.  Based on Government Sponsored Research under contracts NAS7-1407 and/or NAS7-03001.
+# 
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+#   1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+#   2. Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#   3. Neither the name of the California Institute of Technology (Caltech), its operating division the Jet Propulsion Laboratory (JPL),
+#      the National Aeronautics and Space Administration (NASA), nor the names of its contributors may be used to
+#      endorse or promote products derived from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE CALIFORNIA INSTITUTE OF TECHNOLOGY BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+#
+# Resource usage of the mrfgen stages.
+#
+# For each stage, the wall time, user and system CPU time and peak memory of
+# mrfgen and of the GDAL command line tools it runs (as reported by
+# resource.getrusage), and the size of the files the stage wrote, are
+# recorded.  Metrics are written one JSON object per line, and can also be
+# sent to StatsD or written to a Prometheus node_exporter textfile.
+#
+# getrusage only reports the peak memory of the largest child process that
+# has finished so far, so children_max_rss_kb never decreases from one stage
+# to the next.
+#
+# Global Imagery Browse Services
+# NASA Jet Propulsion Laboratory
+# 2015
+
+import json
+import os
+import resource
+import socket
+import time
+
+# State attributes holding the files written by each stage.
+STAGE_OUTPUTS = {'preprocess': ['mod_tiles_filename', 'all_tiles_filename'],
+                 'mosaic': ['vrt_filename'],
+                 'reproject': ['vrt_filename'],
+                 'resize': ['resize_filename', 'vrt_filename'],
+                 'colormap': ['vrt_filename'],
+                 'translate': ['mrf_filename', 'idx_filename', 'out_filename'],
+                 'overview': ['idx_filename', 'out_filename'],
+                 'publish': ['mrf_filename', 'idx_filename', 'out_filename']}
+
+
+def get_usage():
+    """
+    Return the current time and resource usage of this process and of its
+    finished child processes.
+    """
+    return (time.time(), resource.getrusage(resource.RUSAGE_SELF),
+            resource.getrusage(resource.RUSAGE_CHILDREN))
+
+
+def get_output_bytes(state, stage):
+    """
+    Return the total size of the files written by a stage.  Files that do not
+    exist (anymore) or are kept in memory are not counted.
+    Arguments:
+        state -- the pipeline state
+        stage -- name of the stage
+    """
+    output_bytes = 0
+    filenames = []
+    for attribute in STAGE_OUTPUTS.get(stage, []):
+        filename = getattr(state, attribute, '')
+        if filename and filename not in filenames and os.path.isfile(filename):
+            filenames.append(filename)
+            output_bytes += os.path.getsize(filename)
+    return output_bytes
+
+
+class MetricsRecorder:
+    """Records and exports the resource usage of each stage"""
+
+    def __init__(self, metrics_filename, labels, statsd_address=None, prometheus_dir=None):
+        """
+        Arguments:
+            metrics_filename -- JSON lines file to append to, or None until known
+            labels -- dictionary added to every record, e.g. parameter_name
+            statsd_address -- 'host:port' of a StatsD server, if any
+            prometheus_dir -- node_exporter textfile collector directory, if any
+        """
+        self.metrics_filename = metrics_filename
+        self.labels = labels
+        self.statsd_address = statsd_address
+        self.prometheus_dir = prometheus_dir
+        self.records = []
+        # Records before this one have been written to the metrics file.
+        self.written = 0
+        self.start_usage = None
+
+    def start(self):
+        """
+        Start measuring a stage.
+        """
+        self.start_usage = get_usage()
+
+    def stop(self, stage, output_bytes=0, status='success'):
+        """
+        Finish measuring a stage and write its record.  Returns the record.
+        Arguments:
+            stage -- name of the stage
+            output_bytes -- size of the files written by the stage
+            status -- 'success', 'exit' (ended processing) or 'error'
+        """
+        start_time, start_self, start_children = self.start_usage
+        end_time, end_self, end_children = get_usage()
+        record = dict(self.labels)
+        record['stage'] = stage
+        record['status'] = status
+        record['start_time'] = round(start_time, 3)
+        record['wall_time'] = round(end_time - start_time, 6)
+        record['user_time'] = round(end_self.ru_utime - start_self.ru_utime, 6)
+        record['sys_time'] = round(end_self.ru_stime - start_self.ru_stime, 6)
+        record['children_user_time'] = round(end_children.ru_utime - start_children.ru_utime, 6)
+        record['children_sys_time'] = round(end_children.ru_stime - start_children.ru_stime, 6)
+        record['max_rss_kb'] = end_self.ru_maxrss
+        record['children_max_rss_kb'] = end_children.ru_maxrss
+        record['output_bytes'] = output_bytes
+        self.records.append(record)
+        self.write_records()
+        if self.statsd_address:
+            self.send_statsd(record)
+        return record
+
+    def write_records(self):
+        """
+        Append the records not written yet to the JSON lines file.  Records
+        are kept until the metrics filename is known.
+        """
+        if self.metrics_filename == None:
+            return
+        metrics_file = open(self.metrics_filename, 'a')
+        for record in self.records[self.written:]:
+            metrics_file.write(json.dumps(record, sort_keys=True) + '\n')
+        metrics_file.close()
+        self.written = len(self.records)
+
+    def send_statsd(self, record):
+        """
+        Send a record to StatsD over UDP.  Errors are ignored so that metrics
+        never stop processing.
+        """
+        prefix = str().join(['mrfgen.', record.get('parameter_name', 'unknown'), '.', record['stage'], '.'])
+        lines = [prefix + 'wall_time:' + str(int(record['wall_time'] * 1000)) + '|ms',
+                 prefix + 'cpu_time:' + str(int((record['user_time'] + record['sys_time'] +
+                                                 record['children_user_time'] + record['children_sys_time']) * 1000)) + '|ms',
+                 prefix + 'max_rss_kb:' + str(max(record['max_rss_kb'], record['children_max_rss_kb'])) + '|g',
+                 prefix + 'output_bytes:' + str(record['output_bytes']) + '|g']
+        try:
+            host, port = self.statsd_address.rsplit(':', 1)
+            statsd_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            statsd_socket.sendto('\n'.join(lines), (host, int(port)))
+            statsd_socket.close()
+        except (ValueError, socket.error):
+            pass
+
+    def write_prometheus(self):
+        """
+        Write the records of this run to <prometheus_dir>/mrfgen_<parameter_name>.prom.
+        The file is replaced atomically so that node_exporter never reads a
+        partial file.  The temporary file is named after the process, so that
+        concurrent runs of a product (e.g. mrfgen_batch.py date ranges) do not
+        write to the same one.
+        """
+        if not self.prometheus_dir or len(self.records) == 0:
+            return
+        parameter_name = self.labels.get('parameter_name', 'unknown')
+        metrics = [('wall_time', 'mrfgen_stage_wall_seconds', 'Wall time of the mrfgen stage'),
+                   ('user_time', 'mrfgen_stage_user_seconds', 'User CPU time of mrfgen in the stage'),
+                   ('sys_time', 'mrfgen_stage_sys_seconds', 'System CPU time of mrfgen in the stage'),
+                   ('children_user_time', 'mrfgen_stage_children_user_seconds', 'User CPU time of GDAL tools in the stage'),
+                   ('children_sys_time', 'mrfgen_stage_children_sys_seconds', 'System CPU time of GDAL tools in the stage'),
+                   ('max_rss_kb', 'mrfgen_stage_max_rss_kilobytes', 'Peak memory of mrfgen'),
+                   ('children_max_rss_kb', 'mrfgen_stage_children_max_rss_kilobytes', 'Peak memory of the largest GDAL tool'),
+                   ('output_bytes', 'mrfgen_stage_output_bytes', 'Size of the files written by the stage')]
+        lines = []
+        for (key, name, help_text) in metrics:
+            lines.append(str().join(['# HELP ', name, ' ', help_text]))
+            lines.append(str().join(['# TYPE ', name, ' gauge']))
+            for record in self.records:
+                lines.append(str().join([name, '{parameter="', parameter_name, '",stage="', record['stage'],
+                                         '"} ', str(record[key])]))
+        lines.append('# HELP mrfgen_last_run_timestamp_seconds Time of the last mrfgen run')
+        lines.append('# TYPE mrfgen_last_run_timestamp_seconds gauge')
+        lines.append(str().join(['mrfgen_last_run_timestamp_seconds{parameter="', parameter_name, '"} ',
+                                 str(int(self.records[0]['start_time']))]))
+        prom_filename = os.path.join(self.prometheus_dir, 'mrfgen_' + parameter_name + '.prom')
+        temp_filename = str().join([prom_filename, '.', str(os.getpid()), '.tmp'])
+        prom_file = open(temp_filename, 'w')
+        try:
+            prom_file.write('\n'.join(lines) + '\n')
+        finally:
+            prom_file.close()
+        os.rename(temp_filename, prom_filename)
@@ -0,0 +1,196 @@
+#!/bin/env python
+
+# Copyright (c) 2002-2015, California Institute of Technology.
+# All rights reserved.  Based on Government Sponsored Research under contracts NAS7-1407 and/or NAS7-03001.
+# 
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+#   1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+#   2. Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#   3. Neither the name of the California Institute of Technology (Caltech), its operating division the Jet Propulsion Laboratory (JPL),
+#      the National Aeronautics and Space Administration (NASA), nor the names of its contributors may be used to
+#      endorse or promote products derived from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE CALIFORNIA INSTITUTE OF TECHNOLOGY BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+#
+# The mrfgen pipeline: runs the stages in mrfgen.stages in order.
+#
+# Example:
+#
+#  from mrfgen import Pipeline, read_configuration
+#  pipeline = Pipeline(read_configuration('mrfgen_configuration_file.xml'))
+#  pipeline.replace('colormap', my_colormap_stage)
+#  pipeline.run()
+#
+# Global Imagery Browse Services
+# NASA Jet Propulsion Laboratory
+# 2015
+
+import logging
+import os
+import time
+from mrfgen.log import MrfgenExit, log_sig_warn
+from mrfgen.metrics import MetricsRecorder, get_output_bytes
+from mrfgen import stages
+
+# Default stages, in the order they are run.
+STAGES = [('configure', stages.configure),
+          ('discover', stages.discover_tiles),
+          ('validate', stages.validate_tiles),
+          ('preprocess', stages.preprocess_tiles),
+          ('insert', stages.insert_tiles),
+          ('mosaic', stages.mosaic),
+          ('reproject', stages.reproject),
+          ('resize', stages.resize),
+          ('verify', stages.verify_vrt),
+          ('colormap', stages.colormap),
+          ('translate', stages.translate),
+          ('overview', stages.overview),
+          ('publish', stages.publish)]
+
+
+class PipelineState:
+    """Results passed from one stage to the next"""
+
+    def __init__(self):
+        self.gdal_engine = None
+        self.tile_pool = None
+        self.log_handler = None
+        self.alltiles = []
+        self.modtiles = []
+        # False if the VRT is not newer than the previous cycle, see stages.verify_vrt
+        self.vrt_created = True
+
+
+class Pipeline:
+    """Runs the mrfgen stages for one configuration"""
+
+    def __init__(self, config, stages=None):
+        """
+        Arguments:
+            config -- MrfgenConfig
+            stages -- list of (name, function) tuples, default STAGES.
+                      Each function is called as function(config, state).
+        """
+        self.config = config
+        if stages == None:
+            stages = STAGES
+        self.stages = list(stages)
+        self.state = PipelineState()
+        # (name, seconds) of each stage that has run
+        self.stage_times = []
+        # Resource usage of each stage, see mrfgen/metrics.py
+        self.metrics = None
+        if config != None and (config.metrics or config.metrics_statsd or config.metrics_prometheus_dir):
+            self.metrics = MetricsRecorder(None, {'parameter_name': config.parameter_name,
+                                                  'date_of_data': config.date_of_data,
+                                                  'time_of_data': config.time_of_data},
+                                           config.metrics_statsd, config.metrics_prometheus_dir)
+        # MrfgenExit that ended the pipeline, if any
+        self.result = None
+
+    def get_stage_names(self):
+        """
+        Return the names of the stages, in order.
+        """
+        return [name for (name, function) in self.stages]
+
+    def replace(self, name, function):
+        """
+        Replace a stage.  Use a function that does nothing to skip a stage.
+        Arguments:
+            name -- name of the stage, e.g. 'colormap'
+            function -- function(config, state) to run instead
+        """
+        if name not in self.get_stage_names():
+            raise ValueError('Unknown mrfgen stage: ' + name)
+        self.stages = [(stage_name, stage_name == name and function or stage_function)
+                       for (stage_name, stage_function) in self.stages]
+
+    def insert(self, before, name, function):
+        """
+        Add a stage before an existing stage.
+        Arguments:
+            before -- name of the existing stage
+            name -- name of the new stage
+            function -- function(config, state) to run
+        """
+        names = self.get_stage_names()
+        if before not in names:
+            raise ValueError('Unknown mrfgen stage: ' + before)
+        self.stages.insert(names.index(before), (name, function))
+
+    def run_stage(self, name, function):
+        """
+        Run a single stage and record its time and resource usage.
+        """
+        start = time.time()
+        if self.metrics != None:
+            self.metrics.start()
+        status = 'error'
+        try:
+            function(self.config, self.state)
+            status = 'success'
+        except MrfgenExit, e:
+            if e.exit_code == 0:
+                status = 'exit'
+            raise
+        finally:
+            self.stage_times.append((name, time.time() - start))
+            if self.metrics != None:
+                # The metrics file goes next to the log, which is started by the configure stage.
+                if self.config.metrics and self.metrics.metrics_filename == None and \
+                        getattr(self.state, 'log_filename', None):
+                    self.metrics.metrics_filename = self.state.log_filename[:-len('.log')] + '_metrics.jsonl'
+                try:
+                    self.metrics.stop(name, get_output_bytes(self.state, name), status)
+                except (IOError, OSError), e:
+                    # Metrics never fail a run.
+                    log_sig_warn('Cannot write mrfgen metrics: ' + str(e), self.config.sigevent_url)
+
+    def run(self):
+        """
+        Run all stages.  Returns the state of the pipeline.  A stage ending
+        processing with an INFO message (e.g. no new tiles) is a normal
+        completion; errors raise MrfgenExit with a non-zero exit_code.
+        """
+        cwd = os.getcwd()
+        try:
+            for (name, function) in self.stages:
+                self.run_stage(name, function)
+        except MrfgenExit, e:
+            self.result = e
+            if e.exit_code != 0:
+                raise
+        finally:
+            self.close()
+            os.chdir(cwd)
+        return self.state
+
+    def close(self):
+        """
+        Release the tile pool, GDAL in-memory files and the log file.
+        """
+        state = self.state
+        if state.tile_pool != None:
+            state.tile_pool.close()
+            state.tile_pool.join()
+            state.tile_pool = None
+        if state.gdal_engine != None:
+            state.gdal_engine.cleanup()
+        if self.metrics != None:
+            try:
+                self.metrics.write_prometheus()
+            except (IOError, OSError), e:
+                log_sig_warn('Cannot write mrfgen Prometheus metrics: ' + str(e), self.config.sigevent_url)
+        if state.log_handler != None:
+            logging.getLogger().removeHandler(state.log_handler)
+            state.log_handler.close()
+            state.log_handler = None
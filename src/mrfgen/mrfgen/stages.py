@@ -0,0 +1,1123 @@
+#!/bin/env python
+
+# Copyright (c) 2002-2015, California Institute of Technology.
+# All rights reserved.  Based on Government Sponsored Research under contracts NAS7-1407 and/or NAS7-03001.
+# 
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+#   1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+#   2. Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#   3. Neither the name of the California Institute of Technology (Caltech), its operating division the Jet Propulsion Laboratory (JPL),
+#      the National Aeronautics and Space Administration (NASA), nor the names of its contributors may be used to
+#      endorse or promote products derived from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE CALIFORNIA INSTITUTE OF TECHNOLOGY BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+#
+# Stages of the mrfgen pipeline.
+#
+# Each stage is a function taking (config, state), where config is the
+# MrfgenConfig and state holds the results of previous stages (tile lists,
+# filenames, ...).  A stage can end processing early with log_sig_exit; an
+# 'INFO' exit (e.g. no new tiles) completes the pipeline normally.
+#
+# Global Imagery Browse Services / Physical Oceanography Distributed Active Archive Center (PO.DAAC)
+# NASA Jet Propulsion Laboratory
+# 2015
+
+import glob
+import imghdr
+import logging
+import os
+import shutil
+import subprocess
+import time
+import xml.dom.minidom
+from multiprocessing.pool import ThreadPool
+from mrfgen.log import MrfgenExit, sigevent, log_info_mssg, log_info_mssg_with_timestamp, log_sig_warn, log_sig_exit, log_the_command
+from mrfgen.utils import get_modification_time, remove_file, verify_directory_path_exists, get_doy_string, \
+     get_mrf_names, write_previous_cycle_time, remove_temp_tiles
+from mrfgen.tiles import check_jpeg_tile, convert_tile_to_ppng, map_tiles, send_tile_messages
+from mrfgen.gdal_engine import GDALEngine, GDALEngineError, VSIMEM
+
+
+def configure(config, state):
+    """
+    Start the log, verify the configuration and read the previous cycle time.
+    """
+    sigevent_url = config.sigevent_url
+
+    # Get current time, which is written to a file as the previous cycle time.  
+    # Time format is "yyyymmdd.hhmmss".  Do this first to avoid any gap where tiles 
+    # may get passed over because they were created while this script is running.
+    state.current_cycle_time=time.strftime('%Y%m%d.%H%M%S', time.localtime())
+
+    # Define output basename for log, txt, vrt, .mrf, .idx and .ppg or .pjg
+    # Files get date_of_date added, links do not.
+    state.basename=str().join([config.parameter_name, '_', config.date_of_data, '___', 'mrfgen_', 
+                               state.current_cycle_time])
+
+    # Verify logfile_dir first so that the log can be started.
+    verify_directory_path_exists(config.logfile_dir, 'logfile_dir', sigevent_url)
+    # Initialize log file.  The handler is removed when the pipeline ends.
+    state.log_filename=str().join([config.logfile_dir, state.basename, '.log'])
+    state.log_handler=logging.FileHandler(state.log_filename)
+    logging.getLogger().addHandler(state.log_handler)
+    logging.getLogger().setLevel(logging.INFO)
+
+    # Verify remaining directory paths.
+    verify_directory_path_exists(config.input_dir, 'input_dir', sigevent_url)
+    verify_directory_path_exists(config.output_dir, 'output_dir', sigevent_url)
+    verify_directory_path_exists(config.cache_dir, 'cache_dir', sigevent_url)
+    verify_directory_path_exists(config.working_dir, 'working_dir', sigevent_url)
+    if config.metrics_prometheus_dir != '':
+        verify_directory_path_exists(config.metrics_prometheus_dir, 'metrics_prometheus_dir', sigevent_url)
+
+    # Log all of the configuration information.
+    configuration_filename = config.configuration_filename
+    log_info_mssg_with_timestamp(str().join(['config XML file:  ', 
+                                              configuration_filename]))
+    # Copy configuration file to input_dir (if it's not already there)
+    # so that the MRF can be recreated if needed.
+    if os.path.dirname(configuration_filename) != os.path.dirname(config.input_dir):
+        config_preexisting=glob.glob(configuration_filename)
+        if len(config_preexisting) > 0:
+            at_dest_filename=str().join([config.input_dir, configuration_filename])
+            at_dest_preexisting=glob.glob(at_dest_filename)
+            if len(at_dest_preexisting) > 0:
+                remove_file(at_dest_filename)
+            shutil.copy(configuration_filename, config.working_dir+"/"+state.basename+".configuration_file.xml")
+            log_info_mssg(str().join([
+                              'config XML file:  moved to      ', config.input_dir]))
+    log_info_mssg(str().join(['config parameter_name:          ', config.parameter_name]))
+    log_info_mssg(str().join(['config date_of_data:            ', config.date_of_data]))
+    log_info_mssg(str().join(['config time_of_data:            ', config.time_of_data]))
+    log_info_mssg(str().join(['config input_files:             ', config.input_files]))
+    log_info_mssg(str().join(['config input_dir:               ', config.input_dir]))
+    log_info_mssg(str().join(['config output_dir:              ', config.output_dir]))
+    log_info_mssg(str().join(['config cache_dir:               ', config.cache_dir]))
+    log_info_mssg(str().join(['config working_dir:             ', config.working_dir]))
+    log_info_mssg(str().join(['config logfile_dir:             ', config.logfile_dir]))
+    log_info_mssg(str().join(['config mrf_name:                ', config.mrf_name]))
+    log_info_mssg(str().join(['config mrf_empty_tile_filename: ', 
+                              config.mrf_empty_tile_filename]))
+    log_info_mssg(str().join(['config vrtnodata:               ', config.vrtnodata]))
+    log_info_mssg(str().join(['config mrf_blocksize:           ', config.mrf_blocksize]))
+    log_info_mssg(str().join(['config mrf_compression_type:    ',
+                              config.mrf_compression_type]))
+    log_info_mssg(str().join(['config outsize:                 ', config.outsize]))
+    log_info_mssg(str().join(['config target_x:                ', config.target_x]))
+    log_info_mssg(str().join(['config target_y:                ', config.target_y]))
+    log_info_mssg(str().join(['config target_epsg:             ', config.target_epsg]))
+    log_info_mssg(str().join(['config source_epsg:             ', config.source_epsg]))
+    log_info_mssg(str().join(['config extents:                 ', config.extents]))
+    log_info_mssg(str().join(['config target_extents:          ', config.target_extents]))
+    log_info_mssg(str().join(['config overview levels:         ', ' '.join(config.overview_levels)]))
+    log_info_mssg(str().join(['config overview resampling:     ', config.overview_resampling]))
+    log_info_mssg(str().join(['config reprojection resampling: ', config.reprojection_resampling]))
+    log_info_mssg(str().join(['config resize resampling:       ', config.resize_resampling]))
+    log_info_mssg(str().join(['config colormap:                ', config.colormap]))
+    log_info_mssg(str().join(['config engine:                  ', config.engine]))
+    log_info_mssg(str().join(['config worker_count:            ', config.worker_count]))
+    log_info_mssg(str().join(['config partial_update:          ', str(config.partial_update)]))
+    log_info_mssg(str().join(['config metrics:                 ', str(config.metrics)]))
+    if config.metrics_statsd != '':
+        log_info_mssg(str().join(['config metrics_statsd:          ', config.metrics_statsd]))
+    if config.metrics_prometheus_dir != '':
+        log_info_mssg(str().join(['config metrics_prometheus_dir:  ', config.metrics_prometheus_dir]))
+    log_info_mssg(str().join(['mrfgen current_cycle_time:      ', state.current_cycle_time]))
+    log_info_mssg(str().join(['mrfgen basename:                ', state.basename]))
+
+    # Verify that date is 8 characters.
+    if len(config.date_of_data) != 8:
+        mssg='Format for <date_of_data> (in mrfgen XML config file) is:  yyyymmdd'
+        log_sig_exit('ERROR', mssg, sigevent_url)
+        
+    if config.time_of_data != '' and len(config.time_of_data) != 6:
+        mssg='Format for <time_of_data> (in mrfgen XML config file) is:  HHMMSS'
+        log_sig_exit('ERROR', mssg, sigevent_url)
+
+    # Verify the number of tile preprocessing workers.
+    if config.worker_count.isdigit() == False or int(config.worker_count) < 1:
+        mssg='Format for <worker_count> (in mrfgen XML config file) is a positive integer'
+        log_sig_exit('ERROR', mssg, sigevent_url)
+    state.worker_count = int(config.worker_count)
+
+    # Load the in-process GDAL engine if requested.
+    if config.engine == 'python':
+        try:
+            state.gdal_engine = GDALEngine()
+        except GDALEngineError, e:
+            log_sig_exit('ERROR', str(e), sigevent_url)
+    elif config.engine != 'subprocess':
+        mssg='Format for <engine> (in mrfgen XML config file) is:  subprocess or python'
+        log_sig_exit('ERROR', mssg, sigevent_url)
+
+    # Output size may be calculated from the VRT later on.
+    state.target_x = config.target_x
+    state.target_y = config.target_y
+
+    # Check if empty tile filename was specified.
+    mrf_empty_tile_filename = config.mrf_empty_tile_filename
+    mrf_compression_type = config.mrf_compression_type
+    if len(mrf_empty_tile_filename) == 0:
+        log_info_mssg(str('Empty tile not specified, none will be used.'))
+        state.mrf_empty_tile_bytes=0
+    else:
+        # Verify that the empty tile can be found.
+        mrf_empty_tile_existing=glob.glob(mrf_empty_tile_filename)
+        if len(mrf_empty_tile_existing) == 0:
+            mssg=str().join(['Specified empty tile file not found:  ', mrf_empty_tile_filename])
+            log_sig_exit('ERROR', mssg, sigevent_url)
+
+        # Verify that the empty tile image format is either PNG or JPEG.
+        mrf_empty_tile_what=imghdr.what(mrf_empty_tile_filename)
+        if mrf_empty_tile_what != 'png' and mrf_empty_tile_what != 'jpeg' and mrf_empty_tile_what != 'tiff':
+            mssg='Empty tile image format must be either png, jpeg, or tiff.'
+            log_sig_exit('ERROR', mssg, sigevent_url)
+        
+        # Verify that the empty tile matches MRF compression type.
+        if mrf_empty_tile_what == 'png':
+            # Check the last 3 characters in case of PNG or PPNG.
+            if mrf_compression_type[-3:len(mrf_compression_type)] != 'PNG':
+                mssg='Empty tile format does not match MRF compression type.'
+                log_sig_exit('ERROR', mssg, sigevent_url)
+        
+        if mrf_empty_tile_what == 'jpeg':
+            # Check the first 2 characters in case of JPG or JPEG.
+            if mrf_compression_type[0:2] != 'JP':
+                mssg='Empty tile format does not match MRF compression type.'
+                log_sig_exit('ERROR', mssg, sigevent_url)
+        
+        # Report empty tile size in bytes.
+        state.mrf_empty_tile_bytes=os.path.getsize(mrf_empty_tile_filename)
+        log_info_mssg(str().join(['Empty tile size is:             ',
+                                  str(state.mrf_empty_tile_bytes), ' bytes.']))
+
+    # Read previous cycle time string value from disk file.  
+    # Time format in txt file is "yyyymmdd.hhmmss" and will be treated as a double 
+    # precision value for comparing time stamps.
+    state.ptime_filename=os.path.join(config.input_dir, config.previous_cycle_time_file)
+    ptime_preexisting=glob.glob(state.ptime_filename)
+    # Default setting of zero will result in all tiles being procesed.
+    state.pretime='0.0'
+    if len(ptime_preexisting) > 0:
+        try:
+            # Open file.  Time format is "yyyymmdd.hhmmss".
+            ptime_file=open(state.ptime_filename, 'r')
+        except IOError:
+            # Use time zero if file unreadable or not found.
+            mssg=str().join(['All tiles will be processed because cannot open ', 
+                             state.ptime_filename])
+            # Send to log.
+            log_info_mssg(mssg)
+        else:
+            # Read file.
+            ptime_lines=ptime_file.readlines()
+            # The previous cycle time is only used for partial updates, otherwise
+            # the entire MRF is regenerated.
+            if config.partial_update == True and len(ptime_lines) > 0:
+                # Remove line termination.
+                state.pretime=ptime_lines[0].strip('\n')
+            # Close file.
+            ptime_file.close()
+
+    if state.pretime == '0.0':
+        # Send to log.
+        log_info_mssg(str().join(['No previous cycle time.',
+                                  ' All tiles will be processed.']))
+    else:
+        # Send to log.
+        log_info_mssg(str().join(['mrfgen previous_cycle_time:     ', state.pretime]))
+        log_info_mssg(str().join(['mrfgen previous cycle from:     ',
+                                  state.ptime_filename]))
+
+    # Change directory to working_dir.
+    os.chdir(config.working_dir)
+
+
+def discover_tiles(config, state):
+    """
+    Find the input tiles.  For partial updates, only tiles modified since the
+    previous cycle are kept.
+    """
+    input_dir = config.input_dir
+    mrf_compression_type = config.mrf_compression_type
+
+    # transparency flag for custom color maps; default to False
+    state.add_transparency = False
+
+    # Get list of all tile filenames.
+    if config.input_files == '':
+        if mrf_compression_type.lower() == 'jpeg' or mrf_compression_type.lower() == 'jpg':
+            alltiles=glob.glob(str().join([input_dir, '*.jpg']))
+        else: #default to png
+            alltiles=glob.glob(str().join([input_dir, '*.png']))
+    else:
+        alltiles = config.input_files.split(',')
+
+    if len(alltiles) == 0: # No tiles, check for possible tiffs
+        alltiles=glob.glob(str().join([input_dir, '*.tif*']))
+
+    if mrf_compression_type.lower() == 'jpeg' or mrf_compression_type.lower() == 'jpg':
+        state.tiff_compress = "JPEG"
+    else: # Default to png
+        state.tiff_compress = "PNG"
+
+    # For partial updates, find the MRF published by the previous cycle and only
+    # process tiles that have been modified since then.
+    state.update_mrf_filename = ''
+    state.update_idx_filename = ''
+    state.update_data_filename = ''
+    if config.partial_update == True:
+        if mrf_compression_type.lower() == 'jpeg' or mrf_compression_type.lower() == 'jpg':
+            update_data_ext = '.pjg'
+        elif mrf_compression_type.lower() == 'tif' or mrf_compression_type.lower() == 'tiff':
+            update_data_ext = '.ptf'
+        else:
+            update_data_ext = '.ppg'
+        update_mrf, update_idx, update_data, update_aux, update_vrt = get_mrf_names(update_data_ext, config.mrf_name, config.parameter_name, config.date_of_data, config.time_of_data)
+        output_dir = config.output_dir
+        if state.pretime != '0.0' and os.path.isfile(output_dir+update_mrf) and os.path.isfile(output_dir+update_idx) and os.path.isfile(output_dir+update_data):
+            state.update_mrf_filename = output_dir+update_mrf
+            state.update_idx_filename = output_dir+update_idx
+            state.update_data_filename = output_dir+update_data
+            log_info_mssg(str().join(['Partial update of existing MRF: ', state.update_mrf_filename]))
+            alltiles = [tile for tile in alltiles if get_modification_time(tile) > state.pretime]
+        else:
+            log_info_mssg('No existing MRF or previous cycle time found for partial update, the entire MRF will be created')
+
+    state.alltiles = alltiles
+
+
+def get_tile_pool(config, state):
+    """
+    Return the pool of worker threads for per-tile preprocessing, or None if
+    tiles are to be processed serially.  Each tile is an independent external
+    command, so threads are enough to keep all cores busy.
+    """
+    if state.tile_pool == None and len(state.alltiles) > 1 and state.worker_count > 1:
+        state.tile_pool = ThreadPool(min(state.worker_count, len(state.alltiles)))
+        log_info_mssg(str().join(['Preprocessing tiles with ', str(min(state.worker_count, len(state.alltiles))), ' workers']))
+    return state.tile_pool
+
+
+def validate_tiles(config, state):
+    """
+    Filter out bad JPEG tiles.
+    """
+    sigevent_url = config.sigevent_url
+    if config.mrf_compression_type.lower() == 'jpeg' or config.mrf_compression_type.lower() == 'jpg':
+        goodtiles = []
+        no_identify = False
+        for (tile, status) in map_tiles(get_tile_pool(config, state), check_jpeg_tile, state.alltiles):
+            if status == 'good':
+                goodtiles.append(tile)
+            elif status == 'bad':
+                sigevent('ERROR', 'Bad JPEG tile detected: ' + tile, sigevent_url)
+            else:
+                if no_identify == False:
+                    log_sig_warn('identify command not found, unable to detect bad JPEG tiles', sigevent_url)
+                    no_identify = True
+                goodtiles.append(tile)
+        state.alltiles = goodtiles
+
+
+def preprocess_tiles(config, state):
+    """
+    Convert TIFF and RGBA PNG tiles to paletted PNG if requested, then find
+    the tiles that have been modified since the previous cycle.
+    """
+    sigevent_url = config.sigevent_url
+    working_dir = config.working_dir
+    alltiles = state.alltiles
+
+    # Convert RGBA PNGs to indexed paletted PNGs if requested
+    if config.mrf_compression_type == 'PPNG' and config.colormap != '':
+        tile_args = [(tile, config.colormap, config.vrtnodata, working_dir, config.script_dir, state.tiff_compress) for tile in alltiles]
+        for i, (tile, tile_messages, tile_transparency) in enumerate(map_tiles(get_tile_pool(config, state), convert_tile_to_ppng, tile_args)):
+            send_tile_messages(tile_messages, sigevent_url)
+            alltiles[i] = tile
+            if tile_transparency == True:
+                state.add_transparency = True
+
+    if state.tile_pool != None:
+        state.tile_pool.close()
+        state.tile_pool.join()
+        state.tile_pool = None
+            
+    alltiles.sort()
+
+    # Initialize list of tile modification times.
+    modtimes=[]
+    # Initialize list of modified tiles.
+    modtiles=[]
+
+    # Get modification time.  To be used for comparing to previous cycle time, so 
+    # literal time accuracy is unimportant.  Specifically, time ranking will be 
+    # used to check for tiles that have been created or updated since the last MRF 
+    # processing cycle.
+    log_info_mssg('List modification time for each input tile:')
+    for ndx in range(len(alltiles)):
+        # Get modification time for each file.
+        modf=get_modification_time(alltiles[ndx])
+        # Append to list.
+        modtimes.append(modf)
+        # Add to modtiles list only if tile is updated since previous cycle time.
+        if modtimes[ndx] > state.pretime:
+            modtiles.append(alltiles[ndx])
+
+    if len(modtiles) == 0:
+        mssg='No new tiles since previous cycle time.'
+        log_sig_exit('INFO', mssg, sigevent_url)
+
+    # Send to log.
+    log_info_mssg(str().join(['new tiles:  ', str(len(modtiles))]))
+
+    # Write list of modified tiles to disk file.
+    state.mod_tiles_filename=str().join([working_dir, state.basename, '_mod_tiles.txt'])
+    try:
+        # Open file.
+        modtilesfile=open(state.mod_tiles_filename, 'w')
+    except IOError:
+        mssg=str().join(['Cannot open for write:  ', state.mod_tiles_filename])
+        log_sig_exit('ERROR', mssg, sigevent_url)
+    else:
+        # Write to file with line termination.
+        for ndx in range(len(modtiles)):
+            modtilesfile.write(str().join([modtiles[ndx], '\n']))
+        # Close file.
+        modtilesfile.close()
+
+    # Send to log.
+    log_info_mssg(state.mod_tiles_filename)
+
+    # Unless this is a partial update, process entire globe if any new
+    # tiles are detected.
+    # Write all tiles list to a file on disk.
+    state.all_tiles_filename=str().join([working_dir, state.basename, '_all_tiles.txt'])
+    try:
+        # Open file.
+        alltilesfile=open(state.all_tiles_filename, 'w')
+    except IOError:
+        mssg=str().join(['Cannot open for write:  ', state.all_tiles_filename])
+        log_sig_exit('ERROR', mssg, sigevent_url)
+    else:
+        # Write to file with line termination.
+        for ndx in range(len(alltiles)):
+            alltilesfile.write(str().join([alltiles[ndx], '\n']))
+        # Close file.
+        alltilesfile.close()
+    # Send to log.
+    log_info_mssg(str().join(['all tiles:  ', str(len(alltiles))]))
+    log_info_mssg(state.all_tiles_filename)
+
+    state.alltiles = alltiles
+    state.modtiles = modtiles
+
+
+def copy_mrf_index(mrf_filename, idx_filename, data_filename, update_mrf_filename):
+    """
+    Create a header for updating an MRF that may be served meanwhile.  The
+    header refers to the data file of the MRF, where new tiles are appended
+    after the tiles in use, and to a copy of its index, which replaces the
+    index of the MRF once the update is done.  Returns the name of the index copy.
+    Arguments:
+        mrf_filename -- the MRF header
+        idx_filename -- the index of the MRF
+        data_filename -- the data file of the MRF
+        update_mrf_filename -- the header to create
+    """
+    # The copy is renamed over the index, so it is kept in the same directory.
+    update_idx_filename = str().join([idx_filename, '.', str(os.getpid())])
+    shutil.copyfile(idx_filename, update_idx_filename)
+    dom = xml.dom.minidom.parse(mrf_filename)
+    raster = dom.getElementsByTagName('Raster')[0]
+    for (tag_name, filename) in [('DataFile', data_filename), ('IndexFile', update_idx_filename)]:
+        for tag in raster.getElementsByTagName(tag_name):
+            raster.removeChild(tag)
+        tag = dom.createElement(tag_name)
+        tag.appendChild(dom.createTextNode(os.path.abspath(filename)))
+        raster.appendChild(tag)
+    update_mrf_file = open(update_mrf_filename, 'w')
+    update_mrf_file.write(dom.toxml())
+    update_mrf_file.close()
+    return update_idx_filename
+
+
+def run_mrf_insert(tiles, mrf, sigevent_url):
+    """
+    Insert tiles into an existing MRF with mrf_insert.
+    Arguments:
+        tiles -- list of tiles to insert
+        mrf -- the MRF to update
+        sigevent_url -- Example:  'http://[host]/sigevent/events/create'
+    """
+    mrf_insert_command_list = ['mrf_insert', '-v', '-r', 'average'] + tiles + [mrf]
+    log_the_command(mrf_insert_command_list)
+    try:
+        mrf_insert = subprocess.Popen(mrf_insert_command_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError:
+        log_sig_exit('ERROR', "mrf_insert tool cannot be found.", sigevent_url)
+    insert_message = mrf_insert.communicate()[1].splitlines()
+    # Continue or break if there is an error?
+    for message in insert_message:
+        # Break on error
+        if 'ERROR' in message:
+            log_sig_exit('ERROR', message, sigevent_url)
+        else:
+            print message.strip()
+    return mrf_insert.returncode
+
+
+def insert_tiles(config, state):
+    """
+    Set up the output filenames.  Update an existing MRF with mrf_insert if
+    this is a partial update or if an MRF is part of the input, in which case
+    the pipeline ends here.
+    """
+    sigevent_url = config.sigevent_url
+    output_dir = config.output_dir
+    cache_dir = config.cache_dir
+    parameter_name = config.parameter_name
+    basename = state.basename
+    mrf_compression_type = config.mrf_compression_type
+
+    # Convert date of the data into day of the year.  Requred for TWMS server.
+    doy=get_doy_string(config.date_of_data)
+    # Combine year and doy to conform to TWMS convention (yyyydoy).
+    doy=str().join([config.date_of_data[0:4], str(doy)])
+    # Send to log.
+    log_info_mssg(str().join(['doy:  ', doy]))
+
+    # The .mrf file is the XML component of the MRF format.
+    state.mrf_filename=str().join([output_dir, basename, '.mrf'])
+    # The .idx file is the index compnent of the MRF format.
+    state.idx_filename=str().join([output_dir, basename, '.idx'])
+    # Construct the linknames.  These "idx" links will make the data active.
+    state.cache_idx_linkname=str().join([cache_dir, parameter_name, doy, '_.idx'])
+    state.cache_idx_ttttttt=str().join([cache_dir, parameter_name, 'TTTTTTT_.idx'])
+
+    # The image component of MRF is .pjg or .ppg, depending on compression type.
+    if mrf_compression_type == 'PNG' or mrf_compression_type == 'PPNG':
+        out_ext = '.ppg'
+    elif mrf_compression_type == 'JPG' or mrf_compression_type == 'JPEG':
+        out_ext = '.pjg'
+    elif mrf_compression_type == 'TIF' or mrf_compression_type == 'TIFF':
+        out_ext = '.ptf'
+    else:
+        mssg='Unrecognized compression type for MRF: ' + mrf_compression_type 
+        log_sig_exit('ERROR', mssg, sigevent_url)
+    # Output filename.
+    state.out_filename=str().join([output_dir, basename, out_ext])
+    # Linknames.
+    state.cache_out_linkname=str().join([cache_dir, parameter_name, doy, '_', out_ext])
+    state.cache_out_ttttttt=str().join([cache_dir, parameter_name, 'TTTTTTT_', out_ext])
+
+    # The .vrt file is the XML describing the virtual image mosaic layout.
+    state.vrt_filename=str().join([config.working_dir, basename, '.vrt'])
+
+    # Partial update: insert only the modified tiles into the existing MRF.
+    # mrf_insert also regenerates the overview tiles covering the inserted area.
+    # The published MRF may be served: mrf_insert appends the tiles to its data
+    # file and updates a copy of its index, which then replaces the index.
+    if state.update_mrf_filename != '':
+        log_info_mssg(str().join(['Inserting ', str(len(state.modtiles)), ' modified tiles into ', state.update_mrf_filename]))
+        update_mrf_filename = str().join([config.working_dir, basename, '_update.mrf'])
+        update_idx_filename = copy_mrf_index(state.update_mrf_filename, state.update_idx_filename,
+                                             state.update_data_filename, update_mrf_filename)
+        try:
+            returncode = run_mrf_insert(state.modtiles, update_mrf_filename, sigevent_url)
+            if returncode != 0:
+                log_sig_exit('ERROR', 'mrf_insert failed with return code ' + str(returncode), sigevent_url)
+        except MrfgenExit:
+            # The published index is unchanged.
+            remove_file(update_idx_filename)
+            raise
+        os.rename(update_idx_filename, state.update_idx_filename)
+        remove_file(update_mrf_filename)
+
+        # Clean up
+        remove_file(state.mod_tiles_filename)
+        remove_file(state.all_tiles_filename)
+        remove_temp_tiles(state.alltiles, config.working_dir)
+        # The next cycle only needs tiles modified after this one.
+        write_previous_cycle_time(state.ptime_filename, state.current_cycle_time, sigevent_url)
+
+        mssg=str().join(['MRF updated:  ', state.update_mrf_filename])
+        log_sig_exit('INFO', mssg, sigevent_url)
+
+    # Make certain output files do not preexist.  GDAL has issues with that.
+    remove_file(state.mrf_filename)
+    remove_file(state.idx_filename)
+    remove_file(state.out_filename)
+    remove_file(state.vrt_filename)
+    
+    # Check if this is an MRF insert update, if not then regenerate a new MRF
+    mrf_list = []
+    for tile in list(state.alltiles):
+        if '.mrf' in tile.lower():
+            mrf_list.append(tile)
+            state.alltiles.remove(tile)
+    if len(mrf_list) == 0 and config.input_files == '':
+        mrf_list = glob.glob(str().join([config.input_dir, '*.mrf']))
+    # Should only be one MRF, so use that one
+    if len(mrf_list) > 0:
+        mrf = mrf_list[0]
+        print "Inserting new tiles to", mrf
+        run_mrf_insert(state.alltiles, mrf, sigevent_url)
+
+        # Copy MRF to output
+        shutil.copy(mrf, state.mrf_filename)
+        shutil.copy(mrf.replace('.mrf','.idx'), state.idx_filename)
+        shutil.copy(mrf.replace('.mrf',state.out_filename[-4:]), state.out_filename)
+        
+        # Clean up
+        remove_file(state.mod_tiles_filename)
+        remove_file(state.all_tiles_filename)
+        remove_file(state.ptime_filename)
+
+        # Exit here since we don't need to build an MRF from scratch
+        mssg=str().join(['MRF created:  ', state.out_filename])
+        log_sig_exit('INFO', mssg, sigevent_url)
+
+
+def mosaic(config, state):
+    """
+    Build a VRT mosaic of all tiles (gdalbuildvrt).
+    """
+    sigevent_url = config.sigevent_url
+    target_x = state.target_x
+    # Capture stderr to record skipped .png files that are not valid PNG+World.
+    state.gdalbuildvrt_stderr_filename=str().join([config.working_dir, state.basename,
+                                                   '_gdalbuildvrt_stderr.txt'])
+    # Intermediate GeoTIFF used when resizing with gdalwarp.
+    state.resize_filename = ''
+
+    if config.engine == 'python':
+        # Run gdalbuildvrt in-process, keeping the VRT in memory.
+        state.vrt_filename = state.gdal_engine.memory_filename(state.vrt_filename)
+        if target_x != '':
+            resolution = (360.0/int(target_x), 360.0/int(target_x))
+            vrt_srs = config.source_epsg
+        else:
+            resolution = None
+            vrt_srs = None
+        try:
+            log_info_mssg_with_timestamp('GDAL engine: gdalbuildvrt ' + state.vrt_filename)
+            state.gdal_engine.build_vrt(state.vrt_filename, state.alltiles, (config.xmin, config.ymin, config.xmax, config.ymax),
+                                        resolution=resolution, srs=vrt_srs, vrtnodata=config.vrtnodata)
+        except GDALEngineError, e:
+            log_sig_exit('ERROR', str(e), sigevent_url)
+    else:
+        # Create the gdalbuildvrt command.
+        #RESCALE BLUE MARBLE AND USE BLOCKSIZE=256.
+        #CONSIDER DOING THIS FOR EVERY SOTO DATASET.
+        #xres=str(360./65536)
+        #yres=xres
+        #              '-resolution', 'user', '-tr', xres, yres,
+        #              '-addalpha',
+        #target_x=str(360.0/int(target_x))
+        #target_y=target_x
+    
+        gdalbuildvrt_command_list=['gdalbuildvrt','-q', '-te', config.xmin, config.ymin, config.xmax, config.ymax,'-input_file_list', state.all_tiles_filename]
+        # use resolution?
+        if target_x != '':
+            xres = str(360.0/int(target_x))
+            yres = xres
+            gdalbuildvrt_command_list.append('-resolution')
+            gdalbuildvrt_command_list.append('user')
+            gdalbuildvrt_command_list.append('-tr')
+            gdalbuildvrt_command_list.append(xres)
+            gdalbuildvrt_command_list.append(yres)
+            gdalbuildvrt_command_list.append('-a_srs')
+            gdalbuildvrt_command_list.append(config.source_epsg)
+        if config.vrtnodata != "":
+            gdalbuildvrt_command_list.append('-vrtnodata')
+            gdalbuildvrt_command_list.append(config.vrtnodata)
+        # add VRT filename at the end        
+        gdalbuildvrt_command_list.append(state.vrt_filename)
+    
+        # USE GDAL_TRANSLATE -OUTSIZE INSTEAD OF -TR.
+        #'-tr', target_x, target_y, '-resolution', 'user'
+        # Log the gdalbuildvrt command.
+        log_the_command(gdalbuildvrt_command_list)
+        # Open stderr file for write.
+        gdalbuildvrt_stderr_file=open(state.gdalbuildvrt_stderr_filename, 'w')
+
+        #---------------------------------------------------------------------------
+        # Execute gdalbuildvrt.
+        subprocess.call(gdalbuildvrt_command_list, stderr=gdalbuildvrt_stderr_file)
+        #---------------------------------------------------------------------------
+
+        # Close stderr file.
+        gdalbuildvrt_stderr_file.close()
+
+
+def reproject(config, state):
+    """
+    Reproject the VRT to the target EPSG (gdalwarp).
+    """
+    if config.target_epsg == config.source_epsg:
+        return
+    log_info_mssg("Converting tiles to " + config.target_epsg)
+    target_extents = (config.target_xmin, config.target_ymin, config.target_xmax, config.target_ymax)
+    if config.engine == 'python':
+        try:
+            log_info_mssg_with_timestamp('GDAL engine: gdalwarp ' + config.source_epsg + ' to ' + config.target_epsg)
+            reproj_filename = state.gdal_engine.memory_filename(state.vrt_filename.replace('.vrt','_reproj.vrt'))
+            state.vrt_filename = state.gdal_engine.warp(reproj_filename, state.vrt_filename, 'VRT', config.reprojection_resampling,
+                                                        target_extents, source_srs=config.source_epsg, target_srs=config.target_epsg)
+        except GDALEngineError, e:
+            log_sig_exit('ERROR', str(e), config.sigevent_url)
+    else:
+        gdal_warp_command_list = ['gdalwarp', '-of', 'VRT' ,'-r', config.reprojection_resampling, '-s_srs', config.source_epsg, '-t_srs', config.target_epsg, '-te'] + list(target_extents) + ['-multi', state.vrt_filename, state.vrt_filename.replace('.vrt','_reproj.vrt')]
+        log_the_command(gdal_warp_command_list)
+        gdalbuildvrt_stderr_file=open(state.gdalbuildvrt_stderr_filename, 'a')
+        subprocess.call(gdal_warp_command_list, stderr=gdalbuildvrt_stderr_file)
+        gdalbuildvrt_stderr_file.close()
+        state.vrt_filename = state.vrt_filename.replace('.vrt','_reproj.vrt')
+
+
+def resize(config, state):
+    """
+    Resize the VRT with a resampling method if declared (gdalwarp).
+    """
+    if config.resize_resampling == '':
+        return
+    if state.target_y == '':
+        state.target_y = int(int(state.target_x)/2)
+    extents = (config.xmin, config.ymin, config.xmax, config.ymax)
+    if config.engine == 'python':
+        gdal_engine = state.gdal_engine
+        state.resize_filename = config.working_dir + os.path.basename(state.vrt_filename).replace('.vrt','.tif')
+        try:
+            log_info_mssg_with_timestamp('GDAL engine: gdalwarp ' + state.resize_filename)
+            gdal_engine.warp(state.resize_filename, state.vrt_filename, 'GTiff', config.resize_resampling,
+                             extents, size=(state.target_x, state.target_y))
+            gdal_engine.build_vrt(state.vrt_filename, [state.resize_filename], extents, srcnodata='0')
+            # add transparency
+            vrt_text = gdal_engine.read_text(state.vrt_filename)
+            vrt_text = vrt_text.replace('c1="0" c2="0" c3="0" c4="255"', 'c1="0" c2="0" c3="0" c4="0"')
+            gdal_engine.write_text(state.vrt_filename, vrt_text)
+        except GDALEngineError, e:
+            log_sig_exit('ERROR', str(e), config.sigevent_url)
+    else:
+        vrt_filename = state.vrt_filename
+        state.resize_filename = vrt_filename.replace('.vrt','.tif')
+        gdal_warp_command_list = ['gdalwarp', '-of', 'GTiff' ,'-r', config.resize_resampling, '-ts', str(state.target_x), str(state.target_y), '-te'] + list(extents) + ['-overwrite', vrt_filename, state.resize_filename]
+        gdalbuildvrt_command_list2 = ['gdalbuildvrt', '-q', '-srcnodata', '0', '-overwrite', vrt_filename, state.resize_filename]
+     
+        log_the_command(gdal_warp_command_list)
+        log_the_command(gdalbuildvrt_command_list2)
+        gdalbuildvrt_stderr_file=open(state.gdalbuildvrt_stderr_filename, 'a')
+        subprocess.call(gdal_warp_command_list, stderr=gdalbuildvrt_stderr_file)
+        subprocess.call(gdalbuildvrt_command_list2, stderr=gdalbuildvrt_stderr_file)
+        gdalbuildvrt_stderr_file.close()
+    
+        # add transparency
+        new_vrt = open(vrt_filename,"r+")
+        vrt_lines = new_vrt.readlines()
+        for idx in range(0, len(vrt_lines)):
+            vrt_lines[idx] = vrt_lines[idx].replace('c1="0" c2="0" c3="0" c4="255"', 'c1="0" c2="0" c3="0" c4="0"')
+        new_vrt.seek(0)
+        new_vrt.truncate()
+        new_vrt.writelines(vrt_lines)
+        new_vrt.close() 
+
+
+def verify_vrt(config, state):
+    """
+    Report skipped tiles and check that the VRT was created.  A VRT that is
+    not newer than the previous cycle is reported with a warning, and no MRF
+    is created from it.
+    """
+    sigevent_url = config.sigevent_url
+    if config.engine == 'python':
+        # Report skipped .png files that are not valid PNG+World.
+        for warning in state.gdal_engine.warnings:
+            log_sig_warn(str().join(['gdalbuildvrt ', warning]), sigevent_url)
+        state.gdal_engine.warnings = []
+        # Clean up.
+        remove_file(state.mod_tiles_filename)
+        remove_file(state.all_tiles_filename)
+        # Engine failures have already exited, no need to check time stamps.
+        state.vrtf = state.current_cycle_time
+        state.vrt_created = True
+    else:
+        # Open stderr file for read.
+        gdalbuildvrt_stderr_file=open(state.gdalbuildvrt_stderr_filename, 'r')
+        # Report skipped .png files that are not valid PNG+World.
+        gdalbuildvrt_stderr=gdalbuildvrt_stderr_file.readlines()
+        # Loop over all lines in file.
+        for ndx in range(len(gdalbuildvrt_stderr)):
+            # Get line number(s) where skipped files appear in the stderr file.
+            skipped=gdalbuildvrt_stderr[ndx].find('Warning')
+            # If a line (including line 0) was found.
+            if skipped >= 0:
+                mssg=str().join(['gdalbuildvrt ', gdalbuildvrt_stderr[ndx]])
+                log_sig_warn(mssg, sigevent_url)
+        # Close file.
+        gdalbuildvrt_stderr_file.close()
+
+        # Clean up.
+        remove_file(state.mod_tiles_filename)
+        remove_file(state.all_tiles_filename)
+        # Check if vrt was created.
+        vrt_output=glob.glob(state.vrt_filename)
+        if len(vrt_output) == 0:
+            mssg=str().join(['Fail:  gdalbuildvrt',
+                             '  May indicate no georeferenced tiles found.',
+                             #'  May indicate unappropriate target_x.',
+                             '  Look at stderr file:  ', 
+                             state.gdalbuildvrt_stderr_filename])
+            log_sig_exit('ERROR', mssg, sigevent_url)
+        state.vrtf=get_modification_time(state.vrt_filename)
+        state.vrt_created = state.vrtf > state.pretime
+
+    # Create mrf only if vrt was successful.
+    if state.vrt_created:
+        remove_file(state.gdalbuildvrt_stderr_filename)
+    else:
+        log_info_mssg(str().join(['vrtf = ',str(state.vrtf)]))
+        log_info_mssg(str().join(['pretime = ',str(state.pretime)]))
+        log_info_mssg('vrtf should be >= pretime')
+        mssg=str().join(['Unsuccessful:  gdalbuildvrt',
+                         '  Possible that input files not found.',
+                         '  Check stderr file: ',state.gdalbuildvrt_stderr_filename])
+        log_sig_warn(mssg, sigevent_url)
+
+
+def colormap(config, state):
+    """
+    Insert the color map into the VRT if provided (colormap2vrt.py).
+    """
+    if config.colormap == '' or not state.vrt_created:
+        return
+    sigevent_url = config.sigevent_url
+    if config.engine == 'python' and state.vrt_filename.startswith(VSIMEM):
+        # colormap2vrt.py runs in its own process, so it needs the VRT on disk.
+        gdal_engine = state.gdal_engine
+        disk_vrt_filename = config.working_dir + os.path.basename(state.vrt_filename)
+        gdal_engine.write_text(disk_vrt_filename, gdal_engine.read_text(state.vrt_filename))
+        gdal_engine.unlink(state.vrt_filename)
+        state.vrt_filename = disk_vrt_filename
+    vrt_filename = state.vrt_filename
+    new_vrt_filename = vrt_filename.replace('.vrt','_newcolormap.vrt')
+    colormap2vrt_command_list=[config.script_dir+'colormap2vrt.py','--colormap',config.colormap,'--output',new_vrt_filename,'--merge',vrt_filename, '--sigevent_url', sigevent_url]
+    if state.add_transparency == True:
+        colormap2vrt_command_list.append('--transparent')
+    log_the_command(colormap2vrt_command_list)
+    colormap2vrt_stderr_filename=str().join([config.working_dir, state.basename,'_colormap2vrt_stderr.txt'])
+    colormap2vrt_stderr_file=open(colormap2vrt_stderr_filename, 'w+')
+    subprocess.call(colormap2vrt_command_list, stderr=colormap2vrt_stderr_file)
+    colormap2vrt_stderr_file.seek(0)
+    colormap2vrt_stderr = colormap2vrt_stderr_file.read()
+    print colormap2vrt_stderr
+    if "Error" in colormap2vrt_stderr:
+        log_sig_exit('ERROR', "Error executing colormap2vrt.py with colormap:" + config.colormap, sigevent_url)
+
+    if os.path.isfile(new_vrt_filename):
+        remove_file(vrt_filename)
+        remove_file(colormap2vrt_stderr_filename)
+        state.vrt_filename = new_vrt_filename
+
+
+def translate(config, state):
+    """
+    Create the MRF from the VRT (gdal_translate).
+    """
+    if not state.vrt_created:
+        return
+    sigevent_url = config.sigevent_url
+    engine = config.engine
+    gdal_engine = state.gdal_engine
+    vrt_filename = state.vrt_filename
+    mrf_filename = state.mrf_filename
+    mrf_compression_type = config.mrf_compression_type
+
+    # Set the compression type for gdal_translate (-co NAME=VALUE).
+    if mrf_compression_type == 'PNG':
+        # Unpaletted PNG.
+        compress=str('COMPRESS=PNG')
+    elif mrf_compression_type == 'PPNG':
+        # Paletted PNG.
+        compress=str('COMPRESS=PPNG')
+    elif mrf_compression_type == 'JPG':
+        compress=str('COMPRESS=JPEG')
+    elif mrf_compression_type == 'JPEG':
+        compress=str('COMPRESS=JPEG')
+    elif mrf_compression_type == 'TIFF' or mrf_compression_type == 'TIF':
+        compress=str('COMPRESS=TIF')
+    else:
+        mssg='Unrecognized compression type for MRF.'
+        log_sig_exit('ERROR', mssg, sigevent_url)
+
+    # Set the blocksize for gdal_translate (-co NAME=VALUE).
+    blocksize=str().join(['BLOCKSIZE=', config.mrf_blocksize])
+
+    # Get input size.
+    if engine == 'python':
+        dom=xml.dom.minidom.parseString(gdal_engine.read_text(vrt_filename))
+    else:
+        dom=xml.dom.minidom.parse(vrt_filename)
+    rastersize_elements=dom.getElementsByTagName('VRTDataset')
+    x_size=rastersize_elements[0].getAttribute('rasterXSize') #width
+    y_size=rastersize_elements[0].getAttribute('rasterYSize') #height
+    
+    target_x = state.target_x
+    if target_x == '':
+        log_info_mssg('x size and y size from VRT ' + x_size + "," + y_size)
+        exp=11 #minimum outsize 20480 for EPSG4326_2km
+        while int(10*(2**exp)) < int(x_size):
+            #print str(10*(2**exp)) + " is less than " + str(x_size)
+            exp+=1
+        target_x=str(10*(2**exp))            
+        log_info_mssg('Calculating target_x from VRT to ' + target_x)          
+
+    # Only use new target size if different.
+    if target_x != x_size:
+        # Calculate output size of Y dimension and maintain aspect ratio.
+        target_y=str(int(float(target_x)*(float(y_size)/float(x_size))))
+        log_info_mssg('Calculating target_y ' + target_y)
+    else: #don't bother calculating y
+        #target_x=x_size
+        target_y=y_size
+        log_info_mssg('Setting target_y from VRT to ' + target_y)
+        
+    if config.target_epsg == "EPSG:3857":
+        target_y = target_x
+    state.target_x = target_x
+    state.target_y = target_y
+
+    #-----------------------------------------------------------------------
+    # Seed the MRF data file (.ppg or .pjg) with a copy of the empty tile.
+    if config.mrf_empty_tile_filename != '':
+        log_info_mssg('Seed the MRF data file with a copy of the empty tile.' )
+        log_info_mssg(str().join(['Copy ', config.mrf_empty_tile_filename,' to ', state.out_filename]))
+        shutil.copy(config.mrf_empty_tile_filename, state.out_filename)
+    #-----------------------------------------------------------------------    
+
+    # Capture stderr.
+    state.gdal_translate_stderr_filename=str().join([config.working_dir, state.basename,
+                                                     '_gdal_translate_stderr.txt'])
+    if engine == 'python':
+        log_info_mssg_with_timestamp('GDAL engine: gdal_translate ' + mrf_filename)
+        try:
+            gdal_engine.translate_mrf(mrf_filename, vrt_filename, compress, blocksize, (target_x, target_y))
+        except GDALEngineError, e:
+            log_sig_exit('ERROR', str(e), sigevent_url)
+    else:
+        # Create the gdal_translate command.
+        gdal_translate_command_list=['gdal_translate', '-q', '-of', 'MRF',
+                                     '-co', compress, '-co', blocksize,
+                                     '-outsize', target_x, target_y,
+                                     vrt_filename, mrf_filename]
+        # Log the gdal_translate command.
+        log_the_command(gdal_translate_command_list)
+        # Open stderr file for write.
+        gdal_translate_stderr_file=open(state.gdal_translate_stderr_filename, 'w')
+
+        #-------------------------------------------------------------------
+        # Execute gdal_translate.
+        subprocess.call(gdal_translate_command_list, 
+                        stderr=gdal_translate_stderr_file)
+        #-------------------------------------------------------------------
+
+        # Close stderr file.
+        gdal_translate_stderr_file.close()
+   
+    # Copy vrt to output
+    if config.data_only == False:
+        if engine == 'python':
+            gdal_engine.write_text(str().join([config.output_dir, state.basename, '.vrt']), gdal_engine.read_text(vrt_filename))
+        else:
+            shutil.copy(vrt_filename, str().join([config.output_dir, state.basename, '.vrt']))
+   
+    # Clean up.
+    if engine == 'python':
+        gdal_engine.cleanup()
+    remove_file(vrt_filename)
+    if config.resize_resampling != '':
+        remove_file(state.resize_filename)
+
+    # Check if MRF was created.
+    mrf_output=glob.glob(mrf_filename)
+    if len(mrf_output) == 0:
+        mssg=str().join(['Fail:  gdal_translate',
+                         ' Check gdal mrf driver plugin.',
+                         ' Check stderr file:  ', 
+                         state.gdal_translate_stderr_filename])
+        log_sig_exit('ERROR', mssg, sigevent_url)
+
+    # Get largest x,y dimension of MRF, usually x.
+    try:
+        # Open file.
+        mrf_file=open(mrf_filename, 'r')
+    except IOError:
+        mssg=str().join(['Cannot read:  ', mrf_filename])
+        log_sig_exit('ERROR', mssg, sigevent_url)
+    else:
+        dom=xml.dom.minidom.parse(mrf_file)
+        # Raster
+        size_elements=dom.getElementsByTagName('Size')
+        sizeX=size_elements[0].getAttribute('x') #width
+        sizeY=size_elements[0].getAttribute('y') #height
+        sizeC=size_elements[0].getAttribute('c') #bands
+        # Send to log.
+        log_info_mssg(str().join(['size of MRF:  ', sizeX, ' x ', sizeY]))
+        # Close file.
+        mrf_file.close()
+        # Get largest dimension, usually X.
+        state.actual_size=max([int(sizeX), int(sizeY)])
+
+    # Create pyramid only if idx (MRF index file) was successfully created.
+    idxf=get_modification_time(state.idx_filename)
+    if engine == 'python':
+        # gdal_translate failures have already exited.
+        translated = True
+    else:
+        translated = idxf >= state.vrtf
+    if translated:
+        remove_file(state.gdal_translate_stderr_filename)
+    else:
+        log_info_mssg(str().join(['idxf = ',str(idxf)]))
+        log_info_mssg(str().join(['vrtf = ',str(state.vrtf)]))
+        log_info_mssg('idxf should be >= vrtf')
+        mssg=str().join(['Unsuccessful:  gdal_translate   ',
+                         'Check the gdal mrf driver plugin.  ',
+                         'Check stderr file: ',
+                         state.gdal_translate_stderr_filename])
+        log_sig_exit('ERROR', mssg, sigevent_url)
+
+
+def overview(config, state):
+    """
+    Build the MRF overviews (gdaladdo) and store the current cycle time.
+    """
+    if not state.vrt_created:
+        return
+    sigevent_url = config.sigevent_url
+    engine = config.engine
+    overview_levels = config.overview_levels
+    idx_filename = state.idx_filename
+    mrf_filename = state.mrf_filename
+    compare_time=time.strftime('%Y%m%d.%H%M%S', time.localtime())
+    old_stats=os.stat(idx_filename)
+
+    if overview_levels == '' or int(overview_levels[0])>1:
+        # Build out the list of gdaladdo pyramid levels (a.k.a. overviews).
+        overview_list=[]
+        if overview_levels == '':
+            overview=2
+            overview_list.append(str(overview))
+            exp=2
+            while (overview*long(config.mrf_blocksize)) < state.actual_size:
+                overview=2**exp
+                exp=exp+1
+                overview_list.append(str(overview))
+        else:
+            for overview in overview_levels:
+                overview_list.append(str(overview))
+        # Capture stderr.
+        gdaladdo_stderr_filename=str().join([config.working_dir, state.basename,
+                                             '_gdaladdo_stderr.txt'])
+        if engine == 'python':
+            log_info_mssg_with_timestamp('GDAL engine: gdaladdo ' + ' '.join(overview_list))
+            try:
+                state.gdal_engine.build_overviews(mrf_filename, config.overview_resampling, overview_list)
+            except GDALEngineError, e:
+                log_sig_exit('ERROR', str(e), sigevent_url)
+            addf=compare_time
+            new_stats=old_stats
+        else:
+            # Create the gdaladdo command.
+            gdaladdo_command_list=['gdaladdo', '-q', '-r', config.overview_resampling,
+                                   str(mrf_filename)] + overview_list
+            # Log the gdaladdo command.
+            log_the_command(gdaladdo_command_list)
+            # Open stderr file for write.
+            gdaladdo_stderr_file=open(gdaladdo_stderr_filename, 'w')
+
+            #---------------------------------------------------------------
+            # Execute gdaladdo.
+            subprocess.call(gdaladdo_command_list, stderr=gdaladdo_stderr_file)
+            #---------------------------------------------------------------
+
+            # Close stderr file.
+            gdaladdo_stderr_file.close()
+
+            # Update previous cycle time only if gdaladdo was successful.
+            addf=get_modification_time(idx_filename)
+            new_stats=os.stat(idx_filename)
+
+        # Check for gdaladdo success by checking time stamp and file size.
+        if (addf >= compare_time) or (new_stats.st_size >= old_stats.st_size):
+            remove_file(gdaladdo_stderr_filename)
+            # If MRF sucessfully created, then store current cycle time.
+            write_previous_cycle_time(state.ptime_filename, state.current_cycle_time, sigevent_url)
+        else:
+            log_info_mssg(str().join(['addf = ',str(addf)]))
+            log_info_mssg(str().join(['compare_time = ',str(compare_time)]))
+            log_info_mssg('addf should be >= compare_time')
+            log_info_mssg(str().join(['new_stats.st_size = ',
+                                      str(new_stats.st_size)]))
+            log_info_mssg(str().join(['old_stats.st_size = ',
+                                      str(old_stats.st_size)]))
+            log_info_mssg('new_stats.st_size should be >= old_stats.st_size')
+            mssg=str().join(['Unsuccessful:  gdaladdo   Check stderr file: ',
+                             gdaladdo_stderr_filename])
+            log_sig_exit('ERROR', mssg, sigevent_url)
+
+
+def publish(config, state):
+    """
+    Rename the MRF files to the configured naming convention and clean up.
+    """
+    output_dir = config.output_dir
+    working_dir = config.working_dir
+    basename = state.basename
+    mrf_filename = state.mrf_filename
+    # Rename MRFs
+    if config.mrf_name != '' and state.vrt_created:
+        output_mrf, output_idx, output_data, output_aux, output_vrt = get_mrf_names(state.out_filename, config.mrf_name, config.parameter_name, config.date_of_data, config.time_of_data)
+        log_info_mssg(str().join(['Moving ',mrf_filename, ' to ', output_dir+output_mrf]))
+        shutil.move(mrf_filename, output_dir+output_mrf)
+        log_info_mssg(str().join(['Moving ',state.idx_filename, ' to ', output_dir+output_idx]))
+        shutil.move(state.idx_filename, output_dir+output_idx)
+        log_info_mssg(str().join(['Moving ',state.out_filename, ' to ', output_dir+output_data]))
+        shutil.move(state.out_filename, output_dir+output_data)
+        if config.data_only == False:
+            if os.path.isfile(mrf_filename+".aux.xml"):
+                log_info_mssg(str().join(['Moving ',mrf_filename+".aux.xml", ' to ', working_dir+output_aux]))
+                shutil.move(mrf_filename+".aux.xml", working_dir+output_aux)
+            if os.path.isfile(str().join([output_dir, basename, '.vrt'])):
+                log_info_mssg(str().join(['Moving ',str().join([output_dir, basename, '.vrt']), ' to ', working_dir+output_vrt]))
+                shutil.move(str().join([output_dir, basename, '.vrt']), working_dir+output_vrt)
+        state.mrf_filename = output_dir+output_mrf
+        state.out_filename = output_dir+output_data
+        
+    # Leave only MRF data, index, and header files
+    if config.data_only == True:
+        remove_file(state.log_filename)
+        remove_file(output_dir+"/"+basename+".mrf.aux.xml")
+        remove_file(working_dir+"/"+basename+".configuration_file.xml")
+
+    # Remove temp tiles
+    remove_temp_tiles(state.alltiles, working_dir)
+    # Keep the previous cycle time for the next partial update.
+    if config.partial_update == False:
+        remove_file(state.ptime_filename)
+
+    # Send to log.
+    if state.vrt_created:
+        mssg=str().join(['MRF created:  ', state.out_filename])
+    else:
+        mssg=str().join(['MRF not created:  ', state.out_filename])
+    log_sig_exit('INFO', mssg, config.sigevent_url)
@@ -0,0 +1,206 @@
+#!/bin/env python
+
+# Copyright (c) 2002-2015, California Institute of Technology.
+# All rights reserved.  Based on Government Sponsored Research under contracts NAS7-1407 and/or NAS7-03001.
+# 
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+#   1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+#   2. Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#   3. Neither the name of the California Institute of Technology (Caltech), its operating division the Jet Propulsion Laboratory (JPL),
+#      the National Aeronautics and Space Administration (NASA), nor the names of its contributors may be used to
+#      endorse or promote products derived from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE CALIFORNIA INSTITUTE OF TECHNOLOGY BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+#
+# Per-tile preprocessing for mrfgen.
+#
+# The worker functions run in a pool of threads and return their log
+# messages, so that the main thread can send them in input order.
+#
+# Global Imagery Browse Services
+# NASA Jet Propulsion Laboratory
+# 2015
+
+import os
+import shutil
+import subprocess
+from mrfgen.log import sigevent, log_info_mssg, log_info_mssg_with_timestamp, log_sig_warn, log_sig_exit
+from mrfgen.utils import format_command
+
+# Commands run by the tile workers use close_fds=True: under Python 2 a child started
+# by one thread would otherwise inherit the pipes of children started by other threads,
+# and communicate() would wait for those children to exit as well.
+
+def check_jpeg_tile(tile):
+    """
+    Check a JPEG tile with identify.  Runs in a worker thread, so nothing is
+    logged here.  Returns (tile, status) where status is 'good', 'bad', or
+    'no_identify' if the identify command is not available.
+    Arguments:
+        tile -- the input tile filename
+    """
+    if ".mrf" in tile: # ignore MRF inserts
+        return (tile, 'good')
+    # Create the identify command.
+    identify_command_list=['identify', tile]
+    # Execute identify.
+    try:
+        identify_process = subprocess.Popen(identify_command_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                            close_fds=True)
+        identify_output = identify_process.communicate()[0]
+    except OSError:
+        return (tile, 'no_identify')
+    if 'DirectClass' in identify_output.split('\n')[0]:
+        return (tile, 'good')
+    else:
+        return (tile, 'bad')
+
+def convert_tile_to_ppng(args):
+    """
+    Convert a TIFF or RGBA PNG tile to an indexed paletted PNG.  Runs in a
+    worker thread, so log messages are returned instead of being sent.
+    Returns (tile, messages, add_transparency) where tile is the tile to use
+    in the VRT and messages is a list of (type, mssg) for the parent to send
+    in order.  Message types are 'command', 'print', 'info', 'warn',
+    'error' (sigevent only), and 'exit'.
+    Arguments:
+        args -- tuple of (tile, colormap, vrtnodata, working_dir, script_dir, tiff_compress)
+    """
+    tile, colormap, vrtnodata, working_dir, script_dir, tiff_compress = args
+    messages = []
+    new_tile = tile
+    add_transparency = False
+    temp_tile = None
+    
+    # Check to see if tif files need to be converted
+    if '.tif' in tile.lower():
+        # Convert TIFF files
+        messages.append(('print', "Converting TIFF file " + tile + " to " + tiff_compress))
+           
+        # Create the gdal_translate command.
+        gdal_translate_command_list=['gdal_translate', '-q', '-of', tiff_compress, '-co', 'WORLDFILE=YES',
+                                     tile, working_dir+os.path.basename(tile).split('.')[0]+'.'+str(tiff_compress).lower()]
+        # Log the gdal_translate command.
+        messages.append(('command', format_command(gdal_translate_command_list)))
+   
+        # Execute gdal_translate.
+        subprocess.call(gdal_translate_command_list, stdout=subprocess.PIPE,
+                        stderr=subprocess.PIPE, close_fds=True)
+           
+        # Replace with new tiles
+        tile = working_dir+os.path.basename(tile).split('.')[0]+'.'+str(tiff_compress).lower()
+        temp_tile = tile
+        
+    # Check input PNGs if RGBA, then convert        
+    if '.png' in tile.lower():
+        
+        # Run the gdal_info on PNG tile.
+        gdalinfo_command_list=['gdalinfo', tile]
+        messages.append(('command', format_command(gdalinfo_command_list)))
+        gdalinfo = subprocess.Popen(gdalinfo_command_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE, close_fds=True)
+        
+        # Read gdal_info output
+        if "ColorInterp=Palette" not in gdalinfo.communicate()[0]:
+            messages.append(('print', "Converting RGBA PNG to indexed paletted PNG"))
+            
+            output_tile = working_dir + os.path.basename(tile).split('.')[0]+'_indexed.png'
+            
+            # Create the RGBApng2Palpng command.
+            if vrtnodata == "":
+                fill = 0
+            else:
+                fill = vrtnodata
+            RGBApng2Palpng_command_list=[script_dir+'RGBApng2Palpng', '-v', '-lut=' + colormap,
+                                         '-fill='+str(fill), '-of='+output_tile, tile]
+            # Log the RGBApng2Palpng command.
+            messages.append(('command', format_command(RGBApng2Palpng_command_list)))
+     
+            # Execute RGBApng2Palpng.
+            try:
+                RGBApng2Palpng = subprocess.Popen(RGBApng2Palpng_command_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                                  close_fds=True)
+            except OSError:
+                messages.append(('exit', "RGBApng2Palpng tool cannot be found."))
+                return (new_tile, messages, add_transparency)
+            
+            RGBApng2Palpng_stderr = RGBApng2Palpng.communicate()[1]
+            if RGBApng2Palpng.returncode != None:
+                if  0 < RGBApng2Palpng.returncode < 255:
+                    mssg = "RGBApng2Palpng: " + str(RGBApng2Palpng.returncode) + " colors in image not found in color table"
+                    messages.append(('warn', mssg))
+                if RGBApng2Palpng.returncode == 255:
+                    stderr_lines = RGBApng2Palpng_stderr.splitlines()
+                    if len(stderr_lines) > 0:
+                        messages.append(('error', "RGBApng2Palpng: " + stderr_lines[-1]))
+            
+            if os.path.isfile(output_tile):
+                messages.append(('sigevent_info', output_tile + " created"))
+                # Replace with new tiles
+                new_tile = output_tile
+            else:
+                messages.append(('error', "RGBApng2Palpng failed to create " + output_tile))
+            
+            # Make a copy of world file
+            if os.path.isfile(tile.split('.')[0]+'.pgw'):
+                shutil.copy(tile.split('.')[0]+'.pgw', output_tile.split('.')[0]+'.pgw')
+            elif os.path.isfile(tile.split('.')[0]+'.wld'):
+                shutil.copy(tile.split('.')[0]+'.wld', output_tile.split('.')[0]+'.pgw')
+            else:
+                messages.append(('print', "World file does not exist for tile: " + tile))
+                
+            # add transparency flag for custom color map
+            add_transparency = True
+        else:
+            messages.append(('print', "Paletted PNG verified"))
+            
+    # remove tif temp tiles
+    if temp_tile != None:
+        for temp_filename in [temp_tile, temp_tile+'.aux.xml', temp_tile.split('.')[0]+'.wld']:
+            if os.path.isfile(temp_filename):
+                messages.append(('info', str().join(['Removing file:  ', temp_filename])))
+                os.remove(temp_filename)
+    
+    return (new_tile, messages, add_transparency)
+
+def map_tiles(pool, function, items):
+    """
+    Run a tile worker function over items, in parallel if a pool is given.
+    Results are always returned in the same order as items.
+    Arguments:
+        pool -- ThreadPool of tile workers, or None to run serially
+        function -- the tile worker function
+        items -- list of arguments for the worker function
+    """
+    if pool != None:
+        return pool.map(function, items, 1)
+    else:
+        return map(function, items)
+
+def send_tile_messages(messages, sigevent_url):
+    """
+    Send the messages returned by a tile worker to the log and sigevent.
+    Arguments:
+        messages -- list of (type, mssg) returned by convert_tile_to_ppng
+        sigevent_url -- Example:  'http://[host]/sigevent/events/create'
+    """
+    for (type, mssg) in messages:
+        if type == 'command':
+            log_info_mssg_with_timestamp(mssg)
+        elif type == 'print':
+            print mssg
+        elif type == 'info':
+            log_info_mssg(mssg)
+        elif type == 'warn':
+            log_sig_warn(mssg, sigevent_url)
+        elif type == 'exit':
+            log_sig_exit('ERROR', mssg, sigevent_url)
+        else:
+            sigevent(type == 'error' and 'ERROR' or 'INFO', mssg, sigevent_url)
@@ -0,0 +1,241 @@
+#!/bin/env python
+
+# Copyright (c) 2002-2015, California Institute of Technology.
+# All rights reserved.  Based on Government Sponsored Research under contracts NAS7-1407 and/or NAS7-03001.
+# 
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+#   1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+#   2. Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#   3. Neither the name of the California Institute of Technology (Caltech), its operating division the Jet Propulsion Laboratory (JPL),
+#      the National Aeronautics and Space Administration (NASA), nor the names of its contributors may be used to
+#      endorse or promote products derived from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE CALIFORNIA INSTITUTE OF TECHNOLOGY BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+#
+# Utility functions for mrfgen.
+#
+# Global Imagery Browse Services
+# NASA Jet Propulsion Laboratory
+# 2015
+
+import datetime
+import glob
+import os
+import time
+from mrfgen.log import log_info_mssg, log_sig_warn, log_sig_exit
+
+def get_modification_time(filename):
+    """
+    Return (fake) floating point value of posix modification time for a file.
+    The (fake) floating point value is yyyymmdd.hhmmss which may be treated 
+    as a floating point number for the sake of time ordering.
+    Arguments:
+        filename -- name of file for which to return the modificaton time
+    """
+    # Get posix system time for mrf file to check the modification time.
+    stats=os.stat(filename)
+    # Convert st_mtime to time string "yyyymmdd.hhmmss".
+    addt=time.strftime('%Y%m%d.%H%M%S', time.localtime(stats.st_mtime))
+    mssg=str().join(['modification time ', addt, ' ', filename])
+    # Send to log.
+    log_info_mssg(mssg)
+    # Return time as string.
+    return addt
+
+def get_dom_tag_value(dom, tag_name):
+    """
+    Return value of a tag from dom (XML file).
+    Arguments:
+        tag_name -- name of dom tag for which the value should be returned.
+    """
+    tag=dom.getElementsByTagName(tag_name)
+    value=tag[0].firstChild.data.strip()
+    return value
+
+def remove_file(filename):
+    """
+    Delete a file or link, and report this action to the log.
+    Arguments:
+        filename -- file to remove.
+    """
+    #preexisting=glob.glob(str().join([input_dir, filename]))
+    preexisting=glob.glob(filename)
+    if len(preexisting) > 0:
+        # Send to log.
+        if os.path.islink(filename):
+            log_info_mssg(str().join(['Removing link:  ', filename]))
+        else:
+            log_info_mssg(str().join(['Removing file:  ', filename]))
+        os.remove(filename)
+    #THE "CORRECT" TECHNIQUE:
+    #dirname = '/some/path/'
+    #filename = 'somefile.txt'
+    #pathname = os.path.abspath(os.path.join(dirname, filename))
+    #if pathname.startswith(dirname):
+    #   os.remove(pathname)
+    #Normalizing the path with abspath and comparing it against the target 
+    #directory avoids file names like "../../../etc/passwd" or similar.
+
+def check_abs_path(directory_path):
+    """
+    Check if directory is absolute path.
+    If not, prepend current working directory.
+        Argument:
+            directory_path -- path to check if absolute
+    """
+    if directory_path[0] != '/':
+        directory_path = os.getcwd() +'/' + directory_path
+    
+    return directory_path
+    
+
+def add_trailing_slash(directory_path):
+    """
+    Add trailing slash if one is not already present.
+    Argument:
+        directory_path -- path to which trailing slash should be confirmed.
+    """
+    # Add trailing slash.
+    if directory_path[-1] != '/':
+        directory_path=str().join([directory_path, '/'])
+    # Return directory_path with trailing slash.
+    return directory_path
+
+def verify_directory_path_exists(directory_path, variable_name, sigevent_url):
+    """
+    Verify that directory_path exists.
+    Argument:
+        directory_path -- path whose existence needs to be verified.
+        variable_name -- configuration name of the directory
+        sigevent_url -- Example:  'http://[host]/sigevent/events/create'
+    """
+    if not os.path.isdir(directory_path):
+        mssg=str().join([variable_name, ' ', directory_path, 
+                         ' does not exist.'])
+        log_sig_exit('ERROR', mssg, sigevent_url)
+
+def get_doy_string(date_of_data):
+    """
+    Convert date_of_data string into three-digit doy string.
+    Argument:
+        date_of_data -- string variable, example: 20120730
+    """
+    y=int(date_of_data[0:4])
+    m=int(date_of_data[4:6])
+    d=int(date_of_data[6:8])
+    doy=str(datetime.datetime(y, m, d).timetuple().tm_yday)
+    if int(doy) < 10:
+        doy=str().join(['00', str(int(doy))])
+    elif int(doy) < 100:
+        doy=str().join(['0', str(int(doy))])
+    return doy
+
+def lookupEmptyTile(empty_tile, script_dir, sigevent_url):
+    """
+    Lookup predefined empty tiles form config file
+    Arguments:
+        empty_tile -- name of the predefined empty tile
+        script_dir -- directory of the mrfgen script
+        sigevent_url -- Example:  'http://[host]/sigevent/events/create'
+    """
+    script_dir = os.path.dirname(os.path.join(script_dir, ''))
+    if script_dir == '/usr/bin':
+        script_dir = '/usr/share/onearth/mrfgen' # use default directory if in bin
+    try:
+        empty_config_file=open(script_dir+"/empty_config", 'r')
+    except IOError:
+        log_sig_exit('ERROR', script_dir+"/empty_config could not be found", sigevent_url)
+    tiles = {}
+    for line in empty_config_file:
+        (key, val) = line.split()
+        tiles[key] = val
+    
+    try:
+        if tiles[empty_tile][0] == '/':   
+            return os.path.abspath(tiles[empty_tile])
+        else:
+            return os.path.abspath(script_dir+"/"+tiles[empty_tile])
+    except KeyError:
+        mssg = '"' + empty_tile + '" is not a valid empty tile.'
+        log_sig_exit('ERROR', mssg, sigevent_url)
+        
+def get_mrf_names(mrf_data, mrf_name, parameter_name, date_of_data, time_of_data):
+    """
+    Convert MRF filenames to specified naming convention (mrf_name).
+    Argument:
+        mrf_data -- the created MRF data file
+        mrf_name -- the MRF naming convention to use
+        parameter_name -- MRF parameter name
+        date_of_data -- the date of the MRF data, example: 20120730
+        time_of_data -- the time of subdaily MRF data in UTC, 113019 (11:30:19am)
+    """
+    if len(time_of_data) == 6:
+        mrf_date = datetime.datetime.strptime(str(date_of_data)+str(time_of_data),"%Y%m%d%H%M%S")
+    else: 
+        mrf_date = datetime.datetime.strptime(date_of_data,"%Y%m%d")
+    mrf = mrf_name.replace('{$parameter_name}', parameter_name)
+    time_params = []
+    for i, char in enumerate(mrf):
+        if char == '%':
+            time_params.append(char+mrf[i+1])
+    for time_param in time_params:
+        mrf = mrf.replace(time_param,datetime.datetime.strftime(mrf_date,time_param))
+    index = mrf.replace('.mrf', '.idx')
+    data = mrf.replace('.mrf', os.path.basename(mrf_data)[-4:])
+    aux = mrf + '.aux.xml'
+    vrt = mrf.replace('.mrf', '.vrt')
+    return (mrf, index, data, aux, vrt)
+
+def write_previous_cycle_time(ptime_filename, current_cycle_time, sigevent_url):
+    """
+    Store the current cycle time to be used in the next cycle as the previous
+    cycle time.  Time format is "yyyymmdd.hhmmss"
+    Arguments:
+        ptime_filename -- the previous cycle time file
+        current_cycle_time -- the current cycle time
+        sigevent_url -- Example:  'http://[host]/sigevent/events/create'
+    """
+    try:
+        # Open file.
+        ptime_file=open(ptime_filename, 'w')
+    except IOError:
+        mssg1='Cannot open for write:  '
+        mssg2=ptime_filename
+        mssg3='  On next cycle all tiles will be processed.'
+        mssg=str().join([mssg1, mssg2, mssg3])
+        log_sig_warn(mssg, sigevent_url)
+    else:
+        # Write to file with line termination.
+        ptime_file.write(str().join([current_cycle_time, '\n']))
+        # Close file.
+        ptime_file.close()
+
+def remove_temp_tiles(tiles, working_dir):
+    """
+    Remove tiles (and their auxiliary files) created in the working directory.
+    Arguments:
+        tiles -- list of tiles used for the MRF
+        working_dir -- the working directory
+    """
+    for tilename in (tiles):
+        if working_dir in tilename:
+            remove_file(tilename)
+            remove_file(tilename+'.aux.xml')
+            if '_indexed.' in tilename:
+                remove_file(tilename.split('.')[0]+'.pgw')
+
+def format_command(command_list):
+    """
+    Return a command list as a single string for logging.
+    Arguments:
+        command_list -- list containing all elements of a subprocess command.
+    """
+    return str().join([str(element) + ' ' for element in command_list])
@@ -0,0 +1,412 @@
+#!/bin/env python
+
+# Copyright (c) 2002-2015, California Institute of Technology.
+# All rights reserved.  Based on Government Sponsored Research under contracts NAS7-1407 and/or NAS7-03001.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+#   1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+#   2. Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#   3. Neither the name of the California Institute of Technology (Caltech), its operating division the Jet Propulsion Laboratory (JPL),
+#      the National Aeronautics and Space Administration (NASA), nor the names of its contributors may be used to
+#      endorse or promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE CALIFORNIA INSTITUTE OF TECHNOLOGY BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+#
+# Run many mrfgen jobs from one invocation.
+#
+# Jobs are mrfgen configuration files, given individually, as a directory of
+# configuration files, or as a single configuration and a date range.  For a
+# date range, <date_of_data> is replaced for each day and strftime tokens
+# (e.g. %Y, %j) in <input_dir> and <input_files> are expanded for that day.
+#
+# Each job runs in a separate process with its own working directory (a
+# subdirectory of the configured <working_dir>), so jobs cannot interfere
+# with each other.  Jobs run the mrfgen Pipeline in worker processes forked
+# from this one, which saves starting Python and importing GDAL for every
+# job; a process per job is still needed because the pipeline changes the
+# working directory and the handlers of the root logger.  With -m, jobs run
+# the given mrfgen command instead.  Failed jobs are retried, and a summary
+# is printed at the end, optionally also as a JSON report.
+#
+# Example:
+#
+#  mrfgen_batch.py -c MORCR143LLDY.xml --start_date 20140101 --end_date 20141231 -j 8
+#  mrfgen_batch.py -d /mrfgen/configs -r 1 --report batch_report.json
+#
+# Global Imagery Browse Services
+# NASA Jet Propulsion Laboratory
+# 2015
+
+from optparse import OptionParser
+from multiprocessing.pool import ThreadPool
+import datetime
+import glob
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+import xml.dom.minidom
+try:
+    from mrfgen import Pipeline, MrfgenExit, read_configuration
+    import oe_sigevent
+except ImportError:
+    Pipeline = None
+
+versionNumber = '0.1.0'
+
+
+class MrfgenJob:
+    """A single mrfgen run"""
+
+    def __init__(self, name, configuration_filename):
+        """
+        Arguments:
+            name -- job name, used for the job working directory
+            configuration_filename -- mrfgen configuration for the job
+        """
+        self.name = name
+        self.configuration_filename = configuration_filename
+        self.log_filename = ''
+        self.status = 'pending'
+        self.attempts = 0
+        self.returncode = None
+        self.duration = 0.0
+
+
+def get_dom_tag_value(dom, tag_name):
+    """
+    Return value of a tag from dom (XML file), or '' if not found.
+    Arguments:
+        tag_name -- name of dom tag for which the value should be returned.
+    """
+    tags = dom.getElementsByTagName(tag_name)
+    if len(tags) == 0 or tags[0].firstChild == None:
+        return ''
+    return tags[0].firstChild.data.strip()
+
+
+def set_dom_tag_value(dom, tag_name, value):
+    """
+    Set the value of a tag in the mrfgen configuration, adding it if needed.
+    Arguments:
+        dom -- mrfgen configuration dom
+        tag_name -- name of dom tag to set
+        value -- the new value
+    """
+    tags = dom.getElementsByTagName(tag_name)
+    if len(tags) == 0:
+        tag = dom.createElement(tag_name)
+        dom.documentElement.appendChild(tag)
+    else:
+        tag = tags[0]
+    for child in list(tag.childNodes):
+        tag.removeChild(child)
+    tag.appendChild(dom.createTextNode(value))
+
+
+def add_trailing_slash(directory_path):
+    """
+    Add trailing slash if one is not already present.
+    Argument:
+        directory_path -- path to which trailing slash should be confirmed.
+    """
+    if len(directory_path) > 0 and directory_path[-1] != '/':
+        directory_path = directory_path + '/'
+    return directory_path
+
+
+def get_dates(start_date, end_date):
+    """
+    Return a list of dates (datetime.date) from start_date to end_date inclusive.
+    Arguments:
+        start_date -- first date as YYYYMMDD
+        end_date -- last date as YYYYMMDD
+    """
+    start = datetime.datetime.strptime(start_date, '%Y%m%d').date()
+    end = datetime.datetime.strptime(end_date, '%Y%m%d').date()
+    dates = []
+    while start <= end:
+        dates.append(start)
+        start = start + datetime.timedelta(days=1)
+    return dates
+
+
+def create_job(configuration_filename, job_dir, job_names, date=None):
+    """
+    Create a job configuration with its own working directory.
+    Returns the MrfgenJob.
+    Arguments:
+        configuration_filename -- the mrfgen configuration to start from
+        job_dir -- directory for the generated job configurations
+        job_names -- set of the names of the jobs created so far, a number is
+                     added to the name of a job that would have the same name
+        date -- datetime.date of the data for date range jobs, which also get
+                their own previous cycle time file
+    """
+    dom = xml.dom.minidom.parse(configuration_filename)
+    parameter_name = get_dom_tag_value(dom, 'parameter_name')
+    if date != None:
+        set_dom_tag_value(dom, 'date_of_data', date.strftime('%Y%m%d'))
+        for tag_name in ['input_dir', 'input_files']:
+            value = get_dom_tag_value(dom, tag_name)
+            if '%' in value:
+                set_dom_tag_value(dom, tag_name, date.strftime(value))
+    date_of_data = get_dom_tag_value(dom, 'date_of_data')
+    name = str().join([parameter_name, '_', date_of_data, get_dom_tag_value(dom, 'time_of_data')])
+    if name in job_names:
+        count = 2
+        while str().join([name, '_', str(count)]) in job_names:
+            count += 1
+        name = str().join([name, '_', str(count)])
+    job_names.add(name)
+    if date != None:
+        # Jobs of a date range share the input directory.
+        set_dom_tag_value(dom, 'previous_cycle_time_file', str().join(['mrfgen_previous_cycle_time_', name, '.txt']))
+
+    # Each job gets its own working directory.
+    working_dir = get_dom_tag_value(dom, 'working_dir')
+    if working_dir == '':
+        working_dir = '/tmp/'
+    job_working_dir = add_trailing_slash(working_dir) + name + '/'
+    if not os.path.exists(job_working_dir):
+        os.makedirs(job_working_dir)
+    set_dom_tag_value(dom, 'working_dir', job_working_dir)
+
+    job_configuration_filename = os.path.join(job_dir, name + '.xml')
+    job_configuration_file = open(job_configuration_filename, 'w')
+    job_configuration_file.write(dom.toxml())
+    job_configuration_file.close()
+    job = MrfgenJob(name, job_configuration_filename)
+    job.log_filename = job_working_dir + name + '_mrfgen_batch.log'
+    return job
+
+
+def call_mrfgen(job, mrfgen_command, log_file):
+    """
+    Run a job with an mrfgen command.  Returns the exit code.
+    Arguments:
+        job -- the MrfgenJob
+        mrfgen_command -- mrfgen command list
+        log_file -- the open log file of the job
+    """
+    try:
+        return subprocess.call(mrfgen_command + ['-c', job.configuration_filename],
+                               stdout=log_file, stderr=subprocess.STDOUT, close_fds=True)
+    except OSError, e:
+        log_file.write(str(e) + '\n')
+        return -1
+
+
+def run_pipeline(job, pipeline_options, log_file):
+    """
+    Run a job with the mrfgen Pipeline in this process, which must be a
+    process of its own.  The output of the process goes to the log file.
+    Returns the exit code, as mrfgen would.
+    Arguments:
+        job -- the MrfgenJob
+        pipeline_options -- tuple of (sigevent_url, data_only, script_dir)
+        log_file -- the open log file of the job
+    """
+    sigevent_url, data_only, script_dir = pipeline_options
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.dup2(log_file.fileno(), sys.stdout.fileno())
+    os.dup2(log_file.fileno(), sys.stderr.fileno())
+    try:
+        try:
+            config = read_configuration(job.configuration_filename, sigevent_url, data_only, script_dir)
+            Pipeline(config).run()
+        except MrfgenExit, e:
+            return e.exit_code
+        except Exception:
+            traceback.print_exc()
+            return 1
+    finally:
+        # Worker processes exit without running atexit functions.
+        oe_sigevent.flush()
+        sys.stdout.flush()
+        sys.stderr.flush()
+    return 0
+
+
+def run_job(args):
+    """
+    Run a job, retrying if it fails.  Returns the job.
+    Arguments:
+        args -- tuple of (job, mrfgen command list, or None to run the
+                Pipeline with pipeline_options, pipeline_options, retries)
+    """
+    job, mrfgen_command, pipeline_options, retries = args
+    start = time.time()
+    while job.attempts <= retries:
+        job.attempts += 1
+        log_file = open(job.log_filename, 'a')
+        log_file.write(str().join([time.asctime(), ' attempt ', str(job.attempts), '\n']))
+        log_file.flush()
+        if mrfgen_command != None:
+            job.returncode = call_mrfgen(job, mrfgen_command, log_file)
+        else:
+            job.returncode = run_pipeline(job, pipeline_options, log_file)
+        log_file.close()
+        if job.returncode == 0:
+            break
+    job.duration = time.time() - start
+    if job.returncode == 0:
+        job.status = 'success'
+    else:
+        job.status = 'failed'
+    return job
+
+
+#-------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    print 'mrfgen_batch v' + versionNumber
+
+    usageText = 'mrfgen_batch.py [-c config.xml]... [-d config_dir] [--start_date YYYYMMDD --end_date YYYYMMDD] [-j jobs] [-r retries] [--report report.json]'
+
+    # Define command line options and args.
+    parser=OptionParser(usage=usageText, version=versionNumber)
+    parser.add_option('-c', '--configuration_filename',
+                      action='append', type='string', dest='configuration_filenames', default=[],
+                      help='mrfgen configuration file.  May be repeated.')
+    parser.add_option('-d', '--configuration_dir',
+                      action='store', type='string', dest='configuration_dir',
+                      help='Directory of mrfgen configuration (*.xml) files.')
+    parser.add_option('--start_date',
+                      action='store', type='string', dest='start_date',
+                      help='First date (YYYYMMDD) to process with a single configuration.')
+    parser.add_option('--end_date',
+                      action='store', type='string', dest='end_date',
+                      help='Last date (YYYYMMDD) to process with a single configuration.  Default: start_date')
+    parser.add_option('-j', '--jobs',
+                      action='store', type='int', dest='jobs', default=multiprocessing.cpu_count(),
+                      help='Number of concurrent mrfgen jobs.  Default: number of cores')
+    parser.add_option('-r', '--retries',
+                      action='store', type='int', dest='retries', default=0,
+                      help='Number of times to retry a failed job.  Default: 0')
+    parser.add_option('--report',
+                      action='store', type='string', dest='report_filename',
+                      help='Write a JSON summary of all jobs to this file.')
+    parser.add_option('-m', '--mrfgen',
+                      action='store', type='string', dest='mrfgen',
+                      help='mrfgen command to run for each job.  Default: run the mrfgen pipeline in worker processes')
+    parser.add_option("--data_only", action="store_true", dest="data_only",
+                      default=False, help="Only output the MRF data, index, and header files")
+    parser.add_option('-s', '--sigevent_url',
+                      action='store', type='string', dest='sigevent_url',
+                      default=
+                      'http://localhost:8100/sigevent/events/create',
+                      help='Default:  http://localhost:8100/sigevent/events/create')
+
+    # Read command line args.
+    (options, args) = parser.parse_args()
+    configuration_filenames = options.configuration_filenames + args
+    if options.configuration_dir:
+        configuration_filenames += sorted(glob.glob(os.path.join(options.configuration_dir, '*.xml')))
+    if len(configuration_filenames) == 0:
+        parser.error('No mrfgen configurations provided. Use -c or -d.')
+    if options.start_date and len(configuration_filenames) != 1:
+        parser.error('A date range requires exactly one configuration.')
+    configuration_paths = [os.path.realpath(filename) for filename in configuration_filenames]
+    for configuration_path in configuration_paths:
+        if configuration_paths.count(configuration_path) > 1:
+            parser.error('Configuration given more than once: ' + configuration_path)
+    if options.jobs < 1:
+        parser.error('--jobs must be at least 1.')
+
+    # mrfgen command, or None to run the Pipeline.
+    # colormap2vrt.py, RGBApng2Palpng and empty_config are installed next to this script.
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    if options.mrfgen:
+        mrfgen_command = [options.mrfgen]
+    elif Pipeline != None:
+        mrfgen_command = None
+    elif os.path.isfile(os.path.join(script_dir, 'mrfgen')):
+        mrfgen_command = [os.path.join(script_dir, 'mrfgen')]
+    else:
+        mrfgen_command = [sys.executable, os.path.join(script_dir, 'mrfgen.py')]
+    if mrfgen_command != None:
+        mrfgen_command += ['-s', options.sigevent_url]
+        if options.data_only:
+            mrfgen_command.append('-d')
+    pipeline_options = (options.sigevent_url, options.data_only, script_dir)
+
+    # Create jobs
+    job_dir = tempfile.mkdtemp(prefix='mrfgen_batch_')
+    jobs = []
+    job_names = set()
+    try:
+        if options.start_date:
+            end_date = options.end_date or options.start_date
+            for date in get_dates(options.start_date, end_date):
+                jobs.append(create_job(configuration_filenames[0], job_dir, job_names, date))
+        else:
+            for configuration_filename in configuration_filenames:
+                jobs.append(create_job(configuration_filename, job_dir, job_names))
+    except (IOError, OSError, ValueError), e:
+        print >> sys.stderr, 'Error creating jobs: ' + str(e)
+        sys.exit(1)
+    except Exception, e:
+        print >> sys.stderr, 'Error reading mrfgen configuration: ' + str(e)
+        sys.exit(1)
+
+    # Run jobs, reporting each one as it finishes.  Pipeline jobs each get a new worker process.
+    print 'Running ' + str(len(jobs)) + ' mrfgen jobs with ' + str(min(options.jobs, len(jobs))) + ' workers'
+    batch_start = time.time()
+    if mrfgen_command != None:
+        pool = ThreadPool(min(options.jobs, len(jobs)))
+    else:
+        sys.stdout.flush()
+        pool = multiprocessing.Pool(min(options.jobs, len(jobs)), maxtasksperchild=1)
+    finished_jobs = {}
+    for job in pool.imap_unordered(run_job, [(job, mrfgen_command, pipeline_options, options.retries) for job in jobs]):
+        print str().join([time.asctime(), ' ', job.name, ' ', job.status, ' (', str(job.attempts), ' attempts, ',
+                          '%.1f' % job.duration, 's)'])
+        finished_jobs[job.name] = job
+    pool.close()
+    pool.join()
+    batch_duration = time.time() - batch_start
+    jobs = [finished_jobs[job.name] for job in jobs]
+
+    # Summary
+    failed = [job for job in jobs if job.status != 'success']
+    print ''
+    print 'Jobs:      ' + str(len(jobs))
+    print 'Succeeded: ' + str(len(jobs) - len(failed))
+    print 'Failed:    ' + str(len(failed))
+    print 'Duration:  ' + '%.1f' % batch_duration + 's'
+    for job in failed:
+        print 'Failed job ' + job.name + ', see ' + job.log_filename
+    if options.report_filename:
+        report = {'jobs': [], 'succeeded': len(jobs) - len(failed), 'failed': len(failed), 'duration': batch_duration}
+        for job in jobs:
+            report['jobs'].append({'name': job.name, 'status': job.status, 'attempts': job.attempts,
+                                   'returncode': job.returncode, 'duration': job.duration,
+                                   'log': job.log_filename})
+        report_file = open(options.report_filename, 'w')
+        json.dump(report, report_file, indent=2)
+        report_file.close()
+        print 'Report written to ' + options.report_filename
+
+    # Job configurations are kept for failed jobs to be rerun.
+    if len(failed) == 0:
+        for job in jobs:
+            os.remove(job.configuration_filename)
+        os.rmdir(job_dir)
+    else:
+        print 'Job configurations are in ' + job_dir
+        sys.exit(1)
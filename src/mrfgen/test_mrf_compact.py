@@ -0,0 +1,108 @@
+#!/bin/env python
+
+# Tests for mrf_compact.py using a copy of the demo MRF
+
+import os
+import shutil
+import tempfile
+import unittest
+from mrf_compact import *
+
+class TestMRFCompact(unittest.TestCase):
+
+    def setUp(self):
+        demo_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'demo', 'data')
+        self.tmp_dir = tempfile.mkdtemp()
+        for extension in ['.mrf', '.idx', '.pjg']:
+            shutil.copy(os.path.join(demo_dir, 'nasa-logo-jpeg' + extension), self.tmp_dir)
+        self.mrf_filename = os.path.join(self.tmp_dir, 'nasa-logo-jpeg.mrf')
+        self.header = read_mrf_header(self.mrf_filename)
+        self.data_filename = self.header.get_data_filename()
+        self.idx_filename = self.header.get_index_filename()
+        # Append a copy of the first tile and of the last tile, and point two
+        # records at them, as a replaced tile and an identical tile would be
+        index = MRFIndex(self.idx_filename, self.header, 'r+')
+        data_file = open(self.data_filename, 'r+b')
+        data_file.seek(0, 2)
+        for record_number in [0, len(index.records) - 1]:
+            offset, size = int(index.records['offset'][record_number]), int(index.records['size'][record_number])
+            data_file.seek(offset)
+            tile = data_file.read(size)
+            data_file.seek(0, 2)
+            index.records['offset'][record_number] = data_file.tell()
+            data_file.write(tile)
+        # An identical tile stored twice: record 2 gets a copy of the tile of record 3
+        data_file.seek(int(index.records['offset'][3]))
+        tile = data_file.read(int(index.records['size'][3]))
+        data_file.seek(0, 2)
+        index.records['offset'][2] = data_file.tell()
+        index.records['size'][2] = len(tile)
+        data_file.write(tile)
+        # A tile no record points to anymore
+        data_file.write('unused tile')
+        data_file.close()
+        index.records['offset'][1] = index.records['offset'][0]
+        index.records['size'][1] = index.records['size'][0]
+        index.close()
+        self.tiles = self.read_tiles()
+
+    def read_tiles(self):
+        """
+        Return the tile of every index record.
+        """
+        index = MRFIndex(self.idx_filename, self.header, 'r')
+        data_file = open(self.data_filename, 'rb')
+        tiles = []
+        for record in index.records:
+            data_file.seek(int(record['offset']))
+            tiles.append(data_file.read(int(record['size'])))
+        data_file.close()
+        index.close()
+        return tiles
+
+    def read_files(self):
+        return [open(filename, 'rb').read() for filename in [self.mrf_filename, self.data_filename, self.idx_filename]]
+
+    def test_compact(self):
+        old_size = os.path.getsize(self.data_filename)
+        index = MRFIndex(self.idx_filename, self.header, 'r')
+        # The start of the data file before the first tile is kept
+        prefix_size = int(index.records['offset'].min())
+        index.close()
+        stats = compact_mrf(self.mrf_filename, offline=True)
+        self.assertEqual(self.read_tiles(), self.tiles)
+        self.assertEqual((stats['records'], stats['tiles']), (50, 50))
+        # Record 1 shares the tile of record 0, and records 2 and 3 have identical tiles
+        self.assertEqual(stats['unique_tiles'], len(set(self.tiles)))
+        self.assertEqual(stats['unique_tiles'], 48)
+        self.assertEqual(stats['old_size'], old_size)
+        self.assertEqual(stats['new_size'], os.path.getsize(self.data_filename))
+        self.assertEqual(stats['new_size'], prefix_size + sum([len(tile) for tile in set(self.tiles)]))
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), ['nasa-logo-jpeg.idx', 'nasa-logo-jpeg.mrf', 'nasa-logo-jpeg.pjg'])
+
+    def test_no_dedup(self):
+        stats = compact_mrf(self.mrf_filename, dedup=False, offline=True)
+        self.assertEqual(self.read_tiles(), self.tiles)
+        self.assertEqual(stats['unique_tiles'], 49)
+
+    def test_dry_run(self):
+        files = self.read_files()
+        stats = compact_mrf(self.mrf_filename, dry_run=True)
+        self.assertEqual(stats['unique_tiles'], 48)
+        self.assertEqual(self.read_files(), files)
+        self.assertEqual(len(os.listdir(self.tmp_dir)), 3)
+
+    def test_offline(self):
+        files = self.read_files()
+        self.assertRaises(MRFCompactError, compact_mrf, self.mrf_filename)
+        # Another compaction holds the lock
+        lock_file = lock_mrf(self.mrf_filename)
+        self.assertRaises(MRFCompactError, compact_mrf, self.mrf_filename, offline=True)
+        lock_file.close()
+        self.assertEqual(self.read_files(), files)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/bin/env python
+
+# Tests for mrfgen_batch.py using generated configurations and stand-ins for mrfgen
+
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import xml.dom.minidom
+import mrfgen_batch
+from mrfgen_batch import *
+
+CONFIGURATION = """<?xml version="1.0" encoding="UTF-8"?>
+<mrfgen_configuration>
+ <date_of_data>20141004</date_of_data>
+ <parameter_name>MYR4ODLOLLDY</parameter_name>
+ <input_dir>%s/input/%%Y/%%j</input_dir>
+ <output_dir>%s/output</output_dir>
+ <working_dir>%s/working</working_dir>
+ <partial_update>true</partial_update>
+</mrfgen_configuration>
+"""
+
+# Fails on the first attempt of each job, then succeeds.
+MRFGEN_COMMAND = """import os, sys
+attempts_filename = sys.argv[-1] + '.attempts'
+if not os.path.exists(attempts_filename):
+    open(attempts_filename, 'w').close()
+    print 'first attempt failed'
+    sys.exit(1)
+print 'second attempt succeeded'
+"""
+
+class FakePipeline:
+    """Stands in for the mrfgen Pipeline, configurations are file names"""
+
+    def __init__(self, config):
+        self.config = config
+
+    def run(self):
+        print 'processing ' + self.config
+        if 'fail' in os.path.basename(self.config):
+            raise MrfgenExit('ERROR', 'failed', 1)
+
+class TestMrfgenBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.job_dir = os.path.join(self.tmp_dir, 'jobs')
+        os.mkdir(self.job_dir)
+        self.configuration_filename = os.path.join(self.tmp_dir, 'config.xml')
+        configuration_file = open(self.configuration_filename, 'w')
+        configuration_file.write(CONFIGURATION % (self.tmp_dir, self.tmp_dir, self.tmp_dir))
+        configuration_file.close()
+
+    def get_job_value(self, job, tag_name):
+        return get_dom_tag_value(xml.dom.minidom.parse(job.configuration_filename), tag_name)
+
+    def test_date_range(self):
+        job_names = set()
+        jobs = [create_job(self.configuration_filename, self.job_dir, job_names, date)
+                for date in get_dates('20141231', '20150101')]
+        self.assertEqual([job.name for job in jobs], ['MYR4ODLOLLDY_20141231', 'MYR4ODLOLLDY_20150101'])
+        self.assertEqual(self.get_job_value(jobs[1], 'date_of_data'), '20150101')
+        self.assertEqual(self.get_job_value(jobs[1], 'input_dir'), self.tmp_dir + '/input/2015/001')
+        self.assertEqual(self.get_job_value(jobs[1], 'working_dir'), self.tmp_dir + '/working/MYR4ODLOLLDY_20150101/')
+        # Each day has its own previous cycle time.
+        self.assertEqual([self.get_job_value(job, 'previous_cycle_time_file') for job in jobs],
+                         ['mrfgen_previous_cycle_time_MYR4ODLOLLDY_20141231.txt',
+                          'mrfgen_previous_cycle_time_MYR4ODLOLLDY_20150101.txt'])
+
+    def test_duplicate_names(self):
+        job_names = set()
+        jobs = [create_job(self.configuration_filename, self.job_dir, job_names) for count in range(3)]
+        self.assertEqual([job.name for job in jobs], ['MYR4ODLOLLDY_20141004', 'MYR4ODLOLLDY_20141004_2',
+                                                      'MYR4ODLOLLDY_20141004_3'])
+        self.assertEqual(len(set([job.configuration_filename for job in jobs])), 3)
+        self.assertEqual(len(set([self.get_job_value(job, 'working_dir') for job in jobs])), 3)
+        # Jobs of separate configurations keep the default previous cycle time file.
+        self.assertEqual(self.get_job_value(jobs[0], 'previous_cycle_time_file'), '')
+
+    def test_retry_command(self):
+        job_names = set()
+        jobs = [create_job(self.configuration_filename, self.job_dir, job_names) for count in range(2)]
+        command = [sys.executable, '-c', MRFGEN_COMMAND]
+        job = run_job((jobs[0], command, None, 0))
+        self.assertEqual((job.status, job.attempts, job.returncode), ('failed', 1, 1))
+        job = run_job((jobs[1], command, None, 1))
+        self.assertEqual((job.status, job.attempts, job.returncode), ('success', 2, 0))
+        log = open(job.log_filename).read()
+        self.assertTrue('first attempt failed' in log)
+        self.assertTrue('second attempt succeeded' in log)
+
+    @unittest.skipIf(mrfgen_batch.Pipeline == None, 'the mrfgen package is not available')
+    def test_pipeline(self):
+        job_names = set()
+        jobs = [create_job(self.configuration_filename, self.job_dir, job_names) for count in range(2)]
+        os.rename(jobs[1].configuration_filename, jobs[1].configuration_filename.replace('MYR', 'fail'))
+        jobs[1].configuration_filename = jobs[1].configuration_filename.replace('MYR', 'fail')
+        # The fake pipeline is inherited by the worker processes.
+        pipeline = mrfgen_batch.Pipeline
+        read_configuration = mrfgen_batch.read_configuration
+        mrfgen_batch.Pipeline = FakePipeline
+        mrfgen_batch.read_configuration = lambda filename, sigevent_url, data_only, script_dir: filename
+        try:
+            pool = multiprocessing.Pool(2, maxtasksperchild=1)
+            jobs = pool.map(run_job, [(job, None, ('http://127.0.0.1:1/sigevent', False, None), 1) for job in jobs])
+            pool.close()
+            pool.join()
+        finally:
+            mrfgen_batch.Pipeline = pipeline
+            mrfgen_batch.read_configuration = read_configuration
+        self.assertEqual([(job.status, job.attempts, job.returncode) for job in jobs], [('success', 1, 0), ('failed', 2, 1)])
+        self.assertTrue(('processing ' + jobs[0].configuration_filename) in open(jobs[0].log_filename).read())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/bin/env python
+
+# Tests for the partial update steps of mrfgen/stages.py using temporary tiles and MRF files
+
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import xml.dom.minidom
+from mrfgen.pipeline import PipelineState
+from mrfgen.stages import discover_tiles, copy_mrf_index
+
+class Config:
+    """The settings of an mrfgen configuration used by discover_tiles"""
+
+    def __init__(self, input_dir, output_dir):
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.input_files = ''
+        self.mrf_compression_type = 'PPNG'
+        self.partial_update = True
+        self.mrf_name = '{$parameter_name}%Y%j_.mrf'
+        self.parameter_name = 'MYR4ODLOLLDY'
+        self.date_of_data = '20141004'
+        self.time_of_data = ''
+
+class TestPartialUpdate(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.config = Config(self.tmp_dir + '/input/', self.tmp_dir + '/output/')
+        os.mkdir(self.config.input_dir)
+        os.mkdir(self.config.output_dir)
+        # Tiles of the previous cycle and of this one
+        self.old_tiles = [self.add_file(self.config.input_dir + 'old' + str(n) + '.png', 100000) for n in range(2)]
+        self.new_tiles = [self.add_file(self.config.input_dir + 'new' + str(n) + '.png', 0) for n in range(2)]
+        self.state = PipelineState()
+        self.state.pretime = time.strftime('%Y%m%d.%H%M%S', time.localtime(time.time() - 50000))
+        logging.disable(logging.INFO)
+
+    def add_file(self, filename, age, content=''):
+        new_file = open(filename, 'w')
+        new_file.write(content)
+        new_file.close()
+        os.utime(filename, (time.time() - age, time.time() - age))
+        return filename
+
+    def add_mrf(self):
+        for ext in ['.mrf', '.idx', '.ppg']:
+            self.add_file(self.config.output_dir + 'MYR4ODLOLLDY2014277_' + ext, 100000,
+                          '<MRF_META><Raster><Compression>PPNG</Compression></Raster></MRF_META>')
+
+    def test_modified_tiles(self):
+        self.add_mrf()
+        discover_tiles(self.config, self.state)
+        self.assertEqual(self.state.update_mrf_filename, self.config.output_dir + 'MYR4ODLOLLDY2014277_.mrf')
+        self.assertEqual(self.state.update_idx_filename, self.config.output_dir + 'MYR4ODLOLLDY2014277_.idx')
+        self.assertEqual(self.state.update_data_filename, self.config.output_dir + 'MYR4ODLOLLDY2014277_.ppg')
+        self.assertEqual(sorted(self.state.alltiles), self.new_tiles)
+
+    def test_no_previous_cycle(self):
+        self.add_mrf()
+        self.state.pretime = '0.0'
+        discover_tiles(self.config, self.state)
+        self.assertEqual(self.state.update_mrf_filename, '')
+        self.assertEqual(sorted(self.state.alltiles), self.new_tiles + self.old_tiles)
+
+    def test_no_existing_mrf(self):
+        discover_tiles(self.config, self.state)
+        self.assertEqual(self.state.update_mrf_filename, '')
+        self.assertEqual(sorted(self.state.alltiles), self.new_tiles + self.old_tiles)
+
+    def test_copy_mrf_index(self):
+        self.add_mrf()
+        discover_tiles(self.config, self.state)
+        update_mrf_filename = self.tmp_dir + '/update.mrf'
+        update_idx_filename = copy_mrf_index(self.state.update_mrf_filename, self.state.update_idx_filename,
+                                             self.state.update_data_filename, update_mrf_filename)
+        self.assertEqual(os.path.dirname(update_idx_filename), os.path.dirname(self.state.update_idx_filename))
+        self.assertEqual(open(update_idx_filename).read(), open(self.state.update_idx_filename).read())
+        raster = xml.dom.minidom.parse(update_mrf_filename).getElementsByTagName('Raster')[0]
+        self.assertEqual(raster.getElementsByTagName('Compression')[0].firstChild.data, 'PPNG')
+        self.assertEqual(raster.getElementsByTagName('DataFile')[0].firstChild.data, self.state.update_data_filename)
+        self.assertEqual(raster.getElementsByTagName('IndexFile')[0].firstChild.data, update_idx_filename)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        shutil.rmtree(self.tmp_dir)
+
+if __name__ == '__main__':
+    unittest.main()
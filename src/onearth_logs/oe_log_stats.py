@@ -0,0 +1,515 @@
+#!/bin/env python
+
+# Copyright (c) 2002-2015, California Institute of Technology.
+# All rights reserved.  Based on Government Sponsored Research under contracts NAS7-1407 and/or NAS7-03001.
+# 
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+#   1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+#   2. Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#   3. Neither the name of the California Institute of Technology (Caltech), its operating division the Jet Propulsion Laboratory (JPL),
+#      the National Aeronautics and Space Administration (NASA), nor the names of its contributors may be used to
+#      endorse or promote products derived from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE CALIFORNIA INSTITUTE OF TECHNOLOGY BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+#
+# oe_log_stats.py
+# Aggregated tile access statistics for onearth_logs.
+#
+# Requests are counted in a single pass by layer, TileMatrixSet, TileMatrix,
+# time (of the data), and date and hour of the request, with the bytes sent,
+# the status codes by class and the number of unique clients.  Unique clients
+# are estimated with a HyperLogLog of fixed size, so memory only grows with
+# the number of groups, not with the number of clients or requests.  Groups
+# with few clients keep the hashes of the clients instead of the registers
+# (a sparse HyperLogLog), since most groups have only a few requests.  Stats
+# of several parts of a log can be merged.
+#
+# Response times are kept per layer, TileMatrixSet, TileMatrix and status
+# code in log-linear histograms with a fixed number of buckets (as in HDR
+# Histogram), which can be merged across log parts and servers.  The
+# histograms are written with the percentiles, so reports of several servers
+# can be combined into one.
+#
+# The most requested tiles are found with the Space-Saving algorithm, which
+# keeps a fixed number of counters.
+#
+# Global Imagery Browse Services
+# NASA Jet Propulsion Laboratory
+# 2015
+
+import csv
+import hashlib
+import heapq
+import math
+import struct
+
+# Columns of the hot tile list
+HOT_TILE_COLUMNS = ['rank', 'requests', 'max_error', 'layer', 'time', 'tilematrixset', 'tilematrix', 'tilerow', 'tilecol']
+
+# Columns of the latency report
+LATENCY_COLUMNS = ['layer', 'tilematrixset', 'tilematrix', 'statuscode', 'requests', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms',
+                   'max_ms', 'histogram']
+
+# Latency histogram buckets per power of two; the relative error is below 1/LATENCY_SUB_BUCKETS
+LATENCY_SUB_BUCKETS = 32
+
+# Columns of the summary file
+STATS_COLUMNS = ['layer', 'tilematrixset', 'tilematrix', 'time', 'date', 'hour', 'requests', 'bytes',
+                 'status_2xx', 'status_3xx', 'status_4xx', 'status_5xx', 'status_other', 'unique_clients']
+
+MONTHS = {'Jan': '01', 'Feb': '02', 'Mar': '03', 'Apr': '04', 'May': '05', 'Jun': '06',
+          'Jul': '07', 'Aug': '08', 'Sep': '09', 'Oct': '10', 'Nov': '11', 'Dec': '12'}
+
+
+class HyperLogLog:
+    """Fixed memory estimate of the number of distinct values"""
+
+    def __init__(self, precision=10):
+        """
+        Arguments:
+            precision -- 2**precision registers are used; the standard error
+                         is about 1.04/sqrt(2**precision), 3% for 10
+        """
+        self.precision = precision
+        self.size = 1 << precision
+        # The hashes of the values are kept until there are more than sparse_limit,
+        # which take about as much memory as the registers.
+        self.sparse_limit = self.size >> 5
+        self.hashes = set()
+        self.registers = None
+
+    def add(self, value):
+        """
+        Add a value (string).
+        """
+        self.add_hash(struct.unpack('>Q', hashlib.md5(value).digest()[:8])[0])
+
+    def add_hash(self, hashed):
+        """
+        Add the 64-bit hash of a value.
+        """
+        if self.registers == None:
+            self.hashes.add(hashed)
+            if len(self.hashes) > self.sparse_limit:
+                self.to_registers()
+            return
+        register = hashed >> (64 - self.precision)
+        # Position of the first 1 bit in the remaining bits
+        remaining = (hashed << self.precision) & 0xFFFFFFFFFFFFFFFF
+        rank = 1
+        while rank <= 64 - self.precision and not remaining & 0x8000000000000000:
+            remaining <<= 1
+            rank += 1
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+
+    def to_registers(self):
+        """
+        Replace the hashes of the values with the registers.
+        """
+        hashes = self.hashes
+        self.hashes = None
+        self.registers = bytearray(self.size)
+        for hashed in hashes:
+            self.add_hash(hashed)
+
+    def merge(self, other):
+        """
+        Add the values counted by another HyperLogLog of the same precision.
+        """
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge HyperLogLogs of different precision')
+        if other.registers == None:
+            for hashed in other.hashes:
+                self.add_hash(hashed)
+            return
+        if self.registers == None:
+            self.to_registers()
+        for i in range(self.size):
+            if other.registers[i] > self.registers[i]:
+                self.registers[i] = other.registers[i]
+
+    def count(self):
+        """
+        Return the estimated number of distinct values, exact while the hashes are kept.
+        """
+        if self.registers == None:
+            return len(self.hashes)
+        if self.size >= 128:
+            alpha = 0.7213 / (1 + 1.079 / self.size)
+        elif self.size == 64:
+            alpha = 0.709
+        elif self.size == 32:
+            alpha = 0.697
+        else:
+            alpha = 0.673
+        estimate = alpha * self.size * self.size / sum([2.0 ** -register for register in self.registers])
+        zeros = self.registers.count(chr(0))
+        if estimate <= 2.5 * self.size and zeros > 0:
+            # Small range correction
+            estimate = self.size * math.log(float(self.size) / zeros)
+        return int(round(estimate))
+
+
+def get_request_date_hour(timestamp):
+    """
+    Return the (YYYY-MM-DD, HH) of an Apache timestamp, e.g. 17/Mar/2015:10:00:00 -0400
+    Arguments:
+        timestamp -- the Apache log timestamp
+    """
+    try:
+        day, month, rest = timestamp.split('/', 2)
+        return (str().join([rest[0:4], '-', MONTHS[month], '-', day]), rest[5:7])
+    except (ValueError, KeyError):
+        return ('', '')
+
+
+class LogStats:
+    """Request statistics grouped by layer, TileMatrixSet, TileMatrix, time, date and hour"""
+
+    def __init__(self, precision=10):
+        """
+        Arguments:
+            precision -- HyperLogLog precision for unique clients
+        """
+        self.precision = precision
+        # group key -> [requests, bytes, 2xx, 3xx, 4xx, 5xx, other, HyperLogLog of clients]
+        self.groups = {}
+
+    def add(self, log_dict):
+        """
+        Count a request.
+        Arguments:
+            log_dict -- Dictionary of a translated log line (see onearth_logs.translate_log)
+        """
+        date, hour = get_request_date_hour(log_dict['timestamp'])
+        key = (log_dict['layer'] or log_dict['layers'], str(log_dict['tilematrixset']),
+               str(log_dict['tilematrix']), log_dict['time'], date, hour)
+        group = self.groups.get(key)
+        if group == None:
+            group = self.groups[key] = [0, 0, 0, 0, 0, 0, 0, HyperLogLog(self.precision)]
+        group[0] += 1
+        if log_dict['bytes'] != '-':
+            group[1] += int(log_dict['bytes'])
+        status = log_dict['statuscode'][0:1]
+        if status in ('2', '3', '4', '5'):
+            group[int(status)] += 1
+        else:
+            group[6] += 1
+        group[7].add(log_dict['requestor'])
+
+    def merge(self, other):
+        """
+        Add the requests counted by another LogStats.
+        """
+        for key, other_group in other.groups.iteritems():
+            group = self.groups.get(key)
+            if group == None:
+                group = self.groups[key] = [0, 0, 0, 0, 0, 0, 0, HyperLogLog(self.precision)]
+            for i in range(7):
+                group[i] += other_group[i]
+            group[7].merge(other_group[7])
+
+    def get_rows(self):
+        """
+        Return the statistics as lists of values in the order of STATS_COLUMNS, sorted by group.
+        """
+        rows = []
+        for key in sorted(self.groups.keys()):
+            group = self.groups[key]
+            rows.append(list(key) + group[0:7] + [group[7].count()])
+        return rows
+
+    def write_csv(self, stats_filename):
+        """
+        Write the statistics to a CSV file with a header row.
+        Arguments:
+            stats_filename -- the output file
+        """
+        stats_file = open(stats_filename, 'wb')
+        writer = csv.writer(stats_file)
+        writer.writerow(STATS_COLUMNS)
+        writer.writerows(self.get_rows())
+        stats_file.close()
+
+
+class LatencyHistogram:
+    """Mergeable histogram of response times with fixed relative precision"""
+
+    def __init__(self):
+        # bucket -> count
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def get_bucket(self, value):
+        """
+        Return the bucket of a value.  Values below 2 * LATENCY_SUB_BUCKETS
+        have their own bucket, above that there are LATENCY_SUB_BUCKETS
+        buckets per power of two.
+        """
+        if value < 2 * LATENCY_SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - LATENCY_SUB_BUCKETS.bit_length()
+        return LATENCY_SUB_BUCKETS * shift + (value >> shift)
+
+    def get_bucket_value(self, bucket):
+        """
+        Return the middle of the range of values in a bucket.
+        """
+        if bucket < 2 * LATENCY_SUB_BUCKETS:
+            return bucket
+        shift = bucket // LATENCY_SUB_BUCKETS - 1
+        low = (bucket - LATENCY_SUB_BUCKETS * shift) << shift
+        return low + ((1 << shift) - 1) / 2.0
+
+    def add(self, value, count=1):
+        """
+        Count a value (integer, e.g. microseconds).
+        """
+        bucket = self.get_bucket(value)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += count
+        self.total += value * count
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """
+        Add the values counted by another LatencyHistogram.
+        """
+        for bucket, count in other.buckets.iteritems():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.max > self.max:
+            self.max = other.max
+
+    def percentile(self, percent):
+        """
+        Return the approximate value below which percent of the values are.
+        """
+        if self.count == 0:
+            return 0
+        rank = max(1, int(math.ceil(self.count * percent / 100.0)))
+        seen = 0
+        for bucket in sorted(self.buckets.keys()):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.get_bucket_value(bucket), self.max)
+        return self.max
+
+    def to_string(self):
+        """
+        Return the histogram as text: count, total and max, then bucket:count pairs.
+        """
+        values = [str(self.count), str(self.total), str(self.max)]
+        for bucket in sorted(self.buckets.keys()):
+            values.append(str().join([str(bucket), ':', str(self.buckets[bucket])]))
+        return ' '.join(values)
+
+    def from_string(self, text):
+        """
+        Add the values of a histogram written by to_string.
+        """
+        values = text.split()
+        other = LatencyHistogram()
+        other.count, other.total, other.max = [int(value) for value in values[0:3]]
+        for value in values[3:]:
+            bucket, count = value.split(':')
+            other.buckets[int(bucket)] = int(count)
+        self.merge(other)
+
+
+class LatencyStats:
+    """Response time histograms grouped by layer, TileMatrixSet, TileMatrix and status code"""
+
+    def __init__(self):
+        # group key -> LatencyHistogram
+        self.groups = {}
+
+    def add(self, log_dict):
+        """
+        Count the response time of a request.  Requests without a response time are ignored.
+        Arguments:
+            log_dict -- Dictionary of a translated log line (see onearth_logs.translate_log)
+        """
+        if log_dict['responsetime'] == '':
+            return
+        key = (log_dict['layer'] or log_dict['layers'], str(log_dict['tilematrixset']),
+               str(log_dict['tilematrix']), log_dict['statuscode'])
+        histogram = self.groups.get(key)
+        if histogram == None:
+            histogram = self.groups[key] = LatencyHistogram()
+        histogram.add(int(log_dict['responsetime']))
+
+    def merge(self, other):
+        """
+        Add the response times counted by another LatencyStats.
+        """
+        for key, other_histogram in other.groups.iteritems():
+            histogram = self.groups.get(key)
+            if histogram == None:
+                histogram = self.groups[key] = LatencyHistogram()
+            histogram.merge(other_histogram)
+
+    def read_csv(self, latency_filename):
+        """
+        Add the response times of a latency report written by write_csv, e.g. from another server.
+        Arguments:
+            latency_filename -- the latency report
+        """
+        latency_file = open(latency_filename, 'rb')
+        for row in csv.DictReader(latency_file):
+            key = (row['layer'], row['tilematrixset'], row['tilematrix'], row['statuscode'])
+            histogram = self.groups.get(key)
+            if histogram == None:
+                histogram = self.groups[key] = LatencyHistogram()
+            histogram.from_string(row['histogram'])
+        latency_file.close()
+
+    def write_csv(self, latency_filename):
+        """
+        Write the request count and response time percentiles (in milliseconds) of
+        each group to a CSV file with a header row.  The histograms are included,
+        so that reports can be merged with read_csv.
+        Arguments:
+            latency_filename -- the output file
+        """
+        latency_file = open(latency_filename, 'wb')
+        writer = csv.writer(latency_file)
+        writer.writerow(LATENCY_COLUMNS)
+        for key in sorted(self.groups.keys()):
+            histogram = self.groups[key]
+            milliseconds = [float(histogram.total) / max(histogram.count, 1), histogram.percentile(50),
+                            histogram.percentile(95), histogram.percentile(99), histogram.max]
+            writer.writerow(list(key) + [histogram.count] + ['%.3f' % (value / 1000.0) for value in milliseconds] +
+                            [histogram.to_string()])
+        latency_file.close()
+
+
+class SpaceSaving:
+    """Fixed memory counts of the most frequent items (Metwally et al., Space-Saving)"""
+
+    def __init__(self, capacity):
+        """
+        Arguments:
+            capacity -- number of counters; items with more than 1/capacity of
+                        all occurrences are always counted
+        """
+        self.capacity = capacity
+        # item -> [count, max_error]
+        self.counters = {}
+        # (count, item) entries, some outdated, to find the smallest counter
+        self.heap = []
+
+    def add(self, item, count=1):
+        """
+        Count an occurrence of an item.
+        """
+        counter = self.counters.get(item)
+        if counter != None:
+            counter[0] += count
+        elif len(self.counters) < self.capacity:
+            counter = self.counters[item] = [count, 0]
+        else:
+            # Replace the item with the smallest count; the new item may have
+            # occurred up to that many times before.
+            smallest, smallest_item = self.pop_smallest()
+            del self.counters[smallest_item]
+            counter = self.counters[item] = [smallest + count, smallest]
+        heapq.heappush(self.heap, (counter[0], item))
+        if len(self.heap) > 4 * self.capacity + 16:
+            self.heap = [(counter[0], key) for key, counter in self.counters.iteritems()]
+            heapq.heapify(self.heap)
+
+    def pop_smallest(self):
+        """
+        Return (count, item) of the smallest counter, skipping outdated heap entries.
+        """
+        while True:
+            count, item = heapq.heappop(self.heap)
+            counter = self.counters.get(item)
+            if counter != None and counter[0] == count:
+                return (count, item)
+
+    def merge(self, other):
+        """
+        Add the counts of another SpaceSaving.
+        """
+        if len(other.counters) >= other.capacity:
+            # Items not counted by the other SpaceSaving may have occurred there
+            # as often as its smallest counter.
+            other_smallest = min([count for (count, error) in other.counters.itervalues()])
+            for item, counter in self.counters.iteritems():
+                if item not in other.counters:
+                    counter[0] += other_smallest
+                    counter[1] += other_smallest
+            self.heap = [(counter[0], key) for key, counter in self.counters.iteritems()]
+            heapq.heapify(self.heap)
+        for item, (count, error) in other.counters.iteritems():
+            self.add(item, count)
+            self.counters[item][1] += error
+
+    def top(self, n=None):
+        """
+        Return the n (or all) items with the highest counts as (item, count, max_error).
+        The true count of an item is between count - max_error and count.
+        """
+        items = sorted(self.counters.iteritems(), key=lambda entry: (-entry[1][0], entry[0]))
+        if n != None:
+            items = items[:n]
+        return [(item, count, error) for (item, (count, error)) in items]
+
+
+class HotTiles:
+    """Most requested tiles by layer, time, TileMatrixSet, TileMatrix, row and column"""
+
+    def __init__(self, capacity=10000):
+        """
+        Arguments:
+            capacity -- number of tiles counted; more gives better counts for less requested tiles
+        """
+        self.tiles = SpaceSaving(capacity)
+
+    def add(self, log_dict):
+        """
+        Count a tile request.  Requests without a tile row and column are ignored.
+        Arguments:
+            log_dict -- Dictionary of a translated log line (see onearth_logs.translate_log)
+        """
+        if log_dict['tilerow'] == '' or log_dict['tilecol'] == '' or log_dict['tilematrix'] == '':
+            return
+        if log_dict['statuscode'][0:1] != '2':
+            return
+        self.tiles.add((log_dict['layer'] or log_dict['layers'], log_dict['time'], str(log_dict['tilematrixset']),
+                        str(log_dict['tilematrix']), str(log_dict['tilerow']), str(log_dict['tilecol'])))
+
+    def merge(self, other):
+        """
+        Add the requests counted by another HotTiles.
+        """
+        self.tiles.merge(other.tiles)
+
+    def write_csv(self, hot_tiles_filename, n):
+        """
+        Write the n most requested tiles to a CSV file with a header row.
+        Arguments:
+            hot_tiles_filename -- the output file
+            n -- number of tiles
+        """
+        hot_tiles_file = open(hot_tiles_filename, 'wb')
+        writer = csv.writer(hot_tiles_file)
+        writer.writerow(HOT_TILE_COLUMNS)
+        for rank, (tile, count, error) in enumerate(self.tiles.top(n)):
+            writer.writerow([rank + 1, count, error] + list(tile))
+        hot_tiles_file.close()
@@ -0,0 +1,392 @@
+#!/bin/env python
+
+# Copyright (c) 2002-2015, California Institute of Technology.
+# All rights reserved.  Based on Government Sponsored Research under contracts NAS7-1407 and/or NAS7-03001.
+# 
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+#   1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+#   2. Redistributions in binary form must reproduce the above copyright notice,
+#      this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+#   3. Neither the name of the California Institute of Technology (Caltech), its operating division the Jet Propulsion Laboratory (JPL),
+#      the National Aeronautics and Space Administration (NASA), nor the names of its contributors may be used to
+#      endorse or promote products derived from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+# IN NO EVENT SHALL THE CALIFORNIA INSTITUTE OF TECHNOLOGY BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
+# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+#
+# Reads the index records and tiles of the most requested tiles into the
+# operating system page cache, so the first requests after a new MRF is
+# published are not served from disk.
+#
+# The tile list is a hot tiles file from onearth_logs.py --hot_tiles.  Each
+# layer is mapped to its MRF header with a filename template, in which time
+# formats (e.g. %Y%j) are replaced by the time of the tile or by --date.
+# WMTS TileMatrix 0 is the lowest resolution level of the TileMatrixSet of the
+# layer, which often has fewer levels than the MRF index (e.g. the MRF goes
+# down to a 1x1 page, the TileMatrixSet stops at 2x1).  The number of
+# TileMatrixSet levels is taken from --levels, or from <TWMS><Levels> in the
+# MRF header as written by oe_configure_layer.
+#
+# Example:
+#
+#  oe_prewarm_tiles.py -i hot_tiles.csv -d 2015-06-01
+#   -l MODIS_Aqua_Aerosol=/data/EPSG4326/MODIS_Aqua_Aerosol/%Y/MODIS_Aqua_Aerosol%Y%j_.mrf
+#   -m MODIS_Aqua_Aerosol=/usr/share/onearth/layer_config/wmts/EPSG4326/MODIS_Aqua_AerosolTTTTTTT_.mrf
+#
+# Global Imagery Browse Services
+# NASA Jet Propulsion Laboratory
+# 2015
+
+from optparse import OptionParser
+import csv
+import ctypes
+import ctypes.util
+import datetime
+import mmap
+import os
+import sys
+import time
+import xml.dom.minidom
+import xml.parsers.expat
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from oe_mrf_index import read_mrf_header, MRFIndex, MRFIndexError, INDEX_DTYPE
+
+versionNumber = '0.1.0'
+
+# Ranges closer than this are read together.
+MERGE_GAP = 65536
+
+# Bytes read at a time.
+READ_BUFFER_SIZE = 1048576
+
+
+def read_layer_templates(layer_options, layers_filename=None):
+    """
+    Return a dictionary of layer -> MRF header filename template.
+    Arguments:
+        layer_options -- list of 'layer=template' strings
+        layers_filename -- file with a 'layer template' line per layer, if any
+    """
+    templates = {}
+    if layers_filename != None:
+        layers_file = open(layers_filename, 'r')
+        for line in layers_file:
+            line = line.strip()
+            if line == '' or line.startswith('#'):
+                continue
+            fields = line.split()
+            if len(fields) not in (2, 3):
+                raise ValueError('Layer must be given as "layer template [levels]": ' + line)
+            templates[fields[0]] = fields[1]
+        layers_file.close()
+    for layer_option in layer_options:
+        if '=' not in layer_option:
+            raise ValueError('Layer must be given as layer=template: ' + layer_option)
+        layer, template = layer_option.split('=', 1)
+        templates[layer] = template
+    return templates
+
+
+def get_twms_levels(mrf_filename):
+    """
+    Return the number of TileMatrixSet levels in <TWMS><Levels> of an MRF
+    header, or None if there is none.
+    Arguments:
+        mrf_filename -- the .mrf file, e.g. the endpoint MRF written by oe_configure_layer
+    """
+    try:
+        dom = xml.dom.minidom.parse(mrf_filename)
+    except (IOError, xml.parsers.expat.ExpatError), e:
+        raise MRFIndexError('Cannot read MRF header ' + mrf_filename + ': ' + str(e))
+    for twms in dom.getElementsByTagName('TWMS'):
+        for levels in twms.getElementsByTagName('Levels'):
+            if levels.firstChild != None:
+                try:
+                    return int(levels.firstChild.data.strip())
+                except ValueError:
+                    raise MRFIndexError('Invalid <Levels> in ' + mrf_filename)
+    return None
+
+
+def get_levels_value(value):
+    """
+    Return the number of TileMatrixSet levels from a count or an MRF header.
+    Arguments:
+        value -- a number of levels, e.g. '6', or an MRF header with <TWMS><Levels>
+    """
+    if value.isdigit():
+        return int(value)
+    levels = get_twms_levels(value)
+    if levels == None:
+        raise MRFIndexError('No <TWMS><Levels> found in ' + value)
+    return levels
+
+
+def read_layer_levels(levels_options, layers_filename=None):
+    """
+    Return a dictionary of layer -> number of TileMatrixSet levels.
+    Arguments:
+        levels_options -- list of 'layer=levels' strings, where levels is a
+                          count or an MRF header with <TWMS><Levels>
+        layers_filename -- file with a 'layer template [levels]' line per layer, if any
+    """
+    layer_levels = {}
+    if layers_filename != None:
+        layers_file = open(layers_filename, 'r')
+        for line in layers_file:
+            fields = line.split()
+            if len(fields) == 3 and not fields[0].startswith('#'):
+                layer_levels[fields[0]] = get_levels_value(fields[2])
+        layers_file.close()
+    for levels_option in levels_options:
+        if '=' not in levels_option:
+            raise ValueError('Levels must be given as layer=levels: ' + levels_option)
+        layer, value = levels_option.split('=', 1)
+        layer_levels[layer] = get_levels_value(value)
+    return layer_levels
+
+
+def get_tile_time(tile_time, default_time):
+    """
+    Return the datetime of a tile from its WMTS time, or default_time for
+    'default' or no time.
+    Arguments:
+        tile_time -- time of the request, e.g. 2015-06-01 or 2015-06-01T12:00:00Z
+        default_time -- datetime used for requests of the current data
+    """
+    tile_time = tile_time.strip()
+    if tile_time == '' or tile_time.lower() == 'default':
+        return default_time
+    if 'T' in tile_time:
+        return datetime.datetime.strptime(tile_time.rstrip('Z'), '%Y-%m-%dT%H:%M:%S')
+    return datetime.datetime.strptime(tile_time, '%Y-%m-%d')
+
+
+def read_hot_tiles(hot_tiles_filename, templates, default_time, date=None):
+    """
+    Return a dictionary of (MRF header filename, layer) -> list of
+    (tilematrix, tilerow, tilecol) for the tiles in a hot tiles file, in order of requests.
+    Tiles of layers without a template are skipped.
+    Arguments:
+        hot_tiles_filename -- CSV file from onearth_logs.py --hot_tiles
+        templates -- dictionary of layer -> MRF header filename template
+        default_time -- datetime used for requests of the current data
+        date -- datetime used for all tiles instead of their own time, if set
+    """
+    tiles = {}
+    hot_tiles_file = open(hot_tiles_filename, 'rb')
+    for row in csv.DictReader(hot_tiles_file):
+        template = templates.get(row['layer'])
+        if template == None:
+            continue
+        if date != None:
+            tile_time = date
+        else:
+            try:
+                tile_time = get_tile_time(row['time'], default_time)
+            except ValueError:
+                continue
+        mrf_filename = tile_time.strftime(template)
+        tiles.setdefault((mrf_filename, row['layer']), []).append((int(row['tilematrix']), int(row['tilerow']), int(row['tilecol'])))
+    hot_tiles_file.close()
+    return tiles
+
+
+def get_tile_ranges(mrf_filename, tiles, tms_levels=None):
+    """
+    Return the (filename, offset, size) byte ranges of the index records and
+    data of tiles in an MRF.  Tiles outside of the MRF are skipped.
+    Arguments:
+        mrf_filename -- the MRF header (.mrf)
+        tiles -- list of (tilematrix, tilerow, tilecol)
+        tms_levels -- number of levels of the TileMatrixSet, <TWMS><Levels>
+                      of the MRF header if not given
+    """
+    if tms_levels == None:
+        tms_levels = get_twms_levels(mrf_filename)
+        if tms_levels == None:
+            raise MRFIndexError('Number of TileMatrixSet levels unknown, use --levels')
+    header = read_mrf_header(mrf_filename)
+    idx_filename = header.get_index_filename()
+    data_filename = header.get_data_filename()
+    index = MRFIndex(idx_filename, header, 'r')
+    ranges = []
+    for tilematrix, tilerow, tilecol in tiles:
+        # TileMatrix 0 is the last level of the TileMatrixSet, not of the index
+        level = tms_levels - 1 - tilematrix
+        if level < 0:
+            continue
+        try:
+            record_numbers = [index.record_numbers(level, tilerow, tilecol, band) for band in range(header.bands)]
+        except MRFIndexError:
+            continue
+        for record_number in record_numbers:
+            record = index.records[record_number]
+            ranges.append((idx_filename, int(record_number) * INDEX_DTYPE.itemsize, INDEX_DTYPE.itemsize))
+            if record['size'] > 0:
+                ranges.append((data_filename, int(record['offset']), int(record['size'])))
+    index.close()
+    return ranges
+
+
+def merge_ranges(ranges, gap=MERGE_GAP):
+    """
+    Return a dictionary of filename -> sorted list of [offset, size], with
+    overlapping and nearby ranges combined.
+    Arguments:
+        ranges -- list of (filename, offset, size)
+        gap -- ranges closer than this many bytes are combined
+    """
+    merged = {}
+    for filename, offset, size in sorted(ranges):
+        file_ranges = merged.setdefault(filename, [])
+        if len(file_ranges) > 0 and offset <= file_ranges[-1][0] + file_ranges[-1][1] + gap:
+            last = file_ranges[-1]
+            last[1] = max(last[1], offset + size - last[0])
+        else:
+            file_ranges.append([offset, size])
+    return merged
+
+
+def read_ranges(filename, file_ranges):
+    """
+    Read byte ranges of a file, which loads them into the page cache.
+    Returns the number of bytes read.
+    Arguments:
+        filename -- the file to read
+        file_ranges -- list of [offset, size]
+    """
+    total = 0
+    read_file = open(filename, 'rb')
+    for offset, size in file_ranges:
+        read_file.seek(offset)
+        while size > 0:
+            data = read_file.read(min(size, READ_BUFFER_SIZE))
+            if len(data) == 0:
+                break
+            total += len(data)
+            size -= len(data)
+    read_file.close()
+    return total
+
+
+def lock_ranges(filename, file_ranges):
+    """
+    Map byte ranges of a file and lock them in memory, like vmtouch -l.
+    The pages stay in memory until the process exits.  Locking usually
+    needs root or a large RLIMIT_MEMLOCK.  Returns the number of bytes locked.
+    Arguments:
+        filename -- the file to lock
+        file_ranges -- list of [offset, size]
+    """
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    libc.mmap.restype = ctypes.c_void_p
+    libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long]
+    libc.mlock.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+    total = 0
+    lock_file = open(filename, 'rb')
+    file_size = os.fstat(lock_file.fileno()).st_size
+    for offset, size in file_ranges:
+        # Maps start at a page boundary.
+        start = offset - offset % mmap.PAGESIZE
+        length = min(offset + size, file_size) - start
+        if length <= 0:
+            continue
+        address = libc.mmap(None, length, mmap.PROT_READ, mmap.MAP_SHARED, lock_file.fileno(), start)
+        if address == None or address == ctypes.c_void_p(-1).value:
+            raise OSError(ctypes.get_errno(), 'Cannot map ' + filename + ': ' + os.strerror(ctypes.get_errno()))
+        if libc.mlock(address, length) != 0:
+            raise OSError(ctypes.get_errno(), 'Cannot lock ' + filename + ': ' + os.strerror(ctypes.get_errno()))
+        total += length
+    # The maps stay valid after the file is closed.
+    lock_file.close()
+    return total
+
+
+#-------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+
+    usageText = 'oe_prewarm_tiles.py --input [hot_tiles.csv] --layer [layer=template.mrf] --levels [layer=levels] --layers_file [file] --date [YYYY-MM-DD] --top [count] --lock'
+
+    # Define command line options and args.
+    parser=OptionParser(usage=usageText, version=versionNumber)
+    parser.add_option('-d', '--date',
+                      action='store', type='string', dest='date',
+                      help='Date [YYYY-MM-DD] of the MRFs to warm for all tiles, e.g. the day just published.  Default: the time of each tile, or today for the default time')
+    parser.add_option('-f', '--layers_file',
+                      action='store', type='string', dest='layers_file',
+                      help='File with a "layer template [levels]" line for each layer')
+    parser.add_option('-i', '--input',
+                      action='store', type='string', dest='input',
+                      help='Hot tiles file from onearth_logs.py --hot_tiles')
+    parser.add_option('-k', '--lock', action='store_true', dest='lock',
+                      default=False, help='Lock the tiles in memory and wait until interrupted')
+    parser.add_option('-l', '--layer',
+                      action='append', type='string', dest='layers', default=[],
+                      help='Layer and MRF header filename template, e.g. MODIS_Aqua_Aerosol=/data/MODIS_Aqua_Aerosol%Y%j_.mrf.  May be repeated')
+    parser.add_option('-m', '--levels',
+                      action='append', type='string', dest='levels', default=[],
+                      help='Layer and number of TileMatrixSet levels, or an MRF header with <TWMS><Levels> such as the one written by oe_configure_layer, e.g. MODIS_Aqua_Aerosol=6.  Default: <TWMS><Levels> of the MRF.  May be repeated')
+    parser.add_option('-n', '--top',
+                      action='store', type='int', dest='top',
+                      help='Only warm the first tiles of each MRF in the hot tiles file.  Default: all')
+
+    # Read command line args.
+    (options, args) = parser.parse_args()
+    if not options.input:
+        parser.error('Hot tiles file not provided. --input must be specified.')
+    if len(options.layers) == 0 and not options.layers_file:
+        parser.error('No layers provided. --layer or --layers_file must be specified.')
+
+    print 'oe_prewarm_tiles v' + versionNumber
+    try:
+        templates = read_layer_templates(options.layers, options.layers_file)
+        layer_levels = read_layer_levels(options.levels, options.layers_file)
+        date = None
+        if options.date:
+            date = datetime.datetime.strptime(options.date, '%Y-%m-%d')
+        hot_tiles = read_hot_tiles(options.input, templates, datetime.datetime.utcnow(), date)
+    except (IOError, ValueError, KeyError, MRFIndexError), e:
+        print >> sys.stderr, 'Error: ' + str(e)
+        sys.exit(1)
+
+    ranges = []
+    for (mrf_filename, layer), tiles in sorted(hot_tiles.iteritems()):
+        if options.top:
+            tiles = tiles[:options.top]
+        try:
+            mrf_ranges = get_tile_ranges(mrf_filename, tiles, layer_levels.get(layer))
+        except (IOError, OSError, MRFIndexError), e:
+            print >> sys.stderr, 'Skipping ' + mrf_filename + ': ' + str(e)
+            continue
+        print mrf_filename + ': ' + str(len(tiles)) + ' tiles'
+        ranges.extend(mrf_ranges)
+
+    total = 0
+    try:
+        for filename, file_ranges in sorted(merge_ranges(ranges).iteritems()):
+            if options.lock:
+                total += lock_ranges(filename, file_ranges)
+            else:
+                total += read_ranges(filename, file_ranges)
+    except (IOError, OSError), e:
+        print >> sys.stderr, 'Error: ' + str(e)
+        sys.exit(1)
+
+    if options.lock:
+        print 'Locked ' + str(total) + ' bytes, press Ctrl-C to release'
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+    else:
+        print 'Read ' + str(total) + ' bytes into the page cache'
@@ -47,20 +47,79 @@
 # 2014
 
 from optparse import OptionParser
+from collections import deque
+from distutils.spawn import find_executable
+import bz2
+import gzip
+import itertools
+import multiprocessing
+import os
+import subprocess
 import sys
 import time
-import subprocess
-import select
 import re
-import urlparse
 import urllib
 import xml.dom.minidom
+from oe_log_stats import LogStats, HotTiles, LatencyStats
 
 toolName = "onearth_logs.py"
 versionNumber = "v0.3"
 
 pixelsize = 0.00028 # meters
 
+# OnEarth request parameters, blank if not in the request
+request_keys = ['service','request','version','layer','time','tilematrixset','tilematrix','tilerow','tilecol','format',
+                'layers','srs','styles','width','height','bbox','transparent','bgcolor','exceptions','elevation'] #Tiled-WMS specific
+
+# Apache log fields, blank if not in the Apache log format
+log_keys = ['requestor','timestamp','uri','bytes','statuscode','referrer','useragent','responsetime']
+
+# Apache log format nicknames from the default httpd.conf
+log_format_nicknames = {'common': '%h %l %u %t \\"%r\\" %>s %b',
+                        'combined': '%h %l %u %t \\"%r\\" %>s %b \\"%{Referer}i\\" \\"%{User-Agent}i\\"',
+                        'combinedio': '%h %l %u %t \\"%r\\" %>s %b \\"%{Referer}i\\" \\"%{User-Agent}i\\" %I %O',
+                        'referer': '%{Referer}i -> %U',
+                        'agent': '%{User-agent}i'}
+
+# Apache log format directives: (field, regex)
+log_format_directives = {'a': ('remoteip', r'\S+'), 'A': ('localip', r'\S+'), 'B': ('bytes', r'\d+'), 'b': ('bytes', r'\d+|-'),
+                         'D': ('responsetime', r'\d+'), 'f': ('filename', r'\S+'), 'h': ('requestor', r'\S+'),
+                         'H': ('protocol', r'\S+'), 'I': ('bytesin', r'\d+'), 'k': ('keepalives', r'\d+'), 'l': ('logname', r'\S+'),
+                         'L': ('logid', r'\S+'), 'm': ('method', r'\S+'), 'O': ('bytesout', r'\d+'), 'p': ('port', r'\d+'),
+                         'P': ('pid', r'\d+'), 'q': ('querystring', r'\S*'), 'R': ('handler', r'\S+'), 's': ('statuscode', r'\d+|-'),
+                         'S': ('bytestransferred', r'\d+'), 'T': ('responsetime_s', r'\d+'), 'u': ('remoteuser', r'\S+'),
+                         'U': ('path', r'\S+'), 'v': ('servername', r'\S+'), 'V': ('servername', r'\S+'),
+                         'X': ('connectionstatus', r'[-+X]')}
+
+# Apache log format directives with a {name}: (field prefix, regex)
+log_format_name_directives = {'i': ('', '.*?'), 'o': ('response_', '.*?'), 'e': ('env_', '.*?'), 'n': ('note_', '.*?'),
+                              'C': ('cookie_', '.*?'), 'a': ('', r'\S+'), 'p': ('', r'\d+'), 'P': ('', r'\d+')}
+
+# Request headers with the field names of the combined log format
+log_format_headers = {'referer': 'referrer', 'user-agent': 'useragent'}
+
+# Response time fields in other units than microseconds: (field, microseconds per unit)
+responsetime_units = [('responsetime_ms', 1000), ('responsetime_s', 1000000)]
+
+# Fields between double quotes, where Apache escapes quotes with a backslash
+quoted_field = r'[^"\\]*(?:\\.[^"\\]*)*'
+quoted_word = r'[^"\\ ]*(?:\\.[^"\\ ]*)*'
+
+# Buffer size for reading and writing logs
+buffer_size = 1048576
+
+# Compressed logs by extension: (decompress commands, compress commands, Python module).
+# The first command found is run in another process; the module is used if there is none.
+compressed_log_types = {'.gz': ([['pigz', '-dc'], ['gzip', '-dc']], [['pigz', '-c'], ['gzip', '-c']], 'gzip'),
+                        '.bz2': ([['pbzip2', '-dc'], ['bzip2', '-dc']], [['pbzip2', '-c'], ['bzip2', '-c']], 'bz2'),
+                        '.xz': ([['xz', '-dc']], [['xz', '-c']], 'lzma')}
+
+# Seconds to wait for new lines when following a log
+follow_interval = 0.5
+
+# Settings of a translate_range worker process, see init_worker
+worker_settings = {}
+
 
 class TileMatrixSetMap:
     """Mappings for Tiled-WMS bounding box levels to WMTS TileMatrixSets"""
@@ -79,6 +138,34 @@ class TileMatrixSetMap:
         self.minx = float(minx)
         self.maxy = float(maxy)
         self.tilematrixsetmap = tilematrixsetmap
+        # Lookup of layer -> (TileMatrixSet, {tile size key: TileMatrix}) built from the
+        # top-left tile bboxes, so requests are translated without searching the bboxes.
+        self.layers = {}
+        for layer, layer_bboxes in bboxes.iteritems():
+            tilematrices = {}
+            for i, bbox in enumerate(layer_bboxes):
+                if same_coordinate(bbox[0], self.minx) and same_coordinate(bbox[3], self.maxy):
+                    tilematrices[get_size_key(bbox[2]-bbox[0], bbox[3]-bbox[1])] = (len(layer_bboxes)-1)-i
+            self.layers[layer] = (tilematrixsetmap.get(str(len(layer_bboxes))), tilematrices)
+
+
+def same_coordinate(a, b):
+    """
+    Compares coordinates from different sources, ignoring floating point rounding
+    Arguments:
+        a, b -- the coordinates
+    """
+    return abs(a - b) <= 1e-9 * max(abs(a), abs(b), 1.0)
+
+
+def get_size_key(x_size, y_size):
+    """
+    Returns a hashable key for a tile size, quantized to ignore floating point rounding
+    Arguments:
+        x_size -- the width of the tile bbox
+        y_size -- the height of the tile bbox
+    """
+    return (int(round(x_size * 1e6)), int(round(y_size * 1e6)))
 
 def read_getTileService(gettileservice_file):
     """
@@ -168,6 +255,85 @@ def read_config(config_file):
     return (log_format, log_output)
             
 
+def compile_log_format(log_format):
+    """
+    Compiles an Apache LogFormat string into a regex with a named group for each field
+    Arguments:
+        log_format -- LogFormat string as in httpd.conf, in double quotes or not, or a nickname such as combined
+    """
+    
+    log_format = log_format.strip()
+    log_format = log_format_nicknames.get(log_format, log_format)
+    if len(log_format) > 1 and log_format[0] == '"' and log_format[-1] == '"':
+        log_format = log_format[1:-1]
+    # Escapes of the httpd.conf string
+    log_format = re.sub(r'\\(.)', lambda match: {'n': '\n', 't': '\t'}.get(match.group(1), match.group(1)), log_format)
+    
+    tokens = re.split(r'%[<>]?(?:!?[0-9,]+)?[<>]?(?:\{([^}]*)\})?([a-zA-Z%])', log_format)
+    # re.split alternates literal text and the (name, directive) groups
+    literals = tokens[0::3]
+    fields = []
+    for name, directive in zip(tokens[1::3], tokens[2::3]):
+        if directive == '%':
+            fields.append((None, re.escape('%')))
+        elif directive == 't':
+            if name:
+                fields.append(('timestamp', '.*?'))
+            else:
+                # [day/month/year:hour:minute:second zone]
+                fields.append(('timestamp', None))
+        elif directive == 'T' and name == 'us':
+            fields.append(('responsetime', r'\d+'))
+        elif directive == 'T' and name in ('ms', 's'):
+            fields.append(('responsetime_' + name, r'\d+'))
+        elif directive == 'r':
+            fields.append(('uri', '.*?'))
+        elif name and directive in log_format_name_directives:
+            prefix, field_re = log_format_name_directives[directive]
+            field = log_format_headers.get(name.lower(), prefix + re.sub('[^a-z0-9]+', '_', name.lower()))
+            fields.append((field, field_re))
+        elif directive in log_format_directives:
+            fields.append(log_format_directives[directive])
+        else:
+            raise ValueError("Error: %" + directive + " is not a supported Apache log format directive.")
+    
+    pattern = [re.escape(literals[0])]
+    names = set()
+    for i, (field, field_re) in enumerate(fields):
+        before = literals[i]
+        after = literals[i + 1]
+        if field_re == None:
+            # %t includes the brackets, the field does not
+            pattern.append(re.escape('['))
+            field_re = r'[^\]]*'
+            after = ']' + after
+        elif field_re == '.*?':
+            if before.endswith('"') and after.startswith('"'):
+                if field == 'uri':
+                    # Words, so that the protocol is not part of the field
+                    field_re = str().join([quoted_word, '(?: ', quoted_word, ')*?'])
+                else:
+                    field_re = quoted_field
+            elif after == '' and i == len(fields) - 1:
+                field_re = '.*'
+        if field == 'uri' and field not in names:
+            # The request line without the protocol
+            field_re = str().join(['(?P<uri>', field_re, r')(?: HTTP/\d\.\d)?'])
+            names.add(field)
+        elif field == None or field in names:
+            field_re = str().join(['(?:', field_re, ')'])
+        else:
+            field_re = str().join(['(?P<', field, '>', field_re, ')'])
+            names.add(field)
+        pattern.append(field_re)
+        pattern.append(re.escape(after))
+    # Empty groups for fields that are not in the format
+    for field in log_keys:
+        if field not in names:
+            pattern.append(str().join(['(?P<', field, '>)']))
+    return re.compile(str().join(pattern))
+
+
 def parse_request(request_string):
     """
     Parse OnEarth request parameters into a dictionary
@@ -175,50 +341,330 @@ def parse_request(request_string):
         request_string -- The URL request string
     """
     
-    try:
-        request_dict = lower_keys(urlparse.parse_qs(str(request_string).split('?')[1], keep_blank_values=True))
-    except IndexError: # return blank values on error
-        request_dict = {'service': [''], 'request':[''], 'version':[''], 'layer': [''], 'time': [''], 'tilematrixset': [''], 'tilematrix': [''], 'tilerow': [''], 'tilecol': [''], 'format': [''],
-                        'layers': [''], 'srs':[''], 'styles': [''], 'width':[''], 'height':[''], 'bbox':[''], 'transparent':[''], 'bgcolor':[''], 'exceptions':[''], 'elevation':['']} #Tiled-WMS specific
+    request_dict = {}
+    query = str(request_string).split('?', 1)
+    if len(query) > 1:
+        # Same as urlparse.parse_qsl(keep_blank_values=True), but only unquotes
+        # when needed.  Keys are lowercased; the first value of a parameter is used.
+        for field in query[1].replace(';', '&').split('&'):
+            if field == '':
+                continue
+            key, equals, value = field.partition('=')
+            if '%' in key or '+' in key:
+                key = urllib.unquote(key.replace('+', ' '))
+            key = key.lower()
+            if key not in request_dict:
+                if '%' in value or '+' in value:
+                    value = urllib.unquote(value.replace('+', ' '))
+                request_dict[key] = [value]
     
     # add blank values if they don't exist in the request
-    for key in ['service','request','version','layer','time','tilematrixset','tilematrix','tilerow','tilecol','format',
-                'layers','srs','styles','width','height','bbox','transparent','bgcolor','exceptions','elevation']: #Tiled-WMS specific
+    for key in request_keys:
         if key not in request_dict:
             request_dict[key] = ['']
             
     return request_dict
 
 
+def parse_log(log_in, log_re, tilematrixset_data, wmts_translate_off):
+    """
+    Parses a log message in Apache log format into a dictionary of Apache and OnEarth fields, or None if it does not match
+    Arguments:
+        log_in -- The input log message
+        log_re -- Compiled regex for the Apache log format
+    """
+    
+    message = log_re.match(log_in)
+    if not message:
+        return None
+    log_dict = message.groupdict()
+    if log_dict['responsetime'] == '':
+        for key, scale in responsetime_units:
+            if log_dict.get(key):
+                log_dict['responsetime'] = str(int(log_dict[key]) * scale)
+                break
+    request = parse_request(str(log_dict['uri']))
+    for key, value in request.iteritems():
+        log_dict[key] = value[0]
+    
+    if (wmts_translate_off == False) and (log_dict['bbox'] != ''):
+        try:
+            log_dict = translate_wmts(log_dict, tilematrixset_data)
+        except:
+            log_dict = log_dict     
+    return log_dict
+
+
+def format_log(log_dict, log_output):
+    """
+    Formats a parsed log message in the custom format
+    Arguments:
+        log_dict -- The parsed log message, or None
+        log_output -- The custom output log format
+    """
+    
+    if log_dict == None:
+        return ""
+    try:
+        return log_output % log_dict
+    except KeyError,e:
+        raise ValueError("Error: " + str(e) + " is not an available custom log field.")
+
+
 def translate_log(log_in, log_re, log_output, tilematrixset_data, wmts_translate_off):
     """
     Translates log message in Apache log format to a custom format 
     Arguments:
         log_in -- The input log message
-        log_re -- Regex for the Apache log format
+        log_re -- Compiled regex for the Apache log format
         log_output -- The custom output log format
     """
     
-    log_out = ""
-    message = re.match(log_re, log_in)
-    if message:
-        log_dict = message.groupdict()
-        request = parse_request(str(log_dict['uri']))
-        for key, value in request.iteritems():
-            log_dict[key] = value[0]
-        
-        if (wmts_translate_off == False) and (log_dict['bbox'] != ''):
-            try:
-                log_dict = translate_wmts(log_dict, tilematrixset_data)
-            except:
-                log_dict = log_dict     
+    return format_log(parse_log(log_in, log_re, tilematrixset_data, wmts_translate_off), log_output)
+
+
+def translate_lines(lines, log_re, log_output, tilematrixset_data, wmts_translate_off, apachedate=None, stats=None, hot_tiles=None,
+                    latency=None):
+    """
+    Translates log lines and returns the output as a string, one line per input line
+    Arguments:
+        lines -- The input log lines
+        log_re -- Compiled regex for the Apache log format
+        log_output -- The custom output log format, or None to only collect stats
+        apachedate -- Only translate lines containing this date, if set
+        stats -- LogStats to count the requests in, if set
+        hot_tiles -- HotTiles to count the tile requests in, if set
+        latency -- LatencyStats to count the response times in, if set
+    """
+    
+    output = []
+    for line in lines:
+        if apachedate == None or apachedate in line:
+            log_dict = parse_log(line, log_re, tilematrixset_data, wmts_translate_off)
+            if stats != None and log_dict != None:
+                stats.add(log_dict)
+            if hot_tiles != None and log_dict != None:
+                hot_tiles.add(log_dict)
+            if latency != None and log_dict != None:
+                latency.add(log_dict)
+            if log_output != None:
+                output.append(format_log(log_dict, log_output))
+                output.append("\n")
+    return "".join(output)
+
+
+def get_byte_ranges(input_log, chunk_size):
+    """
+    Splits a log file into (start, end) byte ranges of about chunk_size bytes that end at a line break
+    Arguments:
+        input_log -- The input log file
+        chunk_size -- The size of the ranges in bytes
+    """
+    
+    file_size = os.path.getsize(input_log)
+    offsets = [0]
+    input_file = open(input_log, 'rb')
+    while offsets[-1] + chunk_size < file_size:
+        # Move the end of the range to the end of the line.
+        input_file.seek(offsets[-1] + chunk_size)
+        input_file.readline()
+        if input_file.tell() >= file_size:
+            break
+        offsets.append(input_file.tell())
+    input_file.close()
+    offsets.append(file_size)
+    return [(offsets[i], offsets[i+1]) for i in range(len(offsets)-1) if offsets[i+1] > offsets[i]]
+
+
+class PipedFile:
+    """Log file read or written through a compression command running in another process"""
+    
+    def __init__(self, command, filename, mode):
+        """
+        Arguments:
+            command -- the compression command, reading stdin and writing stdout
+            filename -- the compressed file
+            mode -- 'r' to read or 'w' to write
+        """
+        self.command = command
+        self.filename = filename
+        if mode == 'r':
+            self.compressed_file = open(filename, 'rb')
+            self.process = subprocess.Popen(command, stdin=self.compressed_file, stdout=subprocess.PIPE, bufsize=buffer_size)
+            self.file = self.process.stdout
+        else:
+            self.compressed_file = open(filename, 'wb')
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=self.compressed_file, bufsize=buffer_size)
+            self.file = self.process.stdin
+        self.read = self.file.read
+        self.readline = self.file.readline
+        self.readlines = self.file.readlines
+        self.write = self.file.write
+        self.flush = self.file.flush
+    
+    def close(self):
+        """
+        Closes the file and waits for the command to finish.
+        """
+        self.file.close()
+        returncode = self.process.wait()
+        self.compressed_file.close()
+        if returncode > 0:
+            raise IOError(str().join([' '.join(self.command), ' failed for ', self.filename, ' with exit code ', str(returncode)]))
+
+
+def is_compressed_log(log_file):
+    """
+    Returns True if a log file name has the extension of a compressed log (.gz, .bz2 or .xz)
+    Arguments:
+        log_file -- The log file name
+    """
+    
+    return os.path.splitext(log_file)[1].lower() in compressed_log_types
+
+
+def open_log(log_file, mode='r'):
+    """
+    Opens a log file for reading or writing with a large buffer.  Compressed logs (.gz, .bz2, .xz)
+    are decompressed or compressed as a stream by a command in another process if one is installed,
+    so compression runs in parallel with the translation.  Concatenated streams are read in full.
+    Arguments:
+        log_file -- The log file name
+        mode -- 'r' to read or 'w' to write
+    """
+    
+    extension = os.path.splitext(log_file)[1].lower()
+    if extension not in compressed_log_types:
+        return open(log_file, mode, buffer_size)
+    decompress_commands, compress_commands, module_name = compressed_log_types[extension]
+    if mode == 'r':
+        commands = decompress_commands
+    else:
+        commands = compress_commands
+    for command in commands:
+        if find_executable(command[0]) != None:
+            return PipedFile(command, log_file, mode)
+    if module_name == 'gzip':
+        return gzip.GzipFile(log_file, mode + 'b')
+    if module_name == 'bz2':
+        # Only the first stream of concatenated bzip2 files is read
+        return bz2.BZ2File(log_file, mode + 'b', buffer_size)
+    try:
+        lzma = __import__(module_name)
+    except ImportError:
+        raise IOError(str().join(['Cannot open ', log_file, ': ', ' or '.join([command[0] for command in commands]),
+                                  ' or the ', module_name, ' Python module is required']))
+    return lzma.LZMAFile(log_file, mode + 'b')
+
+
+def read_parts(input_file, part_size):
+    """
+    Reads a log file in parts of about part_size bytes that end at a line break
+    Arguments:
+        input_file -- The open log file
+        part_size -- The size of the parts in bytes
+    """
+    
+    while True:
+        lines = input_file.readlines(part_size)
+        if len(lines) == 0:
+            break
+        yield "".join(lines)
+
+
+def follow_log(input_log, interval=follow_interval):
+    """
+    Follows a log like tail -F, yielding lists of the complete lines added since the last batch.
+    Rotation (a new file with the same name) and truncation are detected with the inode and size.
+    Arguments:
+        input_log -- The log file to follow
+        interval -- Seconds to wait when there are no new lines
+    """
+    
+    log_file = open(input_log, 'rb')
+    # Start with lines added from now on.
+    log_file.seek(0, os.SEEK_END)
+    position = log_file.tell()
+    partial = ''
+    while True:
+        data = log_file.read(buffer_size)
+        if data:
+            position += len(data)
+            lines = (partial + data).split('\n')
+            partial = lines.pop()
+            if len(lines) > 0:
+                yield [line + '\n' for line in lines]
+            continue
+        # No new data; check if the log was rotated or truncated.
         try:
-            log_out = log_output % log_dict
-        except KeyError,e:
-            print "Error: " + str(e) + " is not an available custom log field."
-            sys.exit()
-        
-    return log_out
+            stats = os.stat(input_log)
+        except OSError: # between rotation and creation of the new log
+            time.sleep(interval)
+            continue
+        if stats.st_ino != os.fstat(log_file.fileno()).st_ino:
+            # The old log has been read to the end; continue with the new one from the start.
+            log_file.close()
+            log_file = open(input_log, 'rb')
+            position = 0
+            partial = ''
+            continue
+        if stats.st_size < position:
+            log_file.seek(0)
+            position = 0
+            partial = ''
+            continue
+        time.sleep(interval)
+
+
+def init_worker(settings):
+    """
+    Stores the settings used by translate_range in a worker process
+    Arguments:
+        settings -- Dictionary with input_log, log_re, log_output, tilematrixset_data, wmts_translate_off, apachedate, stats, hot_tiles and latency
+    """
+    worker_settings.update(settings)
+
+
+def translate_range(byte_range):
+    """
+    Translates the log lines in a byte range of the input log.
+    Returns the output as a string, and the LogStats, HotTiles and LatencyStats of the lines if they are collected.
+    Arguments:
+        byte_range -- (start, end) byte offsets of the lines
+    """
+    
+    start, end = byte_range
+    input_file = open(worker_settings['input_log'], 'rb')
+    input_file.seek(start)
+    data = input_file.read(end - start)
+    input_file.close()
+    return translate_data(data)
+
+
+def translate_data(data):
+    """
+    Translates log lines, e.g. a part of a compressed log read by the main process.
+    Returns the output as a string, and the LogStats, HotTiles and LatencyStats of the lines if they are collected.
+    Arguments:
+        data -- The log lines as a string
+    """
+    
+    if worker_settings['stats']:
+        stats = LogStats()
+    else:
+        stats = None
+    if worker_settings['hot_tiles'] != None:
+        hot_tiles = HotTiles(worker_settings['hot_tiles'])
+    else:
+        hot_tiles = None
+    if worker_settings['latency']:
+        latency = LatencyStats()
+    else:
+        latency = None
+    log_out = translate_lines(data.splitlines(True), worker_settings['log_re'], worker_settings['log_output'],
+                              worker_settings['tilematrixset_data'], worker_settings['wmts_translate_off'],
+                              worker_settings['apachedate'], stats, hot_tiles, latency)
+    return (log_out, stats, hot_tiles, latency)
 
 
 def translate_wmts(request_dict, tilematrixset_data):
@@ -251,34 +697,23 @@ def translate_wmts(request_dict, tilematrixset_data):
     # set top_left values
     top_left_minx = tilematrixset_data[projection].minx
     top_left_maxy = tilematrixset_data[projection].maxy
-    
-    # calculate additional top_left values for reference
-    top_left_maxx = top_left_minx + x_size
     top_left_miny = top_left_maxy - y_size
     
-    topleftbbox = str(top_left_minx)+","+str(top_left_miny)+","+str(top_left_maxx)+","+str(top_left_maxy)
-#     print "Top Left BBOX:", topleftbbox
-#     print "Request BBOX:",str(request_minx)+","+str(request_miny)+","+str(request_maxx)+","+str(request_maxy)
-    
     # calculate col and row
     col = ((request_minx-top_left_minx)/x_size)
     row = ((request_miny-top_left_miny)/y_size)
     
     # calculate scale denominator for reference
     scale_denominator = (((x_size*2)/pixelsize)*units)/(tilesize*2)
-#     print "Scale Denominator:", str(round(scale_denominator,10))
 
     try:
-        tilematrixsetlevels = len(tilematrixset_data[projection].bboxes[request_dict['layers']])
-    except:
+        tilematrixset, tilematrices = tilematrixset_data[projection].layers[request_dict['layers']]
+    except KeyError:
         return request_dict # return if layer does not exist in getTileService
-    tilematrixset = tilematrixset_data[projection].tilematrixsetmap[str(tilematrixsetlevels)]
-    tilematrix = ''
-    
-    topleftbbox = [float(x) for x in topleftbbox.split(',')]
-    for i, bbox in enumerate(tilematrixset_data[projection].bboxes[request_dict['layers']]):
-        if topleftbbox == bbox:
-            tilematrix = (tilematrixsetlevels-1)-i
+    if tilematrixset == None:
+        raise KeyError('No TileMatrixSet for ' + str(len(tilematrixset_data[projection].bboxes[request_dict['layers']])) + ' levels')
+    # The TileMatrix has a top-left tile of the same size as the request.
+    tilematrix = tilematrices.get(get_size_key(x_size, y_size), '')
             
     request_dict['scaledenominator'] = scale_denominator
     request_dict['tilematrixset'] = tilematrixset
@@ -289,19 +724,6 @@ def translate_wmts(request_dict, tilematrixset_data):
     return request_dict
 
 
-def lower_keys(x):
-    """
-    Lowers key in a dictionary to normalize case
-    Arguments:
-        x -- The dictionary key
-    """    
-    if isinstance(x, list):
-        return [lower_keys(v) for v in x]
-    if isinstance(x, dict):
-        return dict((k.lower(), lower_keys(v)) for k, v in x.iteritems())
-    return x
-
-
 def get_dom_tag_value(dom, tag_name):
     """
     Return value of a tag from dom (XML file).
@@ -315,126 +737,263 @@ def get_dom_tag_value(dom, tag_name):
 
 #-------------------------------------------------------------------------------
 
-print toolName + ' ' + versionNumber
-
-usageText = toolName + " --input [file] --output [file] --config [logs.xml] --tilematrixsetmap [tilematrixsetmap.xml] --date [YYYY-MM-DD] --quiet --tail --wmts_translate_off"
-
-# Define command line options and args.
-parser=OptionParser(usage=usageText, version=versionNumber)
-parser.add_option('-c', '--config',
-                  action='store', type='string', dest='config', default='logs.xml',
-                  help='Full path of log configuration file.  Default: logs.xml')
-parser.add_option('-d', '--date',
-                  action='store', type='string', dest='logdate', default=None,
-                  help='Filter log for specified date [YYYY-MM-DD]')
-parser.add_option('-i', '--input',
-                  action='store', type='string', dest='input',
-                  help='The full path of the input log file')
-parser.add_option('-m', '--tilematrixsetmap',
-                  action='store', type='string', dest='tilematrixsetmap', default='tilematrixsetmap.xml',
-                  help='Full path of configuration file containing TileMatrixSet mappings.  Default: tilematrixsetmap.xml')
-parser.add_option('-o', '--output',
-                  action='store', type='string', dest='output',
-                  help='The full path of the output log file')
-parser.add_option("-q", "--quiet", action="store_true", dest="quiet", 
-                  default=False, help="Suppress log output to terminal")
-parser.add_option("-t", "--tail", action="store_true", dest="tail", 
-                  default=False, help="Tail the log file")
-parser.add_option("-w", "--wmts_translate_off", action="store_true", dest="wmts_translate_off", 
-                  default=False, help="Do not translate Tiled-WMS tile requests to WMTS")
-
-# Read command line args.
-(options, args) = parser.parse_args()
-
-quiet = options.quiet
-tail = options.tail
-
-if options.input:
-    input_log = options.input
-else:
-    print "input log file must be specified...exiting"
-    exit()
-if options.output:
-    output_log = options.output
-else:
-    print "output log file must be specified...exiting"
-    exit()
-if options.logdate != None:
-    if tail:
-        print "date cannot be specified with tail option...exiting"
+if __name__ == '__main__':
+
+    print toolName + ' ' + versionNumber
+
+    usageText = toolName + " --input [file] --output [file] --config [logs.xml] --tilematrixsetmap [tilematrixsetmap.xml] --date [YYYY-MM-DD] --jobs [count] --stats [file.csv] --hot_tiles [file.csv] --top [count] --latency [file.csv] --merge_latency [file.csv] --quiet --tail --wmts_translate_off"
+
+    # Define command line options and args.
+    parser=OptionParser(usage=usageText, version=versionNumber)
+    parser.add_option('-c', '--config',
+                      action='store', type='string', dest='config', default='logs.xml',
+                      help='Full path of log configuration file.  Default: logs.xml')
+    parser.add_option('-d', '--date',
+                      action='store', type='string', dest='logdate', default=None,
+                      help='Filter log for specified date [YYYY-MM-DD]')
+    parser.add_option('-i', '--input',
+                      action='store', type='string', dest='input',
+                      help='The full path of the input log file')
+    parser.add_option('-j', '--jobs',
+                      action='store', type='int', dest='jobs', default=1,
+                      help='Number of processes translating the log in parallel.  Not used with --tail.  Default: 1')
+    parser.add_option('-k', '--chunk_size',
+                      action='store', type='int', dest='chunk_size', default=64,
+                      help='Size in MB of the parts of the log given to each process.  Default: 64')
+    parser.add_option('-l', '--latency',
+                      action='store', type='string', dest='latency',
+                      help='The full path of a CSV file for response time percentiles by layer, TileMatrixSet, TileMatrix and status code')
+    parser.add_option('-m', '--tilematrixsetmap',
+                      action='store', type='string', dest='tilematrixsetmap', default='tilematrixsetmap.xml',
+                      help='Full path of configuration file containing TileMatrixSet mappings.  Default: tilematrixsetmap.xml')
+    parser.add_option('-n', '--top',
+                      action='store', type='int', dest='top', default=1000,
+                      help='Number of tiles in the hot tiles file.  Default: 1000')
+    parser.add_option('-o', '--output',
+                      action='store', type='string', dest='output',
+                      help='The full path of the output log file')
+    parser.add_option('-p', '--hot_tiles',
+                      action='store', type='string', dest='hot_tiles',
+                      help='The full path of a CSV file for the most requested tiles, e.g. for oe_prewarm_tiles.py')
+    parser.add_option("-q", "--quiet", action="store_true", dest="quiet", 
+                      default=False, help="Suppress log output to terminal")
+    parser.add_option('-s', '--stats',
+                      action='store', type='string', dest='stats',
+                      help='The full path of a CSV file for request statistics by layer, TileMatrixSet, TileMatrix, time, date and hour')
+    parser.add_option('-r', '--merge_latency',
+                      action='append', type='string', dest='merge_latency', default=[],
+                      help='Latency file (e.g. of another server) to add to the --latency file.  May be repeated, and used without --input')
+    parser.add_option("-t", "--tail", action="store_true", dest="tail", 
+                      default=False, help="Tail the log file")
+    parser.add_option("-w", "--wmts_translate_off", action="store_true", dest="wmts_translate_off", 
+                      default=False, help="Do not translate Tiled-WMS tile requests to WMTS")
+
+    # Read command line args.
+    (options, args) = parser.parse_args()
+
+    quiet = options.quiet
+    tail = options.tail
+
+    if len(options.merge_latency) > 0 and not options.latency:
+        print "latency file must be specified with merge_latency...exiting"
         exit()
-    try:
-        logdate = time.strptime(options.logdate,"%Y-%m-%d")
-        apachedate = time.strftime('%d/%b/%Y', logdate)
-        print "Filtering for date", apachedate
-    except ValueError,e:
-        print str(e)
+    if len(options.merge_latency) > 0 and not options.input:
+        # Only combine latency files
+        latency = LatencyStats()
+        try:
+            for latency_file in options.merge_latency:
+                latency.read_csv(latency_file)
+            latency.write_csv(options.latency)
+        except (IOError, ValueError, KeyError),e:
+            print str(e)
+            exit()
+        print "Latency written to " + options.latency
         exit()
-
-try:    
-    output_file = open(output_log,'w')
-except IOError,e:
-    print str(e)
-    exit()
-print "opening " + input_log
-
-if options.wmts_translate_off == False:
-    tilematrixset_data = read_tilematrixsetmap(options.tilematrixsetmap)
-else:
-    tilematrixset_data = None
-
-log_format, log_output = read_config(options.config)
-
-# only one Apache log format supported for now
-combined = '"%h %l %u %t \\"%r\\" %>s %b \\"%{Referer}i\\" \\"%{User-Agent}i\\""'
-if log_format == combined:
-    log_re = '(?P<requestor>[.:0-9a-fA-F]+) - - \[(?P<timestamp>.*?)\] "(?P<uri>.*?) HTTP/1.\d" (?P<statuscode>\d+) (?P<bytes>\d+|-) "(?P<referrer>.*?)" "(?P<useragent>.*?)"'
-else:
-    print "The specified Apache log format is not supported by this tool: " + log_format
-    print "Please use: " + combined
-    exit()
-        
-if tail:
-    try:
-        testopen = open(input_log, 'r')
+    if options.input:
+        input_log = options.input
+    else:
+        print "input log file must be specified...exiting"
+        exit()
+    if options.output:
+        output_log = options.output
+    elif options.stats or options.hot_tiles or options.latency:
+        output_log = None
+    else:
+        print "output log file, stats file, hot tiles file or latency file must be specified...exiting"
+        exit()
+    if tail and (is_compressed_log(input_log) or is_compressed_log(output_log or '')):
+        print "compressed logs cannot be used with tail option...exiting"
+        exit()
+    if (options.stats or options.hot_tiles or options.latency) and tail:
+        print "stats, hot tiles and latency cannot be specified with tail option...exiting"
+        exit()
+    if options.top < 1:
+        print "top must be positive...exiting"
+        exit()
+    apachedate = None
+    if options.jobs < 1 or options.chunk_size < 1:
+        print "jobs and chunk_size must be positive...exiting"
+        exit()
+    if options.logdate != None:
+        if tail:
+            print "date cannot be specified with tail option...exiting"
+            exit()
+        try:
+            logdate = time.strptime(options.logdate,"%Y-%m-%d")
+            apachedate = time.strftime('%d/%b/%Y', logdate)
+            print "Filtering for date", apachedate
+        except ValueError,e:
+            print str(e)
+            exit()
+
+    try:    
+        if output_log != None:
+            output_file = open_log(output_log, 'w')
+        if options.stats:
+            # Make sure the stats can be written before reading the log.
+            open(options.stats, 'a').close()
+        if options.hot_tiles:
+            open(options.hot_tiles, 'a').close()
+        if options.latency:
+            open(options.latency, 'a').close()
     except IOError,e:
         print str(e)
-        if "Permission denied" in str(e):
-            print "Please rerun with appropriate permissions or sudo"
         exit()
-    
-    logfile = subprocess.Popen(['tail','-F',input_log], stdout=subprocess.PIPE,stderr=subprocess.PIPE)
-    
-    p = select.poll()
-    p.register(logfile.stdout)
-     
-    while True:
-        if p.poll(1):
-            output_file.write(logfile.stdout.readline())
-            if quiet == False:
-                print translate_log(logfile.stdout.readline().strip(), log_re, log_output, tilematrixset_data, options.wmts_translate_off)
-        time.sleep(.001)
-        
-else:
+    print "opening " + input_log
+
+    if options.wmts_translate_off == False:
+        tilematrixset_data = read_tilematrixsetmap(options.tilematrixsetmap)
+    else:
+        tilematrixset_data = None
+
+    log_format, log_output = read_config(options.config)
+    if output_log == None:
+        # Only stats, hot tiles and latency
+        log_output = None
+        quiet = True
+    if options.stats:
+        stats = LogStats()
+    else:
+        stats = None
+    if options.hot_tiles:
+        # Extra counters make the counts of the last tiles in the list accurate.
+        hot_tiles_capacity = max(options.top * 10, 10000)
+        hot_tiles = HotTiles(hot_tiles_capacity)
+    else:
+        hot_tiles_capacity = None
+        hot_tiles = None
+    if options.latency:
+        latency = LatencyStats()
+        try:
+            for latency_file in options.merge_latency:
+                latency.read_csv(latency_file)
+        except (IOError, ValueError, KeyError),e:
+            print str(e)
+            exit()
+    else:
+        latency = None
+
     try:
-        input_file = open(input_log, 'r')
-    except IOError,e:
+        log_re = compile_log_format(log_format)
+    except (ValueError, re.error),e:
         print str(e)
-        if "Permission denied" in str(e):
-            print "Please rerun with appropriate permissions or sudo"
+        print "The specified Apache log format is not supported by this tool: " + log_format
         exit()
         
-    for line in input_file:
-        if options.logdate == None:
-            log_out = translate_log(line, log_re, log_output, tilematrixset_data, options.wmts_translate_off)
-            if quiet == False:
-                print log_out
-            output_file.write(log_out+"\n")
-        else:
-            if apachedate in line:
-                log_out = translate_log(line, log_re, log_output, tilematrixset_data, options.wmts_translate_off)
+    if tail:
+        try:
+            testopen = open(input_log, 'r')
+        except IOError,e:
+            print str(e)
+            if "Permission denied" in str(e):
+                print "Please rerun with appropriate permissions or sudo"
+            exit()
+        testopen.close()
+    
+        try:
+            for lines in follow_log(input_log):
+                log_out = translate_lines(lines, log_re, log_output, tilematrixset_data, options.wmts_translate_off)
                 if quiet == False:
-                    print log_out
-                output_file.write(log_out+"\n")            
+                    sys.stdout.write(log_out)
+                    sys.stdout.flush()
+                output_file.write(log_out)
+                output_file.flush()
+        except ValueError,e:
+            print str(e)
+            exit()
+        except KeyboardInterrupt:
+            output_file.close()
+        
+    else:
+        try:
+            input_file = open_log(input_log, 'r')
+        except IOError,e:
+            print str(e)
+            if "Permission denied" in str(e):
+                print "Please rerun with appropriate permissions or sudo"
+            exit()
+    
+        try:
+            if options.jobs > 1:
+                # Translate parts of the log in worker processes, and write the results in order.
+                if is_compressed_log(input_log):
+                    # Parts of the decompressed stream are sent to the workers.
+                    parts = ((translate_data, data) for data in read_parts(input_file, options.chunk_size * 1048576))
+                else:
+                    # Workers read their part of the log.
+                    input_file.close()
+                    parts = [(translate_range, byte_range) for byte_range in get_byte_ranges(input_log, options.chunk_size * 1048576)]
+                settings = {'input_log': input_log, 'log_re': log_re, 'log_output': log_output, 'tilematrixset_data': tilematrixset_data,
+                            'wmts_translate_off': options.wmts_translate_off, 'apachedate': apachedate, 'stats': stats != None,
+                            'hot_tiles': hot_tiles_capacity, 'latency': latency != None}
+                pool = multiprocessing.Pool(options.jobs, init_worker, (settings,))
+                # Only a few parts are queued ahead of the writer to limit memory use.
+                pending = deque()
+                # None marks the end of the log, where all remaining results are written.
+                for part in itertools.chain(parts, [None]):
+                    if part != None:
+                        pending.append(pool.apply_async(part[0], (part[1],)))
+                    while len(pending) >= options.jobs * 2 or (part == None and len(pending) > 0):
+                        log_out, range_stats, range_hot_tiles, range_latency = pending.popleft().get()
+                        if quiet == False:
+                            sys.stdout.write(log_out)
+                        if output_log != None:
+                            output_file.write(log_out)
+                        if stats != None:
+                            stats.merge(range_stats)
+                        if hot_tiles != None:
+                            hot_tiles.merge(range_hot_tiles)
+                        if latency != None:
+                            latency.merge(range_latency)
+                pool.close()
+                pool.join()
+                if is_compressed_log(input_log):
+                    input_file.close()
+            else:
+                while True:
+                    lines = input_file.readlines(buffer_size)
+                    if len(lines) == 0:
+                        break
+                    log_out = translate_lines(lines, log_re, log_output, tilematrixset_data, options.wmts_translate_off, apachedate,
+                                              stats, hot_tiles, latency)
+                    if quiet == False:
+                        sys.stdout.write(log_out)
+                    if output_log != None:
+                        output_file.write(log_out)
+                input_file.close()
+            if output_log != None:
+                output_file.close()
+        except (ValueError, IOError),e:
+            print str(e)
+            exit()
+        if stats != None:
+            stats.write_csv(options.stats)
+            print "Stats written to " + options.stats
+        if hot_tiles != None:
+            hot_tiles.write_csv(options.hot_tiles, options.top)
+            print "Hot tiles written to " + options.hot_tiles
+        if latency != None:
+            latency.write_csv(options.latency)
+            print "Latency written to " + options.latency
         
-exit()
\ No newline at end of file
+    exit()
\ No newline at end of file
@@ -0,0 +1,222 @@
+#!/bin/env python
+
+# Tests for oe_log_stats.py using generated values with known exact results
+
+import math
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from oe_log_stats import *
+
+def get_log_dict(layer, tilematrix, statuscode, responsetime):
+    return {'layer': layer, 'layers': '', 'tilematrixset': 'EPSG4326_2km', 'tilematrix': tilematrix,
+            'statuscode': statuscode, 'responsetime': responsetime}
+
+class TestHyperLogLog(unittest.TestCase):
+
+    def get_hll(self, values, precision=10):
+        hll = HyperLogLog(precision)
+        for value in values:
+            hll.add(str(value))
+        return hll
+
+    def assertEstimate(self, estimate, count, error):
+        self.assertTrue(abs(estimate - count) <= error * count,
+                        '%d is not within %.1f%% of %d' % (estimate, error * 100, count))
+
+    def test_count(self):
+        # The standard error is 1.04/sqrt(1024), about 3%, 4 standard errors are allowed.
+        for count in [10, 100, 1000, 10000, 100000]:
+            self.assertEstimate(self.get_hll(range(count)).count(), count, 0.13)
+        # Repeated values are counted once.
+        self.assertEqual(self.get_hll(['client'] * 1000).count(), 1)
+        self.assertEqual(HyperLogLog().count(), 0)
+
+    def test_merge(self):
+        first = self.get_hll(range(0, 30000))
+        second = self.get_hll(range(20000, 50000))
+        first.merge(second)
+        self.assertEstimate(first.count(), 50000, 0.13)
+        # Merging is the same as counting the union.
+        self.assertEqual(first.registers, self.get_hll(range(50000)).registers)
+        self.assertRaises(ValueError, first.merge, HyperLogLog(12))
+
+    def test_sparse(self):
+        # Few values are counted exactly with their hashes.
+        hll = self.get_hll(range(32))
+        self.assertEqual((hll.registers, hll.count()), (None, 32))
+        hll.add('32')
+        self.assertEqual(len(hll.registers), 1024)
+        self.assertEqual(hll.registers, self.get_hll(range(33)).registers)
+        # Sparse and dense HyperLogLogs are merged in any order.
+        for (low, high) in [(10, 20), (0, 1000)]:
+            sparse = self.get_hll(range(low, high))
+            dense = self.get_hll(range(500, 2000))
+            dense.merge(sparse)
+            sparse.merge(self.get_hll(range(500, 2000)))
+            union = self.get_hll(range(low, high) + range(500, 2000))
+            self.assertEqual(dense.registers, union.registers)
+            self.assertEqual(sparse.registers, union.registers)
+        sparse = self.get_hll(range(0, 20))
+        sparse.merge(self.get_hll(range(10, 30)))
+        self.assertEqual((sparse.registers, sparse.count()), (None, 30))
+
+class TestSpaceSaving(unittest.TestCase):
+
+    def get_counts(self, items):
+        counts = {}
+        for item in items:
+            counts[item] = counts.get(item, 0) + 1
+        return counts
+
+    def assertGuarantee(self, space_saving, counts):
+        total = sum(counts.values())
+        top = space_saving.top()
+        self.assertTrue(len(top) <= space_saving.capacity)
+        for (item, count, error) in top:
+            true_count = counts.get(item, 0)
+            self.assertTrue(count - error <= true_count <= count,
+                            '%s: %d is not within [%d, %d]' % (item, true_count, count - error, count))
+        # Items with more than 1/capacity of all occurrences are always counted.
+        counted = set([item for (item, count, error) in top])
+        for item, true_count in counts.iteritems():
+            if true_count * space_saving.capacity > total:
+                self.assertTrue(item in counted, '%s with %d of %d is not counted' % (item, true_count, total))
+
+    def get_items(self, seed, count):
+        # Zipf-like: a few frequent items and many rare ones
+        random.seed(seed)
+        return [str(int(random.paretovariate(1.0))) for i in range(count)]
+
+    def test_counts(self):
+        items = self.get_items(1, 20000)
+        space_saving = SpaceSaving(20)
+        for item in items:
+            space_saving.add(item)
+        self.assertGuarantee(space_saving, self.get_counts(items))
+        # Exact counts while all items fit
+        space_saving = SpaceSaving(10)
+        for item in ['a', 'b', 'a', 'c', 'a', 'b']:
+            space_saving.add(item)
+        self.assertEqual(space_saving.top(2), [('a', 3, 0), ('b', 2, 0)])
+
+    def test_merge(self):
+        parts = [self.get_items(seed, 5000) for seed in range(2, 6)]
+        # Items frequent in only one part
+        parts[0] += ['first'] * 400
+        parts[3] += ['last'] * 400
+        merged = SpaceSaving(20)
+        for part in parts:
+            space_saving = SpaceSaving(20)
+            for item in part:
+                space_saving.add(item)
+            merged.merge(space_saving)
+        self.assertGuarantee(merged, self.get_counts(sum(parts, [])))
+        # Counts are kept when nothing was dropped.
+        first = SpaceSaving(10)
+        second = SpaceSaving(10)
+        for item in ['a', 'b', 'a']:
+            first.add(item)
+        for item in ['a', 'c']:
+            second.add(item)
+        first.merge(second)
+        self.assertEqual(first.top(), [('a', 3, 0), ('b', 1, 0), ('c', 1, 0)])
+        # An item dropped by a full SpaceSaving may have occurred there as often as its smallest counter.
+        first = SpaceSaving(2)
+        second = SpaceSaving(2)
+        first_items = ['a'] * 10
+        second_items = ['a'] * 3 + ['b'] * 5 + ['c'] * 5
+        for item in first_items:
+            first.add(item)
+        for item in second_items:
+            second.add(item)
+        self.assertEqual(second.top(), [('c', 8, 3), ('b', 5, 0)])
+        first.merge(second)
+        self.assertEqual(first.top(1), [('a', 15, 5)])
+        self.assertGuarantee(first, self.get_counts(first_items + second_items))
+
+class TestLatencyHistogram(unittest.TestCase):
+
+    def test_buckets(self):
+        histogram = LatencyHistogram()
+        previous_bucket = -1
+        for value in range(0, 1 << 16) + [1 << 20, (1 << 30) + 12345, (1 << 40) - 1]:
+            bucket = histogram.get_bucket(value)
+            self.assertTrue(bucket >= previous_bucket)
+            previous_bucket = bucket
+            bucket_value = histogram.get_bucket_value(bucket)
+            self.assertEqual(histogram.get_bucket(int(bucket_value)), bucket)
+            self.assertTrue(abs(bucket_value - value) <= float(value) / LATENCY_SUB_BUCKETS,
+                            '%d is in a bucket of %f' % (value, bucket_value))
+        # Small values are exact.
+        self.assertEqual(histogram.get_bucket_value(histogram.get_bucket(63)), 63)
+
+    def test_percentiles(self):
+        random.seed(7)
+        values = [int(random.lognormvariate(9, 1.5)) for i in range(10000)]
+        histogram = LatencyHistogram()
+        for value in values:
+            histogram.add(value)
+        values.sort()
+        for percent in [1, 50, 90, 95, 99, 99.9, 100]:
+            exact = values[max(1, int(math.ceil(len(values) * percent / 100.0))) - 1]
+            self.assertTrue(abs(histogram.percentile(percent) - exact) <= float(exact) / LATENCY_SUB_BUCKETS,
+                            'p%s is %f instead of %d' % (percent, histogram.percentile(percent), exact))
+        self.assertEqual(histogram.max, values[-1])
+        self.assertEqual(histogram.total, sum(values))
+
+    def test_string(self):
+        histogram = LatencyHistogram()
+        for value in [5, 5, 900, 123456]:
+            histogram.add(value)
+        copy = LatencyHistogram()
+        copy.from_string(histogram.to_string())
+        self.assertEqual((copy.buckets, copy.count, copy.total, copy.max),
+                         (histogram.buckets, histogram.count, histogram.total, histogram.max))
+        # Reading adds to the histogram.
+        copy.from_string(histogram.to_string())
+        self.assertEqual((copy.count, copy.total, copy.buckets[5]), (8, 2 * histogram.total, 4))
+
+class TestLatencyStats(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def get_stats(self, seed):
+        random.seed(seed)
+        stats = LatencyStats()
+        for i in range(2000):
+            stats.add(get_log_dict(random.choice(['LayerA', 'LayerB']), random.randint(0, 2),
+                                   random.choice(['200', '304']), str(int(random.expovariate(1 / 20000.0)))))
+        stats.add(get_log_dict('LayerA', 0, '200', ''))
+        return stats
+
+    def test_read_csv(self):
+        servers = [self.get_stats(seed) for seed in range(3)]
+        merged = LatencyStats()
+        report = LatencyStats()
+        for ndx, stats in enumerate(servers):
+            merged.merge(stats)
+            latency_filename = os.path.join(self.tmp_dir, 'latency' + str(ndx) + '.csv')
+            stats.write_csv(latency_filename)
+            report.read_csv(latency_filename)
+        self.assertEqual(sorted(report.groups.keys()), sorted(merged.groups.keys()))
+        self.assertEqual(sum([histogram.count for histogram in report.groups.values()]), 6000)
+        for key, histogram in merged.groups.iteritems():
+            copy = report.groups[key]
+            self.assertEqual((copy.buckets, copy.count, copy.total, copy.max),
+                             (histogram.buckets, histogram.count, histogram.total, histogram.max))
+        # The merged report has the same percentiles.
+        merged_filename = os.path.join(self.tmp_dir, 'merged.csv')
+        report_filename = os.path.join(self.tmp_dir, 'report.csv')
+        merged.write_csv(merged_filename)
+        report.write_csv(report_filename)
+        self.assertEqual(open(report_filename).read(), open(merged_filename).read())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+#!/bin/env python
+
+# Tests for oe_prewarm_tiles.py using a temporary MRF header and index
+
+import os
+import shutil
+import tempfile
+import unittest
+from oe_prewarm_tiles import *
+from oe_mrf_index import create_index
+
+# A 2km MRF with overviews down to a single page, as made by mrfgen
+MRF_HEADER = """<MRF_META>
+  <Raster>
+    <Size x="20480" y="10240" c="1"/>
+    <PageSize x="512" y="512" c="1"/>
+    <Compression>PNG</Compression>
+  </Raster>
+  <Rsets model="uniform" scale="2"/>
+%s</MRF_META>
+"""
+
+class TestPrewarmTiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.mrf_filename = os.path.join(self.tmp_dir, 'Layer2015152_.mrf')
+        self.write_header('')
+        header = read_mrf_header(self.mrf_filename)
+        self.idx_filename = header.get_index_filename()
+        index = create_index(self.idx_filename, header)
+        self.level_offsets = index.level_offsets
+        self.assertEqual(index.levels, 7)
+        # Level 5 is the 2x1 TileMatrix 0 of EPSG4326_2km
+        index.update(5, 0, 1, 1000, 10)
+        index.update(4, 1, 2, 2000, 20)
+        index.close()
+
+    def write_header(self, twms):
+        mrf_file = open(self.mrf_filename, 'w')
+        mrf_file.write(MRF_HEADER % twms)
+        mrf_file.close()
+
+    def test_tilematrix_levels(self):
+        data_filename = self.mrf_filename[:-4] + '.ppg'
+        ranges = get_tile_ranges(self.mrf_filename, [(0, 0, 1), (1, 1, 2), (6, 0, 0)], 6)
+        self.assertEqual(ranges, [(self.idx_filename, (self.level_offsets[5] + 1) * 16, 16),
+                                  (data_filename, 1000, 10),
+                                  (self.idx_filename, (self.level_offsets[4] + 5) * 16, 16),
+                                  (data_filename, 2000, 20)])
+        # The level count of the endpoint MRF is used if none is given
+        self.assertRaises(MRFIndexError, get_tile_ranges, self.mrf_filename, [(0, 0, 1)])
+        self.write_header('<TWMS>\n  <Levels>6</Levels>\n</TWMS>\n')
+        self.assertEqual(get_tile_ranges(self.mrf_filename, [(0, 0, 1)])[1], (data_filename, 1000, 10))
+        self.assertEqual(get_levels_value(self.mrf_filename), 6)
+        self.assertEqual(get_levels_value('7'), 7)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+#!/bin/env python
+
+# Tests for onearth_logs.py using generated Apache log lines
+
+import gzip
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import onearth_logs
+from onearth_logs import *
+
+COMBINED_LINE = ('10.1.2.3 - frank [17/Mar/2015:10:00:00 -0400] "GET /wmts.cgi?Layer=MODIS_Aqua_Aerosol&TileMatrix=3&'
+                 'TileRow=2&TileCol=5&TIME=2015-03-16 HTTP/1.1" 200 2326 "http://example.com/viewer" '
+                 '"Mozilla/5.0 \\"quoted\\" agent"\n')
+
+OUTPUT_FORMAT = '%(requestor)s|%(timestamp)s|%(layer)s|%(tilematrix)s|%(statuscode)s|%(responsetime)s'
+
+
+def get_lines(count):
+    """Log lines of the combined format with a response time, with a few that do not match"""
+    lines = []
+    for i in range(count):
+        if i % 97 == 0:
+            lines.append('not a log line\n')
+        else:
+            lines.append('10.0.0.%d - - [17/Mar/2015:%02d:00:00 -0400] "GET /wmts.cgi?layer=Layer%d&tilematrix=%d HTTP/1.1" '
+                         '200 %d "-" "agent %d" %d\n' % (i % 250, i % 24, i % 3, i % 5, i * 10, i, i * 7))
+    return lines
+
+
+class TestLogFormat(unittest.TestCase):
+
+    def parse(self, log_format, line):
+        return parse_log(line, compile_log_format(log_format), None, True)
+
+    def test_combined(self):
+        log_dict = self.parse('combined', COMBINED_LINE)
+        self.assertEqual(log_dict['requestor'], '10.1.2.3')
+        self.assertEqual(log_dict['remoteuser'], 'frank')
+        self.assertEqual(log_dict['timestamp'], '17/Mar/2015:10:00:00 -0400')
+        self.assertEqual(log_dict['uri'], 'GET /wmts.cgi?Layer=MODIS_Aqua_Aerosol&TileMatrix=3&TileRow=2&TileCol=5&TIME=2015-03-16')
+        self.assertEqual((log_dict['statuscode'], log_dict['bytes']), ('200', '2326'))
+        self.assertEqual(log_dict['referrer'], 'http://example.com/viewer')
+        # Escaped quotes are part of the field.
+        self.assertEqual(log_dict['useragent'], 'Mozilla/5.0 \\"quoted\\" agent')
+        self.assertEqual(log_dict['responsetime'], '')
+        # Request parameters are case insensitive.
+        self.assertEqual((log_dict['layer'], log_dict['tilematrix'], log_dict['tilerow'], log_dict['tilecol'], log_dict['time']),
+                         ('MODIS_Aqua_Aerosol', '3', '2', '5', '2015-03-16'))
+        self.assertEqual(log_dict['bbox'], '')
+        # The same format as in httpd.conf, in quotes with escaped quotes
+        httpd_format = '"%h %l %u %t \\"%r\\" %>s %b \\"%{Referer}i\\" \\"%{User-Agent}i\\""'
+        self.assertEqual(self.parse(httpd_format, COMBINED_LINE), log_dict)
+        self.assertEqual(self.parse('combined', 'not a log line\n'), None)
+
+    def test_responsetime(self):
+        line = '10.1.2.3 - - [17/Mar/2015:10:00:00 -0400] "GET /wmts.cgi?layer=A HTTP/1.1" 200 100 %s\n'
+        self.assertEqual(self.parse('%h %l %u %t "%r" %>s %b %D', line % '12345')['responsetime'], '12345')
+        self.assertEqual(self.parse('%h %l %u %t "%r" %>s %b %{us}T', line % '12345')['responsetime'], '12345')
+        # Other units are converted to microseconds.
+        self.assertEqual(self.parse('%h %l %u %t "%r" %>s %b %{ms}T', line % '12')['responsetime'], '12000')
+        self.assertEqual(self.parse('%h %l %u %t "%r" %>s %b %T', line % '2')['responsetime'], '2000000')
+
+    def test_headers(self):
+        log_format = '%{X-Forwarded-For}i %h %t "%r" %s %B "%{User-Agent}i"'
+        line = '192.168.1.1, 10.0.0.1 10.1.2.3 [17/Mar/2015:10:00:00 -0400] "GET /twms.cgi?layers=A HTTP/1.0" 304 0 "curl"\n'
+        log_dict = self.parse(log_format, line)
+        self.assertEqual(log_dict['x_forwarded_for'], '192.168.1.1, 10.0.0.1')
+        self.assertEqual((log_dict['requestor'], log_dict['statuscode'], log_dict['bytes']), ('10.1.2.3', '304', '0'))
+        self.assertEqual((log_dict['uri'], log_dict['layers'], log_dict['useragent']), ('GET /twms.cgi?layers=A', 'A', 'curl'))
+
+    def test_custom_time(self):
+        log_format = '%h [%{%Y-%m-%d %H:%M:%S}t] "%r" %>s %b %{ms}T'
+        line = '10.1.2.3 [2015-03-17 10:00:00] "GET /wmts.cgi?layer=A HTTP/1.1" 200 100 7\n'
+        log_dict = self.parse(log_format, line)
+        self.assertEqual(log_dict['timestamp'], '2015-03-17 10:00:00')
+        self.assertEqual((log_dict['uri'], log_dict['statuscode'], log_dict['responsetime']), ('GET /wmts.cgi?layer=A', '200', '7000'))
+
+    def test_unsupported(self):
+        self.assertRaises(ValueError, compile_log_format, '%h %Z')
+        self.assertRaises(ValueError, format_log, self.parse('combined', COMBINED_LINE), '%(nofield)s')
+
+
+class TestLogFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log_re = compile_log_format('%h %l %u %t "%r" %>s %b "%{Referer}i" "%{User-Agent}i" %D')
+
+    def write_log(self, filename, lines):
+        log_file = open(filename, 'w')
+        log_file.writelines(lines)
+        log_file.close()
+        return filename
+
+    def test_byte_ranges(self):
+        lines = get_lines(1000)
+        input_log = self.write_log(os.path.join(self.tmp_dir, 'access.log'), lines)
+        expected = translate_lines(lines, self.log_re, OUTPUT_FORMAT, None, True, '17/Mar/2015:1')
+        for chunk_size in [1, 100, 4096, os.path.getsize(input_log), 10 * os.path.getsize(input_log)]:
+            byte_ranges = get_byte_ranges(input_log, chunk_size)
+            # The ranges cover the file at line breaks.
+            self.assertEqual(byte_ranges[0][0], 0)
+            self.assertEqual(byte_ranges[-1][1], os.path.getsize(input_log))
+            for (start, end), (next_start, next_end) in zip(byte_ranges, byte_ranges[1:]):
+                self.assertEqual(end, next_start)
+            init_worker({'input_log': input_log, 'log_re': self.log_re, 'log_output': OUTPUT_FORMAT,
+                         'tilematrixset_data': None, 'wmts_translate_off': True, 'apachedate': '17/Mar/2015:1',
+                         'stats': True, 'hot_tiles': None, 'latency': True})
+            results = [translate_range(byte_range) for byte_range in byte_ranges]
+            self.assertEqual(''.join([result[0] for result in results]), expected)
+        # Stats of the ranges are the same as of a single pass.
+        stats = LogStats()
+        latency = LatencyStats()
+        translate_lines(lines, self.log_re, None, None, True, '17/Mar/2015:1', stats, None, latency)
+        range_stats = LogStats()
+        range_latency = LatencyStats()
+        for log_out, part_stats, part_hot_tiles, part_latency in results:
+            range_stats.merge(part_stats)
+            range_latency.merge(part_latency)
+        self.assertEqual(range_stats.get_rows(), stats.get_rows())
+        self.assertEqual(sorted(range_latency.groups.keys()), sorted(latency.groups.keys()))
+
+    def test_compressed(self):
+        lines = get_lines(100)
+        for extension in ['.gz', '.bz2']:
+            log_filename = os.path.join(self.tmp_dir, 'access.log' + extension)
+            output_file = open_log(log_filename, 'w')
+            output_file.write(''.join(lines))
+            output_file.close()
+            self.assertTrue(os.path.getsize(log_filename) < len(''.join(lines)))
+            input_file = open_log(log_filename)
+            self.assertEqual(input_file.readlines(), lines)
+            input_file.close()
+        # Concatenated gzip streams, e.g. of an appended log, are read in full.
+        gzip_filename = os.path.join(self.tmp_dir, 'access.log.gz')
+        gzip_file = gzip.GzipFile(gzip_filename, 'ab')
+        gzip_file.writelines(lines[:10])
+        gzip_file.close()
+        input_file = open_log(gzip_filename)
+        self.assertEqual(input_file.readlines(), lines + lines[:10])
+        input_file.close()
+        # The Python module is used without a command.
+        find_executable = onearth_logs.find_executable
+        onearth_logs.find_executable = lambda command: None
+        try:
+            input_file = open_log(gzip_filename)
+        finally:
+            onearth_logs.find_executable = find_executable
+        self.assertFalse(isinstance(input_file, PipedFile))
+        self.assertEqual(input_file.readlines(), lines + lines[:10])
+        input_file.close()
+
+    def test_follow_log(self):
+        log_filename = self.write_log(os.path.join(self.tmp_dir, 'access.log'), ['old line\n'])
+        lines = follow_log(log_filename, 0.01)
+        # Only lines added after the log is opened are read, and only complete lines.
+        append = threading.Timer(0.2, self.append_log, (log_filename, 'new line\npartial'))
+        append.start()
+        self.assertEqual(lines.next(), ['new line\n'])
+        append.join()
+        self.append_log(log_filename, ' line\n')
+        self.assertEqual(lines.next(), ['partial line\n'])
+        # The rest of a rotated log is read before the new log.
+        self.append_log(log_filename, 'last line\n')
+        os.rename(log_filename, log_filename + '.1')
+        self.write_log(log_filename, ['rotated line\n'])
+        self.assertEqual(lines.next(), ['last line\n'])
+        self.assertEqual(lines.next(), ['rotated line\n'])
+        # A truncated log is read from the start.
+        self.write_log(log_filename, ['short\n'])
+        self.assertEqual(lines.next(), ['short\n'])
+
+    def append_log(self, filename, data):
+        log_file = open(filename, 'a')
+        log_file.write(data)
+        log_file.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+if __name__ == '__main__':
+    unittest.main()